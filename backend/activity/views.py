@@ -8,6 +8,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
 from orders.models import Order  # Adjust this path if needed
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -29,5 +32,5 @@ class EmployeeActivityView(APIView):
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
-            print('Error fetching employee activity:', str(e))
+            logger.error("Error fetching employee activity: %s", e)
             return Response({'detail': 'Error fetching employee activity.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -2,6 +2,9 @@
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Branch(models.Model):
     name = models.CharField(max_length=100) 
@@ -120,7 +123,7 @@ class Table(models.Model):
                 self.status = 'ordering'
         
         self.save()
-        print(f"[DEBUG] Table {self.number} status updated to: {self.status}")
+        logger.debug("Table %s status updated to: %s", self.number, self.status)
 
 
 
@@ -4,6 +4,10 @@ from .models import Branch
 
 from rest_framework import serializers
 from .models import Table
+import logging
+from core.tracing import tracing_enabled
+
+logger = logging.getLogger(__name__)
 
 
 class BranchSerializer(serializers.ModelSerializer):
@@ -35,10 +39,11 @@ class TableSerializer(serializers.ModelSerializer):
     def validate(self, data):
         user = self.context['request'].user
         number = data.get('number')
-        print(f"[DEBUG] TableSerializer validate - User: {user.username}, Number: {number}")
-        print(f"[DEBUG] Existing tables for user: {Table.objects.filter(created_by=user).count()}")
+        logger.debug("TableSerializer validate - User: %s, Number: %s", user.username, number)
+        if tracing_enabled(logger):
+            logger.debug("Existing tables for user: %s", Table.objects.filter(created_by=user).count())
         if Table.objects.filter(number=number, created_by=user).exists():
-            print(f"[DEBUG] Validation error - table {number} already exists for user {user.username}")
+            logger.debug("Validation error - table %s already exists for user %s", number, user.username)
             raise serializers.ValidationError("A table with this number already exists for this waiter.")
-        print(f"[DEBUG] Validation passed for table {number}")
+        logger.debug("Validation passed for table %s", number)
         return data 
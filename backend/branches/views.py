@@ -10,6 +10,9 @@ from .models import Branch
 from .serializers import BranchSerializer
 from rest_framework.permissions import IsAuthenticated
 from core.decorators import csrf_exempt_for_cors
+import logging
+
+logger = logging.getLogger(__name__)
 
 class BranchViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Branch.objects.all()
@@ -24,9 +27,9 @@ class TableListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        print(f"[DEBUG] POST request received - User: {request.user.username}, Role: {request.user.role}")
-        print(f"[DEBUG] User authenticated: {request.user.is_authenticated}")
-        print(f"[DEBUG] Request data: {request.data}")
+        logger.debug("POST request received - User: %s, Role: %s", request.user.username, request.user.role)
+        logger.debug("User authenticated: %s", request.user.is_authenticated)
+        logger.debug("Request data: %s", request.data)
         return super().post(request, *args, **kwargs)
 
     def get_queryset(self):
@@ -39,40 +42,40 @@ class TableListCreateView(generics.ListCreateAPIView):
             if user.role == 'waiter':
                 # Waiters can see tables they created in their branch
                 queryset = Table.objects.filter(created_by=user, branch=user.branch)
-                print(f"[DEBUG] Filtering tables for waiter: {user.username} in branch: {user.branch.name}")
+                logger.debug("Filtering tables for waiter: %s in branch: %s", user.username, user.branch.name)
             elif user.role in ['manager', 'cashier', 'meat', 'bartender']:
                 # Other roles can see all tables in their branch
                 queryset = Table.objects.filter(branch=user.branch)
-                print(f"[DEBUG] Filtering tables for {user.role}: {user.username} in branch: {user.branch.name}")
+                logger.debug("Filtering tables for %s: %s in branch: %s", user.role, user.username, user.branch.name)
             else:
                 # Other roles see only their own tables
                 queryset = Table.objects.filter(created_by=user)
-                print(f"[DEBUG] Filtering tables for {user.role}: {user.username}")
+                logger.debug("Filtering tables for %s: %s", user.role, user.username)
         elif user.is_superuser:
             # Superuser can see all tables
             queryset = Table.objects.all()
-            print(f"[DEBUG] Superuser - showing all tables")
+            logger.debug("Superuser - showing all tables")
         else:
             # For users without branch, show only their own tables
             queryset = Table.objects.filter(created_by=user)
-            print(f"[DEBUG] User without branch - showing only own tables")
+            logger.debug("User without branch - showing only own tables")
         
         return queryset
 
     def perform_create(self, serializer):
         user = self.request.user
-        print(f"[DEBUG] Table creation attempt - User: {user.username}, Role: {user.role}, Authenticated: {user.is_authenticated}")
-        print(f"[DEBUG] User has role attribute: {hasattr(user, 'role')}")
-        print(f"[DEBUG] User branch: {getattr(user, 'branch', None)}")
+        logger.debug("Table creation attempt - User: %s, Role: %s, Authenticated: %s", user.username, user.role, user.is_authenticated)
+        logger.debug("User has role attribute: %s", hasattr(user, 'role'))
+        logger.debug("User branch: %s", getattr(user, 'branch', None))
         
         if user.is_authenticated and hasattr(user, 'role') and user.role == 'waiter':
             branch = getattr(user, 'branch', None)
             if not branch:
-                print(f"[DEBUG] Permission denied - no branch assigned")
+                logger.debug("Permission denied - no branch assigned")
                 raise PermissionDenied('Waiter does not have a branch assigned.')
-            print(f"[DEBUG] Creating table for waiter: {user.username} in branch: {branch.name}")
+            logger.debug("Creating table for waiter: %s in branch: %s", user.username, branch.name)
             serializer.save(created_by=user, branch=branch)
         else:
-            print(f"[DEBUG] Permission denied - user role: {user.role}, expected: waiter")
+            logger.debug("Permission denied - user role: %s, expected: waiter", user.role)
             raise PermissionDenied('Only waiters can create tables.')
 
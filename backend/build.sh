@@ -12,4 +12,7 @@ python manage.py collectstatic --noinput --settings=kebede_pos.vercel_settings
 # Run migrations
 python manage.py migrate --settings=kebede_pos.vercel_settings
 
+# Create the shared cache table (no-op when REDIS_URL is set)
+python manage.py createcachetable --settings=kebede_pos.vercel_settings
+
 echo "✅ Build completed successfully!" 
\ No newline at end of file
@@ -1,8 +1,24 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication
+from collections import OrderedDict
 from datetime import timedelta
+import copy
+import logging
+import threading
+import time
+
+from . import shared_cache
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -16,13 +32,13 @@ class SessionAuthenticationBackend(ModelBackend):
         # First try the standard authentication
         user = super().authenticate(request, username, password, **kwargs)
         if user:
-            print(f"[DEBUG] SessionAuthenticationBackend: Standard auth successful for {user.username}")
+            logger.debug("SessionAuthenticationBackend: Standard auth successful for %s", user.username)
             return user
         
         # If no user found, try session-based authentication
         if request and hasattr(request, 'session'):
             session_key = request.session.session_key
-            print(f"[DEBUG] SessionAuthenticationBackend: Session key: {session_key}")
+            logger.debug("SessionAuthenticationBackend: Session key: %s", session_key)
             if session_key:
                 try:
                     # Get the session from database
@@ -33,22 +49,22 @@ class SessionAuthenticationBackend(ModelBackend):
                     
                     # Get user ID from session
                     user_id = session.get_decoded().get('_auth_user_id')
-                    print(f"[DEBUG] SessionAuthenticationBackend: User ID from session: {user_id}")
+                    logger.debug("SessionAuthenticationBackend: User ID from session: %s", user_id)
                     if user_id:
                         try:
                             user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] SessionAuthenticationBackend: Session auth successful for {user.username}")
+                            logger.debug("SessionAuthenticationBackend: Session auth successful for %s", user.username)
                             return user
                         except User.DoesNotExist:
-                            print(f"[DEBUG] SessionAuthenticationBackend: User {user_id} not found in database")
+                            logger.debug("SessionAuthenticationBackend: User %s not found in database", user_id)
                             return None
                 except Session.DoesNotExist:
-                    print(f"[DEBUG] SessionAuthenticationBackend: Session {session_key} not found in database")
+                    logger.debug("SessionAuthenticationBackend: Session %s not found in database", session_key)
                     return None
             else:
-                print(f"[DEBUG] SessionAuthenticationBackend: No session key in request")
+                logger.debug("SessionAuthenticationBackend: No session key in request")
         else:
-            print(f"[DEBUG] SessionAuthenticationBackend: No session in request")
+            logger.debug("SessionAuthenticationBackend: No session in request")
         
         return None
 
@@ -56,4 +72,150 @@ class SessionAuthenticationBackend(ModelBackend):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
-            return None 
\ No newline at end of file
+            return None
+
+
+def _version_key(kind, key):
+    return f'auth:{kind}:{key}'
+
+
+def _versions(session_key, user_id):
+    """Current versions of the session and the user in the shared cache; None where missing"""
+    keys = [_version_key('session', session_key), _version_key('user', user_id)]
+    found = cache.get_many(keys)
+    return tuple(found.get(key) for key in keys)
+
+
+def _bump(kind, key, timeout):
+    # After commit, so a rolled back logout or user change keeps the entries
+    transaction.on_commit(lambda: cache.set(_version_key(kind, key), time.time_ns(), timeout))
+
+
+class SessionUserCache:
+    """
+    Users of recently seen session keys, least recently used first. An entry
+    is good for ``SESSION_KEY_AUTH_CACHE_TTL`` seconds or until its session
+    expires, whichever comes first, and at most
+    ``SESSION_KEY_AUTH_CACHE_SIZE`` entries are kept.
+
+    Every entry remembers the versions its session and user had in the shared
+    cache when it was stored, and a hit whose versions have since changed is
+    a miss: deleting the session or saving the user in any worker replaces
+    them. The versions cost one cache read per hit. When the default cache is
+    process-local (``core.shared_cache.is_shared``) nothing is kept, since
+    another worker's logout could not reach this one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, session_key):
+        if not shared_cache.is_shared():
+            return None
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            user, expires, versions = entry
+            if expires <= time.monotonic():
+                del self._entries[session_key]
+                return None
+            self._entries.move_to_end(session_key)
+        if None in versions or _versions(session_key, user.pk) != versions:
+            self.discard(session_key)
+            return None
+        # Each request gets its own instance to change
+        return copy.copy(user)
+
+    def put(self, session_key, user, expire_date):
+        if not shared_cache.is_shared():
+            return
+        lifetime = (expire_date - timezone.now()).total_seconds()
+        # Never set or evicted: start a version that cached entries cannot have
+        cache.add(_version_key('session', session_key), time.time_ns(), max(int(lifetime), 1))
+        cache.add(_version_key('user', user.pk), time.time_ns(), None)
+        versions = _versions(session_key, user.pk)
+        ttl = getattr(settings, 'SESSION_KEY_AUTH_CACHE_TTL', 60)
+        expires = time.monotonic() + min(ttl, lifetime)
+        size = getattr(settings, 'SESSION_KEY_AUTH_CACHE_SIZE', 1000)
+        with self._lock:
+            self._entries[session_key] = (copy.copy(user), expires, versions)
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_key):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for session_key in [key for key, (user, _, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[session_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+session_users = SessionUserCache()
+
+
+class SessionKeyAuthentication(BaseAuthentication):
+    """
+    DRF authentication from the ``X-Session-Key`` header, for clients on the
+    network that cannot keep the session cookie (the login response carries
+    the key in that header).
+
+    The session and its user (with the branch) are looked up once and kept in
+    ``session_users``, so a warm request costs no queries. Deleting the
+    session (logout) or saving the user (password, role or branch change)
+    drops the entries of this process and, through the shared cache, of the
+    other workers. An unknown, expired or stale key is not an error:
+    the request just stays anonymous.
+    """
+
+    def authenticate(self, request):
+        session_key = request.headers.get('X-Session-Key')
+        if not session_key:
+            return None
+        user = session_users.get(session_key)
+        if user is None:
+            user, expire_date = self.load(session_key)
+            if user is None:
+                return None
+            session_users.put(session_key, user, expire_date)
+        return (user, None)
+
+    def load(self, session_key):
+        session = Session.objects.filter(session_key=session_key, expire_date__gt=timezone.now()).first()
+        if session is None:
+            logger.debug("SessionKeyAuthentication: Session %s not found or expired", session_key)
+            return None, None
+        data = session.get_decoded()
+        user_id = data.get('_auth_user_id')
+        if not user_id:
+            return None, None
+        user = User.objects.select_related('branch').filter(pk=user_id).first()
+        if user is None or not user.is_active:
+            logger.debug("SessionKeyAuthentication: User %s not found or inactive", user_id)
+            return None, None
+        # Sessions from before the last password change are no longer valid
+        if not constant_time_compare(data.get('_auth_user_hash', ''), user.get_session_auth_hash()):
+            logger.debug("SessionKeyAuthentication: Stale session %s for %s", session_key, user.username)
+            return None, None
+        return user, session.expire_date
+
+
+@receiver(post_delete, sender=Session)
+def forget_deleted_session(sender, instance, **kwargs):
+    session_users.discard(instance.session_key)
+    _bump('session', instance.session_key, settings.SESSION_COOKIE_AGE)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_changed_user(sender, instance, **kwargs):
+    session_users.discard_user(instance.pk)
+    _bump('user', instance.pk, None)
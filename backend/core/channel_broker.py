@@ -0,0 +1,487 @@
+"""
+Cross-process channel layer.
+
+``InMemoryChannelLayer`` keeps groups in the memory of one process, so a
+``group_send`` from one worker never reaches WebSocket clients connected to
+another. ``BrokerChannelLayer`` sends group membership and messages through
+``Broker``, a small asyncio process every worker connects to over a Unix
+socket (``python manage.py run_channel_broker``; ``CHANNEL_LAYER=broker``
+in settings).
+
+Each worker connection registers a prefix and names its channels
+``<prefix>!<random>`` (channels' process-specific names), so the broker
+routes by prefix: it holds the groups and turns a ``group_send`` into one
+frame per worker carrying the names of that worker's member channels, which
+the worker puts on its local channel queues. Frames are length-prefixed
+JSON, so messages must be JSON serialisable (channels' own layers use
+msgpack, which also carries bytes). Only process-specific channels can
+receive; sends to other channel names are dropped.
+
+Backpressure, from sender to receiver:
+
+* senders wait on the socket (``drain``) when the broker reads slower than
+  they write;
+* the broker queues at most ``outbox_size`` frames per worker and drops
+  (and counts) frames for a worker that falls behind, so one slow worker
+  does not hold up delivery to the others;
+* a worker queues at most ``capacity`` messages per channel; further group
+  messages are dropped and counted, and a direct ``send`` to a full local
+  channel raises ``ChannelFull``, as with the in-memory layer.
+
+A worker reconnects when the broker restarts and re-adds its channels'
+group memberships. Messages sent while it was away are lost.
+
+Channel queues live as long as their consumer: ``new_channel`` creates the
+queue, and it is removed when the consumer's ``receive`` is cancelled (the
+WebSocket went away) or the channel leaves its last group while nothing waits
+on it. Delivery never creates a queue, so messages for a gone consumer are
+dropped, and queues left idle for ``expiry`` seconds are swept during
+delivery. A connection opened from an event loop that has since closed
+(``async_to_sync`` runs each call in a loop of its own) is shut down the next
+time the layer opens a connection or is closed.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import string
+import struct
+import time
+import uuid
+from collections import defaultdict
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = '/tmp/kebede-channels.sock'
+HEADER = struct.Struct('!I')
+MAX_FRAME = 1 << 20
+RECONNECT_DELAYS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+
+def encode(frame):
+    data = json.dumps(frame, separators=(',', ':')).encode()
+    if len(data) > MAX_FRAME:
+        raise ValueError(f"Channel layer frame of {len(data)} bytes is over {MAX_FRAME}")
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_FRAME:
+        raise ConnectionError(f"Frame of {size} bytes is over {MAX_FRAME}")
+    return json.loads(await reader.readexactly(size))
+
+
+def owner(channel):
+    """Prefix of the connection a process-specific channel belongs to, or None"""
+    return channel.split('!', 1)[0] if '!' in channel else None
+
+
+class _Peer:
+    """A worker connected to the broker, with its bounded queue of outgoing frames"""
+
+    def __init__(self, writer, outbox_size):
+        self.writer = writer
+        self.prefix = None
+        self.outbox = asyncio.Queue(maxsize=outbox_size)
+        self.task = asyncio.create_task(self._write())
+
+    def push(self, data):
+        try:
+            self.outbox.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write(self):
+        while True:
+            self.writer.write(await self.outbox.get())
+            while not self.outbox.empty():
+                self.writer.write(self.outbox.get_nowait())
+            await self.writer.drain()
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class Broker:
+    """Holds the groups and forwards messages between the connected workers"""
+
+    def __init__(self, path=DEFAULT_PATH, outbox_size=1000, group_expiry=86400):
+        self.path = path
+        self.outbox_size = outbox_size
+        self.group_expiry = group_expiry
+        self.peers = {}
+        self.groups = defaultdict(dict)
+        self.delivered = 0
+        self.dropped = 0
+        self.server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Left behind by a broker that did not shut down cleanly
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+        os.chmod(self.path, 0o660)
+        logger.debug("Channel broker listening on %s", self.path)
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for peer in list(self.peers.values()):
+                peer.close()
+            await self.server.wait_closed()
+            self.server = None
+            self.peers.clear()
+
+    async def _serve(self, reader, writer):
+        peer = _Peer(writer, self.outbox_size)
+        try:
+            hello = await read_frame(reader)
+            peer.prefix = hello['prefix']
+            self.peers[peer.prefix] = peer
+            while True:
+                self.handle(await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, KeyError):
+            pass
+        except asyncio.CancelledError:
+            # Shutting down; nobody awaits this task
+            pass
+        finally:
+            if peer.prefix is not None and self.peers.get(peer.prefix) is peer:
+                del self.peers[peer.prefix]
+                self._forget(peer.prefix)
+            peer.close()
+
+    def handle(self, frame):
+        op = frame['op']
+        if op == 'send':
+            self.route([frame['channel']], frame['message'])
+        elif op == 'group_send':
+            self.route(self._members(frame['group']), frame['message'])
+        elif op == 'group_add':
+            self.groups[frame['group']][frame['channel']] = time.time()
+        elif op == 'group_discard':
+            members = self.groups.get(frame['group'])
+            if members is not None:
+                members.pop(frame['channel'], None)
+                if not members:
+                    del self.groups[frame['group']]
+        elif op == 'flush':
+            self.groups.clear()
+
+    def _members(self, group):
+        members = self.groups.get(group)
+        if not members:
+            return []
+        expired = time.time() - self.group_expiry
+        for channel, joined in list(members.items()):
+            if joined < expired:
+                del members[channel]
+        return list(members)
+
+    def route(self, channels, message):
+        """One frame per worker with the names of its channels that get ``message``"""
+        by_peer = defaultdict(list)
+        for channel in channels:
+            by_peer[owner(channel)].append(channel)
+        for prefix, names in by_peer.items():
+            peer = self.peers.get(prefix)
+            if peer is not None and peer.push(encode({'op': 'deliver', 'channels': names, 'message': message})):
+                self.delivered += len(names)
+            else:
+                self.dropped += len(names)
+                logger.debug("Dropped a message for %s channels of %s", len(names), prefix)
+
+    def _forget(self, prefix):
+        for group, members in list(self.groups.items()):
+            for channel in [channel for channel in members if owner(channel) == prefix]:
+                del members[channel]
+            if not members:
+                del self.groups[group]
+
+
+class _Link:
+    """A worker's connection to the broker from one event loop"""
+
+    def __init__(self, layer, prefix):
+        self.layer = layer
+        self.prefix = prefix
+        self.memberships = set()
+        self.reader = self.writer = self.task = None
+        self.closed = False
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.layer.path)
+        self.writer.write(encode({'op': 'hello', 'prefix': self.prefix}))
+        for group, channel in self.memberships:
+            self.writer.write(encode({'op': 'group_add', 'group': group, 'channel': channel}))
+        await self.writer.drain()
+
+    async def start(self):
+        await self.connect()
+        self.task = asyncio.create_task(self._read())
+
+    async def write(self, frame):
+        self.writer.write(encode(frame))
+        # Waits while the broker is behind on reading
+        await self.writer.drain()
+
+    async def _read(self):
+        while not self.closed:
+            try:
+                frame = await read_frame(self.reader)
+            except (asyncio.IncompleteReadError, OSError):
+                if not self.closed:
+                    await self._reconnect()
+                continue
+            if frame.get('op') == 'deliver':
+                now = time.time()
+                for channel in frame['channels']:
+                    self.layer.deliver(channel, frame['message'], now)
+
+    async def _reconnect(self):
+        logger.warning("Lost the channel broker at %s; reconnecting", self.layer.path)
+        for delay in itertools.chain(RECONNECT_DELAYS, itertools.repeat(RECONNECT_DELAYS[-1])):
+            await asyncio.sleep(delay)
+            if self.closed:
+                return
+            try:
+                await self.connect()
+            except OSError:
+                continue
+            logger.info("Reconnected to the channel broker")
+            return
+
+    async def close(self):
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    def abandon(self):
+        """Shut the connection of a closed event loop, which can no longer run ``close``"""
+        self.closed = True
+        sock = self.writer.get_extra_info('socket') if self.writer is not None else None
+        if sock is not None:
+            try:
+                # The broker sees the end of the stream and forgets this prefix;
+                # the descriptor goes with the transport
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class BrokerChannelLayer(BaseChannelLayer):
+    """Channel layer that shares groups between processes through ``Broker``"""
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=DEFAULT_PATH, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = path
+        self.group_expiry = group_expiry
+        self.prefix = f"broker.{uuid.uuid4().hex[:12]}"
+        self.channels = {}
+        self.dropped = 0
+        self._links = {}
+        self._locks = {}
+        # Channel -> number of receive calls waiting on it
+        self._receiving = defaultdict(int)
+        # Channel -> when its queue was last created or left without a receiver
+        self._idle_since = {}
+        self._swept = time.time()
+
+    async def _link(self):
+        """This event loop's connection, opened on first use"""
+        loop = asyncio.get_running_loop()
+        link = self._links.get(loop)
+        if link is not None and not link.closed:
+            return link
+        lock = self._locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            link = self._links.get(loop)
+            if link is None or link.closed:
+                self._abandon_closed_loops()
+                link = _Link(self, f"{self.prefix}-{len(self._links)}-{id(loop):x}")
+                await link.start()
+                self._links[loop] = link
+        return link
+
+    def _abandon_closed_loops(self):
+        for loop in [loop for loop in self._links if loop.is_closed()]:
+            link = self._links.pop(loop)
+            self._locks.pop(loop, None)
+            link.abandon()
+            # Their queues belong to the closed loop and nothing can receive from them
+            for channel in [channel for channel in self.channels if owner(channel) == link.prefix]:
+                self._drop(channel)
+
+    def _local(self, channel):
+        prefix = owner(channel)
+        return prefix is not None and any(link.prefix == prefix for link in self._links.values())
+
+    def _owning_link(self, channel):
+        prefix = owner(channel)
+        for link in self._links.values():
+            if link.prefix == prefix:
+                return link
+        return None
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+            self._idle_since[channel] = time.time()
+        return queue
+
+    def _drop(self, channel):
+        self.channels.pop(channel, None)
+        self._idle_since.pop(channel, None)
+
+    def _in_groups(self, channel):
+        link = self._owning_link(channel)
+        return link is not None and any(member == channel for _, member in link.memberships)
+
+    @staticmethod
+    def _remove_expired(queue, now):
+        kept = []
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item[0] >= now:
+                kept.append(item)
+        for item in kept:
+            queue.put_nowait(item)
+
+    def _sweep(self, now):
+        """Drop queues that nobody has received from for ``expiry`` seconds and that hold nothing current"""
+        self._swept = now
+        for channel, queue in list(self.channels.items()):
+            if self._receiving.get(channel) or self._idle_since.get(channel, now) > now - self.expiry:
+                continue
+            self._remove_expired(queue, now)
+            if queue.empty():
+                self._drop(channel)
+
+    def deliver(self, channel, message, now=None):
+        """Put a message that came through the broker on a local channel"""
+        now = time.time() if now is None else now
+        if now - self._swept > self.expiry:
+            self._sweep(now)
+        queue = self.channels.get(channel)
+        if queue is None:
+            # Its consumer has gone
+            self.dropped += 1
+            logger.debug("Channel %s has no consumer; dropped a message", channel)
+            return
+        if queue.full():
+            self._remove_expired(queue, now)
+        try:
+            queue.put_nowait((now + self.expiry, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.debug("Channel %s is full; dropped a message", channel)
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        if self._local(channel):
+            queue = self.channels.get(channel)
+            if queue is None:
+                # Its consumer has gone
+                return
+            try:
+                queue.put_nowait((time.time() + self.expiry, message))
+            except asyncio.QueueFull:
+                raise ChannelFull(channel)
+            return
+        link = await self._link()
+        await link.write({'op': 'send', 'channel': channel, 'message': message})
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        queue = self._queue(channel)
+        self._receiving[channel] += 1
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        except asyncio.CancelledError:
+            # The consumer has gone; a message still queued is left to the sweep
+            if self._receiving[channel] == 1 and queue.empty() and self.channels.get(channel) is queue:
+                self._drop(channel)
+            raise
+        finally:
+            self._receiving[channel] -= 1
+            if not self._receiving[channel]:
+                del self._receiving[channel]
+                if channel in self._idle_since:
+                    self._idle_since[channel] = time.time()
+
+    async def new_channel(self, prefix='specific.'):
+        link = await self._link()
+        channel = f"{link.prefix}!{prefix}{''.join(random.choices(string.ascii_letters, k=12))}"
+        self._queue(channel)
+        return channel
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        owning = self._owning_link(channel)
+        if owning is not None:
+            owning.memberships.add((group, channel))
+        link = await self._link()
+        await link.write({'op': 'group_add', 'group': group, 'channel': channel})
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        owning = self._owning_link(channel)
+        if owning is not None:
+            owning.memberships.discard((group, channel))
+            queue = self.channels.get(channel)
+            if (queue is not None and queue.empty() and not self._receiving.get(channel)
+                    and not self._in_groups(channel)):
+                self._drop(channel)
+        link = await self._link()
+        await link.write({'op': 'group_discard', 'group': group, 'channel': channel})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        link = await self._link()
+        await link.write({'op': 'group_send', 'group': group, 'message': message})
+
+    async def flush(self):
+        self.channels = {}
+        self._idle_since = {}
+        for link in self._links.values():
+            link.memberships.clear()
+        link = await self._link()
+        await link.write({'op': 'flush'})
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        link = self._links.pop(loop, None)
+        self._locks.pop(loop, None)
+        if link is not None:
+            await link.close()
+            for channel in [channel for channel in self.channels if owner(channel) == link.prefix]:
+                self._drop(channel)
+        self._abandon_closed_loops()
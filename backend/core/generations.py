@@ -0,0 +1,69 @@
+"""
+Generation tokens for cached, branch-scoped report data.
+
+A cached result is stored under a key that embeds the current token of the
+namespace for its branch (or for "all branches") plus the namespace's global
+token. ``invalidate`` replaces those tokens once the current transaction
+commits, so stale entries are simply never read again and expire on their own.
+Invalidations are collected per thread and written with one ``set_many`` per
+commit however many rows the transaction touched.
+
+Writes that cannot tell which branch they affect invalidate the global token,
+which every key of the namespace depends on.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL = 'global'
+ALL_BRANCHES = 'all'
+
+_local = threading.local()
+
+
+def _token_key(namespace, scope):
+    return f'gen:{namespace}:{scope}'
+
+
+def current_token(namespace, branch_id=None):
+    """Token to embed in cache keys of ``namespace`` for ``branch_id`` (None: all branches)"""
+    scopes = [GLOBAL, branch_id if branch_id is not None else ALL_BRANCHES]
+    keys = [_token_key(namespace, scope) for scope in scopes]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            # Never set or evicted: start a fresh generation rather than reuse an old one
+            cache.add(key, time.time_ns(), None)
+            tokens[key] = cache.get(key)
+    return '-'.join(str(tokens[key]) for key in keys)
+
+
+def _pending():
+    if not hasattr(_local, 'scopes'):
+        _local.scopes = set()
+    return _local.scopes
+
+
+def invalidate(namespace, branch_id=None):
+    """Drop the cached data of ``namespace`` for ``branch_id`` (every branch if None) on commit"""
+    _pending().add((namespace, branch_id))
+    transaction.on_commit(flush_invalidations)
+
+
+def flush_invalidations():
+    pending = _pending()
+    if not pending:
+        return
+    scopes = set(pending)
+    pending.clear()
+    token = time.time_ns()
+    keys = {}
+    for namespace, branch_id in scopes:
+        if branch_id is None:
+            keys[_token_key(namespace, GLOBAL)] = token
+        else:
+            keys[_token_key(namespace, branch_id)] = token
+            keys[_token_key(namespace, ALL_BRANCHES)] = token
+    cache.set_many(keys, None)
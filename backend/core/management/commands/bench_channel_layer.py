@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.channel_broker import Broker, BrokerChannelLayer
+
+GROUP = 'bench'
+IDLE_TIMEOUT = 2
+
+
+def run_broker(path, outbox_size, stop, results):
+    async def serve():
+        broker = await Broker(path, outbox_size=outbox_size).start()
+        results.put(('broker', None))
+        while not stop.is_set():
+            await asyncio.sleep(0.05)
+        results.put(('broker', {'delivered': broker.delivered, 'dropped': broker.dropped}))
+        await broker.close()
+
+    asyncio.run(serve())
+
+
+def run_worker(path, consumers, capacity, results):
+    last = [time.time()]
+    received = [0]
+
+    async def consume(layer, channel, latencies):
+        while True:
+            message = await layer.receive(channel)
+            if message['type'] == 'bench.stop':
+                return
+            last[0] = time.time()
+            latencies.append(last[0] - message['sent'])
+            received[0] += 1
+
+    async def watch(consuming):
+        # The stop message may be dropped along with others
+        while not consuming.done() and time.time() - last[0] < IDLE_TIMEOUT:
+            await asyncio.sleep(0.1)
+        consuming.cancel()
+
+    async def work():
+        layer = BrokerChannelLayer(path, capacity=capacity)
+        channels = [await layer.new_channel() for _ in range(consumers)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        # group_add is fire-and-forget; a direct message back through the broker
+        # confirms the memberships before the publisher starts
+        await layer.send(channels[0], {'type': 'bench.ready'})
+        await layer.receive(channels[0])
+        results.put(('ready', os.getpid()))
+        latencies = []
+        consuming = asyncio.gather(*(consume(layer, channel, latencies) for channel in channels))
+        watcher = asyncio.create_task(watch(consuming))
+        try:
+            await consuming
+        except asyncio.CancelledError:
+            pass
+        await watcher
+        results.put(('worker', {
+            'received': received[0], 'latencies': latencies, 'dropped': layer.dropped, 'last': last[0],
+        }))
+        await layer.close()
+
+    asyncio.run(work())
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure group_send throughput and delivery latency of the broker channel layer '
+        'with consumers spread over several worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+        parser.add_argument('--consumers', type=int, default=25, help='Group members per worker')
+        parser.add_argument('--messages', type=int, default=2000, help='Messages sent to the group')
+        parser.add_argument('--rate', type=int, default=0,
+                            help='Messages per second to publish at (default: as fast as possible)')
+        parser.add_argument('--capacity', type=int, default=1000, help='Per-channel capacity in the workers')
+        parser.add_argument('--outbox-size', type=int, default=1000, help='Broker outbox size per worker')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        path = os.path.join(tempfile.mkdtemp(), 'bench.sock')
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        stop = context.Event()
+
+        broker = context.Process(target=run_broker, args=(path, options['outbox_size'], stop, results))
+        broker.start()
+        self.expect(results, 'broker', 1)
+        processes = [
+            context.Process(target=run_worker, args=(path, options['consumers'], options['capacity'], results))
+            for _ in range(workers)
+        ]
+        try:
+            for process in processes:
+                process.start()
+            self.expect(results, 'ready', workers)
+
+            total = options['messages']
+            started, elapsed = asyncio.run(self.publish(path, total, options['rate']))
+            reports = self.expect(results, 'worker', workers, timeout=60)
+            stop.set()
+            (broker_stats,) = self.expect(results, 'broker', 1)
+        finally:
+            stop.set()
+            for process in [*processes, broker]:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+
+        latencies = sorted(latency for report in reports for latency in report['latencies'])
+        received = sum(report['received'] for report in reports)
+        expected = total * workers * options['consumers']
+        self.stdout.write(
+            f"{workers} workers x {options['consumers']} consumers, {total} group messages in {elapsed:.2f}s"
+        )
+        self.stdout.write(f"   publish: {total / elapsed:.0f} messages/s")
+        # Until the last consumer got its last message
+        window = max(report['last'] for report in reports) - started
+        self.stdout.write(
+            f"  delivery: {received}/{expected} received in {window:.2f}s ({received / window:.0f} deliveries/s)"
+        )
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"   latency: p50 {quantiles[49] * 1000:.1f}ms, p95 {quantiles[94] * 1000:.1f}ms, "
+                f"p99 {quantiles[98] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms"
+            )
+        self.stdout.write(
+            f"   dropped: {broker_stats['dropped']} by the broker, "
+            f"{sum(report['dropped'] for report in reports)} by full channels"
+        )
+
+    async def publish(self, path, total, rate):
+        layer = BrokerChannelLayer(path)
+        started, clock = time.time(), time.perf_counter()
+        for i in range(total):
+            if rate:
+                ahead = clock + i / rate - time.perf_counter()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            await layer.group_send(GROUP, {'type': 'bench.message', 'seq': i, 'sent': time.time()})
+        elapsed = time.perf_counter() - clock
+        await layer.group_send(GROUP, {'type': 'bench.stop'})
+        await layer.close()
+        return started, elapsed
+
+    def expect(self, results, kind, count, timeout=10):
+        payloads = []
+        while len(payloads) < count:
+            try:
+                got, payload = results.get(timeout=timeout)
+            except queue.Empty:
+                raise CommandError(f"Timed out waiting for {kind} ({len(payloads)}/{count})")
+            if got != kind:
+                raise CommandError(f"Expected {kind}, got {got}")
+            payloads.append(payload)
+        return payloads
@@ -0,0 +1,143 @@
+import logging
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from branches.models import Branch, Table
+from orders.models import Order, OrderItem
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare request latency of the order hot paths with tracing off against '
+        'full DEBUG output (the old print() behaviour, debug-only queries included).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50, help='Open orders in the benchmark branch')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+        parser.add_argument('--to-stdout', action='store_true',
+                            help='Write trace output to stdout like print() did (default: discard it)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+                self.create_fixtures(options['orders'])
+                results = self.run(('off', 'print'))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'endpoint':<22}{'mode':<8}{'p50 ms':>9}{'p95 ms':>9}{'queries':>9}")
+        for name in results['off']:
+            for mode in ('off', 'print'):
+                timings, queries = results[mode][name]
+                self.stdout.write(
+                    f"{name:<22}{mode:<8}{statistics.median(timings):>9.2f}"
+                    f"{self.percentile(timings, 95):>9.2f}{queries:>9.1f}"
+                )
+        off = sum(sum(t) for t, _ in results['off'].values())
+        traced = sum(sum(t) for t, _ in results['print'].values())
+        self.stdout.write(self.style.SUCCESS(f"Total time: tracing off {off:.0f}ms, print-style {traced:.0f}ms"))
+
+    def create_fixtures(self, count):
+        branch = Branch.objects.create(name='Tracing benchmark')
+        table = Table.objects.create(number=1, branch=branch)
+        self.users = {
+            role: User.objects.create_user(username=f'bench_tracing_{role}', password='x', role=role, branch=branch)
+            for role in ('cashier', 'meat', 'bartender')
+        }
+        self.items = []
+        for number in range(count):
+            order = Order.objects.create(order_number=f'bench-tracing-{number}', branch=branch, table=table)
+            for item_type in ('food', 'meat', 'beverage'):
+                self.items.append(OrderItem.objects.create(
+                    order=order, name=item_type, price=Decimal('10.00'), item_type=item_type
+                ))
+
+    def requests(self):
+        def accept_and_revert(client, index):
+            # Two PATCHes per sample so every mode sees the same item states
+            url = f'/api/orders/order-item/{self.items[index % len(self.items)].pk}/update-status/'
+            response = client.patch(url, {'status': 'accepted'}, format='json')
+            if response.status_code >= 400:
+                return response
+            return client.patch(url, {'status': 'pending'}, format='json')
+
+        return [
+            ('order list (cashier)', 'cashier', lambda client, i: client.get('/api/orders/order-list/')),
+            ('kitchen queue', 'meat', lambda client, i: client.get('/api/orders/food/')),
+            ('bar queue', 'bartender', lambda client, i: client.get('/api/orders/beverages/')),
+            ('item accept + revert', 'meat', accept_and_revert),
+        ]
+
+    def configure(self, mode):
+        level = logging.DEBUG if mode == 'print' else logging.INFO
+        for app in settings.LOCAL_APPS:
+            logger = logging.getLogger(app)
+            logger.handlers = [self.handler]
+            logger.setLevel(level)
+            logger.propagate = False
+
+    def run(self, modes):
+        """Time every endpoint, alternating the modes request by request"""
+        loggers = [logging.getLogger(app) for app in settings.LOCAL_APPS]
+        saved = [(logger.handlers, logger.level, logger.propagate) for logger in loggers]
+        stream = sys.stdout if self.options['to_stdout'] else open(os.devnull, 'w')
+        self.handler = logging.StreamHandler(stream)
+        try:
+            return self.time_requests(modes)
+        finally:
+            # Leave the app loggers as settings.LOGGING configured them
+            for logger, (handlers, level, propagate) in zip(loggers, saved):
+                logger.handlers, logger.propagate = handlers, propagate
+                logger.setLevel(level)
+            if stream is not sys.stdout:
+                stream.close()
+
+    def time_requests(self, modes):
+        clients = {}
+        for role, user in self.users.items():
+            clients[role] = APIClient()
+            clients[role].force_authenticate(user)
+
+        results = {mode: {} for mode in modes}
+        for name, role, send in self.requests():
+            client = clients[role]
+            send(client, 0)  # warm up
+            timings = {mode: [] for mode in modes}
+            queries = {mode: 0 for mode in modes}
+            for index in range(self.options['requests']):
+                for mode in modes:
+                    self.configure(mode)
+                    connection.queries_log.clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = send(client, index)
+                        timings[mode].append((time.perf_counter() - started) * 1000)
+                    queries[mode] += len(captured)
+                    if response.status_code >= 400:
+                        raise CommandError(f"{name} failed with {response.status_code}: {response.content[:200]}")
+            for mode in modes:
+                results[mode][name] = (timings[mode], queries[mode] / len(timings[mode]))
+        return results
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,39 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.channel_broker import Broker
+
+
+class Command(BaseCommand):
+    help = 'Run the broker that shares channel layer groups between ASGI worker processes (CHANNEL_LAYER=broker).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.CHANNEL_BROKER_PATH, help='Unix socket to listen on')
+        parser.add_argument('--outbox-size', type=int, default=1000,
+                            help='Frames queued per worker before further messages to it are dropped')
+        parser.add_argument('--group-expiry', type=int, default=86400, help='Seconds a group membership lasts')
+        parser.add_argument('--stats-interval', type=int, default=60,
+                            help='Seconds between delivery statistics lines (0 to disable)')
+
+    def handle(self, *args, **options):
+        broker = Broker(options['path'], outbox_size=options['outbox_size'], group_expiry=options['group_expiry'])
+        try:
+            asyncio.run(self.serve(broker, options['stats_interval']))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, broker, interval):
+        await broker.start()
+        self.stdout.write(f"Channel broker listening on {broker.path}")
+        try:
+            while True:
+                await asyncio.sleep(interval or 3600)
+                if interval:
+                    self.stdout.write(
+                        f"{len(broker.peers)} workers, {len(broker.groups)} groups, "
+                        f"{broker.delivered} delivered, {broker.dropped} dropped"
+                    )
+        finally:
+            await broker.close()
@@ -1,6 +1,12 @@
 from django.middleware.csrf import get_token
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
+import logging
+import time
+from django.conf import settings
+from .query_budget import QueryRecorder, endpoint_report
+
+logger = logging.getLogger(__name__)
 
 class CSRFMiddleware(MiddlewareMixin):
     """
@@ -22,7 +28,7 @@ class CSRFMiddleware(MiddlewareMixin):
                     path='/',
                     domain=None
                 )
-                print(f"[DEBUG] CSRF cookie set by middleware: {csrf_token[:10]}...")
+                logger.debug("CSRF cookie set by middleware: %s...", csrf_token[:10])
         return response
 
 class CORSMiddleware(MiddlewareMixin):
@@ -51,10 +57,10 @@ class CORSMiddleware(MiddlewareMixin):
         
         # Debug logging for network access
         if origin and 'localhost' not in origin and '127.0.0.1' not in origin:
-            print(f"[DEBUG] CORS middleware: Network origin detected: {origin}")
-            print(f"[DEBUG] CORS middleware: Setting Access-Control-Allow-Origin: {origin}")
-            print(f"[DEBUG] CORS middleware: Access-Control-Allow-Credentials: true")
-            print(f"[DEBUG] CORS middleware: Access-Control-Expose-Headers: {response['Access-Control-Expose-Headers']}")
+            logger.debug("CORS middleware: Network origin detected: %s", origin)
+            logger.debug("CORS middleware: Setting Access-Control-Allow-Origin: %s", origin)
+            logger.debug("CORS middleware: Access-Control-Allow-Credentials: true")
+            logger.debug("CORS middleware: Access-Control-Expose-Headers: %s", response['Access-Control-Expose-Headers'])
         
         return response
 
@@ -72,6 +78,41 @@ class SessionMiddleware(MiddlewareMixin):
         if hasattr(request, 'session') and request.session.session_key:
             if request.user and request.user.is_authenticated:
                 request.session.save()
-                print(f"[DEBUG] SessionMiddleware: Saved session for user {request.user.username}")
+                logger.debug("SessionMiddleware: Saved session for user %s", request.user.username)
         
-        return response 
\ No newline at end of file
+        return response
+
+
+UNROUTED = 'unrouted'
+
+
+class QueryBudgetMiddleware:
+    """
+    Record SQL count, DB time and duplicate queries for every request (see
+    core/query_budget.py). Adds X-DB-* headers when QUERY_BUDGET_HEADERS is on
+    and warns when an endpoint goes over its entry in QUERY_BUDGETS.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Paths that resolve to no view (404s, scanners) share one bucket, so
+        # the report has one row per route however many URLs are requested
+        name = (match.view_name or match.route) if match else UNROUTED
+        endpoint_report.record(name, latency, recorder)
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(name)
+        if budget is not None and recorder.count > budget:
+            logger.warning("%s ran %s queries (budget %s), %s duplicated", name, recorder.count, budget, recorder.duplicate_count)
+
+        if getattr(settings, 'QUERY_BUDGET_HEADERS', settings.DEBUG):
+            response['X-DB-Queries'] = str(recorder.count)
+            response['X-DB-Time-ms'] = f"{recorder.db_time * 1000:.2f}"
+            response['X-DB-Duplicate-Queries'] = str(recorder.duplicate_count)
+        return response
@@ -0,0 +1,128 @@
+"""
+Per-request SQL instrumentation.
+
+``QueryRecorder`` hooks into a database connection with
+``connection.execute_wrapper`` (so it works with DEBUG off) and records the
+number of queries, the time spent in the database and a fingerprint of every
+statement. Fingerprints replace literals and parameter lists with ``?``, so the
+same query run once per row of a loop (an N+1) shows up as a duplicate.
+
+``QueryBudgetMiddleware`` (core/middleware.py) records every request, adds the
+numbers as ``X-DB-*`` response headers when ``QUERY_BUDGET_HEADERS`` is on and
+feeds ``endpoint_report``, a rolling per-URL-name window of latency and query
+counts. Tests use core/testing.py to hold endpoints to a query budget.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from django.db import connections
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """Normalise ``sql`` so repeats of one statement with different values compare equal"""
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryRecorder:
+    """Context manager collecting the queries run on ``using`` connections"""
+
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self._contexts = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def __enter__(self):
+        for alias in self.aliases:
+            context = connections[alias].execute_wrapper(self)
+            context.__enter__()
+            self._contexts.append(context)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._contexts:
+            self._contexts.pop().__exit__(*exc_info)
+        return False
+
+    @property
+    def duplicates(self):
+        """Fingerprints run more than once, most repeated first"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    @property
+    def duplicate_count(self):
+        """Queries that repeat an earlier statement of the same request"""
+        return sum(count - 1 for _, count in self.duplicates)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class EndpointReport:
+    """Rolling window of the last ``window`` requests per URL name"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, recorder):
+        sample = (latency, recorder.count, recorder.db_time, recorder.duplicate_count)
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(sample)
+
+    def summary(self):
+        """Per endpoint stats, worst p95 latency first (times in milliseconds)"""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        rows = []
+        for name, samples in snapshot.items():
+            latencies = [s[0] * 1000 for s in samples]
+            queries = [s[1] for s in samples]
+            rows.append({
+                'endpoint': name,
+                'requests': len(samples),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'queries_avg': round(sum(queries) / len(queries), 1),
+                'queries_max': max(queries),
+                'db_ms_avg': round(sum(s[2] for s in samples) * 1000 / len(samples), 2),
+                'duplicates_avg': round(sum(s[3] for s in samples) / len(samples), 1),
+            })
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+endpoint_report = EndpointReport()
@@ -0,0 +1,323 @@
+"""
+Realtime events for the dashboards.
+
+Screens subscribe to the stations of their branch (``NotificationConsumer``
+in kebede_pos/consumers.py) and receive typed JSON events carrying the
+changed rows, so they can patch their state in place instead of refetching
+the order list::
+
+    {"event": "item_status_changed", "branch": 3, "station": "beverage",
+     "at": "2026-10-17T12:00:00+00:00", "data": {...}}
+
+Each (branch, station) pair is its own channel layer group, so a bar screen
+in one branch never wakes up for the kitchen or for another branch. The
+payloads are built when the event is published and must be JSON
+serialisable (the broker channel layer sends JSON).
+
+``publish`` never talks to the channel layer itself. An event is handed on
+only once the transaction that produced it commits, so screens never hear
+about rolled back work. Inside ``realtime_batch`` (every request goes through
+one, see ``RealtimeEventMiddleware``) committed events are collected and
+dispatched together when the block exits; events published with the same
+``key`` for the same group replace each other, so a request that touches an
+item five times sends one update. With ``REALTIME_DISPATCH = 'background'``
+the batch goes to a dispatcher thread that sends it from its own event loop,
+and the request never waits on the broker; with ``'sync'`` the request sends
+it after commit. Events still queued when the process dies are lost.
+
+Each message is numbered within its group and kept in a bounded replay
+buffer (core/replay.py) before it is sent, so a screen that reconnects
+receives what it missed (when the cache is shared by every worker).
+
+``metrics`` keeps the queue depth, counts and the latency from commit to
+send (``/api/debug/realtime/``).
+"""
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import replay
+from .query_budget import percentile
+
+logger = logging.getLogger(__name__)
+
+# food and beverage are the kitchen and bar queues (orders/queues.py); floor
+# is the waiters, manager gets the stock alerts
+STATIONS = ('food', 'beverage', 'cashier', 'floor', 'manager')
+
+ROLE_STATIONS = {
+    'bartender': ('beverage',),
+    'meat': ('food',),
+    'cashier': ('cashier',),
+    'waiter': ('floor',),
+    'manager': STATIONS,
+    'owner': STATIONS,
+}
+
+# What the consumer hands to the socket; see NotificationConsumer.realtime_event
+MESSAGE_TYPE = 'realtime.event'
+
+_local = threading.local()
+_unkeyed = itertools.count()
+
+
+def group_name(branch_id, station):
+    return f"branch.{branch_id}.{station}"
+
+
+def stations_for(user):
+    if user.is_superuser:
+        return STATIONS
+    return ROLE_STATIONS.get(getattr(user, 'role', None), ())
+
+
+class _Event:
+    __slots__ = ('key', 'group', 'message', 'committed')
+
+    def __init__(self, key, group, message):
+        self.key = key
+        self.group = group
+        self.message = message
+        self.committed = None
+
+
+class Metrics:
+    """Dispatch counters and the commit-to-send latency of the last ``window`` events"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queued = self.max_queued = self.sent = self.coalesced = self.failed = 0
+            self._latencies.clear()
+
+    def enqueue(self, count):
+        with self._lock:
+            self.queued += count
+            self.max_queued = max(self.max_queued, self.queued)
+
+    def dequeue(self, count):
+        with self._lock:
+            self.queued -= count
+
+    def record(self, sent, failed, latencies):
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+            self._latencies.extend(latencies)
+
+    def add_coalesced(self, count):
+        with self._lock:
+            self.coalesced += count
+
+    def summary(self):
+        """Counts and latencies in milliseconds"""
+        with self._lock:
+            latencies = [latency * 1000 for latency in self._latencies]
+            return {
+                'queue_depth': self.queued,
+                'max_queue_depth': self.max_queued,
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'failed': self.failed,
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'max_ms': round(max(latencies), 2) if latencies else 0,
+            }
+
+
+metrics = Metrics()
+
+
+class _Outbox:
+    def __init__(self, background):
+        self.background = background
+        self.events = {}
+
+    def add(self, event):
+        event.committed = time.perf_counter()
+        slot = (event.group, event.key)
+        if self.events.pop(slot, None) is not None:
+            metrics.add_coalesced(1)
+        # The replacement goes last, after whatever was published in between
+        self.events[slot] = event
+
+    def flush(self):
+        events, self.events = list(self.events.values()), {}
+        if events:
+            dispatch(events, self.background)
+
+
+def _outboxes():
+    if not hasattr(_local, 'outboxes'):
+        _local.outboxes = []
+    return _local.outboxes
+
+
+def publish(event, branch_id, stations, data, key=None):
+    """
+    Send ``event`` with ``data`` to ``stations`` of ``branch_id`` once the
+    transaction commits. A later event of the same type and ``key`` (usually
+    the id of the changed row) to the same group in the same batch replaces it.
+    """
+    if branch_id is None:
+        return
+    message = {
+        'type': MESSAGE_TYPE,
+        'event': event,
+        'branch': branch_id,
+        'at': timezone.now().isoformat(),
+        'data': data,
+    }
+    outboxes = _outboxes()
+    for station in dict.fromkeys(stations):
+        queued = _Event((event, key if key is not None else next(_unkeyed)), group_name(branch_id, station),
+                        {**message, 'station': station})
+        if outboxes:
+            transaction.on_commit(partial(outboxes[-1].add, queued))
+        else:
+            transaction.on_commit(partial(_dispatch_one, queued))
+
+
+def _dispatch_one(event):
+    event.committed = time.perf_counter()
+    dispatch([event])
+
+
+def dispatch(events, background=None):
+    if background is None:
+        background = getattr(settings, 'REALTIME_DISPATCH', 'background') == 'background'
+    metrics.enqueue(len(events))
+    if background:
+        _dispatcher().put(events)
+    else:
+        async_to_sync(_send)(events)
+
+
+def _coalesce(events):
+    latest = {}
+    for event in events:
+        latest.pop((event.group, event.key), None)
+        latest[(event.group, event.key)] = event
+    if len(latest) < len(events):
+        metrics.add_coalesced(len(events) - len(latest))
+    return list(latest.values())
+
+
+async def _send(events):
+    queued = len(events)
+    events = _coalesce(events)
+    try:
+        # Numbered in send order, so a reconnecting screen can ask for what it missed
+        replay.record([(event.group, event.message) for event in events])
+    except Exception as e:
+        logger.error("Failed to buffer %s realtime events for replay: %s", len(events), e)
+    try:
+        layer = get_channel_layer()
+        results = await asyncio.gather(
+            *(layer.group_send(event.group, event.message) for event in events), return_exceptions=True
+        )
+    except Exception as e:
+        results = [e] * len(events)
+    finally:
+        metrics.dequeue(queued)
+    now = time.perf_counter()
+    failed = 0
+    for event, result in zip(events, results):
+        if isinstance(result, Exception):
+            failed += 1
+            logger.error("Failed to send %s to %s: %s", event.message['event'], event.group, result)
+    metrics.record(len(events) - failed, failed, [now - event.committed for event in events if event.committed])
+
+
+@contextmanager
+def realtime_batch(background=None):
+    """
+    Collect the events published in the block and dispatch the committed ones
+    together when it exits (through the dispatcher thread when
+    ``background``), or when the transaction still open then commits.
+    """
+    outboxes = _outboxes()
+    if background is None and outboxes:
+        background = outboxes[-1].background
+    outbox = _Outbox(background)
+    outboxes.append(outbox)
+    try:
+        yield outbox
+    finally:
+        outboxes.remove(outbox)
+        # Registered after the events' own commit hooks, so it runs after them
+        transaction.on_commit(outbox.flush)
+
+
+class RealtimeEventMiddleware:
+    """Dispatch each request's realtime events in one batch when it finishes"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with realtime_batch():
+            return self.get_response(request)
+
+
+class _Dispatcher(threading.Thread):
+    def __init__(self):
+        super().__init__(name='realtime-dispatcher', daemon=True)
+        self.queue = queue.Queue()
+
+    def put(self, events):
+        self.queue.put(events)
+
+    def run(self):
+        # One loop for the thread's lifetime, so the channel layer keeps its connections
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            batches = [self.queue.get()]
+            # Whatever queued up meanwhile goes out (and is coalesced) together
+            while True:
+                try:
+                    batches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                loop.run_until_complete(_send([event for batch in batches for event in batch]))
+            except Exception:
+                logger.exception("Dropped %s realtime events", sum(len(batch) for batch in batches))
+            finally:
+                for _ in batches:
+                    self.queue.task_done()
+
+
+_dispatcher_thread = None
+_dispatcher_lock = threading.Lock()
+
+
+def _dispatcher():
+    global _dispatcher_thread
+    with _dispatcher_lock:
+        if _dispatcher_thread is None or not _dispatcher_thread.is_alive():
+            _dispatcher_thread = _Dispatcher()
+            _dispatcher_thread.start()
+        return _dispatcher_thread
+
+
+def drain():
+    """Block until the dispatcher thread has sent everything queued so far"""
+    if _dispatcher_thread is not None:
+        _dispatcher_thread.queue.join()
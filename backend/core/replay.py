@@ -0,0 +1,104 @@
+"""
+Replay buffers for the realtime streams (core/realtime.py).
+
+Every channel layer group (one branch station) is a stream with its own
+sequence numbers. Before an event is sent it gets the next number of its
+stream and is written to the stream's ring of ``REALTIME_REPLAY_SIZE`` slots
+in the cache (slot ``seq % size``), so the buffer never grows and old events
+are overwritten. A screen that reconnects asks for the events after the last
+number it saw and gets them back in order, or ``None`` when some of them are
+gone (overwritten, expired or evicted) and it has to reload.
+
+Numbers are allocated with ``cache.incr``, so with a shared cache (Redis,
+memcached) every worker process numbers a stream in the same sequence and a
+screen can resume on any worker. Events from different workers may reach a
+screen slightly out of order; clients keep the highest number they have seen.
+A per-process cache would number each stream once per worker, and Django's
+database cache can hand the same number to two workers, so without an atomic
+shared cache (core/shared_cache.py) events go out unnumbered and every resume
+ends in a reload.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .shared_cache import counts_atomically
+
+
+def size():
+    return getattr(settings, 'REALTIME_REPLAY_SIZE', 500)
+
+
+def _sequence_key(stream):
+    return f'realtime:seq:{stream}'
+
+
+def _slot_key(stream, seq):
+    return f'realtime:slot:{stream}:{seq % size()}'
+
+
+def enabled():
+    return counts_atomically()
+
+
+def current(streams):
+    """The last number allocated in each of ``streams`` (0 if none yet)"""
+    if not enabled():
+        return {stream: 0 for stream in streams}
+    values = cache.get_many([_sequence_key(stream) for stream in streams])
+    return {stream: values.get(_sequence_key(stream), 0) for stream in streams}
+
+
+def record(stream_messages):
+    """
+    Number and buffer ``[(stream, message), ...]``, adding ``seq`` and
+    ``stream`` to each message. One ``incr`` per stream and one ``set_many``.
+    Messages are left unnumbered when replay is not ``enabled``.
+    """
+    if not enabled():
+        return
+    counts = {}
+    for stream, _ in stream_messages:
+        counts[stream] = counts.get(stream, 0) + 1
+    next_seq = {}
+    for stream, count in counts.items():
+        key = _sequence_key(stream)
+        cache.add(key, 0, None)
+        try:
+            last = cache.incr(key, count)
+        except ValueError:
+            # Evicted between add and incr; start over (clients will resync)
+            cache.set(key, count, None)
+            last = count
+        next_seq[stream] = last - count + 1
+    slots = {}
+    for stream, message in stream_messages:
+        seq = next_seq[stream]
+        next_seq[stream] += 1
+        message['stream'], message['seq'] = stream, seq
+        slots[_slot_key(stream, seq)] = message
+    cache.set_many(slots, getattr(settings, 'REALTIME_REPLAY_TTL', 3600))
+
+
+def replay(stream, after):
+    """
+    Messages of ``stream`` numbered above ``after`` in order, or ``None`` if
+    they are not all still buffered (including when ``after`` is ahead of
+    the stream, which happens when the numbers were reset). Always ``None``
+    when replay is not ``enabled``.
+    """
+    if not enabled():
+        return None
+    last = current([stream])[stream]
+    if after > last or last - after > size():
+        return None
+    if after == last:
+        return []
+    seqs = range(after + 1, last + 1)
+    found = cache.get_many([_slot_key(stream, seq) for seq in seqs])
+    messages = []
+    for seq in seqs:
+        message = found.get(_slot_key(stream, seq))
+        if message is None or message.get('seq') != seq:
+            return None
+        messages.append(message)
+    return messages
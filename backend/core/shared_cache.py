@@ -0,0 +1,40 @@
+"""
+Whether the default cache is shared by every server process.
+
+The report series (reports/dashboard.py), owner KPI snapshots
+(reports/kpis.py), conversion graphs (inventory/conversions.py), realtime
+replay buffers (core/replay.py) and the users of X-Session-Key sessions
+(core/authentication.py) are invalidated or numbered through
+``django.core.cache``, which only works when every worker sees the same cache.
+Django's default backend, ``LocMemCache``, lives inside one process: with
+several gunicorn workers the others keep serving what they cached. A
+process-local cache is therefore only used when ``LOCAL_CACHE_IS_SHARED`` says
+the server runs a single process (runserver, tests); otherwise those modules
+go to the database every time.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+# Backends whose ``incr`` is one atomic operation on the cache server
+ATOMIC_BACKENDS = ('redis', 'memcached')
+
+
+def is_shared():
+    """True when every server process reads and writes the same default cache"""
+    if isinstance(caches['default'], LocMemCache):
+        return getattr(settings, 'LOCAL_CACHE_IS_SHARED', False)
+    return True
+
+
+def counts_atomically():
+    """
+    True when ``cache.incr`` hands out each number to one caller only, across
+    processes. Django's database and file caches read and write separately, so
+    two workers may get the same number.
+    """
+    backend = caches['default']
+    if isinstance(backend, LocMemCache):
+        return is_shared()
+    module = type(backend).__module__
+    return any(name in module for name in ATOMIC_BACKENDS)
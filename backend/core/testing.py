@@ -0,0 +1,40 @@
+"""
+Query budgets for tests.
+
+Mix ``QueryBudgetMixin`` into a TestCase to fail when a request or block of
+code runs more queries than allowed. ``assertEndpointWithinBudget`` reads the
+budget of a URL name from ``settings.QUERY_BUDGETS``, the same table the
+QueryBudgetMiddleware warns against in development.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.urls import reverse
+
+from .query_budget import QueryRecorder
+
+
+class QueryBudgetMixin:
+    def _budget_failure(self, label, recorder, budget):
+        lines = [f"{label} ran {recorder.count} queries, budget is {budget}."]
+        for sql, count in recorder.duplicates[:5]:
+            lines.append(f"  {count}x {sql[:200]}")
+        return '\n'.join(lines)
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_duplicates=None, label='Block'):
+        with QueryRecorder() as recorder:
+            yield recorder
+        if recorder.count > max_queries:
+            self.fail(self._budget_failure(label, recorder, max_queries))
+        if max_duplicates is not None and recorder.duplicate_count > max_duplicates:
+            self.fail(self._budget_failure(f"{label} (duplicates)", recorder, f"{max_duplicates} duplicates"))
+
+    def assertEndpointWithinBudget(self, url_name, method='get', args=None, data=None, budget=None, **kwargs):
+        """Call ``url_name`` with ``self.client`` and check it against its query budget"""
+        if budget is None:
+            budget = settings.QUERY_BUDGETS[url_name]
+        with self.assertQueryBudget(budget, label=url_name):
+            response = getattr(self.client, method)(reverse(url_name, args=args), data, **kwargs)
+        self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+        return response
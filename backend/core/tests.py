@@ -1,3 +1,452 @@
-from django.test import TestCase
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.http import HttpResponseNotFound
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from branches.models import Branch
+from .authentication import SessionKeyAuthentication, session_users
+from .channel_broker import Broker, BrokerChannelLayer
+from .middleware import QueryBudgetMiddleware
+from . import realtime, shared_cache
+from .query_budget import EndpointReport, QueryRecorder, endpoint_report, fingerprint
+from .testing import QueryBudgetMixin
+from .tracing import span, traced, tracing_enabled
+
+
+class FingerprintTests(TestCase):
+    def test_literals_and_parameter_lists_are_normalised(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" = 12 AND "name" = \'x\''),
+            fingerprint('SELECT * FROM "t" WHERE "id" = 7 AND "name" = \'y z\''),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            'SELECT * FROM "t" WHERE "id" IN (?+)',
+        )
+
+
+class QueryRecorderTests(QueryBudgetMixin, TestCase):
+    def test_counts_queries_and_duplicates(self):
+        branch = Branch.objects.create(name='Main')
+        with QueryRecorder() as recorder:
+            for _ in range(3):
+                Branch.objects.get(pk=branch.pk)
+            Branch.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicate_count, 2)
+        self.assertGreater(recorder.db_time, 0)
+
+    def test_budget_failure_lists_duplicates(self):
+        branch = Branch.objects.create(name='Main')
+        with self.assertRaises(AssertionError) as failure:
+            with self.assertQueryBudget(1):
+                Branch.objects.get(pk=branch.pk)
+                Branch.objects.get(pk=branch.pk)
+        self.assertIn('2x', str(failure.exception))
+
+
+@override_settings(
+    MIDDLEWARE=['core.middleware.QueryBudgetMiddleware'] + [
+        m for m in settings.MIDDLEWARE if m != 'core.middleware.QueryBudgetMiddleware'
+    ],
+    QUERY_BUDGET_HEADERS=True,
+)
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        endpoint_report.reset()
+
+    def test_headers_and_report(self):
+        response = self.client.get('/api/debug/query-report/')
+        self.assertIn('X-DB-Queries', response)
+        self.assertIn('X-DB-Time-ms', response)
+        self.assertIn('X-DB-Duplicate-Queries', response)
+        summary = endpoint_report.summary()
+        self.assertEqual([row['endpoint'] for row in summary], ['query-report'])
+        self.assertEqual(summary[0]['requests'], 1)
+
+    def test_unrouted_paths_share_one_row(self):
+        middleware = QueryBudgetMiddleware(lambda request: HttpResponseNotFound())
+        for n in range(3):
+            middleware(RequestFactory().get(f'/no-such-page/{n}/'))
+        summary = endpoint_report.summary()
+        self.assertEqual([(row['endpoint'], row['requests']) for row in summary], [('unrouted', 3)])
+
+
+class EndpointReportTests(TestCase):
+    def test_window_keeps_recent_samples(self):
+        report = EndpointReport(window=3)
+        recorder = QueryRecorder()
+        for latency in (0.001, 0.002, 0.003, 0.004):
+            recorder.count += 1
+            report.record('x', latency, recorder)
+        row = report.summary()[0]
+        self.assertEqual(row['requests'], 3)
+        self.assertEqual(row['queries_max'], 4)
+        self.assertEqual(row['p50_ms'], 3.0)
+
+
+class SharedCacheTests(SimpleTestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    DATABASE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+    REDIS = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+
+    def check(self, caches, local_is_shared=False):
+        with override_settings(CACHES=caches, LOCAL_CACHE_IS_SHARED=local_is_shared):
+            return shared_cache.is_shared(), shared_cache.counts_atomically()
+
+    def test_backends(self):
+        self.assertEqual(self.check(self.LOCMEM), (False, False))
+        self.assertEqual(self.check(self.LOCMEM, local_is_shared=True), (True, True))
+        self.assertEqual(self.check(self.DATABASE), (True, False))
+        self.assertEqual(self.check(self.REDIS), (True, True))
+
+
+class BrokerChannelLayerTests(SimpleTestCase):
+    """Two layers on one broker stand in for two worker processes"""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'channels.sock')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.broker = self.start_broker()
+
+    def tearDown(self):
+        self.on_broker(self.broker.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    def on_broker(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def start_broker(self):
+        return self.on_broker(Broker(self.path, outbox_size=10).start())
+
+    def members(self, group):
+        return set(self.broker.groups.get(group, {}))
+
+    async def until(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("Timed out waiting for the broker")
+
+    def test_group_send_reaches_members_in_every_worker(self):
+        async def scenario():
+            first, second = BrokerChannelLayer(self.path), BrokerChannelLayer(self.path)
+            kitchen = [await first.new_channel(), await second.new_channel(), await second.new_channel()]
+            for layer, channel in zip((first, second, second), kitchen):
+                await layer.group_add('kitchen', channel)
+            await self.until(lambda: self.members('kitchen') == set(kitchen))
+
+            await first.group_send('kitchen', {'type': 'order.ready', 'order': 7})
+            received = [
+                await asyncio.wait_for(layer.receive(channel), 2)
+                for layer, channel in zip((first, second, second), kitchen)
+            ]
+            self.assertEqual(received, [{'type': 'order.ready', 'order': 7}] * 3)
+
+            await second.group_discard('kitchen', kitchen[1])
+            await self.until(lambda: kitchen[1] not in self.members('kitchen'))
+            await first.group_send('kitchen', {'type': 'order.ready', 'order': 8})
+            self.assertEqual((await asyncio.wait_for(second.receive(kitchen[2]), 2))['order'], 8)
+            # It left its last group with nothing waiting on it
+            self.assertNotIn(kitchen[1], second.channels)
+            await first.close()
+            await second.close()
+
+        async_to_sync(scenario)()
+
+    def test_send_to_a_channel_of_another_worker(self):
+        async def scenario():
+            first, second = BrokerChannelLayer(self.path), BrokerChannelLayer(self.path)
+            channel = await second.new_channel()
+            await first.send(channel, {'type': 'hello'})
+            self.assertEqual(await asyncio.wait_for(second.receive(channel), 2), {'type': 'hello'})
+            await first.close()
+            await second.close()
+
+        async_to_sync(scenario)()
+
+    def test_full_channels_drop_group_messages(self):
+        async def scenario():
+            sender, slow = BrokerChannelLayer(self.path), BrokerChannelLayer(self.path, capacity=2)
+            channel = await slow.new_channel()
+            await slow.group_add('bar', channel)
+            await self.until(lambda: self.members('bar') == {channel})
+            for i in range(5):
+                await sender.group_send('bar', {'type': 'drink.ready', 'n': i})
+            await self.until(lambda: slow.dropped == 3)
+            self.assertEqual([(await slow.receive(channel))['n'] for _ in range(2)], [0, 1])
+            await sender.close()
+            await slow.close()
+
+        async_to_sync(scenario)()
+
+    def test_queues_go_with_their_consumer(self):
+        async def scenario():
+            sender, worker = BrokerChannelLayer(self.path), BrokerChannelLayer(self.path)
+            gone, idle, live = [await worker.new_channel() for _ in range(3)]
+            await worker.group_add('floor', gone)
+            await worker.group_add('floor', live)
+            await self.until(lambda: self.members('floor') == {gone, live})
+
+            consumer = asyncio.ensure_future(worker.receive(gone))
+            await asyncio.sleep(0)
+            consumer.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await consumer
+            self.assertNotIn(gone, worker.channels)
+
+            await sender.group_send('floor', {'type': 'table.called'})
+            self.assertEqual(await asyncio.wait_for(worker.receive(live), 2), {'type': 'table.called'})
+            await self.until(lambda: worker.dropped == 1)
+            self.assertNotIn(gone, worker.channels)
+
+            # Idle past the expiry: swept on the next delivery, unlike a channel being received from
+            waiting = asyncio.ensure_future(worker.receive(live))
+            await asyncio.sleep(0)
+            worker.deliver(live, {'type': 'later'}, now=time.time() + worker.expiry + 1)
+            self.assertEqual(set(worker.channels), {live})
+            self.assertEqual(await asyncio.wait_for(waiting, 2), {'type': 'later'})
+
+            await worker.group_discard('floor', live)
+            self.assertEqual(worker.channels, {})
+            await sender.close()
+            await worker.close()
+
+        async_to_sync(scenario)()
+
+    def test_links_of_closed_loops_are_shut(self):
+        layer = BrokerChannelLayer(self.path)
+        first = async_to_sync(layer.new_channel)()
+        self.on_broker(self.until(lambda: len(self.broker.peers) == 1))
+        async_to_sync(layer.new_channel)()
+        self.assertEqual(len(layer._links), 1)
+        self.assertNotIn(first, layer.channels)
+        self.on_broker(self.until(lambda: len(self.broker.peers) == 1))
+        async_to_sync(layer.close)()
+        self.on_broker(self.until(lambda: not self.broker.peers))
+
+    def test_reconnect_restores_group_membership(self):
+        async def scenario():
+            sender, worker = BrokerChannelLayer(self.path), BrokerChannelLayer(self.path)
+            channel = await worker.new_channel()
+            await worker.group_add('waiters', channel)
+            await self.until(lambda: self.members('waiters') == {channel})
+
+            with self.assertLogs('core.channel_broker', 'INFO') as logs:
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.broker.close(), self.loop))
+                self.broker = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(Broker(self.path).start(), self.loop)
+                )
+                await self.until(lambda: self.members('waiters') == {channel})
+            self.assertIn('Reconnected', logs.output[-1])
+            await sender.group_send('waiters', {'type': 'table.called'})
+            self.assertEqual(await asyncio.wait_for(worker.receive(channel), 5), {'type': 'table.called'})
+            await sender.close()
+            await worker.close()
+
+        async_to_sync(scenario)()
+
+
+class SlowLayer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    async def group_send(self, group, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append((group, message))
+
+
+class RealtimeDispatchTests(TestCase):
+    def setUp(self):
+        realtime.metrics.reset()
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+        self.addCleanup(async_to_sync(self.layer.flush))
+
+    def received(self, channel):
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(channel), 0.01))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def test_batch_coalesces_events_for_the_same_row(self):
+        channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(realtime.group_name(1, 'floor'), channel)
+        with self.captureOnCommitCallbacks(execute=True):
+            with realtime.realtime_batch(background=False):
+                realtime.publish('item_status_changed', 1, ['floor'], {'id': 7, 'status': 'accepted'}, key=7)
+                realtime.publish('item_status_changed', 1, ['floor'], {'id': 8, 'status': 'accepted'}, key=8)
+                realtime.publish('item_status_changed', 1, ['floor'], {'id': 7, 'status': 'rejected'}, key=7)
+        self.assertEqual([message['data'] for message in self.received(channel)],
+                         [{'id': 8, 'status': 'accepted'}, {'id': 7, 'status': 'rejected'}])
+        summary = realtime.metrics.summary()
+        self.assertEqual((summary['sent'], summary['coalesced'], summary['queue_depth']), (2, 1, 0))
+
+    def test_background_dispatch_does_not_wait_for_the_channel_layer(self):
+        layer = SlowLayer(0.2)
+        with mock.patch('core.realtime.get_channel_layer', return_value=layer):
+            started = time.perf_counter()
+            with self.captureOnCommitCallbacks(execute=True):
+                with realtime.realtime_batch(background=True):
+                    realtime.publish('order_printed', 1, ['cashier', 'floor'], {'order': {'id': 3}}, key=3)
+            self.assertLess(time.perf_counter() - started, 0.1)
+            realtime.drain()
+        self.assertEqual(sorted(group for group, _ in layer.sent), ['branch.1.cashier', 'branch.1.floor'])
+        summary = realtime.metrics.summary()
+        self.assertEqual((summary['sent'], summary['queue_depth'], summary['max_queue_depth']), (2, 0, 2))
+        self.assertGreaterEqual(summary['p50_ms'], 200)
+
+
+class SessionKeyAuthenticationTests(TestCase):
+    def setUp(self):
+        session_users.clear()
+        self.addCleanup(session_users.clear)
+        self.user = get_user_model().objects.create_user(
+            username='cashier', password='x', role='cashier', branch=Branch.objects.create(name='Main')
+        )
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    def authenticate(self, session_key=None):
+        request = Request(APIRequestFactory().get('/', HTTP_X_SESSION_KEY=session_key or self.session_key))
+        result = SessionKeyAuthentication().authenticate(request)
+        return result[0] if result else None
+
+    def test_warm_session_key_costs_no_queries(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual((user.pk, user.role, user.branch.name), (self.user.pk, 'cashier', 'Main'))
+
+    def test_unknown_key_stays_anonymous(self):
+        self.assertIsNone(self.authenticate('not-a-session'))
+        self.assertIsNone(self.authenticate('not-a-session'))
+
+    @override_settings(SESSION_KEY_AUTH_CACHE_SIZE=1)
+    def test_least_recently_used_key_is_evicted(self):
+        other = Client()
+        other.force_login(self.user)
+        self.authenticate()
+        self.authenticate(other.session.session_key)
+        with self.assertNumQueries(2):
+            self.authenticate()
+
+    @override_settings(SESSION_KEY_AUTH_CACHE_TTL=0)
+    def test_entries_expire(self):
+        self.authenticate()
+        with self.assertNumQueries(2):
+            self.authenticate()
+
+    def test_logout_with_the_header_drops_the_cached_user(self):
+        self.authenticate()
+        Client().post(reverse('session-logout'), headers={'X-Session-Key': self.session_key})
+        self.assertIsNone(self.authenticate())
+
+    def test_password_change_drops_the_cached_user(self):
+        self.authenticate()
+        self.user.set_password('y')
+        self.user.save()
+        self.assertIsNone(self.authenticate())
+
+    def test_change_in_another_worker_drops_the_cached_user(self):
+        self.authenticate()
+        # The other worker's save cannot reach this process' entries, only the shared cache
+        with mock.patch.object(session_users, 'discard_user'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.role = 'waiter'
+                self.user.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.authenticate().role, 'waiter')
+
+    def test_logout_in_another_worker_drops_the_cached_user(self):
+        self.authenticate()
+        with mock.patch.object(session_users, 'discard'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Session.objects.filter(session_key=self.session_key).delete()
+        self.assertIsNone(self.authenticate())
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_nothing_is_kept_without_a_shared_cache(self):
+        self.authenticate()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.authenticate(), self.user)
+
+
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('core.tests.tracing')
+        self.addCleanup(self.logger.setLevel, logging.NOTSET)
+
+    def test_off_below_debug(self):
+        self.logger.setLevel(logging.INFO)
+        self.assertFalse(tracing_enabled(self.logger))
+        with mock.patch.object(self.logger, 'debug') as debug:
+            with span(self.logger, 'block'):
+                pass
+            self.assertEqual(traced(self.logger)(lambda: 42)(), 42)
+        debug.assert_not_called()
+
+    def test_span_logs_duration_and_failures(self):
+        self.logger.setLevel(logging.DEBUG)
+        self.assertTrue(tracing_enabled(self.logger))
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            with span(self.logger, 'block'):
+                pass
+            with self.assertRaises(ValueError):
+                with span(self.logger, 'broken'):
+                    raise ValueError('boom')
+        self.assertRegex(logs.output[0], r'block took [\d.]+ms$')
+        self.assertRegex(logs.output[1], r"broken failed after [\d.]+ms: ValueError\('boom'\)$")
+
+    def test_traced_is_named_after_the_function(self):
+        @traced(self.logger)
+        def work(value):
+            return value * 2
+
+        self.logger.setLevel(logging.DEBUG)
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            self.assertEqual(work(21), 42)
+        self.assertIn('TracingTests.test_traced_is_named_after_the_function.<locals>.work took', logs.output[0])
+        self.assertEqual(work.__name__, 'work')
+
+
+class BenchTracingTests(TestCase):
+    def test_runs_and_leaves_nothing_behind(self):
+        loggers = [logging.getLogger(app) for app in settings.LOCAL_APPS]
+        before = [(logger.handlers[:], logger.level, logger.propagate) for logger in loggers]
+        out = io.StringIO()
+        call_command('bench_tracing', orders=2, requests=2, stdout=out)
+        output = out.getvalue()
+        for endpoint in ('order list (cashier)', 'kitchen queue', 'bar queue', 'item accept + revert'):
+            self.assertIn(endpoint, output)
+        self.assertIn('Total time: tracing off', output)
+        self.assertFalse(Branch.objects.filter(name='Tracing benchmark').exists())
+        self.assertEqual([(logger.handlers, logger.level, logger.propagate) for logger in loggers], before)
 
-# Create your tests here.
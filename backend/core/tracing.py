@@ -0,0 +1,66 @@
+"""
+Debug tracing for the order and inventory hot paths.
+
+Each module logs through ``logging.getLogger(__name__)``, so every app has
+its own logger namespace (``orders``, ``inventory``, ``users``...). Tracing is
+the DEBUG level of those loggers and is off unless ``DJANGO_TRACE`` names the
+apps to trace (see ``LOGGING`` in settings). Messages use %-style arguments,
+so nothing is formatted while tracing is off.
+
+Work done only to produce a trace message (counting a queryset, listing
+items) must be guarded with ``tracing_enabled(logger)`` so it never runs in
+production. ``span`` and ``traced`` time a block or function and log its
+duration; when tracing is off they cost a single level check.
+"""
+import functools
+import logging
+import time
+from contextlib import nullcontext
+
+_NOOP = nullcontext()
+
+
+def tracing_enabled(logger):
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+class _Span:
+    __slots__ = ('logger', 'name', 'started')
+
+    def __init__(self, logger, name):
+        self.logger = logger
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        if exc_type is None:
+            self.logger.debug("%s took %.2fms", self.name, elapsed)
+        else:
+            self.logger.debug("%s failed after %.2fms: %r", self.name, elapsed, exc)
+        return False
+
+
+def span(logger, name):
+    """Context manager timing a block under ``name`` when tracing is on"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return _NOOP
+    return _Span(logger, name)
+
+
+def traced(logger, name=None):
+    """Decorator version of ``span``, named after the function by default"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not logger.isEnabledFor(logging.DEBUG):
+                return func(*args, **kwargs)
+            with _Span(logger, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
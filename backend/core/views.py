@@ -1,7 +1,28 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
-from django.shortcuts import render
+from .query_budget import endpoint_report
+from .realtime import metrics
 
 def index(request):
     return render(request, "index.html")
+
+
+def query_report(request):
+    """Rolling per-endpoint latency and query stats collected by QueryBudgetMiddleware"""
+    if not (settings.DEBUG or (request.user.is_authenticated and request.user.is_staff)):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    if request.method == 'DELETE':
+        endpoint_report.reset()
+    return JsonResponse({'endpoints': endpoint_report.summary()})
+
+
+def realtime_report(request):
+    """Queue depth, counts and commit-to-send latency of the realtime event dispatcher"""
+    if not (settings.DEBUG or (request.user.is_authenticated and request.user.is_staff)):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    if request.method == 'DELETE':
+        metrics.reset()
+    return JsonResponse({'dispatch': settings.REALTIME_DISPATCH, **metrics.summary()})
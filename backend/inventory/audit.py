@@ -0,0 +1,174 @@
+"""
+Buffered ``AuditLog`` writes.
+
+``record`` adds nothing to the write path but building the entry: it is only
+handed on once the transaction that produced it commits, so entries of rolled
+back transactions and savepoints are dropped with them. Content types are
+resolved from Django's content type cache when the entries are written.
+
+Inside ``audit_batch`` (every request goes through one, see
+``AuditLogMiddleware``) committed entries are collected and written when the
+block exits, or at commit if it exits inside a transaction. A request that
+saves a thousand products thus writes their audit trail with one INSERT per
+``BATCH_SIZE`` entries rather than one per save. Outside a batch each entry
+is written as soon as it commits.
+
+With ``AUDIT_LOG_WRITER = 'background'`` (or ``audit_batch(background=True)``)
+batches are handed to a writer thread instead of being inserted by the
+request. Entries still queued when the process dies are lost; ``drain``
+waits for the queue to empty.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+class _Batch:
+    def __init__(self, background):
+        self.background = background
+        self.committed = []
+
+    def add(self, entry):
+        self.committed.append(entry)
+        if len(self.committed) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        entries, self.committed = self.committed, []
+        if entries:
+            _write(entries, self.background)
+
+
+def _batches():
+    if not hasattr(_local, 'batches'):
+        _local.batches = []
+    return _local.batches
+
+
+def record(action, instance=None, user=None, details=None, notes=None):
+    """Log ``action`` on ``instance`` once the current transaction commits"""
+    entry = AuditLog(
+        timestamp=timezone.now(),
+        user=user if user is not None and user.is_authenticated else None,
+        action=action,
+        object_id=instance.pk if instance is not None else None,
+        details=details or {},
+        notes=notes,
+    )
+    entry._audited_model = type(instance) if instance is not None else None
+    batches = _batches()
+    if batches:
+        transaction.on_commit(partial(batches[-1].add, entry))
+    else:
+        transaction.on_commit(partial(_write, [entry]))
+
+
+def _write(entries, background=None):
+    if background is None:
+        background = getattr(settings, 'AUDIT_LOG_WRITER', 'sync') == 'background'
+    if background:
+        _writer().put(entries)
+    else:
+        write_entries(entries)
+
+
+def write_entries(entries):
+    models = {entry._audited_model for entry in entries if getattr(entry, '_audited_model', None)}
+    content_types = ContentType.objects.get_for_models(*models) if models else {}
+    for entry in entries:
+        model = getattr(entry, '_audited_model', None)
+        if model is not None:
+            entry.content_type = content_types[model]
+    return AuditLog.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+@contextmanager
+def audit_batch(background=None):
+    """
+    Collect the audit entries recorded in the block and write the committed
+    ones in bulk when it exits (through the writer thread when
+    ``background``), or when the transaction still open then commits.
+    """
+    batches = _batches()
+    if background is None and batches:
+        background = batches[-1].background
+    batch = _Batch(background)
+    batches.append(batch)
+    try:
+        yield batch
+    finally:
+        batches.remove(batch)
+        # Registered after the entries' own commit hooks, so it runs after them
+        transaction.on_commit(batch.flush)
+
+
+class AuditLogMiddleware:
+    """Write each request's audit entries in one batch when it finishes"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_batch():
+            return self.get_response(request)
+
+
+class _Writer(threading.Thread):
+    def __init__(self):
+        super().__init__(name='audit-log-writer', daemon=True)
+        self.queue = queue.Queue()
+
+    def put(self, entries):
+        self.queue.put(entries)
+
+    def run(self):
+        while True:
+            batches = [self.queue.get()]
+            # Merge whatever else queued up meanwhile into the same INSERTs
+            while True:
+                try:
+                    batches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                write_entries([entry for batch in batches for entry in batch])
+            except Exception:
+                logger.exception("Dropped %s audit log entries", sum(len(batch) for batch in batches))
+            finally:
+                for _ in batches:
+                    self.queue.task_done()
+                if self.queue.empty():
+                    close_old_connections()
+
+
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+
+def _writer():
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = _Writer()
+            _writer_thread.start()
+        return _writer_thread
+
+
+def drain():
+    """Block until the background writer has written everything queued so far"""
+    if _writer_thread is not None:
+        _writer_thread.queue.join()
@@ -0,0 +1,366 @@
+"""
+Stock consumption for accepted order items.
+
+``consume_items`` deducts a batch of accepted items from stock with a fixed
+number of queries, however many lines the order has: one to resolve the
+products (by ``OrderItem.product`` or, for older bar items, by name), one for
+their default sales units, one locking read per stock table, one set-based
+UPDATE per table and one INSERT of the ``sale`` ledger rows.
+
+An item's quantity is counted in the product's default sales unit (the
+``to_unit`` of its ``is_default_sales_unit`` measurement, e.g. shots) or in
+its base unit, and converted with the memoised conversion graph. Beverages
+served by a bartender come out of that bartender's ``BarmanStock``;
+everything else, and beverages the bartender holds none of, out of the
+branch's store ``Stock``. Items without a product or without a stock row are
+not tracked in inventory and are skipped.
+
+Rows are locked in (table, id) order, the same order transfers update them
+in (inventory/transfers.py). If any row holds too little, nothing is deducted
+and a ValidationError lists every shortage. Rows a deduction takes down to
+their minimum threshold send a ``stock_low`` event (core/realtime.py).
+
+Each ``sale`` row points at its order item. When an accepted item goes back
+to pending or is rejected, ``restore_items`` puts what is still outstanding
+for it back into the stock it came from with a ``sale_reversal`` row, so
+accepting it again deducts it only once overall.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from core.realtime import publish
+
+from .conversions import conversion_graph
+from .models import BarmanStock, InventoryTransaction, Product, ProductMeasurement, Stock
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+QUANTITY = DecimalField(max_digits=10, decimal_places=2)
+BAR_ITEM_TYPES = ('beverage',)
+
+
+def _resolve_products(items):
+    """item -> product dict (id, name, base_unit_id) for the items that have one"""
+    product_ids = {item.product_id for item in items if item.product_id}
+    # Bar items used to be matched to products by name only
+    names = {item.name.lower() for item in items
+             if not item.product_id and item.name and item.item_type in BAR_ITEM_TYPES}
+    if not product_ids and not names:
+        return {}
+    rows = (
+        Product.objects.annotate(lower_name=Lower('name'))
+        .filter(Q(pk__in=product_ids) | Q(lower_name__in=names))
+        .values('id', 'name', 'lower_name', 'base_unit_id')
+    )
+    by_id, by_name = {}, {}
+    for row in rows:
+        by_id[row['id']] = row
+        by_name.setdefault(row['lower_name'], row)
+    resolved = {}
+    for item in items:
+        if item.product_id:
+            product = by_id.get(item.product_id)
+        else:
+            product = by_name.get((item.name or '').lower()) if item.item_type in BAR_ITEM_TYPES else None
+        if product is not None:
+            resolved[item] = product
+    return resolved
+
+
+def sales_units(products):
+    """
+    product id -> (unit id an item quantity is counted in, base units per
+    such unit) for ``products``, dicts with ``id``, ``name`` and
+    ``base_unit_id``. Products without a base unit are left out.
+    """
+    products = [product for product in products if product['base_unit_id'] is not None]
+    if not products:
+        return {}
+    default_units = dict(
+        ProductMeasurement.objects.filter(product_id__in={product['id'] for product in products},
+                                          is_default_sales_unit=True)
+        .order_by('id').values_list('product_id', 'to_unit_id')
+    )
+    units = {}
+    for product in products:
+        unit_id = default_units.get(product['id'], product['base_unit_id'])
+        factor = conversion_graph(product['id']).factor(unit_id, product['base_unit_id'])
+        if factor is None:
+            logger.warning("No conversion from sales unit %s to base unit of %s; counting base units",
+                           unit_id, product['name'])
+            unit_id, factor = product['base_unit_id'], Decimal(1)
+        units[product['id']] = (unit_id, factor)
+    return units
+
+
+def _base_quantities(items, products):
+    """item -> (unit id the quantity is counted in, quantity in base units)"""
+    units = sales_units({product['id']: product for product in products.values()}.values())
+    quantities = {}
+    for item in items:
+        product = products.get(item)
+        if product is None or product['id'] not in units:
+            continue
+        unit_id, factor = units[product['id']]
+        quantities[item] = (unit_id, (Decimal(item.quantity) * factor).quantize(CENT))
+    return quantities
+
+
+def _locked_rows(queryset, fields):
+    return list(queryset.select_for_update(of=('self',)).order_by('id').values('id', *fields))
+
+
+def _per_row(amounts, output_field=QUANTITY, default=None):
+    return Case(
+        *[When(pk=row_id, then=Value(amount)) for row_id, amount in amounts.items()],
+        default=default if default is not None else Value(ZERO),
+        output_field=output_field,
+    )
+
+
+def _deduct(model, rows, amounts, extra=None):
+    """One UPDATE subtracting ``amounts[row id]`` from each row and setting its running-out flag"""
+    running_out = {
+        row['id']: row['quantity_in_base_units'] - amounts[row['id']] <= row['minimum_threshold_base_units']
+        for row in rows
+    }
+    model.objects.filter(pk__in=amounts).update(
+        quantity_in_base_units=F('quantity_in_base_units') - _per_row(amounts),
+        running_out=Case(*[When(pk=row_id, then=Value(flag)) for row_id, flag in running_out.items()],
+                         default=F('running_out')),
+        last_stock_update=timezone.now(),
+        **(extra or {}),
+    )
+
+
+def _original_quantities(rows, amounts, base_units):
+    """
+    Bar stock also keeps its quantity in the unit it was delivered in: the
+    ``original_quantity`` update for taking ``amounts`` (base units, negative
+    to put back) out of ``rows``. ``base_units`` maps product id to base unit.
+    """
+    original_quantities = {}
+    for row in rows:
+        if row['original_unit_id'] is None or row['original_quantity'] is None:
+            continue
+        product_id = row['stock__product_id']
+        factor = conversion_graph(product_id).factor(row['original_unit_id'], base_units[product_id])
+        delta = amounts[row['id']] / factor if factor else amounts[row['id']]
+        original_quantities[row['id']] = max(row['original_quantity'] - delta, ZERO).quantize(CENT)
+    if not original_quantities:
+        return {}
+    return {'original_quantity': _per_row(original_quantities, default=F('original_quantity'))}
+
+
+def _publish_stock_low(rows, amounts, names, location, stations):
+    """A ``stock_low`` event for each row this deduction took to or below its threshold"""
+    for row in rows:
+        remaining = row['quantity_in_base_units'] - amounts[row['id']]
+        threshold = row['minimum_threshold_base_units']
+        if row['quantity_in_base_units'] <= threshold or remaining > threshold:
+            continue
+        product_id = row.get('product_id', row.get('stock__product_id'))
+        branch_id = row.get('branch_id', row.get('stock__branch_id'))
+        publish('stock_low', branch_id, stations, {
+            'location': location,
+            'stock_id': row['id'],
+            'product_id': product_id,
+            'product_name': names[row['id']],
+            'quantity_in_base_units': str(remaining),
+            'minimum_threshold_base_units': str(threshold),
+        }, key=(location, row['id']))
+
+
+def _shortages(rows, amounts, names):
+    return [
+        f"Insufficient stock of {names[row['id']]}: {amounts[row['id']]} needed, "
+        f"{row['quantity_in_base_units']} available"
+        for row in rows if row['quantity_in_base_units'] < amounts[row['id']]
+    ]
+
+
+@transaction.atomic
+def consume_items(items, bartender=None, initiated_by=None):
+    """
+    Deduct accepted ``items`` (OrderItems with their ``order`` loaded) from
+    stock and record one ``sale`` transaction per item. Returns the ledger rows.
+    """
+    items = [item for item in items if item.quantity]
+    products = _resolve_products(items)
+    quantities = _base_quantities(items, products)
+    if not quantities:
+        return []
+
+    def branch_of(item):
+        return item.order.branch_id
+
+    bar_items = [item for item in quantities if bartender is not None and item.item_type in BAR_ITEM_TYPES]
+    bar_rows, bar_location = [], {}
+    if bar_items:
+        bar_rows = _locked_rows(
+            BarmanStock.objects.filter(
+                bartender=bartender,
+                stock__product_id__in={products[item]['id'] for item in bar_items},
+                stock__branch_id__in={branch_of(item) for item in bar_items},
+            ),
+            ('stock__product_id', 'stock__branch_id', 'quantity_in_base_units',
+             'minimum_threshold_base_units', 'original_unit_id', 'original_quantity'),
+        )
+        by_key = {(row['stock__product_id'], row['stock__branch_id']): row for row in bar_rows}
+        for item in bar_items:
+            row = by_key.get((products[item]['id'], branch_of(item)))
+            if row is not None:
+                bar_location[item] = row
+
+    store_items = [item for item in quantities if item not in bar_location]
+    store_rows, store_location = [], {}
+    if store_items:
+        store_rows = _locked_rows(
+            Stock.objects.filter(
+                product_id__in={products[item]['id'] for item in store_items},
+                branch_id__in={branch_of(item) for item in store_items},
+            ),
+            ('product_id', 'branch_id', 'quantity_in_base_units', 'minimum_threshold_base_units'),
+        )
+        by_key = {(row['product_id'], row['branch_id']): row for row in store_rows}
+        for item in store_items:
+            row = by_key.get((products[item]['id'], branch_of(item)))
+            if row is not None:
+                store_location[item] = row
+
+    bar_amounts, store_amounts, names = defaultdict(Decimal), defaultdict(Decimal), {}
+    for locations, amounts in ((bar_location, bar_amounts), (store_location, store_amounts)):
+        for item, row in locations.items():
+            amounts[row['id']] += quantities[item][1]
+    bar_rows = [row for row in bar_rows if row['id'] in bar_amounts]
+    store_rows = [row for row in store_rows if row['id'] in store_amounts]
+    for item, row in list(bar_location.items()) + list(store_location.items()):
+        names[row['id']] = products[item]['name']
+
+    shortages = _shortages(bar_rows, bar_amounts, names) + _shortages(store_rows, store_amounts, names)
+    if shortages:
+        raise ValidationError(shortages)
+
+    if bar_rows:
+        base_units = {product['id']: product['base_unit_id'] for product in products.values()}
+        _deduct(BarmanStock, bar_rows, bar_amounts, _original_quantities(bar_rows, bar_amounts, base_units))
+        _publish_stock_low(bar_rows, bar_amounts, names, 'bar', ['beverage', 'manager'])
+    if store_rows:
+        _deduct(Stock, store_rows, store_amounts)
+        _publish_stock_low(store_rows, store_amounts, names, 'store', ['manager'])
+        from reports.kpis import invalidate_owner_kpis
+        for branch_id in {row['branch_id'] for row in store_rows}:
+            invalidate_owner_kpis(branch_id)
+
+    ledger = []
+    for item, (unit_id, base_quantity) in quantities.items():
+        bar_row, store_row = bar_location.get(item), store_location.get(item)
+        if bar_row is None and store_row is None:
+            logger.debug("No stock tracked for %s in branch %s", item.name, branch_of(item))
+            continue
+        ledger.append(InventoryTransaction(
+            branch_id=branch_of(item),
+            product_id=products[item]['id'],
+            transaction_type='sale',
+            quantity=Decimal(item.quantity),
+            transaction_unit_id=unit_id,
+            quantity_in_base_units=-base_quantity,
+            from_stock_barman_id=bar_row['id'] if bar_row else None,
+            from_stock_main_id=store_row['id'] if store_row else None,
+            initiated_by=initiated_by or bartender,
+            price_at_transaction=item.price,
+            order_item_id=item.pk,
+            notes=f"Order #{item.order.order_number}",
+        ))
+    return InventoryTransaction.objects.bulk_create(ledger)
+
+
+@transaction.atomic
+def restore_items(items, initiated_by=None):
+    """
+    Put back the stock ``consume_items`` took for ``items`` (OrderItems with
+    their ``order`` loaded) that are no longer accepted: one ``sale_reversal``
+    row per item with a sale outstanding, into the stock row its last sale
+    came from. Returns the ledger rows.
+    """
+    items = {item.pk: item for item in items if item.pk}
+    if not items:
+        return []
+    outstanding, last_sale = defaultdict(Decimal), {}
+    rows = (
+        InventoryTransaction.objects
+        .filter(order_item_id__in=items, transaction_type__in=('sale', 'sale_reversal'))
+        .order_by('id')
+        .values('order_item_id', 'transaction_type', 'quantity', 'quantity_in_base_units', 'transaction_unit_id',
+                'product_id', 'product__base_unit_id', 'branch_id', 'from_stock_main_id', 'from_stock_barman_id')
+    )
+    for row in rows:
+        # Sales are negative, reversals positive
+        outstanding[row['order_item_id']] -= row['quantity_in_base_units']
+        if row['transaction_type'] == 'sale':
+            last_sale[row['order_item_id']] = row
+    restores = {
+        item_id: (last_sale[item_id], amount) for item_id, amount in outstanding.items()
+        if amount > 0 and item_id in last_sale
+    }
+
+    bar_amounts, store_amounts = defaultdict(Decimal), defaultdict(Decimal)
+    for sale, amount in restores.values():
+        if sale['from_stock_barman_id'] is not None:
+            bar_amounts[sale['from_stock_barman_id']] -= amount
+        elif sale['from_stock_main_id'] is not None:
+            store_amounts[sale['from_stock_main_id']] -= amount
+    bar_rows = store_rows = []
+    if bar_amounts:
+        bar_rows = _locked_rows(
+            BarmanStock.objects.filter(pk__in=bar_amounts),
+            ('stock__product_id', 'quantity_in_base_units', 'minimum_threshold_base_units',
+             'original_unit_id', 'original_quantity'),
+        )
+    if store_amounts:
+        store_rows = _locked_rows(
+            Stock.objects.filter(pk__in=store_amounts),
+            ('branch_id', 'quantity_in_base_units', 'minimum_threshold_base_units'),
+        )
+    # Negative amounts: _deduct adds them back and clears the running-out flag if it can
+    if bar_rows:
+        bar_amounts = {row['id']: bar_amounts[row['id']] for row in bar_rows}
+        base_units = {sale['product_id']: sale['product__base_unit_id'] for sale, _ in restores.values()}
+        _deduct(BarmanStock, bar_rows, bar_amounts, _original_quantities(bar_rows, bar_amounts, base_units))
+    if store_rows:
+        store_amounts = {row['id']: store_amounts[row['id']] for row in store_rows}
+        _deduct(Stock, store_rows, store_amounts)
+        from reports.kpis import invalidate_owner_kpis
+        for branch_id in {row['branch_id'] for row in store_rows}:
+            invalidate_owner_kpis(branch_id)
+
+    ledger = []
+    for item_id, (sale, amount) in restores.items():
+        bar_id = sale['from_stock_barman_id'] if sale['from_stock_barman_id'] in bar_amounts else None
+        store_id = sale['from_stock_main_id'] if sale['from_stock_main_id'] in store_amounts else None
+        if bar_id is None and store_id is None:
+            # The stock row is gone; there is nothing to put it back into
+            continue
+        ledger.append(InventoryTransaction(
+            branch_id=sale['branch_id'],
+            product_id=sale['product_id'],
+            transaction_type='sale_reversal',
+            quantity=sale['quantity'],
+            transaction_unit_id=sale['transaction_unit_id'],
+            quantity_in_base_units=amount,
+            to_stock_barman_id=bar_id,
+            to_stock_main_id=store_id,
+            initiated_by=initiated_by,
+            order_item_id=item_id,
+            notes=f"Order #{items[item_id].order.order_number}",
+        ))
+    return InventoryTransaction.objects.bulk_create(ledger)
@@ -0,0 +1,224 @@
+"""
+Consistency checks for product unit conversions.
+
+Measurements reach the database from several places (product creation, the
+restock views, ``add_conversion``, ``quick_fix``, the default conversions), so
+a product can end up with two paths between the same units that disagree
+(carton->bottle->ml vs carton->ml), with units that cannot be converted to its
+base unit, or with stock kept in a unit that has no conversion at all.
+
+``analyze_conversions`` loads every measurement, base unit and stock unit with
+three queries and checks each product's graph in memory: a breadth-first tree
+is grown from the base unit and every edge outside the tree is compared with
+the factor the tree implies, allowing for the 4-decimal rounding of every
+edge on the way, which finds every inconsistent cycle in
+O(units + measurements). ``repair`` deletes what can be fixed without
+guessing: invalid rows and edges that contradict the path through the base
+unit, so the tree from the base unit wins. Missing paths need a human and are only reported.
+
+``validate_measurement`` runs the same comparison for one row before it is
+saved (pre_save hook in inventory/signals.py, see ``INVENTORY_CONVERSION_CHECK``).
+The ``check_conversions`` management command runs the batch analysis.
+"""
+import logging
+from collections import deque, namedtuple
+from decimal import Decimal
+from fractions import Fraction
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Amounts are stored with 4 decimals (1/12 comes back as 0.0833), so each
+# edge carries up to half a step of rounding on top of the tolerance.
+ROUNDING = Fraction(1, 20000)
+RELATIVE_TOLERANCE = Fraction(1, 1000)
+
+INVALID = 'invalid'
+INCONSISTENT = 'inconsistent'
+UNREACHABLE = 'unreachable'
+NO_BASE_UNIT = 'no_base_unit'
+ORPHAN_STOCK_UNIT = 'orphan_stock_unit'
+
+Issue = namedtuple('Issue', 'product_id kind message measurement_ids fixable')
+
+
+def _rounding(amount):
+    """Relative rounding error of a stored amount (the same for its inverse)"""
+    return ROUNDING / amount
+
+
+def _agrees(amount, implied, rounding):
+    """Whether ``amount`` matches ``implied`` within the tolerance plus the rounding along both paths"""
+    return abs(amount - implied) <= implied * (RELATIVE_TOLERANCE + rounding)
+
+
+def _spanning_tree(edges, root):
+    """
+    Factor from ``root`` to every unit reachable from it, the accumulated
+    rounding of each factor, and the edges of the tree.
+    """
+    adjacency = {}
+    for measurement_id, from_id, to_id, amount in edges:
+        adjacency.setdefault(from_id, []).append((measurement_id, to_id, amount, _rounding(amount)))
+        adjacency.setdefault(to_id, []).append((measurement_id, from_id, 1 / amount, _rounding(amount)))
+    factors = {root: Fraction(1)}
+    errors = {root: Fraction(0)}
+    tree_edges = set()
+    queue = deque([root])
+    while queue:
+        unit = queue.popleft()
+        for measurement_id, neighbour, amount, rounding in adjacency.get(unit, ()):
+            if neighbour not in factors:
+                factors[neighbour] = factors[unit] * amount
+                errors[neighbour] = errors[unit] + rounding
+                tree_edges.add(measurement_id)
+                queue.append(neighbour)
+    return factors, errors, tree_edges
+
+
+def analyze_product(product_id, base_unit_id, measurements, stock_unit_ids=(), unit_names=None):
+    """
+    Issues of one product.
+
+    ``measurements`` are (id, from_unit_id, to_unit_id, amount_per) tuples.
+    """
+    name = (unit_names or {}).get
+    issues = []
+    edges = []
+    for measurement_id, from_id, to_id, amount in measurements:
+        if amount is None or amount <= 0 or from_id == to_id:
+            issues.append(Issue(product_id, INVALID, f"Measurement {measurement_id} converts "
+                                f"{name(from_id, from_id)} to {name(to_id, to_id)} by {amount}",
+                                [measurement_id], True))
+        else:
+            edges.append((measurement_id, from_id, to_id, Fraction(amount)))
+
+    units = {unit for _, from_id, to_id, _ in edges for unit in (from_id, to_id)}
+    if not edges:
+        if stock_unit_ids and base_unit_id is not None:
+            for unit_id in set(stock_unit_ids) - {base_unit_id}:
+                issues.append(Issue(product_id, ORPHAN_STOCK_UNIT,
+                                    f"Stock is kept in {name(unit_id, unit_id)} but the product has no conversions",
+                                    [], False))
+        return issues
+    if base_unit_id is None:
+        issues.append(Issue(product_id, NO_BASE_UNIT, "Product has conversions but no base unit", [], False))
+        return issues
+
+    root = base_unit_id if base_unit_id in units else min(units)
+    factors, errors, tree_edges = _spanning_tree(edges, root)
+    if base_unit_id not in units:
+        issues.append(Issue(product_id, UNREACHABLE,
+                            f"Base unit {name(base_unit_id, base_unit_id)} appears in no conversion", [], False))
+    for unit in sorted(units - set(factors)):
+        issues.append(Issue(product_id, UNREACHABLE,
+                            f"No path from {name(unit, unit)} to base unit {name(base_unit_id, base_unit_id)}",
+                            [], False))
+    for unit in sorted(set(stock_unit_ids) - units - {base_unit_id}):
+        issues.append(Issue(product_id, ORPHAN_STOCK_UNIT,
+                            f"Stock is kept in {name(unit, unit)} which has no conversion", [], False))
+
+    for measurement_id, from_id, to_id, amount in edges:
+        if measurement_id in tree_edges or from_id not in factors or to_id not in factors:
+            continue
+        implied = factors[to_id] / factors[from_id]
+        if not _agrees(amount, implied, errors[from_id] + errors[to_id] + _rounding(amount)):
+            issues.append(Issue(
+                product_id, INCONSISTENT,
+                f"Measurement {measurement_id}: 1 {name(from_id, from_id)} = {amount} {name(to_id, to_id)}, "
+                f"but the path through the base unit gives {float(implied):g}",
+                [measurement_id], True,
+            ))
+    return issues
+
+
+def analyze_conversions(product_ids=None):
+    """Issues of every product (or of ``product_ids``), with three queries in total"""
+    from .models import Product, ProductMeasurement, ProductUnit, Stock
+
+    products = Product.objects.all()
+    measurements = ProductMeasurement.objects.order_by()
+    stocks = Stock.objects.filter(original_unit__isnull=False)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+        measurements = measurements.filter(product_id__in=product_ids)
+        stocks = stocks.filter(product_id__in=product_ids)
+
+    by_product = {}
+    for product_id, *row in measurements.values_list('product_id', 'id', 'from_unit_id', 'to_unit_id', 'amount_per'):
+        by_product.setdefault(product_id, []).append(tuple(row))
+    stock_units = {}
+    for product_id, unit_id in stocks.values_list('product_id', 'original_unit_id').distinct():
+        stock_units.setdefault(product_id, set()).add(unit_id)
+    unit_names = dict(ProductUnit.objects.values_list('id', 'unit_name'))
+
+    issues = []
+    for product_id, base_unit_id in products.values_list('id', 'base_unit_id').iterator(chunk_size=2000):
+        issues.extend(analyze_product(product_id, base_unit_id, by_product.get(product_id, []),
+                                      stock_units.get(product_id, ()), unit_names))
+    return issues
+
+
+@transaction.atomic
+def repair(issues):
+    """Delete the measurements behind fixable issues. Returns the number deleted."""
+    from .models import ProductMeasurement
+    ids = {measurement_id for issue in issues if issue.fixable for measurement_id in issue.measurement_ids}
+    if not ids:
+        return 0
+    deleted = 0
+    # One by one so the post_delete handlers drop the cached conversion graphs
+    for measurement in ProductMeasurement.objects.filter(pk__in=ids):
+        measurement.delete()
+        deleted += 1
+    return deleted
+
+
+def validate_measurement(measurement):
+    """
+    Raise ValidationError if ``measurement`` contradicts the factor its
+    product's other measurements already give for the same two units.
+    """
+    from .models import ProductMeasurement
+    if measurement.amount_per is None or measurement.product_id is None:
+        return
+    if measurement.from_unit_id == measurement.to_unit_id:
+        raise ValidationError("From Unit and To Unit cannot be the same.")
+    try:
+        amount = Fraction(str(measurement.amount_per))
+    except ValueError:
+        raise ValidationError({'amount_per': 'Amount per must be a number.'})
+    if amount <= 0:
+        raise ValidationError({'amount_per': 'Amount per must be positive.'})
+
+    others = ProductMeasurement.objects.filter(product_id=measurement.product_id).exclude(pk=measurement.pk)
+    edges = [
+        (measurement_id, from_id, to_id, Fraction(other_amount))
+        for measurement_id, from_id, to_id, other_amount
+        in others.values_list('id', 'from_unit_id', 'to_unit_id', 'amount_per')
+        if other_amount and other_amount > 0 and from_id != to_id
+    ]
+    factors, errors, _ = _spanning_tree(edges, measurement.from_unit_id)
+    implied = factors.get(measurement.to_unit_id)
+    if implied is not None and not _agrees(amount, implied, errors[measurement.to_unit_id] + _rounding(amount)):
+        expected = Decimal(implied.numerator) / Decimal(implied.denominator)
+        raise ValidationError(
+            f"1 {measurement.from_unit.unit_name} = {measurement.amount_per} {measurement.to_unit.unit_name} "
+            f"contradicts the product's other conversions, which give {expected:.4f}."
+        )
+
+
+def check_measurement_on_save(measurement):
+    """pre_save hook: raise, warn or skip according to ``INVENTORY_CONVERSION_CHECK``"""
+    mode = getattr(settings, 'INVENTORY_CONVERSION_CHECK', 'raise')
+    if mode == 'off':
+        return
+    try:
+        validate_measurement(measurement)
+    except ValidationError as e:
+        if mode == 'raise':
+            raise
+        logger.warning("Inconsistent conversion saved for product %s: %s", measurement.product_id, e)
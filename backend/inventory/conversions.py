@@ -0,0 +1,147 @@
+"""
+Per-product unit conversion graphs.
+
+A product's ``ProductMeasurement`` rows are edges of an undirected graph
+(1 from_unit = amount_per to_unit, and the inverse). ``ConversionGraph`` loads
+them with one query and precomputes the factor between every pair of units
+along the shortest path. Factors are multiplied as exact fractions and rounded
+to a Decimal once per pair, so long paths do not accumulate rounding.
+
+Graphs are memoised in process and in the shared cache. A process re-reads
+the shared copy at most every ``LOCAL_TTL`` seconds, so once a graph is warm
+a conversion is a dict lookup with no queries. Saving or deleting a
+measurement drops the product's graph here and, on commit, in the shared cache
+(inventory/signals.py). When the cache is per process (core/shared_cache.py)
+it is skipped and a process reloads the graph from the database every
+``LOCAL_TTL`` seconds instead, so other workers are never stale for longer.
+"""
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from fractions import Fraction
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.shared_cache import is_shared
+
+LOCAL_TTL = 5
+SHARED_TIMEOUT = 24 * 60 * 60
+ONE = Decimal('1.0')
+
+_local_graphs = {}
+_lock = threading.Lock()
+
+
+def _unit_id(unit):
+    return getattr(unit, 'pk', unit)
+
+
+def _to_decimal(value):
+    if value.denominator == 1:
+        return Decimal(value.numerator)
+    return Decimal(value.numerator) / Decimal(value.denominator)
+
+
+class ConversionGraph:
+    """All-pairs conversion factors of one product's units"""
+
+    def __init__(self, edges):
+        adjacency = {}
+        from_units, to_units = set(), set()
+        for from_id, to_id, amount_per in edges:
+            if not amount_per or amount_per <= 0 or from_id == to_id:
+                continue
+            amount = Fraction(amount_per)
+            adjacency.setdefault(from_id, []).append((to_id, amount))
+            adjacency.setdefault(to_id, []).append((from_id, 1 / amount))
+            from_units.add(from_id)
+            to_units.add(to_id)
+
+        self.factors = {}
+        for source in adjacency:
+            # Breadth-first: the first path reaching a unit is a shortest one
+            reached = {source: Fraction(1)}
+            queue = deque([source])
+            while queue:
+                unit = queue.popleft()
+                for neighbour, amount in adjacency[unit]:
+                    if neighbour not in reached:
+                        reached[neighbour] = reached[unit] * amount
+                        queue.append(neighbour)
+            for target, factor in reached.items():
+                if target != source:
+                    self.factors[source, target] = _to_decimal(factor)
+        # Units nothing converts from, e.g. 'shot' or 'ml'
+        self.smallest_unit_ids = sorted(to_units - from_units)
+
+    @classmethod
+    def load(cls, product_id):
+        from .models import ProductMeasurement
+        return cls(ProductMeasurement.objects.filter(product_id=product_id)
+                   .values_list('from_unit_id', 'to_unit_id', 'amount_per'))
+
+    def factor(self, from_unit, to_unit):
+        """How many ``to_unit`` are in one ``from_unit``, or None if the units are not connected"""
+        from_id, to_id = _unit_id(from_unit), _unit_id(to_unit)
+        if from_id == to_id:
+            return ONE
+        return self.factors.get((from_id, to_id))
+
+
+def _shared_key(product_id):
+    return f'conversion-graph:{product_id}'
+
+
+def conversion_graph(product_id):
+    """The product's graph from process memory, the shared cache (if any) or the database, in that order"""
+    if product_id is None:
+        return ConversionGraph([])
+    now = time.monotonic()
+    entry = _local_graphs.get(product_id)
+    if entry is not None and now - entry[1] < LOCAL_TTL:
+        return entry[0]
+
+    shared = is_shared()
+    graph = cache.get(_shared_key(product_id)) if shared else None
+    if graph is None:
+        graph = ConversionGraph.load(product_id)
+        if shared:
+            cache.set(_shared_key(product_id), graph, SHARED_TIMEOUT)
+    with _lock:
+        _local_graphs[product_id] = (graph, now)
+    return graph
+
+
+def _drop(product_id):
+    with _lock:
+        _local_graphs.pop(product_id, None)
+    cache.delete(_shared_key(product_id))
+
+
+def _drop_many(product_ids):
+    with _lock:
+        for product_id in product_ids:
+            _local_graphs.pop(product_id, None)
+    cache.delete_many([_shared_key(product_id) for product_id in product_ids])
+
+
+def invalidate_conversion_graph(product_id):
+    """Forget the product's graph now and again once the current transaction commits"""
+    _drop(product_id)
+    transaction.on_commit(lambda: _drop(product_id))
+
+
+def invalidate_conversion_graphs(product_ids):
+    """``invalidate_conversion_graph`` for many products, with one cache round trip each time"""
+    product_ids = list(product_ids)
+    _drop_many(product_ids)
+    transaction.on_commit(lambda: _drop_many(product_ids))
+
+
+def clear_conversion_graphs():
+    with _lock:
+        product_ids = list(_local_graphs)
+        _local_graphs.clear()
+    cache.delete_many([_shared_key(product_id) for product_id in product_ids])
@@ -0,0 +1,390 @@
+"""
+Bulk product import.
+
+``import_products`` takes product rows in the shape
+``ProductViewSet.create_product_with_related`` accepts (``parse_csv`` turns
+a CSV file into the same shape) and imports them with a fixed number of
+queries per chunk instead of a dozen per product:
+
+* every category, unit and branch the rows name (by id or by name) and the
+  names that already exist are resolved up front with one IN query each;
+* rows are validated in memory, conversions included (the same check as the
+  measurement pre_save hook, see inventory/conversion_checks.py), and the
+  initial stock is converted to base units with the row's own conversions;
+* each chunk of ``CHUNK_SIZE`` valid rows is written in one transaction with
+  one ``bulk_create`` per table: products, measurements (with the default
+  conversion when the stock unit has no path to the base unit), stock and
+  the ``restock`` ledger rows for the initial stock.
+
+Rows that fail validation are reported with their index and skipped. If a
+chunk hits an integrity error (a product created concurrently under the same
+name) it is rolled back and retried row by row, so only the offending rows
+are reported.
+
+``bulk_create`` bypasses the post_save receivers, so the audit entries,
+conversion graph and owner KPI invalidations they would do are issued here.
+"""
+import csv
+import io
+import logging
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from branches.models import Branch
+
+from .audit import audit_batch, record
+from .conversion_checks import INCONSISTENT, INVALID, analyze_product
+from .conversions import ConversionGraph, invalidate_conversion_graphs
+from .models import Category, InventoryTransaction, Product, ProductMeasurement, ProductUnit, Stock
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+CENT = Decimal('0.01')
+AMOUNT_PLACES = Decimal('0.0001')
+NAME_LENGTH = Product._meta.get_field('name').max_length
+
+# Used when a row's stock unit has no conversion to its base unit
+DEFAULT_CONVERSIONS = {
+    'carton': {'bottle': 24, 'shot': 480, 'unit': 24},
+    'bottle': {'shot': 20, 'ml': 750, 'unit': 1},
+    'shot': {'ml': 37.5, 'unit': 1},
+    'unit': {'shot': 1, 'ml': 37.5},
+}
+
+# Flat CSV columns; measurement and stock columns are optional
+CSV_STOCK_COLUMNS = ('branch', 'branch_id', 'original_quantity', 'original_unit', 'original_unit_id',
+                     'quantity_in_base_units', 'minimum_threshold_base_units')
+CSV_MEASUREMENT_COLUMNS = ('from_unit', 'from_unit_id', 'to_unit', 'to_unit_id', 'amount_per',
+                           'is_default_sales_unit')
+
+ImportResult = namedtuple('ImportResult', 'created errors')
+
+
+class RowError(Exception):
+    pass
+
+
+def default_conversion_factor(from_unit_name, to_unit_name):
+    """Default factor for common unit pairs, or None"""
+    return DEFAULT_CONVERSIONS.get(from_unit_name.lower(), {}).get(to_unit_name.lower())
+
+
+def parse_csv(text):
+    """Product rows from CSV text (one product per line, with an optional stock and measurement)"""
+    rows = []
+    for line in csv.DictReader(io.StringIO(text)):
+        line = {key.strip(): (value or '').strip() for key, value in line.items() if key}
+        row = {key: value for key, value in line.items()
+               if value and key not in CSV_STOCK_COLUMNS + CSV_MEASUREMENT_COLUMNS}
+        stock = {key: line[key] for key in CSV_STOCK_COLUMNS if line.get(key)}
+        measurement = {key: line[key] for key in CSV_MEASUREMENT_COLUMNS if line.get(key)}
+        if stock:
+            row['stock'] = stock
+        if measurement:
+            row['measurement'] = measurement
+        rows.append(row)
+    return rows
+
+
+def _decimal(value, field, default=None):
+    if value is None or value == '':
+        return default
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise RowError(f"{field} must be a number, got {value!r}")
+
+
+def _id(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be an id, got {value!r}")
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _measurements(row):
+    measurements = row.get('measurements') or []
+    if row.get('measurement'):
+        measurements = [row['measurement']] + list(measurements)
+    return measurements
+
+
+class _Lookups:
+    """Every category, unit, branch and existing product name the rows refer to, one query per table"""
+
+    def __init__(self, rows):
+        ids = {'unit': set(), 'category': set(), 'branch': set()}
+        names = {'unit': set(), 'category': set(), 'branch': set()}
+
+        def collect(kind, data, key):
+            value = data.get(f'{key}_id')
+            if value not in (None, ''):
+                try:
+                    ids[kind].add(int(value))
+                except (TypeError, ValueError):
+                    pass
+            elif data.get(key):
+                names[kind].add(str(data[key]).strip().lower())
+
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            collect('unit', row, 'base_unit')
+            collect('category', row, 'category')
+            for measurement in _measurements(row):
+                if isinstance(measurement, dict):
+                    collect('unit', measurement, 'from_unit')
+                    collect('unit', measurement, 'to_unit')
+            stock = row.get('stock')
+            if isinstance(stock, dict):
+                collect('branch', stock, 'branch')
+                collect('unit', stock, 'original_unit')
+
+        self.units = self._load(ProductUnit, 'unit_name', ids['unit'], names['unit'])
+        self.categories = self._load(Category, 'category_name', ids['category'], names['category'])
+        self.branches = self._load(Branch, 'name', ids['branch'], names['branch'])
+        row_names = {str(row.get('name', '')).strip().lower() for row in rows if isinstance(row, dict)}
+        self.existing_names = set(
+            Product.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=row_names)
+            .values_list('lower_name', flat=True)
+        ) if row_names else set()
+
+    @staticmethod
+    def _load(model, name_field, ids, names):
+        by_id, by_name = {}, {}
+        if not ids and not names:
+            return by_id, by_name
+        objects = model.objects.annotate(lookup_name=Lower(name_field)).filter(
+            Q(pk__in=ids) | Q(lookup_name__in=names)
+        )
+        for obj in objects:
+            by_id[obj.pk] = obj
+            # Names that match several rows (categories of different item types) stay ambiguous
+            by_name[obj.lookup_name] = None if obj.lookup_name in by_name else obj
+        return by_id, by_name
+
+    def resolve(self, kind, data, key, required=False):
+        by_id, by_name = getattr(self, kind)
+        label = key.replace('_', ' ')
+        object_id = _id(data.get(f'{key}_id'), f'{key}_id')
+        if object_id is not None:
+            if object_id not in by_id:
+                raise RowError(f"Unknown {label} id {object_id}")
+            return by_id[object_id]
+        name = str(data.get(key) or '').strip()
+        if not name:
+            if required:
+                raise RowError(f"{key}_id is required")
+            return None
+        if name.lower() not in by_name:
+            raise RowError(f"Unknown {label} {name!r}")
+        if by_name[name.lower()] is None:
+            raise RowError(f"{label.capitalize()} {name!r} is ambiguous; give its id")
+        return by_name[name.lower()]
+
+
+class _Row:
+    """One validated import row and the objects it creates"""
+
+    def __init__(self, index, data, lookups, seen_names):
+        if not isinstance(data, dict):
+            raise RowError("Row must be an object")
+        self.index = index
+        self.name = str(data.get('name') or '').strip()
+        if not self.name:
+            raise RowError("name is required")
+        if len(self.name) > NAME_LENGTH:
+            raise RowError(f"name is longer than {NAME_LENGTH} characters")
+        if self.name.lower() in lookups.existing_names or self.name.lower() in seen_names:
+            raise RowError(f"Product with name '{self.name}' already exists.")
+
+        self.base_unit = lookups.resolve('units', data, 'base_unit')
+        self.product = Product(
+            name=self.name,
+            description=data.get('description') or '',
+            base_unit=self.base_unit,
+            base_unit_price=_decimal(data.get('base_unit_price'), 'base_unit_price'),
+            volume_per_base_unit_ml=_decimal(data.get('volume_per_base_unit_ml'), 'volume_per_base_unit_ml'),
+            category=lookups.resolve('categories', data, 'category'),
+        )
+
+        self.measurements = []
+        for measurement in _measurements(data):
+            if not isinstance(measurement, dict):
+                raise RowError("measurement must be an object")
+            amount = _decimal(measurement.get('amount_per'), 'amount_per')
+            if amount is None or amount <= 0:
+                raise RowError("amount_per must be positive")
+            self.measurements.append(ProductMeasurement(
+                from_unit=lookups.resolve('units', measurement, 'from_unit', required=True),
+                to_unit=lookups.resolve('units', measurement, 'to_unit', required=True),
+                amount_per=amount.quantize(AMOUNT_PLACES),
+                is_default_sales_unit=_flag(measurement.get('is_default_sales_unit', False)),
+            ))
+        self._check_conversions()
+
+        self.stock = self.ledger = None
+        if data.get('stock'):
+            self._build_stock(data['stock'], lookups)
+
+    def reset(self):
+        """Forget primary keys assigned by a rolled back insert"""
+        for obj in [self.product, self.stock, self.ledger] + self.measurements:
+            if obj is not None:
+                obj.pk = None
+                obj._state.adding = True
+
+    def _edges(self):
+        return [(m.from_unit.pk, m.to_unit.pk, m.amount_per) for m in self.measurements]
+
+    def _check_conversions(self):
+        if getattr(settings, 'INVENTORY_CONVERSION_CHECK', 'raise') == 'off' or not self.measurements:
+            return
+        edges = [(n, from_id, to_id, amount) for n, (from_id, to_id, amount) in enumerate(self._edges(), 1)]
+        problems = [issue for issue in analyze_product(None, self.base_unit and self.base_unit.pk, edges)
+                    if issue.kind in (INVALID, INCONSISTENT)]
+        if not problems:
+            return
+        if settings.INVENTORY_CONVERSION_CHECK == 'raise':
+            raise RowError('; '.join(issue.message for issue in problems))
+        logger.warning("Importing inconsistent conversions for %s: %s", self.name,
+                       '; '.join(issue.message for issue in problems))
+
+    def _build_stock(self, stock, lookups):
+        if not isinstance(stock, dict):
+            raise RowError("stock must be an object")
+        branch = lookups.resolve('branches', stock, 'branch', required=True)
+        unit = lookups.resolve('units', stock, 'original_unit', required=True)
+        original_quantity = _decimal(stock.get('original_quantity'), 'original_quantity', Decimal('0'))
+        threshold = _decimal(stock.get('minimum_threshold_base_units'), 'minimum_threshold_base_units',
+                             Decimal('0'))
+        if original_quantity < 0 or threshold < 0:
+            raise RowError("Quantity cannot be negative.")
+
+        quantity = _decimal(stock.get('quantity_in_base_units'), 'quantity_in_base_units')
+        if quantity is None:
+            if self.base_unit is None:
+                raise RowError("base_unit_id is required to convert the initial stock")
+            factor = ConversionGraph(self._edges()).factor(unit.pk, self.base_unit.pk)
+            if factor is None:
+                default = default_conversion_factor(unit.unit_name, self.base_unit.unit_name)
+                if default is None:
+                    raise RowError(f"No conversion path found and no default available for "
+                                   f"{unit.unit_name} -> {self.base_unit.unit_name}")
+                factor = Decimal(str(default))
+                self.measurements.append(ProductMeasurement(
+                    from_unit=unit, to_unit=self.base_unit, amount_per=factor.quantize(AMOUNT_PLACES),
+                ))
+            quantity = original_quantity * factor
+        quantity = quantity.quantize(CENT)
+
+        self.stock = Stock(
+            branch=branch,
+            quantity_in_base_units=quantity,
+            minimum_threshold_base_units=threshold,
+            running_out=quantity <= threshold,
+            original_quantity=original_quantity,
+            original_unit=unit,
+        )
+        if original_quantity:
+            self.ledger = InventoryTransaction(
+                branch=branch,
+                transaction_type='restock',
+                quantity=original_quantity,
+                transaction_unit=unit,
+                quantity_in_base_units=quantity,
+                price_at_transaction=self.product.base_unit_price or Decimal('0.00'),
+                notes=f"Initial stock: {original_quantity} {unit.unit_name}",
+            )
+
+
+def _write(rows, initiated_by=None):
+    """Insert the rows' products and related objects, one INSERT per table"""
+    products = Product.objects.bulk_create([row.product for row in rows])
+    measurements, stocks = [], []
+    for row in rows:
+        for measurement in row.measurements:
+            measurement.product = row.product
+            measurements.append(measurement)
+        if row.stock is not None:
+            row.stock.product = row.product
+            stocks.append(row.stock)
+    ProductMeasurement.objects.bulk_create(measurements)
+    Stock.objects.bulk_create(stocks)
+
+    ledger = []
+    for row in rows:
+        if row.ledger is not None:
+            row.ledger.product = row.product
+            row.ledger.to_stock_main = row.stock
+            row.ledger.initiated_by = initiated_by
+            ledger.append(row.ledger)
+    InventoryTransaction.objects.bulk_create(ledger)
+
+    invalidate_conversion_graphs(product.pk for product in products)
+    for product in products:
+        record('create', product, user=initiated_by, details={'product_name': product.name},
+               notes="Product created via bulk import")
+    return products
+
+
+def _write_chunks(rows, chunk_size, initiated_by, created, errors):
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with transaction.atomic():
+                created.extend(_write(chunk, initiated_by))
+        except IntegrityError:
+            logger.warning("Chunk of %s products hit an integrity error; retrying row by row", len(chunk))
+            for row in chunk:
+                row.reset()
+                try:
+                    with transaction.atomic():
+                        created.extend(_write([row], initiated_by))
+                except IntegrityError as e:
+                    errors.append({'row': row.index, 'product': row.name, 'error': str(e)})
+
+
+def import_products(data, initiated_by=None, chunk_size=CHUNK_SIZE):
+    """
+    Import product rows (dicts, see the module docstring). Returns an
+    ImportResult of the created products and ``{'row', 'product', 'error'}``
+    dicts for the rows that were skipped.
+    """
+    data = list(data)
+    lookups = _Lookups(data)
+    errors, valid, seen_names = [], [], set()
+    for index, row_data in enumerate(data):
+        try:
+            row = _Row(index, row_data, lookups, seen_names)
+        except RowError as e:
+            name = row_data.get('name') if isinstance(row_data, dict) else None
+            errors.append({'row': index, 'product': name, 'error': str(e)})
+            continue
+        seen_names.add(row.name.lower())
+        valid.append(row)
+
+    created = []
+    with audit_batch():
+        _write_chunks(valid, chunk_size, initiated_by, created, errors)
+
+    if created:
+        from reports.kpis import invalidate_owner_kpis
+        invalidate_owner_kpis()
+    errors.sort(key=lambda error: error['row'])
+    logger.info("Imported %s products, skipped %s rows", len(created), len(errors))
+    return ImportResult(created, errors)
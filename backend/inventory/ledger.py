@@ -0,0 +1,217 @@
+"""
+Stock balances from the inventory ledger.
+
+``InventoryTransaction`` rows are the source of truth for store (``Stock``)
+and bar (``BarmanStock``) balances: a row with ``to_stock_main`` adds its
+(absolute) base quantity to that store stock and one with ``from_stock_main``
+removes it, and ``to_stock_barman``/``from_stock_barman`` do the same for
+bar stock. ``StockSnapshot`` checkpoints that sum per stock row, so a balance
+is always the nearest snapshot plus the ledger rows written after it, never
+a scan of the whole ledger.
+
+Every balance change writes its ledger row in the same transaction: sales
+and their reversals (inventory/consumption.py), transfers, restocks and
+manual adjustments (``adjust_stock`` in inventory/transfers.py). The API
+never writes a balance directly.
+
+``take_snapshots`` (management command ``snapshot_stock``, run periodically
+per branch) writes the next checkpoint. Rows that had no snapshot get an
+opening one at their live balance. Ledger ids are allocated before commit,
+so a checkpoint only covers rows older than ``SETTLE_SECONDS`` (as in
+orders/changes.py); newer rows stay in the tail.
+
+``stock_at`` answers "store stock of product P at branch B at time T" with
+three queries. ``reconcile`` compares live balances with snapshot plus tail
+and can reset drifted rows to the ledger (management command
+``reconcile_stock``).
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from .models import BarmanStock, InventoryTransaction, Stock, StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+SETTLE_SECONDS = 2
+
+
+class Location:
+    """Where a kind of stock row sits in the ledger and in ``StockSnapshot``"""
+
+    def __init__(self, name, model, snapshot_field, to_field, from_field, prefix=''):
+        self.name = name
+        self.model = model
+        self.snapshot_field = f'{snapshot_field}_id'
+        self.to_field = f'{to_field}_id'
+        self.from_field = f'{from_field}_id'
+        self.product_field = f'{prefix}product_id'
+        self.branch_field = f'{prefix}branch_id'
+
+
+STORE = Location('store', Stock, 'stock', 'to_stock_main', 'from_stock_main')
+BAR = Location('bar', BarmanStock, 'barman_stock', 'to_stock_barman', 'from_stock_barman', prefix='stock__')
+# In the (table, id) order writers lock rows in (inventory/transfers.py)
+LOCATIONS = sorted((STORE, BAR), key=lambda location: location.model._meta.db_table)
+
+
+def latest_snapshots(stock_ids, at=None, location=STORE):
+    """stock id -> its newest snapshot (taken at or before ``at``), in one query"""
+    field = location.snapshot_field
+    snapshots = StockSnapshot.objects.filter(**{f'{field}__in': stock_ids})
+    newer = StockSnapshot.objects.filter(**{field: OuterRef(field)}).filter(
+        Q(taken_at__gt=OuterRef('taken_at')) | Q(taken_at=OuterRef('taken_at'), pk__gt=OuterRef('pk'))
+    )
+    if at is not None:
+        snapshots = snapshots.filter(taken_at__lte=at)
+        newer = newer.filter(taken_at__lte=at)
+    return {getattr(snapshot, field): snapshot for snapshot in snapshots.filter(~Exists(newer))}
+
+
+def ledger_rows(stock_ids, after_id=0, until=None, location=STORE):
+    """(stock id, transaction id, signed base quantity) of ledger rows after ``after_id``, in one query"""
+    stock_ids = set(stock_ids)
+    rows = InventoryTransaction.objects.filter(
+        Q(**{f'{location.to_field}__in': stock_ids}) | Q(**{f'{location.from_field}__in': stock_ids}),
+        pk__gt=after_id,
+    )
+    if until is not None:
+        rows = rows.filter(transaction_date__lte=until)
+    for to_id, from_id, row_id, quantity in rows.values_list(
+            location.to_field, location.from_field, 'id', 'quantity_in_base_units'):
+        quantity = abs(quantity)
+        if to_id in stock_ids:
+            yield to_id, row_id, quantity
+        if from_id in stock_ids:
+            yield from_id, row_id, -quantity
+
+
+def ledger_balances(stock_ids, at=None, location=STORE):
+    """
+    stock id -> balance from its snapshot and ledger tail (as of ``at``, or
+    now). Stocks with no snapshot by then are left out. Two queries.
+    """
+    snapshots = latest_snapshots(stock_ids, at, location)
+    if not snapshots:
+        return {}
+    balances = {stock_id: snapshot.quantity_in_base_units for stock_id, snapshot in snapshots.items()}
+    after_id = min(snapshot.last_transaction_id for snapshot in snapshots.values())
+    for stock_id, row_id, quantity in ledger_rows(snapshots, after_id, at, location):
+        snapshot = snapshots.get(stock_id)
+        if snapshot is not None and row_id > snapshot.last_transaction_id:
+            balances[stock_id] += quantity
+    return balances
+
+
+def stock_at(product_id, branch_id, at=None):
+    """Store stock of a product at a branch as of ``at`` (now by default), or None if unknown"""
+    stock_id = Stock.objects.filter(product_id=product_id, branch_id=branch_id).values_list('id', flat=True).first()
+    if stock_id is None:
+        return None
+    return ledger_balances([stock_id], at).get(stock_id)
+
+
+def _stocks(location, branch_id=None):
+    stocks = location.model.objects.all()
+    if branch_id:
+        stocks = stocks.filter(**{location.branch_field: branch_id})
+    return stocks
+
+
+@transaction.atomic
+def take_snapshots(branch_id=None):
+    """Checkpoint every store and bar stock row (of ``branch_id``). Returns the new snapshots."""
+    # Writers update the stock row in the same transaction as their ledger row
+    live = {
+        location: dict(_stocks(location, branch_id).select_for_update(of=('self',)).order_by('id')
+                       .values_list('id', 'quantity_in_base_units'))
+        for location in LOCATIONS
+    }
+    if not any(live.values()):
+        return []
+    now = timezone.now()
+    # Newest first on the primary key, so this stops at the first settled row
+    through_id = (
+        InventoryTransaction.objects.filter(transaction_date__lte=now - timedelta(seconds=SETTLE_SECONDS))
+        .order_by('-pk').values_list('pk', flat=True).first()
+    ) or 0
+    snapshots = []
+    for location in LOCATIONS:
+        if live[location]:
+            snapshots.extend(_snapshots(location, live[location], through_id, now))
+    return StockSnapshot.objects.bulk_create(snapshots)
+
+
+def _snapshots(location, live, through_id, now):
+    previous = latest_snapshots(live, location=location)
+    floors = {stock_id: previous[stock_id].last_transaction_id if stock_id in previous else through_id
+              for stock_id in live}
+    settled_delta, recent_delta = defaultdict(Decimal), defaultdict(Decimal)
+    for stock_id, row_id, quantity in ledger_rows(live, min(floors.values()), location=location):
+        if row_id > floors[stock_id]:
+            (settled_delta if row_id <= through_id else recent_delta)[stock_id] += quantity
+
+    snapshots = []
+    for stock_id, quantity in live.items():
+        snapshot = previous.get(stock_id)
+        if snapshot is None:
+            # The live balance already includes the unsettled tail
+            snapshots.append(StockSnapshot(
+                **{location.snapshot_field: stock_id}, taken_at=now,
+                quantity_in_base_units=quantity - recent_delta[stock_id],
+                last_transaction_id=through_id, is_opening=True,
+            ))
+            continue
+        balance = snapshot.quantity_in_base_units + settled_delta[stock_id]
+        drift = quantity - balance - recent_delta[stock_id]
+        if drift:
+            logger.warning("%s stock %s is %s off its ledger balance", location.name.title(), stock_id, drift)
+        snapshots.append(StockSnapshot(
+            **{location.snapshot_field: stock_id}, taken_at=now, quantity_in_base_units=balance,
+            last_transaction_id=max(through_id, snapshot.last_transaction_id), drift=drift,
+        ))
+    return snapshots
+
+
+def reconcile(branch_id=None, fix=False):
+    """
+    Store and bar stock rows (of ``branch_id``) whose live balance differs
+    from snapshot plus ledger tail, as dicts of location ('store' or 'bar'),
+    stock, product, ledger and live balance. Only the tail since each row's
+    last snapshot is read. With ``fix``, the drifted rows are reset to the
+    ledger balance.
+    """
+    drifted = []
+    for location in (STORE, BAR):
+        live = {
+            row[0]: row[1:] for row in
+            _stocks(location, branch_id).values_list('id', location.product_field, 'quantity_in_base_units')
+        }
+        if not live:
+            continue
+        expected = ledger_balances(live, location=location)
+        drifted.extend(
+            {'location': location.name, 'stock': stock_id, 'product': live[stock_id][0], 'ledger': balance,
+             'live': live[stock_id][1]}
+            for stock_id, balance in expected.items() if balance != live[stock_id][1]
+        )
+    if fix and drifted:
+        with transaction.atomic():
+            for location in LOCATIONS:
+                rows = [row for row in drifted if row['location'] == location.name]
+                if not rows:
+                    continue
+                location.model.objects.filter(pk__in=[row['stock'] for row in rows]).update(
+                    quantity_in_base_units=Case(*[When(pk=row['stock'], then=Value(row['ledger'])) for row in rows]),
+                    last_stock_update=timezone.now(),
+                )
+            if any(row['location'] == STORE.name for row in drifted):
+                from reports.kpis import invalidate_owner_kpis
+                invalidate_owner_kpis(branch_id)
+        logger.warning("Reset %s stock rows to their ledger balance", len(drifted))
+    return drifted
@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.signals import post_save
+
+from inventory.audit import audit_batch, drain
+from inventory.models import AuditLog, Product, ProductUnit
+from inventory.signals import track_product_update
+from inventory.views import ProductViewSet
+
+MODES = ('direct', 'batched', 'background')
+
+
+def direct_audit(sender, instance, created, **kwargs):
+    # The audit receiver as it was before inventory/audit.py: one INSERT per save
+    action = 'create' if created else 'update'
+    AuditLog.objects.create(
+        user=None,
+        action=action,
+        object_id=instance.pk,
+        content_type=ContentType.objects.get_for_model(instance),
+        details={'product_name': instance.name},
+        notes=f"Product {action}d via system auto-log",
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Time a bulk product import (the products/bulk_create code path) with audit entries written '
+        'one per save, batched after commit and handed to the background writer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Products to import per mode')
+        parser.add_argument('--mode', choices=MODES, action='append', dest='modes', help='Only run this mode')
+        parser.add_argument('--keep', action='store_true', help='Keep the imported products and their audit rows')
+
+    def handle(self, *args, **options):
+        total = options['products']
+        unit = ProductUnit.objects.create(unit_name=f'audit-bench-{time.time_ns()}')
+        view = ProductViewSet()
+        try:
+            for mode in options['modes'] or MODES:
+                prefix = f'Audit bench {mode} {unit.pk}'
+                elapsed, audited = self.run_mode(mode, view, prefix, unit, total)
+                self.stdout.write(
+                    f"{mode:>10}: {total} products in {elapsed:.2f}s ({total / elapsed:.0f} products/s), "
+                    f"{audited} audit rows"
+                )
+                if audited != total:
+                    raise CommandError(f"{mode}: expected {total} audit rows, found {audited}")
+        finally:
+            if not options['keep']:
+                product_ids = list(Product.objects.filter(base_unit=unit).values_list('id', flat=True))
+                AuditLog.objects.filter(content_type=ContentType.objects.get_for_model(Product),
+                                        object_id__in=product_ids).delete()
+                Product.objects.filter(pk__in=product_ids).delete()
+                unit.delete()
+
+    def run_mode(self, mode, view, prefix, unit, total):
+        if mode == 'direct':
+            post_save.disconnect(track_product_update, sender=Product)
+            post_save.connect(direct_audit, sender=Product)
+        try:
+            started = time.perf_counter()
+            # One request's worth of imports, as AuditLogMiddleware wraps it
+            with audit_batch(background=mode == 'background'):
+                for i in range(total):
+                    view.create_product_with_related({'name': f'{prefix} {i}', 'base_unit_id': unit.pk})
+            elapsed = time.perf_counter() - started
+        finally:
+            if mode == 'direct':
+                post_save.disconnect(direct_audit, sender=Product)
+                post_save.connect(track_product_update, sender=Product)
+        if mode == 'background':
+            drain()
+        audited = AuditLog.objects.filter(details__product_name__startswith=prefix).count()
+        return elapsed, audited
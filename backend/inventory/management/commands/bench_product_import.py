@@ -0,0 +1,70 @@
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from branches.models import Branch
+from inventory.audit import audit_batch
+from inventory.imports import import_products
+from inventory.models import AuditLog, InventoryTransaction, Product, ProductUnit
+from inventory.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Time importing generated products (with a conversion and initial stock each) through the '
+        'bulk import engine, and optionally through the old one-product-at-a-time path.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Products to import')
+        parser.add_argument('--per-row', type=int, default=0,
+                            help='Also import this many products one at a time for comparison')
+        parser.add_argument('--keep', action='store_true', help='Keep the imported products')
+
+    def handle(self, *args, **options):
+        tag = time.time_ns()
+        carton = ProductUnit.objects.create(unit_name=f'bench-carton-{tag}')
+        bottle = ProductUnit.objects.create(unit_name=f'bench-bottle-{tag}')
+        branch = Branch.objects.create(name=f'Import benchmark {tag}')
+
+        def rows(prefix, count):
+            return [{
+                'name': f'{prefix} {tag} {i}',
+                'base_unit_id': bottle.pk,
+                'base_unit_price': '12.50',
+                'measurement': {'from_unit_id': carton.pk, 'to_unit_id': bottle.pk, 'amount_per': 24},
+                'stock': {'branch_id': branch.pk, 'original_quantity': 3, 'original_unit_id': carton.pk},
+            } for i in range(count)]
+
+        try:
+            total = options['products']
+            started = time.perf_counter()
+            result = import_products(rows('Bulk', total))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"bulk import: {total} products in {elapsed:.2f}s ({total / elapsed:.0f} products/s)")
+            if result.errors or len(result.created) != total:
+                raise CommandError(f"Imported {len(result.created)}/{total}; first error: {result.errors[:1]}")
+
+            per_row = options['per_row']
+            if per_row:
+                view = ProductViewSet()
+                started = time.perf_counter()
+                with audit_batch():
+                    for data in rows('Single', per_row):
+                        view.create_product_with_related(data)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"   per row: {per_row} products in {elapsed:.2f}s ({per_row / elapsed:.0f} products/s)"
+                )
+        finally:
+            if not options['keep']:
+                products = Product.objects.filter(base_unit=bottle)
+                product_ids = list(products.values_list('id', flat=True))
+                AuditLog.objects.filter(content_type=ContentType.objects.get_for_model(Product),
+                                        object_id__in=product_ids).delete()
+                InventoryTransaction.objects.filter(product_id__in=product_ids).delete()
+                products.delete()
+                branch.delete()
+                carton.delete()
+                bottle.delete()
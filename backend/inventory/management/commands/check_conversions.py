@@ -0,0 +1,38 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.conversion_checks import analyze_conversions, repair
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every product\'s unit conversions for inconsistent cycles, units with no path '
+        'to the base unit and stock kept in unconvertible units.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='Only check this product id (repeatable)')
+        parser.add_argument('--fix', action='store_true',
+                            help='Delete invalid measurements and those contradicting the path through the base unit')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error if issues remain')
+
+    def handle(self, *args, **options):
+        issues = analyze_conversions(options['products'])
+        for issue in issues:
+            marker = 'fixable' if issue.fixable else 'manual'
+            self.stdout.write(f"[{issue.kind}] product {issue.product_id} ({marker}): {issue.message}")
+
+        counts = Counter(issue.kind for issue in issues)
+        summary = ', '.join(f'{count} {kind}' for kind, count in sorted(counts.items())) or 'no issues'
+        self.stdout.write(f"Found {summary}.")
+
+        if options['fix'] and issues:
+            deleted = repair(issues)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} measurements."))
+            issues = analyze_conversions(options['products'])
+            self.stdout.write(f"{len(issues)} issues remain.")
+
+        if options['strict'] and issues:
+            raise CommandError(f"{len(issues)} conversion issues")
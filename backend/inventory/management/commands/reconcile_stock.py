@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Compare live store and bar stock balances with the inventory ledger since the last snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help='Only reconcile this branch id')
+        parser.add_argument('--fix', action='store_true', help='Reset drifted stock rows to their ledger balance')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error if stock has drifted')
+
+    def handle(self, *args, **options):
+        drifted = reconcile(options['branch'], fix=options['fix'])
+        for row in drifted:
+            self.stdout.write(
+                f"{row['location'].title()} stock {row['stock']} (product {row['product']}): "
+                f"ledger {row['ledger']}, live {row['live']}"
+            )
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Stock matches the ledger."))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Reset {len(drifted)} stock rows to the ledger."))
+        elif options['strict']:
+            raise CommandError(f"{len(drifted)} stock rows differ from the ledger")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Checkpoint store and bar stock balances from the inventory ledger. Run periodically so '
+        'point-in-time stock queries only read the ledger rows since the last snapshot.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help='Only snapshot this branch id')
+
+    def handle(self, *args, **options):
+        snapshots = take_snapshots(options['branch'])
+        opening = sum(1 for snapshot in snapshots if snapshot.is_opening)
+        drifted = [snapshot for snapshot in snapshots if snapshot.drift]
+        for snapshot in drifted:
+            self.stdout.write(self.style.WARNING(
+                f"{snapshot} (ledger balance) is {snapshot.drift} off the live balance"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Took {len(snapshots)} snapshots ({opening} opening, {len(drifted)} drifted)."
+        ))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def open_stock_snapshots(apps, schema_editor):
+    # Existing balances become the ledger's opening baseline
+    Stock = apps.get_model('inventory', 'Stock')
+    StockSnapshot = apps.get_model('inventory', 'StockSnapshot')
+    InventoryTransaction = apps.get_model('inventory', 'InventoryTransaction')
+    through_id = InventoryTransaction.objects.aggregate(last=Max('id'))['last'] or 0
+    now = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(
+            stock_id=stock_id, taken_at=now, quantity_in_base_units=quantity,
+            last_transaction_id=through_id, is_opening=True,
+        )
+        for stock_id, quantity in Stock.objects.values_list('id', 'quantity_in_base_units').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('quantity_in_base_units', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_transaction_id', models.BigIntegerField(default=0, help_text='Last InventoryTransaction included')),
+                ('is_opening', models.BooleanField(default=False)),
+                ('drift', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Live balance minus ledger balance when the snapshot was taken', max_digits=12)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.stock')),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['stock', 'taken_at'], name='stock_snapshot_idx')],
+            },
+        ),
+        migrations.RunPython(open_stock_snapshots, migrations.RunPython.noop),
+    ]
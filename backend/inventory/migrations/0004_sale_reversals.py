@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stock_snapshots'),
+        ('orders', '0006_order_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='order_item',
+            field=models.ForeignKey(blank=True, help_text='Order item a sale (or its reversal) was for', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_transactions', to='orders.orderitem'),
+        ),
+        migrations.AlterField(
+            model_name='inventorytransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('restock', 'Restock (Inbound)'), ('sale', 'Sale (Outbound)'), ('wastage', 'Wastage (Outbound)'), ('store_to_barman', 'Transfer Store to Barman'), ('barman_to_store', 'Transfer Barman to Store'), ('adjustment_in', 'Adjustment In'), ('adjustment_out', 'Adjustment Out'), ('sale_reversal', 'Sale Reversal (Inbound)')], max_length=20),
+        ),
+    ]
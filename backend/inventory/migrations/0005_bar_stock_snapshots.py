@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_sale_reversals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='barman_stock',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.barmanstock'),
+        ),
+        migrations.AlterField(
+            model_name='stocksnapshot',
+            name='stock',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.stock'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['barman_stock', 'taken_at'], name='barman_stock_snapshot_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('barman_stock__isnull', True), ('stock__isnull', False)), models.Q(('barman_stock__isnull', False), ('stock__isnull', True)), _connector='OR'), name='stock_snapshot_one_location'),
+        ),
+    ]
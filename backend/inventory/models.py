@@ -11,6 +11,10 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 from django.contrib import admin
+import logging
+from core.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 
 # --- Lookup Tables ---
@@ -83,31 +87,19 @@ class Product(models.Model):
             raise ValidationError(
                 {'volume_per_base_unit_ml': 'Volume per base unit (ml) is required for liquid products.'}
             )
+    def conversion_graph(self):
+        """All-pairs unit conversion factors, memoised (see inventory/conversions.py)"""
+        from .conversions import conversion_graph
+        return conversion_graph(self.pk)
     def get_conversion_factor(self, from_unit, to_unit):
         if from_unit == to_unit:
             return Decimal('1.0')
-        try:
-            conversion = self.measurements.get(from_unit=from_unit, to_unit=to_unit)
-            return conversion.amount_per
-        except ProductMeasurement.DoesNotExist:
-            pass
-        try:
-            conversion = self.measurements.get(from_unit=to_unit, to_unit=from_unit)
-            return Decimal('1.0') / conversion.amount_per
-        except ProductMeasurement.DoesNotExist:
-            pass
-        if from_unit != self.base_unit and to_unit != self.base_unit:
-            try:
-                factor_from_to_base = self.get_conversion_factor(from_unit, self.base_unit)
-                factor_base_to_to = self.get_conversion_factor(self.base_unit, to_unit)
-                return factor_from_to_base * factor_base_to_to
-            except ValueError:
-                pass
-        raise ValueError(f"No conversion path found for Product '{self.name}' from '{from_unit.unit_name}' to '{to_unit.unit_name}'.")
+        factor = self.conversion_graph().factor(from_unit, to_unit)
+        if factor is None:
+            raise ValueError(f"No conversion path found for Product '{self.name}' from '{from_unit.unit_name}' to '{to_unit.unit_name}'.")
+        return factor
     def get_smallest_unit(self):
-        from_units = set(self.measurements.values_list('from_unit', flat=True))
-        to_units = set(self.measurements.values_list('to_unit', flat=True))
-        smallest_unit_ids = [uid for uid in to_units if uid not in from_units]
+        smallest_unit_ids = self.conversion_graph().smallest_unit_ids
         if not smallest_unit_ids:
             return None
         return ProductUnit.objects.get(id=smallest_unit_ids[0])
@@ -117,27 +109,11 @@ class Product(models.Model):
             raise ValueError(f"No smallest unit defined for product '{self.name}'")
         return self._get_conversion_factor_recursive(from_unit, smallest_unit, set())
     def _get_conversion_factor_recursive(self, from_unit, to_unit, visited):
-        if from_unit == to_unit:
-            return Decimal('1.0')
-        visited.add(from_unit.id if hasattr(from_unit, 'id') else from_unit)
-        try:
-            conv = self.measurements.get(from_unit=from_unit, to_unit=to_unit)
-            return conv.amount_per
-        except ProductMeasurement.DoesNotExist:
-            pass
-        for m in self.measurements.filter(from_unit=from_unit):
-            if (m.to_unit.id if hasattr(m.to_unit, 'id') else m.to_unit) not in visited:
-                try:
-                    factor = self._get_conversion_factor_recursive(m.to_unit, to_unit, visited)
-                    return m.amount_per * factor
-                except Exception:
-                    continue
-        try:
-            conv = self.measurements.get(from_unit=to_unit, to_unit=from_unit)
-            return Decimal('1.0') / conv.amount_per
-        except ProductMeasurement.DoesNotExist:
-            pass
-        raise ValueError(f"No conversion path from {from_unit} to {to_unit} for product '{self.name}'")
+        # Kept for callers of the old recursive walk; the graph already holds the shortest path
+        factor = self.conversion_graph().factor(from_unit, to_unit)
+        if factor is None:
+            raise ValueError(f"No conversion path from {from_unit} to {to_unit} for product '{self.name}'")
+        return factor
 
 class ProductMeasurement(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='measurements')
@@ -164,6 +140,8 @@ class ProductMeasurement(models.Model):
             raise ValidationError("From Unit and To Unit cannot be the same.")
         if self.amount_per <= 0:
             raise ValidationError({'amount_per': 'Amount per must be positive.'})
+        from .conversion_checks import validate_measurement
+        validate_measurement(self)
 from decimal import Decimal
 from django.db import models
 from django.utils import timezone
@@ -227,6 +205,7 @@ class Stock(models.Model):
             raise ValidationError({'quantity_in_base_units': 'Quantity cannot be negative.'})
         if self.minimum_threshold_base_units < 0:
             raise ValidationError({'minimum_threshold_base_units': 'Minimum threshold cannot be negative.'})
+    @traced(logger, 'Stock.adjust_quantity')
     def adjust_quantity(self, quantity, unit, is_addition=True, original_quantity_delta=None):
         """
         Adjust quantity_in_base_units and original_quantity by adding the delta values.
@@ -236,8 +215,8 @@ class Stock(models.Model):
         is_addition: if False, quantities will be subtracted
         """
         
-        print(f"[DEBUG] Stock.adjust_quantity() called for {self.product.name} - quantity: {quantity}, is_addition: {is_addition}, original_quantity_delta: {original_quantity_delta}")
-        print(f"[DEBUG] Before adjustment - quantity_in_base_units: {self.quantity_in_base_units}, original_quantity: {self.original_quantity}")
+        logger.debug("Stock.adjust_quantity() called for product %s - quantity: %s, is_addition: %s, original_quantity_delta: %s", self.product_id, quantity, is_addition, original_quantity_delta)
+        logger.debug("Before adjustment - quantity_in_base_units: %s, original_quantity: %s", self.quantity_in_base_units, self.original_quantity)
 
         # Convert to Decimal and validate
         try:
@@ -269,8 +248,8 @@ class Stock(models.Model):
         if self.original_quantity is None:
             self.original_quantity = Decimal("0.00")
 
-        print(f"[DEBUG] Stock.adjust_quantity() - Before update - quantity_in_base_units: {self.quantity_in_base_units}, original_quantity: {self.original_quantity}")
-        print(f"[DEBUG] Stock.adjust_quantity() - Adding quantity: {quantity}, original_quantity_delta: {original_quantity_delta}")
+        logger.debug("Stock.adjust_quantity() - Before update - quantity_in_base_units: %s, original_quantity: %s", self.quantity_in_base_units, self.original_quantity)
+        logger.debug("Stock.adjust_quantity() - Adding quantity: %s, original_quantity_delta: %s", quantity, original_quantity_delta)
 
         # Update fields atomically
         Stock.objects.filter(id=self.id).update(
@@ -280,9 +259,13 @@ class Stock(models.Model):
         )
 
         self.refresh_from_db()
-        print(f"[DEBUG] Stock.adjust_quantity() - After update - quantity_in_base_units: {self.quantity_in_base_units}, original_quantity: {self.original_quantity}")
+        logger.debug("Stock.adjust_quantity() - After update - quantity_in_base_units: %s, original_quantity: %s", self.quantity_in_base_units, self.original_quantity)
         self.update_running_out_status()
 
+        # The queryset update bypasses post_save; the owner's inventory value changed
+        from reports.kpis import invalidate_owner_kpis
+        invalidate_owner_kpis(self.branch_id)
+
     def update_running_out_status(self):
         from django.db.models.expressions import CombinedExpression
 
@@ -326,7 +309,7 @@ class Stock(models.Model):
                     'base_unit': self.product.base_unit.unit_name
                 }
         except Exception as e:
-            print(f"Error in original_quantity_display: {e}")
+            logger.error("Error in original_quantity_display: %s", e)
             pass
         return None
 
@@ -352,9 +335,10 @@ class BarmanStock(models.Model):
             raise ValidationError({'quantity_in_base_units': 'Quantity cannot be negative.'})
         if self.minimum_threshold_base_units < 0:
             raise ValidationError({'minimum_threshold_base_units': 'Minimum threshold cannot be negative.'})
+    @traced(logger, 'BarmanStock.adjust_quantity')
     def adjust_quantity(self, quantity, unit, is_addition=True):
         # quantity is already in base units
-        print(f"[DEBUG] BarmanStock.adjust_quantity() called - quantity: {quantity}, is_addition: {is_addition}, unit: {unit}")
+        logger.debug("BarmanStock.adjust_quantity() called - quantity: %s, is_addition: %s, unit: %s", quantity, is_addition, unit)
         
         if not isinstance(quantity, Decimal):
             quantity = Decimal(str(quantity))
@@ -369,15 +353,15 @@ class BarmanStock(models.Model):
                 raise ValidationError(f"Insufficient stock of {self.stock.product.name} to remove {quantity} {self.stock.product.base_unit.unit_name}. Available: {current_stock} {self.stock.product.base_unit.unit_name}")
             quantity_in_base_units_to_adjust = -quantity_in_base_units_to_adjust
 
-        print(f"[DEBUG] BarmanStock.adjust_quantity() - Before update - quantity_in_base_units: {self.quantity_in_base_units}")
-        print(f"[DEBUG] BarmanStock.adjust_quantity() - Adding quantity_in_base_units_to_adjust: {quantity_in_base_units_to_adjust}")
+        logger.debug("BarmanStock.adjust_quantity() - Before update - quantity_in_base_units: %s", self.quantity_in_base_units)
+        logger.debug("BarmanStock.adjust_quantity() - Adding quantity_in_base_units_to_adjust: %s", quantity_in_base_units_to_adjust)
 
         BarmanStock.objects.filter(id=self.id).update(
             quantity_in_base_units=F('quantity_in_base_units') + quantity_in_base_units_to_adjust,
             last_stock_update=timezone.now()
         )
         self.refresh_from_db()
-        print(f"[DEBUG] BarmanStock.adjust_quantity() - After update - quantity_in_base_units: {self.quantity_in_base_units}")
+        logger.debug("BarmanStock.adjust_quantity() - After update - quantity_in_base_units: %s", self.quantity_in_base_units)
 
         # Update original_quantity properly - don't recalculate from base units
         if is_addition and self.original_unit and self.original_unit == unit:
@@ -453,7 +437,7 @@ class BarmanStock(models.Model):
             conversion_factor = product.get_conversion_factor(product.base_unit, target_unit)
             return self.quantity_in_base_units #* conversion_factor
         except ValueError as e:
-            print(f"Warning: No valid conversion path for Product '{product.name}' from base unit '{product.base_unit.unit_name}' to target unit '{target_unit.unit_name}': {e}")
+            logger.warning("No valid conversion path for Product '%s' from base unit '%s' to target unit '%s': %s", product.name, product.base_unit.unit_name, target_unit.unit_name, e)
             return None
     @property
     def display_stock_summary(self):
@@ -513,7 +497,7 @@ class BarmanStock(models.Model):
                     'base_unit': self.stock.product.base_unit.unit_name
                 }
         except Exception as e:
-            print(f"Error in BarmanStock original_quantity_display: {e}")
+            logger.error("Error in BarmanStock original_quantity_display: %s", e)
             pass
         return None
 
@@ -527,6 +511,7 @@ class InventoryTransaction(models.Model):
         ('barman_to_store', 'Transfer Barman to Store'),
         ('adjustment_in', 'Adjustment In'),
         ('adjustment_out', 'Adjustment Out'),
+        ('sale_reversal', 'Sale Reversal (Inbound)'),
     )
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='transactions')
@@ -542,6 +527,7 @@ class InventoryTransaction(models.Model):
     to_stock_barman = models.ForeignKey(BarmanStock, on_delete=models.SET_NULL, null=True, blank=True, related_name='incoming_transactions_barman', help_text="Barman stock affected (destination)")
     initiated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_transactions')
     price_at_transaction = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    order_item = models.ForeignKey('orders.OrderItem', on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_transactions', help_text="Order item a sale (or its reversal) was for")
     notes = models.TextField(blank=True, null=True)
     class Meta:
         verbose_name = "Inventory Transaction"
@@ -556,13 +542,13 @@ class InventoryTransaction(models.Model):
         # Skip quantity_in_base_units calculation for restock transactions that are handled by the view
         # This prevents double calculation when skip_stock_adjustment=True
         if hasattr(self, '_skip_quantity_calculation') and self._skip_quantity_calculation:
-            print(f"[DEBUG] Skipping quantity_in_base_units calculation for transaction {self.id}")
+            logger.debug("Skipping quantity_in_base_units calculation for transaction %s", self.id)
             pass
         else:
             try:
                 conversion_factor = self.product.get_conversion_factor(self.transaction_unit, self.product.base_unit)
                 self.quantity_in_base_units = (self.quantity * conversion_factor).quantize(Decimal('0.01'))
-                print(f"[DEBUG] Calculated quantity_in_base_units in clean(): {self.quantity_in_base_units}")
+                logger.debug("Calculated quantity_in_base_units in clean(): %s", self.quantity_in_base_units)
             except ValueError as e:
                 raise ValidationError({'transaction_unit': f'Invalid unit conversion for this product: {e}'})
         
@@ -574,7 +560,7 @@ class InventoryTransaction(models.Model):
             self.quantity_in_base_units = -abs(self.quantity_in_base_units)
             if self.transaction_type == 'sale' and self.price_at_transaction is None:
                 raise ValidationError({'price_at_transaction': 'Sale price is required for sales transactions.'})
-        elif self.transaction_type in ['restock', 'adjustment_in']:
+        elif self.transaction_type in ['restock', 'adjustment_in', 'sale_reversal']:
             if not (self.to_stock_main or self.to_stock_barman):
                 raise ValidationError("For inbound transactions, a 'to' stock location must be specified.")
             if self.from_stock_main or self.from_stock_barman:
@@ -590,39 +576,43 @@ class InventoryTransaction(models.Model):
             if not (self.from_stock_barman and self.to_stock_main):
                 raise ValidationError("For 'barman_to_store' transfer, both barman source and main store destination must be specified.")
             self.quantity_in_base_units = abs(self.quantity_in_base_units)
+    @traced(logger, 'InventoryTransaction.save')
     def save(self, *args, **kwargs):
         # Extract skip_stock_adjustment from kwargs before calling super().save()
         skip_stock_adjustment = kwargs.pop('skip_stock_adjustment', False)
         
-        print(f"[DEBUG] InventoryTransaction.save() - skip_stock_adjustment: {skip_stock_adjustment}, self.pk: {self.pk}")
+        logger.debug("InventoryTransaction.save() - skip_stock_adjustment: %s, self.pk: %s", skip_stock_adjustment, self.pk)
         
         # Calculate quantity_in_base_units ONCE here with proper decimal quantization
         # Only calculate if not skipping stock adjustment AND if this is a new transaction AND quantity_in_base_units is not already set
         if not skip_stock_adjustment and not self.pk and self.quantity_in_base_units == 0:
             conversion_factor = self.product.get_conversion_factor(self.transaction_unit, self.product.base_unit)
             self.quantity_in_base_units = (self.quantity * conversion_factor).quantize(Decimal('0.01'))
-            print(f"[DEBUG] Calculated quantity_in_base_units in save(): {self.quantity_in_base_units}")
+            logger.debug("Calculated quantity_in_base_units in save(): %s", self.quantity_in_base_units)
         else:
-            print(f"[DEBUG] Skipping quantity_in_base_units calculation in save() - skip_stock_adjustment: {skip_stock_adjustment}, is_new: {not self.pk}, already_set: {self.quantity_in_base_units != 0}")
+            logger.debug("Skipping quantity_in_base_units calculation in save() - skip_stock_adjustment: %s, is_new: %s, already_set: %s", skip_stock_adjustment, not self.pk, self.quantity_in_base_units != 0)
             # If quantity_in_base_units is already set, make sure we don't recalculate it
             if self.quantity_in_base_units != 0:
-                print(f"[DEBUG] quantity_in_base_units already set to: {self.quantity_in_base_units}")
+                logger.debug("quantity_in_base_units already set to: %s", self.quantity_in_base_units)
         
         self.full_clean()
+        if not skip_stock_adjustment and self.transaction_type in ('store_to_barman', 'barman_to_store'):
+            self._save_transfer(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
         
         # Skip stock adjustments if this is a restock transaction that was already handled by the restock view
         if skip_stock_adjustment:
-            print(f"[DEBUG] Skipping stock adjustments due to skip_stock_adjustment=True")
-            print(f"[DEBUG] Transaction saved without any stock adjustments")
-            print(f"[DEBUG] Final transaction values - quantity: {self.quantity}, quantity_in_base_units: {self.quantity_in_base_units}")
+            logger.debug("Skipping stock adjustments due to skip_stock_adjustment=True")
+            logger.debug("Transaction saved without any stock adjustments")
+            logger.debug("Final transaction values - quantity: %s, quantity_in_base_units: %s", self.quantity, self.quantity_in_base_units)
             return
             
         # Calculate abs_quantity_in_base_units for stock adjustments
         is_addition = self.quantity_in_base_units > 0
         abs_quantity_in_base_units = abs(self.quantity_in_base_units)
         base_unit_obj = self.product.base_unit
-        if self.transaction_type in ['restock', 'adjustment_in']:
+        if self.transaction_type in ['restock', 'adjustment_in', 'sale_reversal']:
             if self.to_stock_main:
                 self.to_stock_main.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=True)
             elif self.to_stock_barman:
@@ -632,14 +622,18 @@ class InventoryTransaction(models.Model):
                 self.from_stock_main.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=False)
             elif self.from_stock_barman:
                 self.from_stock_barman.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=False)
-        elif self.transaction_type == 'store_to_barman':
-            if self.from_stock_main and self.to_stock_barman:
-                self.from_stock_main.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=False)
-                self.to_stock_barman.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=True)
-        elif self.transaction_type == 'barman_to_store':
-            if self.from_stock_barman and self.to_stock_main:
-                self.from_stock_barman.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=False)
-                self.to_stock_main.adjust_quantity(abs_quantity_in_base_units, base_unit_obj, is_addition=True)
+
+    def _save_transfer(self, *args, **kwargs):
+        """Save a transfer and move its stock together (see inventory/transfers.py)"""
+        from django.db import transaction
+        from .transfers import move_stock
+        if self.transaction_type == 'store_to_barman':
+            source, destination = self.from_stock_main, self.to_stock_barman
+        else:
+            source, destination = self.from_stock_barman, self.to_stock_main
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            move_stock(source, destination, abs(self.quantity_in_base_units), self.product)
 
 class InventoryRequest(models.Model):
     STATUS_CHOICES = (
@@ -669,17 +663,17 @@ class InventoryRequest(models.Model):
         if self.quantity <= 0:
             raise ValidationError({'quantity': 'Quantity must be positive.'})
     def save(self, *args, **kwargs):
-        print(f"[DEBUG] InventoryRequest.save() called for id={self.pk}, status={self.status}")
+        logger.debug("InventoryRequest.save() called for id=%s, status=%s", self.pk, self.status)
         original_status = None
         if self.pk:
             original_status = InventoryRequest.objects.get(pk=self.pk).status
-        print(f"[DEBUG] original_status={original_status}, new status={self.status}")
+        logger.debug("original_status=%s, new status=%s", original_status, self.status)
         self.full_clean()
         super().save(*args, **kwargs)
         
         # Prevent double execution by checking if we're already processing fulfillment
         if original_status != 'fulfilled' and self.status == 'fulfilled' and not kwargs.get('_fulfilling', False):
-            print(f"[DEBUG] Entering transaction creation block for request id={self.pk}")
+            logger.debug("Entering transaction creation block for request id=%s", self.pk)
             try:
                 store_stock = Stock.objects.get(product=self.product, branch=self.branch)
                 
@@ -687,16 +681,12 @@ class InventoryRequest(models.Model):
                 try:
                     conversion_factor = self.product.get_conversion_factor(self.request_unit, self.product.base_unit)
                     quantity_in_base_units = (self.quantity * conversion_factor).quantize(Decimal('0.01'))
-                    print(f"[DEBUG] Converting {self.quantity} {self.request_unit.unit_name} to {quantity_in_base_units} {self.product.base_unit.unit_name}")
+                    logger.debug("Converting %s %s to %s %s", self.quantity, self.request_unit.unit_name, quantity_in_base_units, self.product.base_unit.unit_name)
                 except ValueError as e:
-                    print(f"[ERROR] Conversion error: {e}")
+                    logger.error("Conversion error: %s", e)
                     # Fallback: assume 1:1 conversion
                     quantity_in_base_units = self.quantity
                 
-                # First, reduce main store stock using InventoryTransaction
-                if store_stock.quantity_in_base_units < quantity_in_base_units:
-                    raise ValueError(f"Insufficient stock in main store. Available: {store_stock.quantity_in_base_units}, Required: {quantity_in_base_units}")
-                
                 # Use only unique fields for get_or_create
                 barman_stock, created = BarmanStock.objects.get_or_create(
                     stock=store_stock,
@@ -710,37 +700,60 @@ class InventoryRequest(models.Model):
                 # Update branch if needed
                 if barman_stock.branch != self.branch:
                     barman_stock.branch = self.branch
-                
-                # Create InventoryTransaction to handle the transfer properly
-                transaction = InventoryTransaction(
-                    product=self.product,
-                    transaction_type='store_to_barman',
-                    quantity=self.quantity,
-                    transaction_unit=self.request_unit,
-                    from_stock_main=store_stock,
-                    to_stock_barman=barman_stock,
+
+                # Ledger row and both stock rows in one transaction; fails if the store holds too little
+                from .transfers import transfer
+                transfer(
+                    store_stock, barman_stock, self.quantity,
+                    unit=self.request_unit,
+                    quantity_in_base_units=quantity_in_base_units,
                     initiated_by=self.responded_by,
                     notes=f"Fulfilled request #{self.pk} by {self.requested_by.username}.",
                     branch=self.branch,
+                    product=self.product,
                 )
-                # Set the quantity_in_base_units directly to avoid double calculation
-                transaction.quantity_in_base_units = quantity_in_base_units
-                transaction.save(skip_stock_adjustment=True)  # Skip stock adjustment since we handle it manually
-                
-                # Manually adjust the stock quantities
-                store_stock.adjust_quantity(quantity_in_base_units, self.product.base_unit, is_addition=False)
-                barman_stock.adjust_quantity(quantity_in_base_units, self.product.base_unit, is_addition=True)
-                
-                print(f"[DEBUG] InventoryTransaction created for request id={self.pk}")
+
+                logger.debug("InventoryTransaction created for request id=%s", self.pk)
                 self.responded_at = timezone.now()
                 # Use direct database update to avoid recursive save() call
                 InventoryRequest.objects.filter(pk=self.pk).update(responded_at=self.responded_at)
             except Stock.DoesNotExist:
-                print(f"[ERROR] Main store stock not found for product {self.product.name} at branch {self.branch.name} during request fulfillment.")
+                logger.error("Main store stock not found for product %s at branch %s during request fulfillment.", self.product.name, self.branch.name)
             except Exception as e:
-                print(f"[ERROR] Exception fulfilling request {self.pk}: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Exception fulfilling request %s: %s", self.pk, e)
+
+class StockSnapshot(models.Model):
+    """
+    Ledger balance of a store (``stock``) or bar (``barman_stock``) stock row
+    as of ``last_transaction_id`` (see inventory/ledger.py). Opening snapshots
+    take the live balance of rows that had none; every later one is the
+    previous snapshot plus the ledger since.
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+    barman_stock = models.ForeignKey(BarmanStock, on_delete=models.CASCADE, null=True, blank=True,
+                                     related_name='snapshots')
+    taken_at = models.DateTimeField(default=timezone.now)
+    quantity_in_base_units = models.DecimalField(max_digits=12, decimal_places=2)
+    last_transaction_id = models.BigIntegerField(default=0, help_text="Last InventoryTransaction included")
+    is_opening = models.BooleanField(default=False)
+    drift = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"),
+                                help_text="Live balance minus ledger balance when the snapshot was taken")
+    class Meta:
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['stock', 'taken_at'], name='stock_snapshot_idx'),
+            models.Index(fields=['barman_stock', 'taken_at'], name='barman_stock_snapshot_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(stock__isnull=False, barman_stock__isnull=True)
+                | models.Q(stock__isnull=True, barman_stock__isnull=False),
+                name='stock_snapshot_one_location',
+            ),
+        ]
+    def __str__(self):
+        location = f"Stock {self.stock_id}" if self.stock_id else f"Bar stock {self.barman_stock_id}"
+        return f"{location} @ {self.taken_at:%Y-%m-%d %H:%M}: {self.quantity_in_base_units}"
 
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
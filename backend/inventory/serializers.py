@@ -45,7 +45,8 @@ class BarmanStockSerializer(serializers.ModelSerializer):
             'original_unit',
             'original_quantity_display',
         ]
-        read_only_fields = ['running_out']
+        # Balances only change through the ledger (inventory/ledger.py)
+        read_only_fields = ['quantity_in_base_units', 'running_out']
 
     def get_quantity_basic_unit(self, obj):
         # Try to convert to the default sales unit for this product
@@ -1,18 +1,39 @@
 # inventory/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Product, AuditLog
-from django.contrib.contenttypes.models import ContentType
+from .conversion_checks import check_measurement_on_save
+from .conversions import invalidate_conversion_graph
+from .audit import record
+from .models import Product, ProductMeasurement
 
 @receiver(post_save, sender=Product)
-def track_product_update(sender, instance, created, **kwargs):
+def track_product_update(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
     action = 'create' if created else 'update'
-    AuditLog.objects.create(
-        user=None,  # Set to the user if available
-        action=action,
-        object_id=instance.pk,
-        content_type=ContentType.objects.get_for_model(instance),
+    record(
+        action,
+        instance,
         details={'product_name': instance.name},
         notes=f"Product {action}d via system auto-log",
     )
+
+
+@receiver(pre_save, sender=ProductMeasurement)
+def validate_conversion(sender, instance, raw=False, **kwargs):
+    # Fixtures may load a product's measurements in any order
+    if not raw:
+        check_measurement_on_save(instance)
+
+
+@receiver(post_save, sender=ProductMeasurement)
+@receiver(post_delete, sender=ProductMeasurement)
+def drop_conversion_graph(sender, instance, **kwargs):
+    invalidate_conversion_graph(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+def drop_conversion_graph_on_product_save(sender, instance, **kwargs):
+    # A new product may reuse the id of a deleted one
+    invalidate_conversion_graph(instance.pk)
@@ -1,3 +1,621 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from branches.models import Branch
+from orders.models import Order, OrderItem
+from users.models import User
+
+from .audit import audit_batch, drain
+from .consumption import consume_items
+from .conversion_checks import INCONSISTENT, ORPHAN_STOCK_UNIT, UNREACHABLE, analyze_conversions, repair
+from .conversions import clear_conversion_graphs, conversion_graph
+from .imports import import_products
+from .ledger import reconcile, stock_at, take_snapshots
+from .models import (
+    AuditLog, BarmanStock, Category, InventoryRequest, InventoryTransaction, ItemType, Product, ProductMeasurement,
+    ProductUnit, Stock, StockSnapshot,
+)
+from .transfers import transfer
+
+
+class ConversionGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        units = ('carton', 'bottle', 'shot', 'ml')
+        cls.carton, cls.bottle, cls.shot, cls.ml = (ProductUnit.objects.create(unit_name=name) for name in units)
+        cls.product = Product.objects.create(name='Gin', base_unit=cls.bottle)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.carton, to_unit=cls.bottle, amount_per=12)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.bottle, to_unit=cls.shot, amount_per=3)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.shot, to_unit=cls.ml, amount_per=25)
+
+    def setUp(self):
+        cache.clear()
+        clear_conversion_graphs()
+
+    def test_factors_along_shortest_path(self):
+        factor = self.product.get_conversion_factor
+        self.assertEqual(factor(self.carton, self.bottle), Decimal('12'))
+        self.assertEqual(factor(self.carton, self.ml), Decimal('900'))
+        self.assertEqual(factor(self.ml, self.carton), Decimal(1) / Decimal(900))
+        # Inverse of a product of edges is rounded once, not per hop
+        self.assertEqual(factor(self.shot, self.carton), Decimal(1) / Decimal(36))
+        self.assertEqual(self.product.get_conversion_factor_to_smallest(self.carton), Decimal('900'))
+
+    def test_warm_lookups_run_no_queries(self):
+        self.product.get_conversion_factor(self.carton, self.shot)
+        with self.assertNumQueries(0):
+            for from_unit in (self.carton, self.bottle, self.shot, self.ml):
+                for to_unit in (self.carton, self.bottle, self.shot, self.ml):
+                    self.product.get_conversion_factor(from_unit, to_unit)
+
+    def test_measurement_changes_invalidate(self):
+        litre = ProductUnit.objects.create(unit_name='litre')
+        with self.assertRaises(ValueError):
+            self.product.get_conversion_factor(self.bottle, litre)
+        with self.captureOnCommitCallbacks(execute=True):
+            measurement = ProductMeasurement.objects.create(product=self.product, from_unit=litre, to_unit=self.ml,
+                                                            amount_per=1000)
+        self.assertEqual(self.product.get_conversion_factor(self.bottle, litre), Decimal('0.075'))
+        with self.captureOnCommitCallbacks(execute=True):
+            measurement.delete()
+        with self.assertRaises(ValueError):
+            self.product.get_conversion_factor(self.bottle, litre)
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_per_process_cache_is_not_used(self):
+        self.assertEqual(self.product.get_conversion_factor(self.carton, self.bottle), Decimal('12'))
+        self.assertIsNone(cache.get(f'conversion-graph:{self.product.pk}'))
+        with self.assertNumQueries(0):
+            self.product.get_conversion_factor(self.carton, self.shot)
+
+
+class ConversionCheckTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        units = ('carton', 'bottle', 'shot', 'ml', 'litre')
+        cls.carton, cls.bottle, cls.shot, cls.ml, cls.litre = (
+            ProductUnit.objects.create(unit_name=name) for name in units
+        )
+        cls.product = Product.objects.create(name='Rum', base_unit=cls.bottle)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.carton, to_unit=cls.bottle, amount_per=12)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.bottle, to_unit=cls.ml, amount_per=750)
+
+    def test_save_rejects_contradicting_path(self):
+        with self.assertRaises(ValidationError):
+            ProductMeasurement.objects.create(product=self.product, from_unit=self.carton, to_unit=self.ml,
+                                              amount_per=8000)
+        measurement = ProductMeasurement(product=self.product, from_unit=self.ml, to_unit=self.carton,
+                                         amount_per=Decimal('0.0002'))
+        with self.assertRaises(ValidationError):
+            measurement.full_clean()
+
+    def test_save_accepts_redundant_rounded_path(self):
+        ProductMeasurement.objects.create(product=self.product, from_unit=self.carton, to_unit=self.ml,
+                                          amount_per=9000)
+        # 1/12 and 1/750 stored with four decimals
+        ProductMeasurement.objects.create(product=self.product, from_unit=self.bottle, to_unit=self.carton,
+                                          amount_per=Decimal('0.0833'))
+        ProductMeasurement.objects.create(product=self.product, from_unit=self.ml, to_unit=self.bottle,
+                                          amount_per=Decimal('0.0013'))
+        self.assertEqual(analyze_conversions([self.product.pk]), [])
+
+    @override_settings(INVENTORY_CONVERSION_CHECK='off')
+    def test_analyze_and_repair(self):
+        bad = ProductMeasurement.objects.create(product=self.product, from_unit=self.carton, to_unit=self.ml,
+                                                amount_per=8000)
+        ProductMeasurement.objects.create(product=self.product, from_unit=self.shot, to_unit=self.litre,
+                                          amount_per=Decimal('0.025'))
+        main, annex = Branch.objects.create(name='Main'), Branch.objects.create(name='Annex')
+        Stock.objects.bulk_create([Stock(product=self.product, branch=main, original_unit=self.carton),
+                                   Stock(product=self.product, branch=annex, original_unit=self.litre)])
+
+        with self.assertNumQueries(4):
+            issues = analyze_conversions([self.product.pk])
+        kinds = sorted(issue.kind for issue in issues)
+        self.assertEqual(kinds, [INCONSISTENT, UNREACHABLE, UNREACHABLE])
+        self.assertEqual([issue.measurement_ids for issue in issues if issue.kind == INCONSISTENT], [[bad.pk]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(repair(issues), 1)
+        self.assertFalse(ProductMeasurement.objects.filter(pk=bad.pk).exists())
+        self.assertEqual(self.product.get_conversion_factor(self.carton, self.ml), Decimal('9000'))
+        self.assertEqual(sorted(issue.kind for issue in analyze_conversions([self.product.pk])),
+                         [UNREACHABLE, UNREACHABLE])
+
+    def test_stock_unit_without_conversion(self):
+        branch = Branch.objects.create(name='Main')
+        Stock.objects.bulk_create([Stock(product=self.product, branch=branch, original_unit=self.litre)])
+        out = StringIO()
+        call_command('check_conversions', product=[self.product.pk], stdout=out)
+        self.assertIn(ORPHAN_STOCK_UNIT, out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('check_conversions', product=[self.product.pk], strict=True, stdout=StringIO())
+
+
+class StockTransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.bottle = ProductUnit.objects.create(unit_name='bottle')
+        cls.carton = ProductUnit.objects.create(unit_name='carton')
+        cls.product = Product.objects.create(name='Beer', base_unit=cls.bottle)
+        ProductMeasurement.objects.create(product=cls.product, from_unit=cls.carton, to_unit=cls.bottle, amount_per=24)
+        cls.bartender = User.objects.create_user(username='bar', password='x', role='bartender')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store = Stock.objects.create(product=self.product, branch=self.branch,
+                                              quantity_in_base_units=Decimal('48'),
+                                              minimum_threshold_base_units=Decimal('10'))
+            self.bar = BarmanStock.objects.create(stock=self.store, bartender=self.bartender, branch=self.branch)
+
+    def test_transfer_moves_stock_with_three_queries(self):
+        self.product.get_conversion_factor(self.carton, self.bottle)
+        with CaptureQueriesContext(connection) as queries:
+            ledger = transfer(self.store, self.bar, 1, unit=self.carton, initiated_by=self.bartender)
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 3, statements)
+
+        self.store.refresh_from_db()
+        self.bar.refresh_from_db()
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('24'))
+        self.assertFalse(self.store.running_out)
+        self.assertEqual(self.bar.quantity_in_base_units, Decimal('24'))
+        self.assertEqual(self.bar.original_quantity, Decimal('24'))
+        self.assertEqual(self.bar.original_unit, self.bottle)
+        self.assertEqual(self.bar.minimum_threshold_base_units, Decimal('4.80'))
+        self.assertFalse(self.bar.running_out)
+        self.assertEqual(ledger.transaction_type, 'store_to_barman')
+        self.assertEqual(ledger.quantity_in_base_units, Decimal('24'))
+        self.assertEqual(InventoryTransaction.objects.get().to_stock_barman, self.bar)
+
+        transfer(self.store, self.bar, 15)
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('9'))
+        self.assertTrue(self.store.running_out)
+        transfer(self.bar, self.store, 21)
+        self.assertEqual(self.bar.quantity_in_base_units, Decimal('18'))
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('30'))
+        self.assertFalse(self.store.running_out)
+        self.assertEqual(
+            list(InventoryTransaction.objects.order_by('id').values_list('transaction_type', flat=True)),
+            ['store_to_barman', 'store_to_barman', 'barman_to_store'],
+        )
+
+    def test_stale_source_cannot_overdraw(self):
+        stale = Stock.objects.get(pk=self.store.pk)
+        transfer(self.store, self.bar, 40)
+        # ``stale`` still shows 48 in the store
+        with self.assertRaisesMessage(ValidationError, 'Available: 8.00'):
+            transfer(stale, self.bar, 10)
+        self.store.refresh_from_db()
+        self.bar.refresh_from_db()
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('8'))
+        self.assertEqual(self.bar.quantity_in_base_units, Decimal('40'))
+        self.assertEqual(InventoryTransaction.objects.count(), 1)
+
+    def test_transaction_save_and_request_fulfilment_use_transfers(self):
+        InventoryTransaction(
+            branch=self.branch, product=self.product, transaction_type='store_to_barman', quantity=Decimal('6'),
+            transaction_unit=self.bottle, from_stock_main=self.store, to_stock_barman=self.bar,
+        ).save()
+        request = InventoryRequest.objects.create(product=self.product, quantity=1, request_unit=self.carton,
+                                                  requested_by=self.bartender, branch=self.branch)
+        request.status = 'fulfilled'
+        request.save()
+
+        self.store.refresh_from_db()
+        self.bar.refresh_from_db()
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('18'))
+        self.assertEqual(self.bar.quantity_in_base_units, Decimal('30'))
+        self.assertEqual(InventoryTransaction.objects.filter(notes__contains=f'#{request.pk}').count(), 1)
+
+
+class StockConsumptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.bottle, cls.shot, cls.plate = (ProductUnit.objects.create(unit_name=name)
+                                           for name in ('bottle', 'shot', 'plate'))
+        cls.bartender = User.objects.create_user(username='bar', password='x', role='bartender', branch=cls.branch)
+        cls.spirits = []
+        for n in range(10):
+            product = Product.objects.create(name=f'Spirit {n}', base_unit=cls.bottle)
+            ProductMeasurement.objects.create(product=product, from_unit=cls.bottle, to_unit=cls.shot,
+                                              amount_per=20, is_default_sales_unit=True)
+            cls.spirits.append(product)
+        cls.beer = Product.objects.create(name='Beer', base_unit=cls.bottle)
+        cls.tibs = Product.objects.create(name='Tibs', base_unit=cls.plate)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bar_stocks = []
+            for product in self.spirits:
+                store = Stock.objects.create(product=product, branch=self.branch, quantity_in_base_units=10)
+                self.bar_stocks.append(BarmanStock.objects.create(
+                    stock=store, bartender=self.bartender, branch=self.branch,
+                    quantity_in_base_units=Decimal('2.00'), minimum_threshold_base_units=Decimal('1.00'),
+                    original_unit=self.bottle, original_quantity=Decimal('2.00'),
+                ))
+            self.beer_store = Stock.objects.create(product=self.beer, branch=self.branch, quantity_in_base_units=24,
+                                                   minimum_threshold_base_units=5)
+            self.tibs_store = Stock.objects.create(product=self.tibs, branch=self.branch, quantity_in_base_units=30)
+            self.order = Order.objects.create(order_number='20260101-01-B1', branch=self.branch)
+
+    def add_item(self, product, quantity, item_type='beverage', name=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OrderItem.objects.create(order=self.order, name=name or product.name, product=product,
+                                            quantity=quantity, price=Decimal('50.00'), item_type=item_type,
+                                            status='accepted')
+
+    def test_bar_order_is_deducted_in_a_fixed_number_of_queries(self):
+        for product in self.spirits:
+            self.add_item(product, 5)
+            self.add_item(product, 3)
+        self.add_item(self.beer, 20)
+        self.add_item(self.tibs, 2, item_type='food')
+        self.add_item(None, 2, item_type='beverage', name='beer')
+        items = list(self.order.items.all())
+        for product in self.spirits + [self.beer, self.tibs]:
+            conversion_graph(product.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                ledger = consume_items(items, bartender=self.bartender)
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(statements), 7, statements)
+        self.assertEqual(len(ledger), 23)
+
+        bar = BarmanStock.objects.get(pk=self.bar_stocks[0].pk)
+        # 8 shots of 20 per bottle
+        self.assertEqual(bar.quantity_in_base_units, Decimal('1.60'))
+        self.assertEqual(bar.original_quantity, Decimal('1.60'))
+        self.assertFalse(bar.running_out)
+        self.beer_store.refresh_from_db()
+        self.assertEqual(self.beer_store.quantity_in_base_units, Decimal('2'))
+        self.assertTrue(self.beer_store.running_out)
+        self.tibs_store.refresh_from_db()
+        self.assertEqual(self.tibs_store.quantity_in_base_units, Decimal('28'))
+        sale = InventoryTransaction.objects.filter(product=self.beer).order_by('id').first()
+        self.assertEqual((sale.transaction_type, sale.quantity_in_base_units, sale.from_stock_main_id),
+                         ('sale', Decimal('-20'), self.beer_store.pk))
+
+    def test_crossing_the_threshold_sends_stock_low(self):
+        items = [self.add_item(self.beer, 20), self.add_item(self.spirits[0], 10)]
+        with mock.patch('inventory.consumption.publish') as publish:
+            consume_items(items, bartender=self.bartender)
+            consume_items([self.add_item(self.beer, 1)], bartender=self.bartender)
+        # Half a bottle of spirit leaves 1.5 (threshold 1); the beer drops from 24 to 4 (threshold 5) once
+        publish.assert_called_once()
+        event, branch_id, stations, data = publish.call_args.args
+        self.assertEqual((event, branch_id, stations), ('stock_low', self.branch.pk, ['manager']))
+        self.assertEqual((data['location'], data['product_name'], data['quantity_in_base_units']),
+                         ('store', 'Beer', '4.00'))
+
+    def test_shortage_deducts_nothing(self):
+        items = [self.add_item(self.spirits[0], 10), self.add_item(self.spirits[1], 50)]
+        with self.assertRaisesMessage(ValidationError, 'Insufficient stock of Spirit 1'):
+            consume_items(items, bartender=self.bartender)
+        self.assertEqual(BarmanStock.objects.get(pk=self.bar_stocks[0].pk).quantity_in_base_units, Decimal('2'))
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+    def test_accepting_an_item_consumes_stock_once(self):
+        item = self.add_item(self.spirits[0], 10)
+        OrderItem.objects.filter(pk=item.pk).update(status='pending')
+        big = self.add_item(self.spirits[1], 50)
+        OrderItem.objects.filter(pk=big.pk).update(status='pending')
+        client = APIClient()
+        client.force_authenticate(self.bartender)
+        url = reverse('order-item-update-status', args=[item.pk])
+
+        for _ in range(2):
+            self.assertEqual(client.patch(url, {'status': 'accepted'}, format='json').status_code, 200)
+        self.assertEqual(BarmanStock.objects.get(pk=self.bar_stocks[0].pk).quantity_in_base_units, Decimal('1.5'))
+
+        response = client.patch(reverse('order-item-update-status', args=[big.pk]), {'status': 'accepted'},
+                                format='json')
+        self.assertEqual(response.status_code, 400)
+        big.refresh_from_db()
+        self.assertEqual(big.status, 'pending')
+
+
+    def test_taking_an_acceptance_back_restores_stock(self):
+        shots = self.add_item(self.spirits[0], 10)
+        tibs = self.add_item(self.tibs, 2, item_type='food')
+        OrderItem.objects.filter(pk__in=[shots.pk, tibs.pk]).update(status='pending')
+        client = APIClient()
+        client.force_authenticate(self.bartender)
+
+        for status_value, bar, store in (('accepted', '1.5', '28'), ('rejected', '2', '30'),
+                                         ('accepted', '1.5', '28'), ('pending', '2', '30'), ('rejected', '2', '30')):
+            for item in (shots, tibs):
+                url = reverse('order-item-update-status', args=[item.pk])
+                self.assertEqual(client.patch(url, {'status': status_value}, format='json').status_code, 200)
+            bar_stock = BarmanStock.objects.get(pk=self.bar_stocks[0].pk)
+            self.assertEqual((bar_stock.quantity_in_base_units, bar_stock.original_quantity),
+                             (Decimal(bar), Decimal(bar)), status_value)
+            self.tibs_store.refresh_from_db()
+            self.assertEqual(self.tibs_store.quantity_in_base_units, Decimal(store), status_value)
+
+        self.assertEqual(
+            list(InventoryTransaction.objects.filter(order_item=shots).order_by('id')
+                 .values_list('transaction_type', 'quantity_in_base_units', 'to_stock_barman_id')),
+            [('sale', Decimal('-0.5'), None), ('sale_reversal', Decimal('0.5'), self.bar_stocks[0].pk)] * 2,
+        )
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.bottle = ProductUnit.objects.create(unit_name='bottle')
+        cls.product = Product.objects.create(name='Beer', base_unit=cls.bottle)
+        cls.bartender = User.objects.create_user(username='bar', password='x', role='bartender')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store = Stock.objects.create(product=self.product, branch=self.branch,
+                                              quantity_in_base_units=Decimal('48'))
+            self.bar = BarmanStock.objects.create(stock=self.store, bartender=self.bartender, branch=self.branch)
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def move(self, source, destination, quantity, minutes):
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger = transfer(source, destination, quantity)
+        InventoryTransaction.objects.filter(pk=ledger.pk).update(
+            transaction_date=self.start + timedelta(minutes=minutes))
+        return ledger
+
+    def store_snapshots(self, branch_id=None):
+        return [snapshot for snapshot in take_snapshots(branch_id) if snapshot.stock_id]
+
+    def test_balance_at_points_in_time(self):
+        opening, = self.store_snapshots(self.branch.pk)
+        self.assertTrue(opening.is_opening)
+        self.assertEqual(opening.quantity_in_base_units, Decimal('48'))
+        StockSnapshot.objects.filter(pk=opening.pk).update(taken_at=self.start)
+        self.move(self.store, self.bar, 10, minutes=10)
+        last = self.move(self.bar, self.store, 5, minutes=20)
+
+        with CaptureQueriesContext(connection) as queries:
+            balance = stock_at(self.product.pk, self.branch.pk, self.start + timedelta(minutes=15))
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(balance, Decimal('38'))
+        self.assertEqual(stock_at(self.product.pk, self.branch.pk), Decimal('43'))
+        self.assertIsNone(stock_at(self.product.pk, self.branch.pk, self.start - timedelta(minutes=1)))
+
+        snapshot, = self.store_snapshots(self.branch.pk)
+        self.assertEqual((snapshot.quantity_in_base_units, snapshot.drift, snapshot.last_transaction_id),
+                         (Decimal('43'), 0, last.pk))
+        self.assertEqual(stock_at(self.product.pk, self.branch.pk), Decimal('43'))
+        self.assertEqual(stock_at(self.product.pk, self.branch.pk, self.start + timedelta(minutes=15)),
+                         Decimal('38'))
+
+    def test_unsettled_rows_stay_in_the_tail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer(self.store, self.bar, 10)
+        opening, = self.store_snapshots()
+        # The transfer is younger than the settle window
+        self.assertEqual((opening.quantity_in_base_units, opening.last_transaction_id), (Decimal('48'), 0))
+        self.assertEqual(stock_at(self.product.pk, self.branch.pk), Decimal('38'))
+        self.assertEqual(reconcile(), [])
+
+    def test_drift_is_recorded_and_reconciled(self):
+        take_snapshots()
+        Stock.objects.filter(pk=self.store.pk).update(quantity_in_base_units=Decimal('50'))
+        self.assertEqual(reconcile(self.branch.pk), [
+            {'location': 'store', 'stock': self.store.pk, 'product': self.product.pk, 'ledger': Decimal('48'),
+             'live': Decimal('50')},
+        ])
+        snapshot, = self.store_snapshots()
+        self.assertEqual((snapshot.quantity_in_base_units, snapshot.drift), (Decimal('48'), Decimal('2')))
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', '--strict', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_stock', '--fix', stdout=StringIO())
+        self.store.refresh_from_db()
+        self.assertEqual(self.store.quantity_in_base_units, Decimal('48'))
+        self.assertEqual(reconcile(), [])
+
+    def test_bar_stock_is_on_the_ledger(self):
+        take_snapshots()
+        self.move(self.store, self.bar, 10, minutes=10)
+        self.assertEqual(reconcile(), [])
+        BarmanStock.objects.filter(pk=self.bar.pk).update(quantity_in_base_units=Decimal('7'))
+        self.assertEqual(reconcile(), [
+            {'location': 'bar', 'stock': self.bar.pk, 'product': self.product.pk, 'ledger': Decimal('10'),
+             'live': Decimal('7')},
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            reconcile(fix=True)
+        self.bar.refresh_from_db()
+        self.assertEqual(self.bar.quantity_in_base_units, Decimal('10'))
+
+    def test_manual_changes_go_through_the_ledger(self):
+        manager = User.objects.create_user(username='manager', password='x', role='manager', branch=self.branch)
+        client = APIClient()
+        client.force_authenticate(manager)
+        take_snapshots()
+
+        response = client.post(reverse('stock-adjust', args=[self.store.pk]), {'quantity_in_base_units': '45'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['quantity_in_base_units']), Decimal('45'))
+        # Writing the balance directly is ignored
+        client.patch(reverse('stock-detail', args=[self.store.pk]), {'quantity_in_base_units': '99'})
+        manager.is_staff = True
+        manager.save()
+        client.patch(reverse('barmanstock-detail', args=[self.bar.pk]), {'quantity_in_base_units': '99'})
+        self.assertEqual(client.post(reverse('barmanstock-adjust', args=[self.bar.pk]),
+                                     {'quantity_in_base_units': '3'}).status_code, 200)
+
+        other = Product.objects.create(name='Wine', base_unit=self.bottle)
+        response = client.post(reverse('stock-list'), {
+            'product_id': other.pk, 'branch_id': self.branch.pk, 'original_quantity': '6',
+            'original_unit_id': self.bottle.pk,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Stock.objects.get(product=other).quantity_in_base_units, Decimal('6'))
+
+        self.assertEqual(reconcile(), [])
+        self.assertEqual(
+            sorted(InventoryTransaction.objects.values_list('transaction_type', 'quantity_in_base_units')),
+            [('adjustment_in', Decimal('3')), ('adjustment_in', Decimal('6')), ('adjustment_out', Decimal('-3'))],
+        )
+        self.assertEqual((Stock.objects.get(pk=self.store.pk).quantity_in_base_units,
+                          BarmanStock.objects.get(pk=self.bar.pk).quantity_in_base_units),
+                         (Decimal('45'), Decimal('3')))
+
+    def test_stock_at_endpoint(self):
+        take_snapshots()
+        url = reverse('stock-at')
+        response = APIClient().get(url, {'product': self.product.pk, 'branch': self.branch.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.data['quantity_in_base_units'])), Decimal('48'))
+        self.assertEqual(APIClient().get(url, {'product': self.product.pk}).status_code, 400)
+        self.assertEqual(APIClient().get(url, {'product': self.product.pk, 'branch': self.branch.pk,
+                                               'at': 'yesterday'}).status_code, 400)
+
+
+class AuditLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bottle = ProductUnit.objects.create(unit_name='bottle')
+
+    def audit_inserts(self, queries):
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "inventory_auditlog"')]
+
+    def test_batch_writes_entries_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                with audit_batch():
+                    for n in range(50):
+                        Product.objects.create(name=f'Beer {n}', base_unit=self.bottle)
+                    self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(len(self.audit_inserts(queries)), 1)
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 50)
+        entry = AuditLog.objects.get(details__product_name='Beer 7')
+        self.assertIsInstance(entry.content_object, Product)
+
+    def test_entries_of_rolled_back_writes_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with audit_batch(), transaction.atomic():
+                Product.objects.create(name='Kept', base_unit=self.bottle)
+                try:
+                    with transaction.atomic():
+                        Product.objects.create(name='Undone', base_unit=self.bottle)
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(list(AuditLog.objects.values_list('details__product_name', flat=True)), ['Kept'])
+
+    def test_entries_outside_a_batch_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Beer', base_unit=self.bottle)
+            product.name = 'Lager'
+            product.save()
+            self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)), ['create', 'update'])
+
+
+class BackgroundAuditLogTests(TransactionTestCase):
+    def test_background_writer_drains_the_queue(self):
+        bottle = ProductUnit.objects.create(unit_name='bottle')
+        with audit_batch(background=True):
+            for n in range(20):
+                Product.objects.create(name=f'Beer {n}', base_unit=bottle)
+        drain()
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 20)
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.bottle = ProductUnit.objects.create(unit_name='bottle')
+        cls.carton = ProductUnit.objects.create(unit_name='carton')
+        cls.shot = ProductUnit.objects.create(unit_name='shot')
+        cls.category = Category.objects.create(item_type=ItemType.objects.create(type_name='beverage'),
+                                               category_name='Beer')
+        cls.existing = Product.objects.create(name='Existing', base_unit=cls.bottle)
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+
+    def row(self, name, **extra):
+        return {
+            'name': name, 'base_unit': 'Bottle', 'category': 'beer', 'base_unit_price': '30',
+            'measurement': {'from_unit': 'carton', 'to_unit': 'bottle', 'amount_per': 24},
+            'stock': {'branch': 'Main', 'original_quantity': '2', 'original_unit': 'carton',
+                      'minimum_threshold_base_units': '10'},
+            **extra,
+        }
+
+    def test_import_writes_each_table_once_per_chunk(self):
+        rows = [self.row(f'Beer {n}') for n in range(120)]
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = import_products(rows, initiated_by=self.manager, chunk_size=50)
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # 4 lookups, 4 inserts per chunk of 50, 1 content type read and 1 audit insert
+        self.assertLessEqual(len(statements), 4 + 3 * 4 + 2, statements)
+        self.assertEqual((len(result.created), result.errors), (120, []))
+
+        stock = Stock.objects.get(product__name='Beer 7')
+        self.assertEqual((stock.quantity_in_base_units, stock.original_unit, stock.branch),
+                         (Decimal('48'), self.carton, self.branch))
+        self.assertEqual(stock.product.category, self.category)
+        self.assertEqual(stock.product.get_conversion_factor(self.carton, self.bottle), Decimal('24'))
+        ledger = InventoryTransaction.objects.get(to_stock_main=stock)
+        self.assertEqual((ledger.transaction_type, ledger.quantity_in_base_units, ledger.initiated_by),
+                         ('restock', Decimal('48'), self.manager))
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 120)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        rows = [
+            self.row('Good'),
+            self.row('existing'),
+            self.row('Good'),
+            self.row('Unknown unit', base_unit='crate'),
+            self.row('Bad price', base_unit_price='cheap'),
+            self.row('Contradiction', measurements=[
+                {'from_unit': 'carton', 'to_unit': 'shot', 'amount_per': 480},
+                {'from_unit': 'bottle', 'to_unit': 'shot', 'amount_per': 25},
+            ]),
+            'not a row',
+            self.row('Default conversion', measurement=None),
+        ]
+        result = import_products(rows)
+        self.assertEqual([product.name for product in result.created], ['Good', 'Default conversion'])
+        self.assertEqual([error['row'] for error in result.errors], [1, 2, 3, 4, 5, 6])
+        self.assertIn('already exists', result.errors[0]['error'])
+        self.assertIn("Unknown base unit 'crate'", result.errors[2]['error'])
+        self.assertIn('path through the base unit', result.errors[4]['error'])
+        # carton -> bottle falls back to the default 24 per carton
+        self.assertEqual(Stock.objects.get(product__name='Default conversion').quantity_in_base_units, Decimal('48'))
+
+    def test_csv_upload(self):
+        csv_file = SimpleUploadedFile('products.csv', (
+            'name,base_unit,category,branch,original_quantity,original_unit,from_unit,to_unit,amount_per\n'
+            'Lager,bottle,Beer,Main,1,carton,carton,bottle,12\n'
+            'Stout,bottle,Beer,,,,,,\n'
+            'Existing,bottle,Beer,Main,,,,,\n'
+        ).encode(), content_type='text/csv')
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.post(reverse('product-bulk-create'), {'file': csv_file}, format='multipart')
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual(sorted(product['name'] for product in response.data['created']), ['Lager', 'Stout'])
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Stock.objects.get(product__name='Lager').quantity_in_base_units, Decimal('12'))
+        self.assertFalse(Stock.objects.filter(product__name='Stout').exists())
@@ -0,0 +1,263 @@
+"""
+Stock transfers between store (``Stock``) and bar (``BarmanStock``) locations.
+
+``move_stock`` moves a quantity in base units from one location to another
+with one UPDATE per side: the source row is only decremented ``WHERE
+quantity_in_base_units >= n``, so the sufficiency check and the write are a
+single statement and two concurrent transfers cannot both spend the same
+stock. The running-out flag, the bar's original-unit quantity and its default
+threshold are computed in the same statements. Both rows are updated in a
+fixed (table, id) order, so two transfers touching the same pair of rows in
+opposite directions queue on the first lock instead of deadlocking.
+
+``transfer`` does the same and inserts the ``InventoryTransaction`` ledger
+row: three queries in all, inside one transaction (savepoint when nested).
+``adjust_stock`` changes a single location (restocks, counts, wastage) the
+same way, so every balance change has its ledger row (inventory/ledger.py).
+
+Updated fields are dropped from the passed instances rather than refreshed,
+so reading them afterwards loads the committed value.
+"""
+import logging
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Floor, Greatest
+from django.utils import timezone
+
+from .conversions import conversion_graph
+from .models import BarmanStock, InventoryTransaction, Stock
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+# Bars without a threshold get 20% of their first delivery (see BarmanStock.adjust_quantity)
+DEFAULT_THRESHOLD_SHARE = 20
+MIN_THRESHOLD = Decimal('0.01')
+
+LEDGER_TYPES = {
+    (Stock, BarmanStock): 'store_to_barman',
+    (BarmanStock, Stock): 'barman_to_store',
+}
+INBOUND_TYPES = ('restock', 'adjustment_in')
+OUTBOUND_TYPES = ('adjustment_out', 'wastage')
+
+
+def _product(location):
+    return location.stock.product if isinstance(location, BarmanStock) else location.product
+
+
+def _product_id(location):
+    return location.stock.product_id if isinstance(location, BarmanStock) else location.product_id
+
+
+def _original_unit_factor(location, product):
+    """Factor from the bar's original unit to the base unit, from the memoised graph (no query when warm)"""
+    if location.original_unit_id is None:
+        return None
+    return conversion_graph(product.pk).factor(location.original_unit_id, product.base_unit_id)
+
+
+def _decrement(location, quantity, product):
+    values = {
+        'quantity_in_base_units': F('quantity_in_base_units') - quantity,
+        'last_stock_update': timezone.now(),
+        'running_out': Case(
+            When(quantity_in_base_units__lte=F('minimum_threshold_base_units') + quantity, then=Value(True)),
+            default=Value(False),
+        ),
+    }
+    if isinstance(location, BarmanStock) and location.original_unit_id is not None:
+        factor = _original_unit_factor(location, product)
+        delta = quantity / factor if factor else quantity
+        values['original_quantity'] = Greatest(Coalesce(F('original_quantity'), Value(ZERO)) - delta, Value(ZERO))
+    return values
+
+
+def _increment(location, quantity, product):
+    values = {
+        'quantity_in_base_units': F('quantity_in_base_units') + quantity,
+        'last_stock_update': timezone.now(),
+    }
+    if not isinstance(location, BarmanStock):
+        values['running_out'] = Case(
+            When(quantity_in_base_units__lte=F('minimum_threshold_base_units') - quantity, then=Value(True)),
+            default=Value(False),
+        )
+        return values
+
+    # Bar stock is kept in the unit of its last delivery, which is the base unit here
+    if location.original_unit_id == product.base_unit_id:
+        values['original_quantity'] = Coalesce(F('original_quantity'), Value(ZERO)) + quantity
+    else:
+        factor = _original_unit_factor(location, product)
+        if factor:
+            values['original_quantity'] = Coalesce(F('original_quantity'), Value(ZERO)) * factor + quantity
+        else:
+            values['original_quantity'] = Value(quantity)
+        values['original_unit_id'] = product.base_unit_id
+    # Without a threshold the new one is 20% of the new quantity, which is never running out
+    values['minimum_threshold_base_units'] = Case(
+        When(minimum_threshold_base_units=0, then=Greatest(
+            Floor((F('quantity_in_base_units') + quantity) * DEFAULT_THRESHOLD_SHARE) * Value(Decimal('0.01')),
+            Value(MIN_THRESHOLD),
+        )),
+        default=F('minimum_threshold_base_units'),
+    )
+    values['running_out'] = Case(
+        When(minimum_threshold_base_units=0, then=Value(False)),
+        When(quantity_in_base_units__lte=F('minimum_threshold_base_units') - quantity, then=Value(True)),
+        default=Value(False),
+    )
+    return values
+
+
+def _insufficient(source, quantity, product):
+    base_unit = product.base_unit
+    available = type(source).objects.filter(pk=source.pk).values_list('quantity_in_base_units', flat=True).first()
+    if available is None:
+        return ValidationError("Stock record not found for adjustment.")
+    return ValidationError(
+        f"Insufficient stock of {product.name} to remove {quantity} {base_unit.unit_name}. "
+        f"Available: {available} {base_unit.unit_name}"
+    )
+
+
+def _forget(location, fields):
+    # Deferred fields are reloaded on next access
+    for field in fields:
+        if field == 'original_unit_id':
+            location.__dict__.pop('original_unit_id', None)
+            location._state.fields_cache.pop('original_unit', None)
+        else:
+            location.__dict__.pop(field, None)
+
+
+def move_stock(source, destination, quantity, product=None):
+    """
+    Move ``quantity`` base units from ``source`` to ``destination`` (``Stock``
+    or ``BarmanStock`` of the same product). Raises ValidationError, changing
+    nothing, if the source holds less.
+    """
+    quantity = Decimal(str(quantity))
+    if quantity <= 0:
+        raise ValidationError("Transfer quantity must be positive.")
+    if _product_id(source) != _product_id(destination):
+        raise ValidationError("Stock can only be transferred between locations of the same product.")
+    product = product or _product(source)
+
+    updates = [
+        (source, _decrement(source, quantity, product), Q(quantity_in_base_units__gte=quantity)),
+        (destination, _increment(destination, quantity, product), Q()),
+    ]
+    updates.sort(key=lambda update: (update[0]._meta.db_table, update[0].pk))
+    with transaction.atomic():
+        for location, values, condition in updates:
+            updated = type(location).objects.filter(condition, pk=location.pk).update(**values)
+            if not updated:
+                raise _insufficient(source, quantity, product)
+    for location, values, _ in updates:
+        _forget(location, values)
+
+    # Queryset updates bypass post_save; the owner's inventory value changed
+    from reports.kpis import invalidate_owner_kpis
+    for location in (source, destination):
+        if isinstance(location, Stock):
+            invalidate_owner_kpis(location.branch_id)
+    logger.debug("Moved %s base units of product %s from %s %s to %s %s", quantity, product.pk,
+                 type(source).__name__, source.pk, type(destination).__name__, destination.pk)
+
+
+def transfer(source, destination, quantity, unit=None, quantity_in_base_units=None, initiated_by=None,
+             notes=None, branch=None, product=None):
+    """
+    Move stock and record it in the ledger, in one transaction. ``quantity``
+    is in ``unit`` (the product's base unit by default); pass
+    ``quantity_in_base_units`` when the caller already converted it.
+    Returns the ``InventoryTransaction``.
+    """
+    try:
+        transaction_type = LEDGER_TYPES[type(source), type(destination)]
+    except KeyError:
+        raise ValidationError(
+            f"No ledger type for transfers from {type(source).__name__} to {type(destination).__name__}."
+        )
+    product = product or _product(source)
+    unit = unit or product.base_unit
+    quantity = Decimal(str(quantity))
+    if quantity_in_base_units is None:
+        try:
+            factor = product.get_conversion_factor(unit, product.base_unit)
+        except ValueError as e:
+            raise ValidationError({'transaction_unit': f'Invalid unit conversion for this product: {e}'})
+        quantity_in_base_units = (quantity * factor).quantize(Decimal('0.01'))
+
+    ledger = InventoryTransaction(
+        branch_id=branch.pk if branch else (source.branch_id or destination.branch_id),
+        product=product,
+        transaction_type=transaction_type,
+        quantity=quantity,
+        transaction_unit=unit,
+        quantity_in_base_units=abs(quantity_in_base_units),
+        from_stock_main=source if isinstance(source, Stock) else None,
+        from_stock_barman=source if isinstance(source, BarmanStock) else None,
+        to_stock_main=destination if isinstance(destination, Stock) else None,
+        to_stock_barman=destination if isinstance(destination, BarmanStock) else None,
+        initiated_by=initiated_by,
+        notes=notes,
+    )
+    with transaction.atomic():
+        move_stock(source, destination, ledger.quantity_in_base_units, product)
+        # bulk_create skips save(), whose full_clean re-reads every foreign key
+        InventoryTransaction.objects.bulk_create([ledger])
+    return ledger
+
+
+def adjust_stock(location, quantity_in_base_units, transaction_type, unit=None, quantity=None,
+                 initiated_by=None, notes=None, price=None, product=None):
+    """
+    Add (``restock``, ``adjustment_in``) or remove (``adjustment_out``,
+    ``wastage``) ``quantity_in_base_units`` at one ``Stock`` or
+    ``BarmanStock`` and record it in the ledger: one UPDATE and one INSERT in
+    one transaction. ``quantity`` in ``unit`` is what the ledger row shows
+    (the base quantity in the base unit by default). Removing more than the
+    location holds raises ValidationError and changes nothing. Returns the
+    ``InventoryTransaction``.
+    """
+    if transaction_type not in INBOUND_TYPES + OUTBOUND_TYPES:
+        raise ValidationError(f"{transaction_type} is not a single-location stock change.")
+    amount = abs(Decimal(str(quantity_in_base_units))).quantize(Decimal('0.01'))
+    if not amount:
+        raise ValidationError("Adjustment quantity must be positive.")
+    product = product or _product(location)
+    inbound = transaction_type in INBOUND_TYPES
+    bar = isinstance(location, BarmanStock)
+    ledger = InventoryTransaction(
+        branch_id=location.branch_id or (location.stock.branch_id if bar else None),
+        product=product,
+        transaction_type=transaction_type,
+        quantity=Decimal(str(quantity)) if quantity is not None else amount,
+        transaction_unit=unit or product.base_unit,
+        quantity_in_base_units=amount if inbound else -amount,
+        to_stock_main=location if inbound and not bar else None,
+        to_stock_barman=location if inbound and bar else None,
+        from_stock_main=location if not inbound and not bar else None,
+        from_stock_barman=location if not inbound and bar else None,
+        initiated_by=initiated_by,
+        price_at_transaction=price,
+        notes=notes,
+    )
+    values = _increment(location, amount, product) if inbound else _decrement(location, amount, product)
+    condition = Q() if inbound else Q(quantity_in_base_units__gte=amount)
+    with transaction.atomic():
+        if not type(location).objects.filter(condition, pk=location.pk).update(**values):
+            raise _insufficient(location, amount, product)
+        InventoryTransaction.objects.bulk_create([ledger])
+    _forget(location, values)
+
+    if not bar:
+        from reports.kpis import invalidate_owner_kpis
+        invalidate_owner_kpis(location.branch_id)
+    return ledger
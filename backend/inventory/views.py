@@ -1,4 +1,5 @@
-from decimal import Decimal
+import csv
+from decimal import Decimal, InvalidOperation
 from django.db import transaction, models
 from rest_framework import viewsets, status
 from rest_framework.response import Response
@@ -20,6 +21,39 @@ from .serializers import (
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .imports import default_conversion_factor, import_products, parse_csv
+from .ledger import stock_at
+from .transfers import adjust_stock
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_to_count(request, location, serializer_class):
+    """
+    Set ``location`` (a Stock or BarmanStock) to the counted
+    ``quantity_in_base_units`` in the request with an adjustment ledger row,
+    so manual corrections survive ``reconcile_stock --fix``.
+    """
+    try:
+        counted = Decimal(str(request.data.get('quantity_in_base_units'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return Response({'detail': 'quantity_in_base_units must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not counted.is_finite() or counted < 0:
+        return Response({'detail': 'Quantity cannot be negative.'}, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        location = type(location).objects.select_for_update(of=('self',)).get(pk=location.pk)
+        difference = counted - location.quantity_in_base_units
+        if difference:
+            adjust_stock(
+                location, difference, 'adjustment_in' if difference > 0 else 'adjustment_out',
+                initiated_by=request.user,
+                notes=request.data.get('notes') or f"Stock count: {counted}",
+            )
+    location.refresh_from_db()
+    return Response(serializer_class(location).data)
+
 
 # Custom permission class for managers only
 class IsManager(BasePermission):
@@ -106,11 +140,11 @@ class InventoryRequestViewSet(viewsets.ModelViewSet):
                 stock.original_quantity = (stock.original_quantity - req.quantity).quantize(Decimal('0.01'))
             stock.original_unit = req.request_unit
             stock.save()
-            print(f"[DEBUG] Stock updated after reach: original_quantity={stock.original_quantity}, original_unit={stock.original_unit.unit_name}")
+            logger.debug("Stock updated after reach: original_quantity=%s, original_unit=%s", stock.original_quantity, stock.original_unit.unit_name)
         except Stock.DoesNotExist:
             return Response({'detail': 'No stock found for this product and branch.'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            print(f"[ERROR] Error reaching request: {e}")
+            logger.error("Error reaching request: %s", e)
             return Response({'detail': f'Error reaching request: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
         req.status = 'fulfilled'
         req.reached_status = True
@@ -145,7 +179,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 original_unit = ProductUnit.objects.get(id=original_unit_id)
                 conversion_factor = product.get_conversion_factor(original_unit, product.base_unit)
                 quantity_in_base_units = original_quantity * conversion_factor
-                Stock.objects.create(
+                stock = Stock.objects.create(
                     product=product,
                     branch=branch,
                     quantity_in_base_units=quantity_in_base_units,
@@ -153,6 +187,18 @@ class ProductViewSet(viewsets.ModelViewSet):
                     original_unit=original_unit,
                     minimum_threshold_base_units=Decimal(stock_data.get('minimum_threshold_base_units', 0)),
                 )
+                # Record the opening balance so the ledger adds up to the stock
+                InventoryTransaction(
+                    product=product,
+                    transaction_type='restock',
+                    quantity=original_quantity,
+                    transaction_unit=original_unit,
+                    quantity_in_base_units=quantity_in_base_units,
+                    to_stock_main=stock,
+                    branch=branch,
+                    initiated_by=request.user if request.user.is_authenticated else None,
+                    notes=f"Initial stock: {original_quantity} {original_unit.unit_name}",
+                ).save(skip_stock_adjustment=True)
             return response
 
     def create_product_with_related(self, product_data):
@@ -184,9 +230,9 @@ class ProductViewSet(viewsets.ModelViewSet):
                     amount_per=measurement_data.get('amount_per'),
                     is_default_sales_unit=measurement_data.get('is_default_sales_unit', False),
                 )
-                print(f"Product measurement created successfully")
+                logger.debug("Product measurement created successfully")
             except Exception as e:
-                print(f"Error creating measurement: {e}")
+                logger.error("Error creating measurement: %s", e)
                 raise ValueError(f"Error creating measurement: {e}")
         
         # Create stock AFTER measurement is created
@@ -197,7 +243,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 original_unit_id = stock_data.get('original_unit_id')
                 provided_quantity_in_base_units = stock_data.get('quantity_in_base_units')
                 
-                print(f"[DEBUG] Stock data - original_quantity: {original_quantity} (type: {type(original_quantity)})")
+                logger.debug("Stock data - original_quantity: %s (type: %s)", original_quantity, type(original_quantity))
                 
                 if not original_unit_id:
                     raise ValueError("original_unit_id is required in stock_data")
@@ -208,7 +254,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 # Use provided quantity_in_base_units if available, otherwise calculate
                 if provided_quantity_in_base_units is not None:
                     quantity_in_base_units = Decimal(str(provided_quantity_in_base_units)).quantize(Decimal('0.01'))
-                    print(f"Using provided quantity_in_base_units: {quantity_in_base_units}")
+                    logger.debug("Using provided quantity_in_base_units: %s", quantity_in_base_units)
                 else:
                     # Calculate quantity in base units - now the conversion should exist
                     try:
@@ -216,10 +262,10 @@ class ProductViewSet(viewsets.ModelViewSet):
                         original_quantity_decimal = Decimal(str(original_quantity))
                         conversion_factor = product.get_conversion_factor(original_unit, product.base_unit)
                         quantity_in_base_units = (original_quantity_decimal * conversion_factor).quantize(Decimal('0.01'))
-                        print(f"Calculated quantity_in_base_units: {quantity_in_base_units} (original: {original_quantity_decimal}, conversion: {conversion_factor})")
+                        logger.debug("Calculated quantity_in_base_units: %s (original: %s, conversion: %s)", quantity_in_base_units, original_quantity_decimal, conversion_factor)
                     except ValueError as e:
                         # If conversion doesn't exist, try to create it automatically
-                        print(f"Missing conversion for {product.name}: {original_unit.unit_name} -> {product.base_unit.unit_name}")
+                        logger.debug("Missing conversion for %s: %s -> %s", product.name, original_unit.unit_name, product.base_unit.unit_name)
                         default_factor = self._get_default_conversion_factor(original_unit.unit_name, product.base_unit.unit_name)
                         if default_factor:
                             ProductMeasurement.objects.create(
@@ -229,11 +275,11 @@ class ProductViewSet(viewsets.ModelViewSet):
                                 amount_per=Decimal(str(default_factor)),
                                 is_default_sales_unit=False
                             )
-                            print(f"Auto-created conversion: {original_unit.unit_name} -> {product.base_unit.unit_name} = {default_factor}")
+                            logger.debug("Auto-created conversion: %s -> %s = %s", original_unit.unit_name, product.base_unit.unit_name, default_factor)
                             conversion_factor = Decimal(str(default_factor))
                             original_quantity_decimal = Decimal(str(original_quantity))
                             quantity_in_base_units = (original_quantity_decimal * conversion_factor).quantize(Decimal('0.01'))
-                            print(f"Auto-calculated quantity_in_base_units: {quantity_in_base_units} (original: {original_quantity_decimal}, conversion: {conversion_factor})")
+                            logger.debug("Auto-calculated quantity_in_base_units: %s (original: %s, conversion: %s)", quantity_in_base_units, original_quantity_decimal, conversion_factor)
                         else:
                             raise ValueError(f"No conversion path found and no default available for {original_unit.unit_name} -> {product.base_unit.unit_name}")
                 
@@ -245,7 +291,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                     original_unit=original_unit,
                     minimum_threshold_base_units=stock_data.get('minimum_threshold_base_units', 0),
                 )
-                print(f"Stock created successfully: {stock.id}")
+                logger.debug("Stock created successfully: %s", stock.id)
                 
                 # Create inventory transaction for initial stock with skip_stock_adjustment=True
                 transaction = InventoryTransaction(
@@ -260,38 +306,17 @@ class ProductViewSet(viewsets.ModelViewSet):
                     notes=f"Initial stock: {original_quantity} {original_unit.unit_name}"
                 )
                 transaction.save(skip_stock_adjustment=True)
-                print(f"Inventory transaction created for initial stock")
+                logger.debug("Inventory transaction created for initial stock")
                 
             except Exception as e:
-                print(f"Error creating stock: {e}")
+                logger.error("Error creating stock: %s", e)
                 raise ValueError(f"Error creating stock: {e}")
         
         return product
 
     def _get_default_conversion_factor(self, from_unit_name, to_unit_name):
         """Get default conversion factor for common unit combinations"""
-        default_conversions = {
-            'carton': {
-                'bottle': 24,
-                'shot': 480,
-                'unit': 24,
-            },
-            'bottle': {
-                'shot': 20,
-                'ml': 750,
-                'unit': 1,
-            },
-            'shot': {
-                'ml': 37.5,
-                'unit': 1,
-            },
-            'unit': {
-                'shot': 1,
-                'ml': 37.5,
-            }
-        }
-        
-        return default_conversions.get(from_unit_name.lower(), {}).get(to_unit_name.lower())
+        return default_conversion_factor(from_unit_name, to_unit_name)
 
     @action(detail=False, methods=['get'], url_path='available')
     def available(self, request):
@@ -389,7 +414,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                             amount_per=Decimal(str(factor)),
                             is_default_sales_unit=False
                         )
-                        print(f"Created conversion: {from_unit_name} -> {to_unit_name} = {factor}")
+                        logger.debug("Created conversion: %s -> %s = %s", from_unit_name, to_unit_name, factor)
                     
                     # Add to valid units if not already there
                     if from_unit_name not in created_units:
@@ -398,7 +423,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             return created_units
             
         except Exception as e:
-            print(f"Error creating default conversions: {e}")
+            logger.error("Error creating default conversions: %s", e)
             return ['carton', 'bottle', 'unit']  # Fallback
 
     @action(detail=True, methods=['post'], url_path='add_conversion')
@@ -464,27 +489,29 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'], url_path='bulk_create')
     def bulk_create(self, request):
-        products_data = request.data.get('products', [])
-        print(f"Received {len(products_data)} products for bulk creation")
+        """Import products from a ``products`` list or a CSV ``file`` (see inventory/imports.py)"""
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                products_data = parse_csv(upload.read().decode('utf-8-sig'))
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({'detail': f'Could not read CSV: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            products_data = request.data.get('products', [])
         if not isinstance(products_data, list):
             return Response({'detail': 'products must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-        created_products = []
-        errors = []
-        for i, pdata in enumerate(products_data):
-            print(f"Processing product {i+1}: {pdata.get('name', 'Unknown')}")
-            try:
-                product = self.create_product_with_related(pdata)
-                created_products.append(product)
-                print(f"Successfully created product: {product.name}")
-            except Exception as e:
-                error_msg = f"Error creating product {pdata.get('name', 'Unknown')}: {str(e)}"
-                print(error_msg)
-                errors.append({'product': pdata.get('name'), 'error': str(e)})
-        
-        print(f"Bulk creation completed. Created: {len(created_products)}, Errors: {len(errors)}")
-        if errors:
-            return Response({'created': ProductSerializer(created_products, many=True).data, 'errors': errors}, status=status.HTTP_207_MULTI_STATUS)
-        return Response(ProductSerializer(created_products, many=True).data, status=status.HTTP_201_CREATED)
+        logger.debug("Received %s products for bulk creation", len(products_data))
+
+        result = import_products(
+            products_data, initiated_by=request.user if request.user.is_authenticated else None,
+        )
+        created_products = Product.objects.filter(pk__in=[product.pk for product in result.created]) \
+            .select_related('category', 'category__item_type', 'base_unit')
+        created = ProductSerializer(created_products, many=True).data
+        logger.debug("Bulk creation completed. Created: %s, Errors: %s", len(result.created), len(result.errors))
+        if result.errors:
+            return Response({'created': created, 'errors': result.errors}, status=status.HTTP_207_MULTI_STATUS)
+        return Response(created, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['get'], url_path='debug_values')
     def debug_values(self, request, pk=None):
@@ -562,12 +589,12 @@ class StockViewSet(viewsets.ModelViewSet):
                     conversion_amount = request.data.get('conversion_amount')
                     if conversion_amount:
                         conversion_factor = Decimal(str(conversion_amount))
-                        print(f"[DEBUG] Using conversion factor from frontend: {conversion_factor}")
+                        logger.debug("Using conversion factor from frontend: %s", conversion_factor)
                     else:
                         # Fallback: try to get conversion from database
                         try:
                             conversion_factor = stock.product.get_conversion_factor(original_unit, stock.product.base_unit)
-                            print(f"[DEBUG] Using conversion factor from database: {conversion_factor}")
+                            logger.debug("Using conversion factor from database: %s", conversion_factor)
                         except ValueError:
                             # If conversion doesn't exist, try to find it in ProductMeasurement
                             measurement = ProductMeasurement.objects.filter(
@@ -578,63 +605,81 @@ class StockViewSet(viewsets.ModelViewSet):
                             
                             if measurement:
                                 conversion_factor = measurement.amount_per
-                                print(f"[DEBUG] Found conversion in ProductMeasurement: {conversion_factor}")
+                                logger.debug("Found conversion in ProductMeasurement: %s", conversion_factor)
                             else:
                                 # Fallback: assume 1:1 conversion
                                 conversion_factor = Decimal('1.0')
-                                print(f"[DEBUG] No conversion found, using 1:1 fallback")
+                                logger.debug("No conversion found, using 1:1 fallback")
                     
                     quantity_in_base_units = (original_quantity * conversion_factor).quantize(Decimal('0.01'))
                     
-                    print(f"[DEBUG] Stock creation conversion:")
-                    print(f"  Original quantity: {original_quantity}")
-                    print(f"  Original unit: {original_unit.unit_name}")
-                    print(f"  Base unit: {stock.product.base_unit.unit_name}")
-                    print(f"  Conversion factor: {conversion_factor}")
-                    print(f"  Calculated quantity_in_base_units: {quantity_in_base_units}")
-                    print(f"  Expected: {original_quantity} × {conversion_factor} = {original_quantity * conversion_factor}")
+                    logger.debug("Stock creation conversion:")
+                    logger.debug("  Original quantity: %s", original_quantity)
+                    logger.debug("  Original unit: %s", original_unit.unit_name)
+                    logger.debug("  Base unit: %s", stock.product.base_unit.unit_name)
+                    logger.debug("  Conversion factor: %s", conversion_factor)
+                    logger.debug("  Calculated quantity_in_base_units: %s", quantity_in_base_units)
+                    logger.debug("  Expected: %s × %s = %s", original_quantity, conversion_factor, original_quantity * conversion_factor)
                     
-                    print(f"[DEBUG] About to update stock with quantities:")
-                    print(f"  - original_quantity: {original_quantity}")
-                    print(f"  - original_unit: {original_unit.unit_name}")
-                    print(f"  - quantity_in_base_units: {quantity_in_base_units}")
+                    logger.debug("About to update stock with quantities:")
+                    logger.debug("  - original_quantity: %s", original_quantity)
+                    logger.debug("  - original_unit: %s", original_unit.unit_name)
+                    logger.debug("  - quantity_in_base_units: %s", quantity_in_base_units)
                     
-                    # Update stock with initial quantities (directly, no double adjustment)
+                    # The opening balance goes through the ledger like any other change
                     stock.original_quantity = original_quantity
                     stock.original_unit = original_unit
-                    stock.quantity_in_base_units = quantity_in_base_units
-                    stock.save()
-                    
-                    print(f"[DEBUG] Stock saved. Current values:")
-                    print(f"  - stock.original_quantity: {stock.original_quantity}")
-                    print(f"  - stock.quantity_in_base_units: {stock.quantity_in_base_units}")
-                    
-                    # Create initial inventory transaction, but skip stock adjustment
-                    transaction = InventoryTransaction(
-                        product=stock.product,
-                        transaction_type='restock',
-                        quantity=original_quantity,
-                        transaction_unit=original_unit,
-                        quantity_in_base_units=quantity_in_base_units,
-                        to_stock_main=stock,
-                        branch=stock.branch,
-                        initiated_by=request.user if request.user.is_authenticated else None,
-                        notes=f"Initial stock creation: {original_quantity} {original_unit.unit_name}",
-                    )
-                    transaction.save(skip_stock_adjustment=True)
-                    
-                    print(f"[DEBUG] Transaction created with skip_stock_adjustment=True")
-                    print(f"[DEBUG] Final stock values after transaction:")
-                    stock.refresh_from_db()
-                    print(f"  - stock.original_quantity: {stock.original_quantity}")
-                    print(f"  - stock.quantity_in_base_units: {stock.quantity_in_base_units}")
+                    stock.save(update_fields=['original_quantity', 'original_unit'])
+                    if quantity_in_base_units > 0:
+                        adjust_stock(
+                            stock, quantity_in_base_units, 'adjustment_in',
+                            unit=original_unit, quantity=original_quantity,
+                            initiated_by=request.user if request.user.is_authenticated else None,
+                            notes=f"Initial stock creation: {original_quantity} {original_unit.unit_name}",
+                        )
+                    response.data['quantity_in_base_units'] = str(quantity_in_base_units)
                     
                 except (ProductUnit.DoesNotExist, ValueError) as e:
-                    print(f"Error setting initial stock: {e}")
+                    logger.error("Error setting initial stock: %s", e)
                     # Continue without initial stock
             
             return response
 
+    @action(detail=True, methods=['post'], url_path='adjust', permission_classes=[IsManager])
+    def adjust(self, request, pk=None):
+        """Correct the balance to a stock count (see ``adjust_to_count``)"""
+        return adjust_to_count(request, self.get_object(), StockSerializer)
+
+    @action(detail=False, methods=['get'], url_path='at')
+    def at(self, request):
+        """Store stock of a product at a branch as of ``at`` (now by default), from the ledger"""
+        product_id = request.query_params.get('product')
+        branch_id = request.query_params.get('branch')
+        if not product_id or not branch_id:
+            return Response({'detail': 'product and branch are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        at = request.query_params.get('at')
+        if at:
+            try:
+                at = parse_datetime(at)
+            except ValueError:
+                at = None
+            if at is None:
+                return Response({'detail': 'at must be an ISO 8601 datetime.'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        else:
+            at = timezone.now()
+        try:
+            quantity = stock_at(int(product_id), int(branch_id), at)
+        except ValueError:
+            return Response({'detail': 'product and branch must be ids.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'product': int(product_id),
+            'branch': int(branch_id),
+            'at': at,
+            'quantity_in_base_units': quantity,
+        })
+
     @action(detail=True, methods=['post'], url_path='restock', permission_classes=[IsManager])
     @transaction.atomic
     def restock(self, request, pk=None):
@@ -643,8 +688,8 @@ class StockViewSet(viewsets.ModelViewSet):
         data = request.data
         
         # Debug logging
-        print(f"Restock request data: {data}")
-        print(f"Files: {request.FILES}")
+        logger.debug("Restock request data: %s", data)
+        logger.debug("Files: %s", request.FILES)
         
         try:
             restock_quantity = data.get('quantity')
@@ -654,7 +699,7 @@ class StockViewSet(viewsets.ModelViewSet):
             total_amount = data.get('total_amount')
             receipt_file = request.FILES.get('receipt')
             
-            print(f"Parsed values - quantity: {restock_quantity}, type: {restock_type}, price: {price_per_unit}")
+            logger.debug("Parsed values - quantity: %s, type: %s, price: %s", restock_quantity, restock_type, price_per_unit)
             
             # Validate required fields with better error messages
             if not restock_quantity:
@@ -692,7 +737,7 @@ class StockViewSet(viewsets.ModelViewSet):
                 quantity_in_base_units = (restock_quantity * conversion_factor).quantize(Decimal('0.01'))
             except ValueError as e:
                 # Try to create missing conversion automatically
-                print(f"Missing conversion for {product.name}: {restock_type} -> {product.base_unit.unit_name}")
+                logger.debug("Missing conversion for %s: %s -> %s", product.name, restock_type, product.base_unit.unit_name)
                 try:
                     # Create a reasonable default conversion
                     default_factor = self._get_default_conversion_factor(restock_type, product.base_unit.unit_name)
@@ -704,7 +749,7 @@ class StockViewSet(viewsets.ModelViewSet):
                             amount_per=Decimal(str(default_factor)),
                             is_default_sales_unit=False
                         )
-                        print(f"Auto-created conversion: {restock_type} -> {product.base_unit.unit_name} = {default_factor}")
+                        logger.debug("Auto-created conversion: %s -> %s = %s", restock_type, product.base_unit.unit_name, default_factor)
                         conversion_factor = Decimal(str(default_factor))
                         quantity_in_base_units = (restock_quantity * conversion_factor).quantize(Decimal('0.01'))
                     else:
@@ -713,15 +758,15 @@ class StockViewSet(viewsets.ModelViewSet):
                             'suggestion': f'Try adding conversion: 1 {restock_type} = X {product.base_unit.unit_name}'
                         }, status=status.HTTP_400_BAD_REQUEST)
                 except Exception as auto_create_error:
-                    print(f"Failed to auto-create conversion: {auto_create_error}")
+                    logger.warning("Failed to auto-create conversion: %s", auto_create_error)
                     return Response({
                         'detail': f'No conversion path found for Product "{product.name}" from "{restock_type}" to "{product.base_unit.unit_name}". Please configure unit conversions.',
                         'suggestion': f'Try adding conversion: 1 {restock_type} = X {product.base_unit.unit_name}'
                     }, status=status.HTTP_400_BAD_REQUEST)
             
             # Update stock quantities - REMOVE DIRECT MODIFICATION, let InventoryTransaction handle it
-            print(f"[DEBUG] Before restock - quantity_in_base_units: {stock.quantity_in_base_units}, original_quantity: {stock.original_quantity}, original_unit: {stock.original_unit}")
-            print(f"[DEBUG] Restock calculation - restock_quantity: {restock_quantity}, conversion_factor: {conversion_factor}, quantity_in_base_units: {quantity_in_base_units}")
+            logger.debug("Before restock - quantity_in_base_units: %s, original_quantity: %s, original_unit: %s", stock.quantity_in_base_units, stock.original_quantity, stock.original_unit)
+            logger.debug("Restock calculation - restock_quantity: %s, conversion_factor: %s, quantity_in_base_units: %s", restock_quantity, conversion_factor, quantity_in_base_units)
             
             # REMOVED: stock.quantity_in_base_units = (stock.quantity_in_base_units + quantity_in_base_units).quantize(Decimal('0.01'))
             # Let InventoryTransaction handle the stock adjustment
@@ -733,21 +778,21 @@ class StockViewSet(viewsets.ModelViewSet):
                     existing_conversion = product.get_conversion_factor(stock.original_unit, restock_unit)
                     converted_existing = stock.original_quantity * existing_conversion
                     stock.original_quantity = (converted_existing + restock_quantity).quantize(Decimal('0.01'))
-                    print(f"[DEBUG] Unit conversion - from {stock.original_unit.unit_name} to {restock_unit.unit_name}, factor: {existing_conversion}, converted: {converted_existing}")
+                    logger.debug("Unit conversion - from %s to %s, factor: %s, converted: %s", stock.original_unit.unit_name, restock_unit.unit_name, existing_conversion, converted_existing)
                 except ValueError:
                     # If conversion doesn't exist, just add the new quantity
                     stock.original_quantity = restock_quantity
-                    print(f"[DEBUG] No conversion found, using new quantity as original: {restock_quantity}")
+                    logger.debug("No conversion found, using new quantity as original: %s", restock_quantity)
             else:
                 # Same unit or no existing original_unit, just add
                 stock.original_quantity = (stock.original_quantity + restock_quantity).quantize(Decimal('0.01'))
-                print(f"[DEBUG] Same unit or no existing unit, adding: {stock.original_quantity}")
+                logger.debug("Same unit or no existing unit, adding: %s", stock.original_quantity)
             
             stock.original_unit = restock_unit
             stock.last_stock_update = timezone.now()
             stock.save()
             
-            print(f"[DEBUG] After restock - quantity_in_base_units: {stock.quantity_in_base_units}, original_quantity: {stock.original_quantity}, original_unit: {stock.original_unit}")
+            logger.debug("After restock - quantity_in_base_units: %s, original_quantity: %s, original_unit: %s", stock.quantity_in_base_units, stock.original_quantity, stock.original_unit)
             
             # Create inventory transaction - use constructor to avoid double save
             user = request.user if request.user.is_authenticated else None
@@ -784,7 +829,7 @@ class StockViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            print(f"Restock error: {str(e)}")
+            logger.exception("Restock error: %s", e)
             return Response({'detail': f'Restock failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
     def _get_default_conversion_factor(self, from_unit_name, to_unit_name):
@@ -825,6 +870,11 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
             return qs
         return qs.filter(bartender=user)
 
+    @action(detail=True, methods=['post'], url_path='adjust', permission_classes=[IsManager])
+    def adjust(self, request, pk=None):
+        """Correct the balance to a stock count (see ``adjust_to_count``)"""
+        return adjust_to_count(request, self.get_object(), BarmanStockSerializer)
+
     @action(detail=True, methods=['post'], url_path='restock', permission_classes=[IsManager])
     @transaction.atomic
     def restock(self, request, pk=None):
@@ -833,8 +883,8 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
         data = request.data
         
         # Debug logging
-        print(f"[DEBUG] BarmanStock restock request data: {data}")
-        print(f"[DEBUG] Files: {request.FILES}")
+        logger.debug("BarmanStock restock request data: %s", data)
+        logger.debug("Files: %s", request.FILES)
         
         try:
             restock_quantity = data.get('quantity')
@@ -843,7 +893,7 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
             total_amount = data.get('total_amount')
             receipt_file = request.FILES.get('receipt')
             
-            print(f"[DEBUG] Parsed values - quantity: {restock_quantity}, type: {restock_type}, price: {price_per_unit}")
+            logger.debug("Parsed values - quantity: %s, type: %s, price: %s", restock_quantity, restock_type, price_per_unit)
             
             # Validate required fields
             if not restock_quantity:
@@ -881,7 +931,7 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
                 quantity_in_base_units = (restock_quantity * conversion_factor).quantize(Decimal('0.01'))
             except ValueError as e:
                 # Try to create missing conversion automatically
-                print(f"Missing conversion for {product.name}: {restock_type} -> {product.base_unit.unit_name}")
+                logger.debug("Missing conversion for %s: %s -> %s", product.name, restock_type, product.base_unit.unit_name)
                 try:
                     # Create a reasonable default conversion
                     default_factor = self._get_default_conversion_factor(restock_type, product.base_unit.unit_name)
@@ -893,7 +943,7 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
                             amount_per=Decimal(str(default_factor)),
                             is_default_sales_unit=False
                         )
-                        print(f"Auto-created conversion: {restock_type} -> {product.base_unit.unit_name} = {default_factor}")
+                        logger.debug("Auto-created conversion: %s -> %s = %s", restock_type, product.base_unit.unit_name, default_factor)
                         conversion_factor = Decimal(str(default_factor))
                         quantity_in_base_units = (restock_quantity * conversion_factor).quantize(Decimal('0.01'))
                     else:
@@ -902,7 +952,7 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
                             'suggestion': f'Try adding conversion: 1 {restock_type} = X {product.base_unit.unit_name}'
                         }, status=status.HTTP_400_BAD_REQUEST)
                 except Exception as auto_create_error:
-                    print(f"Failed to auto-create conversion: {auto_create_error}")
+                    logger.warning("Failed to auto-create conversion: %s", auto_create_error)
                     return Response({
                         'detail': f'No conversion path found for Product "{product.name}" from "{restock_type}" to "{product.base_unit.unit_name}". Please configure unit conversions.',
                         'suggestion': f'Try adding conversion: 1 {restock_type} = X {product.base_unit.unit_name}'
@@ -946,7 +996,7 @@ class BarmanStockViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            print(f"BarmanStock restock error: {str(e)}")
+            logger.exception("BarmanStock restock error: %s", e)
             return Response({'detail': f'BarmanStock restock failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
     def _get_default_conversion_factor(self, from_unit_name, to_unit_name):
@@ -1,38 +1,139 @@
 import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from core import replay
+from core.realtime import group_name, stations_for
+
+
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Realtime events (core/realtime.py) for the user's branch and stations.
+
+    ``?stations=food,beverage`` narrows the subscription to some of the
+    stations the user's role may see. Owners without a branch get every
+    branch.
+
+    Each station of a branch is a stream with its own sequence numbers. On
+    connect the screen gets ``{"event": "subscribed", "streams": {stream:
+    last seq}}``; after a reconnect it sends ``{"action": "resume",
+    "streams": {stream: last seq seen before the drop}}`` and receives the
+    events it missed, or ``{"event": "resync_required", "stream": ...,
+    "seq": ...}`` for a stream whose gap is no longer buffered
+    (core/replay.py). Events of a stream arriving while it is being replayed
+    are held back and sent after the replay; events the screen already has
+    are not sent again. Without a shared cache events carry no ``seq`` and
+    every resume gets ``resync_required``.
+    """
+
     async def connect(self):
         self.user = self.scope["user"]
         if not self.user.is_authenticated:
             await self.close()
             return
 
-        self.group_name = self.get_group_name(self.user)
-        if not self.group_name:
+        self.group_names = await self.get_group_names(self.user)
+        if not self.group_names:
             await self.close()
             return
-        
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+
+        # Per stream: the seq the screen has everything up to, the seqs sent on
+        # this connection, and events held back during a replay
+        self.floor = {}
+        self.sent = {}
+        self.held = {}
+        for name in self.group_names:
+            await self.channel_layer.group_add(name, self.channel_name)
         await self.accept()
+        await self.send_json({
+            'event': 'subscribed',
+            'streams': await sync_to_async(replay.current)(self.group_names),
+        })
 
     async def disconnect(self, close_code):
-        if hasattr(self, 'group_name'):
-            await self.channel_layer.group_discard(
-                self.group_name,
-                self.channel_name
-            )
-
-    async def send_notification(self, event):
-        message = event['message']
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
-        
-    def get_group_name(self, user):
-        if user.role in ['meat_area', 'bartender']:
-            return f"{user.role}_notifications"
-        return None 
\ No newline at end of file
+        for name in getattr(self, 'group_names', ()):
+            await self.channel_layer.group_discard(name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            request = json.loads(text_data or '')
+        except ValueError:
+            return
+        if isinstance(request, dict) and request.get('action') == 'resume':
+            await self.resume(request.get('streams') or {})
+
+    async def resume(self, streams):
+        streams = {
+            stream: seq for stream, seq in streams.items()
+            if stream in self.group_names and isinstance(seq, int)
+        }
+        for stream in streams:
+            self.held.setdefault(stream, [])
+        for stream, after in streams.items():
+            try:
+                self.floor[stream] = max(after, self.floor.get(stream, 0))
+                missed = await sync_to_async(replay.replay)(stream, after)
+                if missed is None:
+                    last = (await sync_to_async(replay.current)([stream]))[stream]
+                    await self.send_json({'event': 'resync_required', 'stream': stream, 'seq': last})
+                    self.floor[stream] = last
+                else:
+                    for event in missed:
+                        await self.send_event(event)
+            finally:
+                for event in self.held.pop(stream):
+                    await self.send_event(event)
+
+    async def realtime_event(self, event):
+        stream = event.get('stream')
+        if stream in self.held:
+            self.held[stream].append(event)
+            return
+        await self.send_event(event)
+
+    async def send_event(self, event):
+        stream, seq = event.get('stream'), event.get('seq')
+        if seq is not None:
+            sent = self.sent.setdefault(stream, set())
+            if seq <= self.floor.get(stream, 0) or seq in sent:
+                return
+            sent.add(seq)
+            if len(sent) > 2 * replay.size():
+                # Older than anything a replay could send again
+                self.sent[stream] = {n for n in sent if n > max(sent) - replay.size()}
+        await self.send_json({
+            'event': event['event'],
+            'stream': stream,
+            'seq': seq,
+            'branch': event['branch'],
+            'station': event['station'],
+            'at': event['at'],
+            'data': event['data'],
+        })
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
+
+    async def get_group_names(self, user):
+        stations = stations_for(user)
+        requested = parse_qs(self.scope.get('query_string', b'').decode()).get('stations')
+        if requested:
+            wanted = {station for value in requested for station in value.split(',')}
+            stations = [station for station in stations if station in wanted]
+        if not stations:
+            return []
+        if user.branch_id is not None:
+            branch_ids = [user.branch_id]
+        elif user.is_superuser or user.role == 'owner':
+            branch_ids = await self.all_branch_ids()
+        else:
+            return []
+        return [group_name(branch_id, station) for branch_id in branch_ids for station in stations]
+
+    @database_sync_to_async
+    def all_branch_ids(self):
+        from branches.models import Branch
+        return list(Branch.objects.values_list('id', flat=True))
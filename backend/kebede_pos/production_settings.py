@@ -96,6 +96,7 @@ CACHES = {
         }
     }
 }
+LOCAL_CACHE_IS_SHARED = False
 
 # Session settings
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
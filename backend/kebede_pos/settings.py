@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'core.authentication.SessionKeyAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
@@ -80,8 +81,26 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.audit.AuditLogMiddleware',
+    'core.realtime.RealtimeEventMiddleware',
 ]
 
+# Per-request SQL count / DB time / duplicate-query instrumentation (core/query_budget.py)
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', str(DEBUG)) == 'True'
+QUERY_BUDGET_HEADERS = DEBUG
+if QUERY_INSTRUMENTATION:
+    MIDDLEWARE.insert(1, 'core.middleware.QueryBudgetMiddleware')
+
+# Maximum queries per request, by URL name. Enforced in tests, warned about in dev.
+QUERY_BUDGETS = {
+    'food-order-list': 4,
+    'beverage-order-list': 4,
+    'order-change-feed': 6,
+    'order-item-update-status': 8,
+    'dashboard-report': 3,
+    'food-dashboard-report': 3,
+}
+
 ROOT_URLCONF = 'kebede_pos.urls'
 
 TEMPLATES = [
@@ -101,9 +120,80 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'kebede_pos.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# Channel layer: 'memory' keeps groups inside one process; 'broker' shares them
+# between worker processes through `manage.py run_channel_broker` (core/channel_broker.py)
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'memory')
+CHANNEL_BROKER_PATH = os.environ.get('CHANNEL_BROKER_PATH', '/tmp/kebede-channels.sock')
+
+if CHANNEL_LAYER == 'broker':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "core.channel_broker.BrokerChannelLayer",
+            "CONFIG": {"path": CHANNEL_BROKER_PATH},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        },
+    }
+
+# Order numbers: how many sequence values each worker leases at once (1 = no leasing)
+ORDER_NUMBER_BLOCK_SIZE = int(os.environ.get('ORDER_NUMBER_BLOCK_SIZE', '1'))
+
+# Saving a unit conversion that contradicts the product's other conversions
+# (inventory/conversion_checks.py): 'raise', 'warn' or 'off'
+INVENTORY_CONVERSION_CHECK = os.environ.get('INVENTORY_CONVERSION_CHECK', 'raise')
+
+# Audit log entries (inventory/audit.py) are written in bulk after commit, by the
+# request ('sync') or by a writer thread ('background')
+AUDIT_LOG_WRITER = os.environ.get('AUDIT_LOG_WRITER', 'sync')
+
+# Realtime events (core/realtime.py) are sent after commit by a dispatcher thread
+# ('background') or by the request itself ('sync')
+REALTIME_DISPATCH = os.environ.get('REALTIME_DISPATCH', 'background')
+
+# Recent realtime events kept per branch station for reconnecting screens
+# (core/replay.py), and for how many seconds
+REALTIME_REPLAY_SIZE = int(os.environ.get('REALTIME_REPLAY_SIZE', '500'))
+REALTIME_REPLAY_TTL = int(os.environ.get('REALTIME_REPLAY_TTL', '3600'))
+
+# Users of X-Session-Key sessions (core/authentication.py) kept per process
+# (only with a shared cache, which carries their invalidations),
+# and for how many seconds at most
+SESSION_KEY_AUTH_CACHE_SIZE = int(os.environ.get('SESSION_KEY_AUTH_CACHE_SIZE', '1000'))
+SESSION_KEY_AUTH_CACHE_TTL = int(os.environ.get('SESSION_KEY_AUTH_CACHE_TTL', '60'))
+
+# The report, KPI and conversion caches and the realtime replay buffers
+# (core/shared_cache.py) need a cache every server process shares. Django's
+# default per-process cache is only used when this says the server runs a
+# single process (runserver); deployments configure a shared CACHES instead.
+LOCAL_CACHE_IS_SHARED = os.environ.get('LOCAL_CACHE_IS_SHARED', str(DEBUG)) == 'True'
+
+# Debug tracing (core/tracing.py): DJANGO_TRACE=orders,inventory (or "all") turns
+# on DEBUG output for those apps' loggers. Off by default.
+LOCAL_APPS = ['users', 'products', 'orders', 'inventory', 'payments', 'branches', 'activity', 'menu', 'reports', 'core', 'api']
+TRACED_APPS = [app.strip() for app in os.environ.get('DJANGO_TRACE', '').split(',') if app.strip()]
+if 'all' in TRACED_APPS:
+    TRACED_APPS = LOCAL_APPS
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'trace': {'format': '[%(levelname)s] %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'trace'},
+    },
+    'loggers': {
+        app: {
+            'handlers': ['console'],
+            'level': 'DEBUG' if app in TRACED_APPS else 'INFO',
+            'propagate': False,
+        }
+        for app in LOCAL_APPS
     },
 }
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from core.views import index
+from core.views import index, query_report, realtime_report
 from django.conf import settings
 from django.conf.urls.static import static
 from pathlib import Path
@@ -82,6 +82,12 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
+    # Per-endpoint query/latency report (QueryBudgetMiddleware)
+    path('api/debug/query-report/', query_report, name='query-report'),
+
+    # Realtime event dispatcher metrics (core/realtime.py)
+    path('api/debug/realtime/', realtime_report, name='realtime-report'),
+
     # React frontend catch-all route (uncommented for serving frontend if needed)
     re_path(r'^(?:.*)/?$', index, name='index'),
 
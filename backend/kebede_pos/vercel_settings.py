@@ -90,6 +90,25 @@ else:
         }
     }
 
+# Cache shared by the gunicorn workers (core/shared_cache.py): Redis when
+# REDIS_URL is set (needs the redis package), otherwise a database table
+# created by `manage.py createcachetable`
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'kebede_pos_cache',
+        }
+    }
+LOCAL_CACHE_IS_SHARED = False
+
 # Static files
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
@@ -14,6 +14,10 @@ from .serializers import (
 )
 
 from inventory.models import Stock
+import logging
+from core.tracing import tracing_enabled
+
+logger = logging.getLogger(__name__)
 
 
 class MenuViewSet(viewsets.ModelViewSet):
@@ -29,7 +33,7 @@ class MenuViewSet(viewsets.ModelViewSet):
         user = request.user
         user_role = getattr(user, 'role', None)
         
-        print(f"[DEBUG] MenuViewSet.available_items - User: {user.username}, Role: {user_role}")
+        logger.debug("MenuViewSet.available_items - User: %s, Role: %s", user.username, user_role)
 
         for section in menu.sections.all():
             # Include items that are available and either:
@@ -40,10 +44,10 @@ class MenuViewSet(viewsets.ModelViewSet):
             # Apply role-based filtering
             if user_role == 'bartender':
                 available_items = available_items.filter(item_type='beverage')
-                print(f"[DEBUG] Bartender - filtering section '{section.name}' to beverage items only")
+                logger.debug("Bartender - filtering section '%s' to beverage items only", section.name)
             elif user_role == 'meat':
                 available_items = available_items.filter(item_type='food')
-                print(f"[DEBUG] Meat staff - filtering section '{section.name}' to food items only")
+                logger.debug("Meat staff - filtering section '%s' to food items only", section.name)
             
             filtered_items = []
             for item in available_items:
@@ -95,39 +99,38 @@ class MenuItemViewSet(viewsets.ModelViewSet):
         user = self.request.user
         user_role = getattr(user, 'role', None)
         
-        print(f"[DEBUG] MenuItemViewSet - User: {user.username}, Role: {user_role}")
-        print(f"[DEBUG] MenuItemViewSet - Initial queryset count: {queryset.count()}")
+        logger.debug("MenuItemViewSet - User: %s, Role: %s", user.username, user_role)
+        trace = tracing_enabled(logger)
+        if trace:
+            logger.debug("MenuItemViewSet - Initial queryset count: %s", queryset.count())
         
         # Check if we should bypass filtering for debugging
         bypass_filtering = self.request.query_params.get('bypass_filtering', 'false').lower() == 'true'
         if bypass_filtering:
-            print(f"[DEBUG] Bypassing all filtering for debugging - showing all menu items")
+            logger.debug("Bypassing all filtering for debugging - showing all menu items")
             return queryset.filter(is_available=True)
         
         # TEMPORARY: Simplified filtering for debugging
         # Just filter by availability and role, skip complex branch filtering for now
         queryset = queryset.filter(is_available=True)
-        print(f"[DEBUG] After availability filter: {queryset.count()}")
+        if trace:
+            logger.debug("After availability filter: %s", queryset.count())
         
         # Role-based filtering
         if user_role == 'bartender':
             # Bartenders can only see beverage items
             queryset = queryset.filter(item_type='beverage')
-            print(f"[DEBUG] Bartender - filtering to beverage items only, count after role filter: {queryset.count()}")
+            logger.debug("Bartender - filtering to beverage items only")
             
         elif user_role == 'meat':
             # Meat staff can only see food items
             queryset = queryset.filter(item_type='food')
-            print(f"[DEBUG] Meat staff - filtering to food items only, count after role filter: {queryset.count()}")
+            logger.debug("Meat staff - filtering to food items only")
         
         # Skip complex branch filtering for now - just show all available items for the user's role
-        print(f"[DEBUG] Final queryset count: {queryset.count()}")
-        
         # Additional debugging - show what items are available
-        if queryset.count() > 0:
-            print(f"[DEBUG] Available menu items: {list(queryset.values_list('name', 'item_type', 'is_available'))}")
-        else:
-            print(f"[DEBUG] No menu items available after all filtering")
+        if trace:
+            logger.debug("Available menu items: %s", list(queryset.values_list('name', 'item_type', 'is_available')))
         
         return queryset
 
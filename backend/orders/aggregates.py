@@ -0,0 +1,244 @@
+"""
+Incremental order aggregates.
+
+Every order keeps pending/accepted/rejected/cancelled item counts and the
+accepted subtotal for its food and beverage stations. Item writes turn into small
+F() deltas on those counters, and ``food_status``, ``beverage_status`` and
+``total_money`` are derived from the new counter values inside the same
+UPDATE statement, so an item change never has to reload the whole order.
+
+Status rules per station, in order (the rules of the original
+``calculate_food_status``/``calculate_beverage_status``):
+    no items                     -> not_applicable
+    any pending item             -> pending
+    any rejected item            -> rejected
+    every item accepted          -> completed
+    otherwise (cancelled items)  -> pending
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .changes import mark_order_changed
+from .models import Order, OrderItem
+
+STATIONS = ('food', 'beverage')
+COUNTED_STATUSES = ('pending', 'accepted', 'rejected', 'cancelled')
+# Meat is prepared in the kitchen (the meat counter follows the food station)
+STATION_FOR_ITEM_TYPE = {'food': 'food', 'meat': 'food', 'beverage': 'beverage'}
+
+COUNTER_FIELDS = tuple(
+    [f'{station}_{status}_count' for station in STATIONS for status in COUNTED_STATUSES]
+    + [f'{station}_accepted_total' for station in STATIONS]
+)
+DERIVED_FIELDS = ('food_status', 'beverage_status', 'total_money')
+
+# Orders whose stations are all in these states no longer occupy their table
+TABLE_RELEASING_STATUSES = ('cancelled', 'rejected')
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def derive_station_status(pending, accepted, rejected, cancelled):
+    """Python twin of the CASE expression used when applying deltas"""
+    if pending:
+        return 'pending'
+    if rejected:
+        return 'rejected'
+    if cancelled:
+        return 'pending'
+    if accepted:
+        return 'completed'
+    return 'not_applicable'
+
+
+def summarize_order_items(order):
+    """
+    Per-station item counts and derived status for ``order``.
+
+    Uses the prefetched ``items`` when they are already in memory, otherwise a
+    single conditional-aggregation query. Returns::
+
+        {'food': {'items': 3, 'pending': 1, 'accepted': 2, 'rejected': 0, 'cancelled': 0, 'status': 'pending'},
+         'beverage': {...}}
+
+    ``items`` counts every item of the station, including cancelled ones.
+    """
+    counts = {station: dict.fromkeys(('items',) + COUNTED_STATUSES, 0) for station in STATIONS}
+
+    prefetched = getattr(order, '_prefetched_objects_cache', {}).get('items')
+    if prefetched is not None:
+        for item in prefetched:
+            station = STATION_FOR_ITEM_TYPE.get(item.item_type)
+            if station is None:
+                continue
+            counts[station]['items'] += 1
+            if item.status in COUNTED_STATUSES:
+                counts[station][item.status] += 1
+    else:
+        aggregates = {}
+        for station in STATIONS:
+            in_station = Q(item_type__in=[t for t, s in STATION_FOR_ITEM_TYPE.items() if s == station])
+            aggregates[f'{station}__items'] = Count('id', filter=in_station)
+            for status in COUNTED_STATUSES:
+                aggregates[f'{station}__{status}'] = Count('id', filter=in_station & Q(status=status))
+        row = OrderItem.objects.filter(order_id=order.pk).aggregate(**aggregates)
+        for key, value in row.items():
+            station, name = key.split('__')
+            counts[station][name] = value
+
+    for station_counts in counts.values():
+        station_counts['status'] = derive_station_status(
+            *(station_counts[status] for status in COUNTED_STATUSES)
+        )
+    return counts
+
+
+def item_snapshot(item):
+    """The aggregate-relevant state of an item, or None if some of it is deferred"""
+    values = item.__dict__
+    try:
+        return (values['order_id'], values['item_type'], values['status'], values['price'], values['quantity'])
+    except KeyError:
+        return None
+
+
+def item_contribution(item_type, status, price, quantity):
+    station = STATION_FOR_ITEM_TYPE.get(item_type)
+    if station is None or status not in COUNTED_STATUSES:
+        return {}
+    contribution = {f'{station}_{status}_count': 1}
+    if status == 'accepted':
+        contribution[f'{station}_accepted_total'] = Decimal(str(price)) * int(quantity)
+    return contribution
+
+
+def add_snapshot_delta(deltas, old, new):
+    """Accumulate the counter change from ``old`` to ``new`` snapshots into ``deltas`` (keyed by order id)"""
+    for snapshot, sign in ((old, -1), (new, 1)):
+        if snapshot is None:
+            continue
+        order_deltas = deltas.setdefault(snapshot[0], {})
+        for field, value in item_contribution(*snapshot[1:]).items():
+            order_deltas[field] = order_deltas.get(field, 0) + sign * value
+    return deltas
+
+
+def _derived_expressions(counters):
+    def status(station):
+        pending, accepted, rejected, cancelled = (counters[f'{station}_{s}_count'] for s in COUNTED_STATUSES)
+        return Case(
+            When(GreaterThan(pending, 0), then=Value('pending')),
+            When(GreaterThan(rejected, 0), then=Value('rejected')),
+            When(GreaterThan(cancelled, 0), then=Value('pending')),
+            When(GreaterThan(accepted, 0), then=Value('completed')),
+            default=Value('not_applicable'),
+        )
+
+    return {
+        'food_status': status('food'),
+        'beverage_status': status('beverage'),
+        'total_money': ExpressionWrapper(
+            counters['food_accepted_total'] + counters['beverage_accepted_total'], output_field=MONEY
+        ),
+    }
+
+
+def apply_order_deltas(order_id, deltas):
+    """Apply counter deltas and re-derive statuses/total in a single UPDATE"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return 0
+    counters = {
+        field: F(field) + Value(deltas[field]) if field in deltas else F(field)
+        for field in COUNTER_FIELDS
+    }
+    updates = {field: counters[field] for field in deltas}
+    updates.update(_derived_expressions(counters))
+    updates['updated_at'] = timezone.now()
+    return Order.objects.filter(pk=order_id).update(**updates)
+
+
+def refresh_aggregates(order):
+    """Reload counters and derived fields on an in-memory order"""
+    order.refresh_from_db(fields=COUNTER_FIELDS + DERIVED_FIELDS + ('updated_at',))
+    return order
+
+
+def sync_table_status(order):
+    """Release the table only when an item change made the whole order terminal"""
+    if (order.table_id
+            and order.food_status in TABLE_RELEASING_STATUSES
+            and order.beverage_status in TABLE_RELEASING_STATUSES):
+        order.table.update_status_from_order(order)
+
+
+def apply_item_write(item, old, new):
+    """Apply the change of a single saved/deleted item (used by the OrderItem signals)"""
+    applied = 0
+    for order_id, order_deltas in add_snapshot_delta({}, old, new).items():
+        applied += apply_order_deltas(order_id, order_deltas)
+    item._aggregate_snapshot = new
+    if not applied:
+        return None
+
+    if OrderItem.order.is_cached(item):
+        order = refresh_aggregates(item.order)
+    else:
+        order = Order.objects.only('id', 'table_id', *DERIVED_FIELDS).get(pk=item.order_id)
+    sync_table_status(order)
+    return order
+
+
+def apply_item_changes(order, items, created=False):
+    """
+    Fold the changes of several items written behind the signals' back
+    (bulk_create / bulk_update) into one counter update for ``order``.
+    """
+    deltas = {}
+    for item in items:
+        old = None if created else getattr(item, '_aggregate_snapshot', None)
+        new = item_snapshot(item)
+        if new is None or (old is None and not created):
+            return rebuild_order_aggregates(order)
+        if old != new:
+            add_snapshot_delta(deltas, old, new)
+            item._aggregate_snapshot = new
+    for order_id, order_deltas in deltas.items():
+        apply_order_deltas(order_id, order_deltas)
+    mark_order_changed(order.pk)
+    refresh_aggregates(order)
+    sync_table_status(order)
+    return order
+
+
+def rebuild_order_aggregates(order):
+    """Recount every counter of ``order`` from its items (repair/backfill path)"""
+    values = {field: Decimal('0.00') if field.endswith('_total') else 0 for field in COUNTER_FIELDS}
+    rows = (
+        OrderItem.objects.filter(order_id=order.pk)
+        .values('item_type', 'status')
+        .annotate(count=Count('id'), subtotal=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=MONEY)))
+    )
+    for row in rows:
+        station = STATION_FOR_ITEM_TYPE.get(row['item_type'])
+        if station is None or row['status'] not in COUNTED_STATUSES:
+            continue
+        values[f"{station}_{row['status']}_count"] += row['count']
+        if row['status'] == 'accepted':
+            values[f'{station}_accepted_total'] += row['subtotal'] or Decimal('0.00')
+
+    for station in STATIONS:
+        values[f'{station}_status'] = derive_station_status(
+            *(values[f'{station}_{s}_count'] for s in COUNTED_STATUSES)
+        )
+    values['total_money'] = values['food_accepted_total'] + values['beverage_accepted_total']
+
+    Order.objects.filter(pk=order.pk).update(updated_at=timezone.now(), **values)
+    mark_order_changed(order.pk)
+    for field, value in values.items():
+        setattr(order, field, value)
+    sync_table_status(order)
+    return order
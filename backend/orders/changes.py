@@ -0,0 +1,157 @@
+"""
+Delta-sync change feed for the waiter, kitchen, bar and cashier dashboards.
+
+Every order write (the order itself, its items, its payment) marks the order
+as changed. Marks are collected per thread and written to ``OrderChange`` once
+the surrounding transaction commits: one SELECT and one bulk INSERT however
+many items the request touched. Orders that no longer exist at that point are
+logged as tombstones, unless their branch is gone too (deleting a branch
+deletes its orders and its change log).
+
+Clients keep the id of the last change they saw as their cursor and poll
+``read_changes`` for the orders touched since then, so the work per poll is
+proportional to the change rate rather than to the size of the orders table.
+
+Change ids are allocated when the row is inserted, so a change may commit
+slightly after one with a higher id. The returned cursor therefore only moves
+past changes older than ``SETTLE_SECONDS``; newer ones are sent again on the
+next poll, which is harmless because clients merge orders by id.
+"""
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from branches.models import Branch
+
+from .models import Order, OrderChange
+
+SETTLE_SECONDS = 2
+BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+def _pending():
+    if not hasattr(_local, 'orders'):
+        _local.orders = {}
+    return _local.orders
+
+
+def mark_order_changed(order_id, branch_id=None):
+    """
+    Record that ``order_id`` changed once the current transaction commits.
+    Pass ``branch_id`` when the order is being deleted so its tombstone can be
+    routed to the right branch.
+    """
+    if order_id is None:
+        return
+    pending = _pending()
+    if branch_id is not None or order_id not in pending:
+        pending[order_id] = branch_id
+    transaction.on_commit(flush_order_changes)
+
+
+def flush_order_changes():
+    """Write the pending marks to the change log (idempotent, runs on commit)"""
+    pending = _pending()
+    if not pending:
+        return []
+    # A rolled back transaction leaves its marks behind; they are written with
+    # the next commit, which at worst makes clients refetch an unchanged order.
+    changed = dict(pending)
+    pending.clear()
+
+    live = dict(Order.objects.filter(pk__in=changed).values_list('id', 'branch_id'))
+    rows = [OrderChange(order_id=order_id, branch_id=branch_id) for order_id, branch_id in live.items()]
+    deleted = {
+        order_id: branch_id for order_id, branch_id in changed.items()
+        if order_id not in live and branch_id is not None
+    }
+    if deleted:
+        branches = set(Branch.objects.filter(pk__in=set(deleted.values())).values_list('id', flat=True))
+        rows.extend(
+            OrderChange(order_id=order_id, branch_id=branch_id, deleted=True)
+            for order_id, branch_id in deleted.items() if branch_id in branches
+        )
+    return OrderChange.objects.bulk_create(rows)
+
+
+def latest_cursor(branch=None):
+    changes = OrderChange.objects.all()
+    if branch is not None:
+        changes = changes.filter(branch=branch)
+    return changes.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def cursor_expired(cursor):
+    """True if changes after ``cursor`` may already have been pruned"""
+    oldest = OrderChange.objects.order_by('id').values_list('id', flat=True).first()
+    return oldest is not None and cursor < oldest - 1
+
+
+def read_changes(cursor, branch=None, limit=BATCH_SIZE):
+    """
+    Changes after ``cursor``, collapsed per order.
+
+    Returns ``(changed_ids, deleted_ids, next_cursor, has_more)``: the ids of
+    orders to refetch, the ids of deleted orders and the cursor to send next.
+    """
+    changes = OrderChange.objects.filter(id__gt=cursor)
+    if branch is not None:
+        changes = changes.filter(branch=branch)
+    rows = list(changes.order_by('id').values_list('id', 'order_id', 'deleted', 'created_at')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for _, order_id, deleted, _ in rows:
+        latest[order_id] = deleted
+
+    next_cursor = cursor
+    settled_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    for change_id, _, _, created_at in rows:
+        if created_at > settled_before:
+            break
+        next_cursor = change_id
+
+    changed_ids = [order_id for order_id, deleted in latest.items() if not deleted]
+    deleted_ids = [order_id for order_id, deleted in latest.items() if deleted]
+    return changed_ids, deleted_ids, next_cursor, has_more
+
+
+def feed_queryset(scope, branch=None, created_by=None):
+    """
+    The orders a dashboard shows for ``scope``: 'orders' (waiter/cashier
+    lists), 'printed' (cashier's printed bills) or a station queue ('food' or
+    'beverage'). Changed orders outside it are reported to clients as closed.
+    """
+    if scope in ('food', 'beverage'):
+        from .queues import open_tickets
+        return open_tickets(scope, branch=branch, created_by=created_by)
+
+    from payments.models import Payment
+
+    queryset = Order.objects.all()
+    if scope == 'printed':
+        queryset = queryset.filter(cashier_status='printed')
+    elif scope != 'orders':
+        raise ValueError(f"Unknown feed scope: {scope}")
+    if branch is not None:
+        queryset = queryset.filter(branch=branch)
+    if created_by is not None:
+        queryset = queryset.filter(created_by=created_by)
+    return (
+        queryset
+        .select_related('table', 'created_by')
+        .annotate(payment_exists=Exists(Payment.objects.filter(order=OuterRef('pk'))))
+        .prefetch_related('items')
+    )
+
+
+def prune_order_changes(older_than):
+    """Drop change log rows created before ``older_than`` (a datetime)"""
+    deleted, _ = OrderChange.objects.filter(created_at__lt=older_than).delete()
+    return deleted
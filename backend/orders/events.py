@@ -0,0 +1,96 @@
+"""
+Order events for the realtime stream (core/realtime.py).
+
+The kitchen and bar get only their own items of an order; the cashier and the
+floor get the whole order. Item changes carry the item and the order fields
+the change re-derived (station statuses and total), which is everything a
+screen needs to patch its copy of the order.
+"""
+from core.realtime import publish
+
+from .aggregates import STATION_FOR_ITEM_TYPE
+from .models import Order, OrderItem
+
+
+def order_data(order):
+    return {
+        'id': order.pk,
+        'order_number': order.order_number,
+        'table_id': order.table_id,
+        'created_by_id': order.created_by_id,
+        'food_status': order.food_status,
+        'beverage_status': order.beverage_status,
+        'cashier_status': order.cashier_status,
+        'payment_option': order.payment_option,
+        'total_money': str(order.total_money) if order.total_money is not None else None,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+    }
+
+
+def item_data(item):
+    return {
+        'id': item.pk,
+        'order_id': item.order_id,
+        'name': item.name,
+        'quantity': item.quantity,
+        'price': str(item.price),
+        'item_type': item.item_type,
+        'status': item.status,
+        'product_id': item.product_id,
+    }
+
+
+def _by_station(items):
+    stations = {}
+    for item in items:
+        station = STATION_FOR_ITEM_TYPE.get(item.item_type)
+        if station is not None:
+            stations.setdefault(station, []).append(item_data(item))
+    return stations
+
+
+def _publish_items(event, order, items):
+    summary = order_data(order)
+    by_station = _by_station(items)
+    for station, station_items in by_station.items():
+        publish(event, order.branch_id, [station], {'order': summary, 'items': station_items}, key=order.pk)
+    publish(event, order.branch_id, ['cashier', 'floor'],
+            {'order': summary, 'items': [item for station_items in by_station.values() for item in station_items]},
+            key=order.pk)
+
+
+def order_created(order, items):
+    _publish_items('order_created', order, items)
+
+
+def items_added(order, items):
+    _publish_items('items_added', order, items)
+
+
+def order_updated(order, items):
+    """``items`` is the order's full item list after the update; stations get theirs as a replacement"""
+    _publish_items('order_updated', order, items)
+
+
+def item_status_changed(item, previous_status):
+    if OrderItem.order.is_cached(item):
+        order = item.order
+    else:
+        order = Order.objects.only(
+            'id', 'branch_id', 'food_status', 'beverage_status', 'total_money'
+        ).get(pk=item.order_id)
+    station = STATION_FOR_ITEM_TYPE.get(item.item_type)
+    publish('item_status_changed', order.branch_id, [station, 'cashier', 'floor'] if station else ['cashier', 'floor'], {
+        'item': item_data(item),
+        'previous_status': previous_status,
+        'order': {
+            'id': order.pk,
+            'food_status': order.food_status,
+            'beverage_status': order.beverage_status,
+            'total_money': str(order.total_money) if order.total_money is not None else None,
+        },
+    }, key=item.pk)
+
+
+def order_printed(order):
+    publish('order_printed', order.branch_id, ['cashier', 'floor'], {'order': order_data(order)}, key=order.pk)
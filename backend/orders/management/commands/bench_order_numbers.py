@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection
+
+from branches.models import Branch
+from orders.models import Order
+from orders.numbering import OrderNumberAllocator
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent order creates through the order number allocator and check for duplicates. '
+        'Runs against a throwaway test database, never the configured one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help='Number of orders to create')
+        parser.add_argument('--workers', type=int, default=16, help='Number of parallel threads')
+        parser.add_argument('--block-size', type=int, default=1, help='Numbers leased per allocation')
+
+    def handle(self, *args, **options):
+        # The workers commit on their own connections, so the run cannot be
+        # wrapped in a rolled-back transaction; it gets its own database instead.
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        with tempfile.TemporaryDirectory() as scratch:
+            if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+                # An in-memory test database would lock concurrent writers out
+                test_settings['NAME'] = os.path.join(scratch, 'bench_order_numbers.sqlite3')
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.bench(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def bench(self, options):
+        total = options['orders']
+        allocator = OrderNumberAllocator(block_size=options['block_size'])
+        branch = Branch.objects.create(name='Order number benchmark')
+
+        def create_order(_):
+            try:
+                # Ask for a number once; any collision is reported, never retried
+                number = allocator.allocate(branch)
+                try:
+                    Order.objects.create(order_number=number, branch=branch)
+                except IntegrityError:
+                    return number, False
+                return number, True
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(create_order, range(total)))
+        elapsed = time.perf_counter() - started
+
+        numbers = [number for number, _ in results]
+        collisions = sum(1 for _, created in results if not created)
+        duplicates = len(numbers) - len(set(numbers))
+        stored = Order.objects.filter(branch=branch).count()
+
+        self.stdout.write(
+            f"{total} orders, {options['workers']} workers, block size {allocator.block_size}: "
+            f"{elapsed:.2f}s ({total / elapsed:.0f} orders/s)"
+        )
+        self.stdout.write(f"Duplicate numbers: {duplicates}, insert collisions (would-be retries): {collisions}")
+
+        if duplicates or collisions or stored != total:
+            raise CommandError(f"Allocator handed out conflicting numbers ({stored}/{total} orders stored)")
+        self.stdout.write(self.style.SUCCESS("No duplicates and no retries."))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.changes import prune_order_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete old rows from the order change log behind the dashboards delta-sync feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48, help='Keep changes from the last N hours')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = prune_order_changes(cutoff)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} order changes older than {cutoff:%Y-%m-%d %H:%M}."))
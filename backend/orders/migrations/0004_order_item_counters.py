@@ -0,0 +1,88 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:59
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+STATION_FOR_ITEM_TYPE = {'food': 'food', 'meat': 'food', 'beverage': 'beverage'}
+COUNTED_STATUSES = ('pending', 'accepted', 'rejected')
+
+
+def backfill_counters(apps, schema_editor):
+    """Fill the new counters from existing items; statuses and totals are left as they are"""
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    counters = {}
+    rows = (
+        OrderItem.objects.values('order_id', 'item_type', 'status')
+        .annotate(
+            count=Count('id'),
+            subtotal=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))),
+        )
+    )
+    for row in rows.iterator():
+        station = STATION_FOR_ITEM_TYPE.get(row['item_type'])
+        if station is None or row['status'] not in COUNTED_STATUSES:
+            continue
+        values = counters.setdefault(row['order_id'], {})
+        field = f"{station}_{row['status']}_count"
+        values[field] = values.get(field, 0) + row['count']
+        if row['status'] == 'accepted':
+            field = f'{station}_accepted_total'
+            values[field] = values.get(field, Decimal('0.00')) + (row['subtotal'] or Decimal('0.00'))
+
+    for order_id, values in counters.items():
+        Order.objects.filter(pk=order_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='beverage_accepted_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='beverage_accepted_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='beverage_pending_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='beverage_rejected_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='food_accepted_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='food_accepted_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='food_pending_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='food_rejected_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0002_initial'),
+        ('orders', '0004_order_item_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('food_status__in', ('pending', 'preparing', 'completed')), ('cashier_status__in', ('pending', 'ready_for_payment', 'printed')), models.Q(('food_pending_count__gt', 0), ('food_accepted_count__gt', 0), _connector='OR')), fields=['branch', 'created_at'], name='order_open_food_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('beverage_status__in', ('pending', 'preparing', 'completed')), ('cashier_status__in', ('pending', 'ready_for_payment', 'printed')), models.Q(('beverage_pending_count__gt', 0), ('beverage_accepted_count__gt', 0), _connector='OR')), fields=['branch', 'created_at'], name='order_open_beverage_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0002_initial'),
+        ('orders', '0005_order_open_ticket_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('order_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_changes', to='branches.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['branch', 'id'], name='order_change_branch_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+STATION_FOR_ITEM_TYPE = {'food': 'food', 'meat': 'food', 'beverage': 'beverage'}
+STATUSES = ('pending', 'accepted', 'rejected', 'cancelled')
+
+
+def derive_station_status(pending, accepted, rejected, cancelled):
+    # Frozen copy of orders.aggregates.derive_station_status
+    if pending:
+        return 'pending'
+    if rejected:
+        return 'rejected'
+    if cancelled:
+        return 'pending'
+    if accepted:
+        return 'completed'
+    return 'not_applicable'
+
+
+def backfill_cancelled_counts(apps, schema_editor):
+    """
+    Count cancelled items and re-derive the statuses of orders with items
+    from the original status rules, replacing any interim ones item changes
+    wrote since 0004. Stations an order was cancelled at stay 'cancelled'.
+    """
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    counts = {}
+    rows = OrderItem.objects.filter(status__in=STATUSES).values('order_id', 'item_type', 'status').annotate(count=Count('id'))
+    for row in rows.iterator():
+        station = STATION_FOR_ITEM_TYPE.get(row['item_type'])
+        if station is not None:
+            key = (row['order_id'], station)
+            counts.setdefault(key, dict.fromkeys(STATUSES, 0))[row['status']] += row['count']
+
+    orders = Order.objects.only('id', 'food_status', 'beverage_status').filter(
+        pk__in={order_id for order_id, _ in counts}
+    )
+    for order in orders.iterator():
+        values = {}
+        for station in ('food', 'beverage'):
+            station_counts = counts.get((order.pk, station), dict.fromkeys(STATUSES, 0))
+            values[f'{station}_cancelled_count'] = station_counts['cancelled']
+            if getattr(order, f'{station}_status') != 'cancelled':
+                values[f'{station}_status'] = derive_station_status(*(station_counts[s] for s in STATUSES))
+        Order.objects.filter(pk=order.pk).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='beverage_cancelled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='food_cancelled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_cancelled_counts, migrations.RunPython.noop),
+    ]
@@ -8,6 +8,23 @@ from asgiref.sync import async_to_sync
 from inventory.models import Product  
 from django.utils import timezone
 from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Kitchen/bar queues (orders/queues.py): which orders are still open tickets
+OPEN_TICKET_STATUSES = ('pending', 'preparing', 'completed')
+OPEN_CASHIER_STATUSES = ('pending', 'ready_for_payment', 'printed')
+
+
+def open_ticket_condition(station):
+    """Orders with live items for ``station`` that the cashier has not closed yet"""
+    return (
+        models.Q(**{f'{station}_status__in': OPEN_TICKET_STATUSES})
+        & models.Q(cashier_status__in=OPEN_CASHIER_STATUSES)
+        & (models.Q(**{f'{station}_pending_count__gt': 0}) | models.Q(**{f'{station}_accepted_count__gt': 0}))
+    )
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -47,9 +64,39 @@ class Order(models.Model):
         help_text='Payment receipt image for online payments'
     )
 
+    # Per-station item counters maintained by orders/aggregates.py with F() deltas.
+    # food_status, beverage_status and total_money are derived from them.
+    food_pending_count = models.IntegerField(default=0)
+    food_accepted_count = models.IntegerField(default=0)
+    food_rejected_count = models.IntegerField(default=0)
+    food_cancelled_count = models.IntegerField(default=0)
+    food_accepted_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    beverage_pending_count = models.IntegerField(default=0)
+    beverage_accepted_count = models.IntegerField(default=0)
+    beverage_rejected_count = models.IntegerField(default=0)
+    beverage_cancelled_count = models.IntegerField(default=0)
+    beverage_accepted_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'created_at'], condition=open_ticket_condition('food'), name='order_open_food_idx'),
+            models.Index(fields=['branch', 'created_at'], condition=open_ticket_condition('beverage'), name='order_open_beverage_idx'),
+        ]
+
     def __str__(self):
         return self.order_number
 
+    def save(self, *args, **kwargs):
+        # A full save of an order loaded earlier in the request must not write
+        # back stale counters over deltas applied by item changes since then.
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            from orders.aggregates import COUNTER_FIELDS
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def food_items(self):
         return self.items.filter(item_type='food')
@@ -69,51 +116,30 @@ class Order(models.Model):
         """Check if there are any pending food items that need approval"""
         return self.food_items.filter(status='pending').exists()
     
+    def status_summary(self):
+        """
+        Item counts and derived food/beverage status in one pass: from prefetched
+        items when available, otherwise from a single aggregate query.
+        """
+        from orders.aggregates import summarize_order_items
+        return summarize_order_items(self)
+
     def calculate_beverage_status(self):
         """Calculate beverage status based on item statuses"""
-        beverage_items = self.beverage_items
-        if not beverage_items.exists():
-            return 'not_applicable'
-        
-        if beverage_items.filter(status='pending').exists():
-            return 'pending'
-        elif beverage_items.filter(status='rejected').exists():
-            return 'rejected'
-        elif beverage_items.filter(status='accepted').exists():
-            if beverage_items.filter(status='accepted').count() == beverage_items.count():
-                return 'completed'
-            else:
-                return 'pending'
-        else:
-            return 'pending'
+        return self.status_summary()['beverage']['status']
     
     def calculate_food_status(self):
         """Calculate food status based on item statuses"""
-        food_items = self.food_items
-        if not food_items.exists():
-            return 'not_applicable'
-        
-        if food_items.filter(status='pending').exists():
-            return 'pending'
-        elif food_items.filter(status='rejected').exists():
-            return 'rejected'
-        elif food_items.filter(status='accepted').exists():
-            if food_items.filter(status='accepted').count() == food_items.count():
-                return 'completed'
-            else:
-                return 'pending'
-        else:
-            return 'pending'
+        return self.status_summary()['food']['status']
 
     def get_total_amount(self):
         return sum(item.price * item.quantity for item in self.items.all())
     
     def recalculate_total(self):
-        """Recalculate the total amount based on current items"""
-        total = sum(item.price * item.quantity for item in self.items.all())
-        self.total_money = total
-        self.save()
-        return total
+        """Recount the item counters from scratch and return the derived total (accepted items)"""
+        from orders.aggregates import rebuild_order_aggregates
+        rebuild_order_aggregates(self)
+        return self.total_money
 
 class OrderItem(models.Model):
     ORDER_ITEM_TYPE = [
@@ -138,6 +164,40 @@ class OrderItem(models.Model):
         return f"{self.name} x {self.quantity}"
 
 
+class OrderNumberSequence(models.Model):
+    """Per-branch, per-day counter backing order number allocation (see orders/numbering.py)"""
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='order_sequences')
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('branch', 'day')
+
+    def __str__(self):
+        return f"{self.branch_id} {self.day}: {self.last_value}"
+
+
+class OrderChange(models.Model):
+    """
+    Append-only change log behind the dashboards' delta-sync feed (see
+    orders/changes.py). The auto-increment id is the client cursor; order_id is
+    a plain integer so tombstones outlive the order they describe.
+    """
+    id = models.BigAutoField(primary_key=True)
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='order_changes')
+    order_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'id'], name='order_change_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} order {self.order_id}{' (deleted)' if self.deleted else ''}"
+
+
 class OrderUpdate(models.Model):
     UPDATE_TYPES = [
         ('addition', 'Item Addition'),
@@ -227,28 +287,17 @@ class OrderUpdate(models.Model):
         original_order = self.original_order
         
         if self.update_type == 'addition':
-            # Add new items to the original order
-            new_items = self.items_changes.get('items', [])
-            for item_data in new_items:
-                try:
-                    # Create new order item with proper type conversion
-                    OrderItem.objects.create(
-                        order=original_order,
-                        name=item_data['name'],
-                        quantity=int(item_data['quantity']),
-                        price=Decimal(str(item_data['price'])),
-                        item_type=item_data.get('item_type', 'food'),
-                        status='pending'
-                    )
-                except (ValueError, TypeError, KeyError) as e:
-                    # Skip invalid items
-                    print(f"Warning: Skipping invalid item in order update: {item_data}, error: {e}")
-                    continue
-            
-            # Update order total
-            original_order.total_money += self.total_addition_cost
-            original_order.save()
-            
+            # Add new items to the original order in one insert; the pipeline
+            # recalculates the order total and statuses once afterwards
+            from orders.utils import add_order_items
+            add_order_items(
+                original_order,
+                self.items_changes.get('items', []),
+                status='pending',
+                skip_invalid=True,
+            )
+            return
+
         elif self.update_type == 'modification':
             # Modify existing items
             modifications = self.items_changes.get('modifications', [])
@@ -263,7 +312,7 @@ class OrderUpdate(models.Model):
                         item.status = mod['status']
                     item.save()
                 except (OrderItem.DoesNotExist, ValueError, TypeError) as e:
-                    print(f"Warning: Failed to modify item {mod.get('item_id')}: {e}")
+                    logger.warning("Failed to modify item %s: %s", mod.get('item_id'), e)
                     pass  # Item might have been deleted or has invalid data
         
         elif self.update_type == 'removal':
@@ -276,9 +325,9 @@ class OrderUpdate(models.Model):
                 except OrderItem.DoesNotExist:
                     pass
         
-        # Recalculate order total
+        # Item saves/deletes above already applied their counter deltas; recount
+        # once anyway in case any item was changed behind the signals' back.
         original_order.recalculate_total()
-        original_order.save()
     
     def recalculate_total(self):
         """Recalculate the total cost of this update"""
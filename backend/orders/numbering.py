@@ -0,0 +1,116 @@
+"""
+Order number allocation.
+
+Order numbers look like ``YYYYMMDD-NN-B<branch_id>``: NN is a per-branch,
+per-day sequence kept in ``OrderNumberSequence``. Each allocation is a single
+upsert statement (``INSERT ... ON CONFLICT DO UPDATE ... RETURNING``), so
+concurrent waiters never read-then-write the same counter and never collide on
+the unique ``order_number`` constraint.
+
+Orders take their number inside the transaction that inserts them, so a
+failed insert rolls the counter back and leaves no gap; the sequence row stays
+locked until that transaction ends.
+
+With ``ORDER_NUMBER_BLOCK_SIZE`` > 1 each worker process leases a range of
+numbers at once and hands them out from memory. Unused numbers in a lease are
+skipped when the process exits, so sequences may have gaps in that mode.
+Leases are only taken outside a transaction (the benchmark command), so order
+creation always reserves one number at a time.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderNumberSequence
+
+
+def format_order_number(branch_id, day, sequence):
+    # The sequence stays in the second slot so "order_number.split('-')[1]"
+    # in the waiter screens keeps showing the short number.
+    return f"{day:%Y%m%d}-{sequence:02d}-B{branch_id}"
+
+
+def _reserve_upsert(branch_id, day, size):
+    table = connection.ops.quote_name(OrderNumberSequence._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (branch_id, day, last_value) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (branch_id, day) DO UPDATE "
+            f"SET last_value = {table}.last_value + EXCLUDED.last_value "
+            f"RETURNING last_value",
+            [branch_id, day, size],
+        )
+        return cursor.fetchone()[0]
+
+
+def _reserve_locked(branch_id, day, size):
+    # Fallback for backends without INSERT ... ON CONFLICT ... RETURNING
+    with transaction.atomic():
+        sequence, _ = OrderNumberSequence.objects.select_for_update().get_or_create(
+            branch_id=branch_id, day=day
+        )
+        OrderNumberSequence.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + size)
+        return sequence.last_value + size
+
+
+def reserve_block(branch_id, day, size=1):
+    """Atomically reserve ``size`` numbers and return the (first, last) pair"""
+    if connection.vendor in ('postgresql', 'sqlite'):
+        last = _reserve_upsert(branch_id, day, size)
+    else:
+        last = _reserve_locked(branch_id, day, size)
+    return last - size + 1, last
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers, optionally from per-process leased blocks"""
+
+    def __init__(self, block_size=None):
+        self._block_size = block_size
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    @property
+    def block_size(self):
+        if self._block_size is not None:
+            return self._block_size
+        return max(1, getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1))
+
+    def next_sequence(self, branch_id, day):
+        size = self.block_size
+        # A lease taken inside an outer transaction could be rolled back while
+        # this process keeps handing out its numbers, so only lease outside one.
+        if size == 1 or connection.in_atomic_block:
+            return reserve_block(branch_id, day, 1)[0]
+
+        key = (branch_id, day)
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] > lease[1]:
+                lease = list(reserve_block(branch_id, day, size))
+                # Leases for previous days can never be used again
+                self._leases = {k: v for k, v in self._leases.items() if k[1] == day}
+                self._leases[key] = lease
+            sequence = lease[0]
+            lease[0] += 1
+            return sequence
+
+    def allocate(self, branch, day=None):
+        branch_id = getattr(branch, 'pk', branch)
+        day = day or timezone.localdate()
+        return format_order_number(branch_id, day, self.next_sequence(branch_id, day))
+
+    def reset(self):
+        with self._lock:
+            self._leases.clear()
+
+
+order_numbers = OrderNumberAllocator()
+
+
+def allocate_order_number(branch, day=None):
+    """Return the next free order number for ``branch`` on ``day`` (today by default)"""
+    return order_numbers.allocate(branch, day)
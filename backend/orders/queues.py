@@ -0,0 +1,55 @@
+"""
+Kitchen and bar ticket queues.
+
+An order is an open ticket for a station while the station still has counted
+items (see orders/aggregates.py), its station status is one of
+``OPEN_TICKET_STATUSES`` and the cashier has not closed it. The counters and
+statuses are kept up to date on every item write, so the queue is a plain
+filter on ``Order`` served by one partial index per station (see
+``open_ticket_condition`` and ``Order.Meta``) - no join on items and no DISTINCT.
+
+Listing a queue costs a fixed two queries however many tickets are open: one
+for the orders (with table, waiter and payment flag) and one for the station's
+items, which are attached to each order as ``station_items``.
+"""
+from django.db.models import Exists, OuterRef, Prefetch
+
+from .aggregates import STATION_FOR_ITEM_TYPE, STATIONS
+from .models import Order, OrderItem, open_ticket_condition
+
+
+def station_item_types(station):
+    return [item_type for item_type, item_station in STATION_FOR_ITEM_TYPE.items() if item_station == station]
+
+
+def open_tickets(station, branch=None, created_by=None, date=None):
+    """
+    Open tickets for ``station`` ('food' or 'beverage'), oldest first.
+
+    Each order carries ``station_items`` (only that station's items) and
+    ``payment_exists`` so serializers never go back to the database.
+    """
+    if station not in STATIONS:
+        raise ValueError(f"Unknown station: {station}")
+
+    from payments.models import Payment
+
+    queryset = Order.objects.filter(open_ticket_condition(station))
+    if branch is not None:
+        queryset = queryset.filter(branch=branch)
+    if created_by is not None:
+        queryset = queryset.filter(created_by=created_by)
+    if date:
+        queryset = queryset.filter(created_at__date=date)
+
+    return (
+        queryset
+        .select_related('table', 'created_by')
+        .annotate(payment_exists=Exists(Payment.objects.filter(order=OuterRef('pk'))))
+        .prefetch_related(Prefetch(
+            'items',
+            queryset=OrderItem.objects.filter(item_type__in=station_item_types(station)).order_by('id'),
+            to_attr='station_items',
+        ))
+        .order_by('created_at', 'id')
+    )
@@ -3,25 +3,14 @@ from .models import Order, OrderItem, OrderUpdate
 from users.serializers import UserListSerializer as UserSerializer
 from branches.models import Table
 from django.db import transaction
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import json
-from .utils import get_waiter_actions, validate_order_update, update_order_with_validation
-
-def send_notification_to_role(role, message):
-    """Send notification to users with specific role via WebSocket"""
-    try:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"{role}_notifications",
-            {
-                "type": "send_notification",
-                "message": message
-            }
-        )
-        print(f"📢 Notification sent to {role}: {message}")
-    except Exception as e:
-        print(f"❌ Failed to send notification to {role}: {e}")
+from .utils import get_waiter_actions, validate_order_update, update_order_with_validation, add_order_items
+from .numbering import allocate_order_number
+from . import events
+from django.core.exceptions import ValidationError as DjangoValidationError
+import logging
+from core.tracing import tracing_enabled
+
+logger = logging.getLogger(__name__)
 
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -67,103 +56,47 @@ class OrderSerializer(serializers.ModelSerializer):
         if items_data is None:
             raise serializers.ValidationError("Order must include 'items'.")
 
-        # Generate order number automatically
-        from datetime import datetime
-        today = datetime.now().strftime('%Y%m%d')
-        
-        # Get the last order number for today
-        last_order = Order.objects.filter(
-            order_number__startswith=today
-        ).order_by('-order_number').first()
-        
-        if last_order:
-            # Extract the sequence number and increment
-            try:
-                last_sequence = int(last_order.order_number.split('-')[1])
-                new_sequence = last_sequence + 1
-            except (IndexError, ValueError):
-                new_sequence = 1
-        else:
-            new_sequence = 1
-        
-        # Format: YYYYMMDD-XX (e.g., 20250817-01)
-        validated_data['order_number'] = f"{today}-{new_sequence:02d}"
-        
-        print(f"[DEBUG] OrderSerializer.create - Generated order number: {validated_data['order_number']}")
-        print(f"[DEBUG] OrderSerializer.create - Table: {table}, Branch: {table.branch if table else 'None'}")
-        print(f"[DEBUG] OrderSerializer.create - Validated data keys: {list(validated_data.keys())}")
+        logger.debug("OrderSerializer.create - Table: %s, Branch: %s", table, table.branch if table else 'None')
+        logger.debug("OrderSerializer.create - Validated data keys: %s", list(validated_data.keys()))
 
+        # The order number, the order and its items are saved together, or not at all
         try:
-            order = Order.objects.create(**validated_data)
-            print(f"[DEBUG] OrderSerializer.create - Order created: {order.id}")
-        except Exception as e:
-            print(f"[DEBUG] OrderSerializer.create - Error creating order: {str(e)}")
-            print(f"[DEBUG] OrderSerializer.create - Error type: {type(e)}")
-            print(f"[DEBUG] OrderSerializer.create - Validated data: {validated_data}")
-            raise
-        
-        total = 0
-        for item_data in items_data:
-            try:
-                print(f"[DEBUG] OrderSerializer.create - Creating item with data: {item_data}")
-                print(f"[DEBUG] OrderSerializer.create - Product field: {item_data.get('product')}")
-                
-                # Create order item with original item_type (no mapping needed)
-                # Remove any fields that don't exist in OrderItem model
-                item_fields = {k: v for k, v in item_data.items() 
-                             if k in ['name', 'quantity', 'price', 'item_type', 'status']}
-                item = OrderItem.objects.create(order=order, **item_fields)
-                print(f"[DEBUG] OrderSerializer.create - Item created: {item.id}, Product: {item.product}, item_type: {item_data.get('item_type')}")
-                
-                if item.status == 'accepted':
-                    total += item.price * item.quantity
-            except Exception as e:
-                order.delete()
-                raise serializers.ValidationError(f"Error creating order item: {str(e)}")
+            with transaction.atomic():
+                # Generate order number automatically (per-branch daily sequence)
+                validated_data['order_number'] = allocate_order_number(table.branch_id)
+                logger.debug("OrderSerializer.create - Generated order number: %s", validated_data['order_number'])
 
-        order.total_money = total
-        
-        # Set initial statuses based on actual items in the order
-        beverage_items = [item for item in items_data if item.get('item_type') == 'beverage']
-        food_items = [item for item in items_data if item.get('item_type') == 'food']
-        
-        # Set food status based on food items
-        if food_items:
-            order.food_status = 'pending'
-        else:
-            order.food_status = 'not_applicable'
-        
-        # Set beverage status based on beverage items
-        if beverage_items:
-            order.beverage_status = 'pending'
-        else:
-            order.beverage_status = 'not_applicable'
-        
-        order.save()
-        
-        # Send notifications to respective roles for new orders
-        if beverage_items:
-            beverage_message = f"New order #{order.order_number} (Table {order.table.number}) with {len(beverage_items)} beverage item(s)"
-            send_notification_to_role('bartender', beverage_message)
-        
-        if food_items:
-            food_message = f"New order #{order.order_number} (Table {order.table.number}) with {len(food_items)} food item(s)"
-            send_notification_to_role('meat_area', food_message)
+                try:
+                    order = Order.objects.create(**validated_data)
+                    logger.debug("OrderSerializer.create - Order created: %s", order.id)
+                except Exception as e:
+                    logger.debug("OrderSerializer.create - Error creating order: %s", e)
+                    logger.debug("OrderSerializer.create - Error type: %s", type(e))
+                    logger.debug("OrderSerializer.create - Validated data: %s", validated_data)
+                    raise
+
+                # Insert all items at once and derive total (accepted items) and statuses from them
+                items = add_order_items(order, items_data, status=None)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(f"Error creating order item: {'; '.join(e.messages)}")
+
+        # The kitchen and bar screens get the new order with their items
+        events.order_created(order, items)
         
         return order
 
     @transaction.atomic
     def update(self, instance, validated_data):
         try:
-            print(f"[DEBUG] OrderSerializer.update - Starting update for order {instance.id}")
-            print(f"[DEBUG] OrderSerializer.update - Validated data: {validated_data}")
+            logger.debug("OrderSerializer.update - Starting update for order %s", instance.id)
+            logger.debug("OrderSerializer.update - Validated data: %s", validated_data)
             
             # Get the user making the update
             user = self.context.get('request').user if hasattr(self.context, 'get') and self.context.get('request') else None
             
             items_data = validated_data.get('items')
             if items_data is not None:
-                print(f'[DEBUG] OrderSerializer.update - Processing items_data: {items_data}')
+                logger.debug("OrderSerializer.update - Processing items_data: %s", items_data)
                 
                 # Use the new validation and update logic
                 update_result = update_order_with_validation(instance.id, items_data, user)
@@ -171,58 +104,22 @@ class OrderSerializer(serializers.ModelSerializer):
                 if not update_result['success']:
                     raise serializers.ValidationError(update_result['error'])
                 
-                print(f'[DEBUG] OrderSerializer.update - Update successful: {update_result["message"]}')
+                logger.debug("OrderSerializer.update - Update successful: %s", update_result["message"])
                 
                 # Refresh the instance to get updated data
                 instance.refresh_from_db()
                 
-                # Recalculate order statuses based on current items
-                beverage_items = instance.items.filter(item_type='beverage')
-                food_items = instance.items.filter(item_type='food')
-                
-                # Update food status
-                if food_items.exists():
-                    if food_items.filter(status='pending').exists():
-                        instance.food_status = 'pending'
-                    elif food_items.filter(status='rejected').exists():
-                        instance.food_status = 'rejected'
-                    elif food_items.filter(status='accepted').count() == food_items.count():
-                        instance.food_status = 'completed'
-                    else:
-                        instance.food_status = 'pending'
-                else:
-                    instance.food_status = 'not_applicable'
-                
-                # Update beverage status
-                if beverage_items.exists():
-                    if beverage_items.filter(status='pending').exists():
-                        instance.beverage_status = 'pending'
-                    elif beverage_items.filter(status='rejected').exists():
-                        instance.beverage_status = 'rejected'
-                    elif beverage_items.filter(status='accepted').count() == beverage_items.count():
-                        instance.beverage_status = 'completed'
-                    else:
-                        instance.beverage_status = 'pending'
-                else:
-                    instance.beverage_status = 'not_applicable'
+                # Recalculate order statuses based on current items (one query)
+                summary = instance.status_summary()
+                instance.food_status = summary['food']['status']
+                instance.beverage_status = summary['beverage']['status']
                 
                 instance.save()
                 
-                # Send notifications to respective roles
-                beverage_items_data = [item for item in items_data if item.get('item_type') == 'beverage']
-                food_items_data = [item for item in items_data if item.get('item_type') == 'food']
-                
-                if beverage_items_data:
-                    beverage_message = f"Order #{instance.order_number} (Table {instance.table.number}) updated with {len(beverage_items_data)} beverage item(s)"
-                    send_notification_to_role('bartender', beverage_message)
-                
-                if food_items_data:
-                    food_message = f"Order #{instance.order_number} (Table {instance.table.number}) updated with {len(food_items_data)} food item(s)"
-                    send_notification_to_role('meat_area', food_message)
+                # The items were replaced; screens swap in the new list
+                events.order_updated(instance, list(instance.items.all()))
                 
-                print(f'[DEBUG] OrderSerializer.update - Final order state:')
-                print(f'[DEBUG] OrderSerializer.update - Total money: {instance.total_money}')
-                print(f'[DEBUG] OrderSerializer.update - Items after update: {list(instance.items.values())}')
+                logger.debug("OrderSerializer.update - Total money: %s", instance.total_money)
                 
             else:
                 # Update other fields if no items data
@@ -233,22 +130,24 @@ class OrderSerializer(serializers.ModelSerializer):
                 instance.assigned_to = validated_data.get('assigned_to', instance.assigned_to)
                 instance.save()
 
-            print(f'[DEBUG] OrderSerializer.update - Update completed for order {instance.id}')
+            logger.debug("OrderSerializer.update - Update completed for order %s", instance.id)
             
             # Verify the update was actually saved to database
             instance.refresh_from_db()
-            print(f'[DEBUG] OrderSerializer.update - After refresh from DB:')
-            print(f'[DEBUG] OrderSerializer.update - Order {instance.id} total_money: {instance.total_money}')
-            print(f'[DEBUG] OrderSerializer.update - Order {instance.id} items count: {instance.items.count()}')
-            print(f'[DEBUG] OrderSerializer.update - Order {instance.id} items: {list(instance.items.values())}')
+            if tracing_enabled(logger):
+                logger.debug("OrderSerializer.update - Order %s total_money: %s", instance.id, instance.total_money)
+                logger.debug("OrderSerializer.update - Order %s items: %s", instance.id, list(instance.items.values()))
             
             return instance
             
         except Exception as e:
-            print(f'[ERROR] OrderSerializer.update - Error updating order {instance.id}: {str(e)}')
+            logger.error("OrderSerializer.update - Error updating order %s: %s", instance.id, e)
             raise
 
     def get_has_payment(self, obj):
+        # Queue querysets annotate this up front (orders/queues.py)
+        if hasattr(obj, 'payment_exists'):
+            return obj.payment_exists
         from payments.models import Payment
         return Payment.objects.filter(order=obj).exists()
 
@@ -275,8 +174,10 @@ class FoodOrderSerializer(OrderSerializer):
         ]
     
     def get_items(self, obj):
-        # Only return food items
-        food_items = obj.items.filter(item_type='food')
+        # Only return kitchen items; queue querysets prefetch them as station_items
+        food_items = getattr(obj, 'station_items', None)
+        if food_items is None:
+            food_items = obj.items.filter(item_type__in=['food', 'meat'])
         return FoodOrderItemSerializer(food_items, many=True).data
 
 
@@ -301,8 +202,10 @@ class BeverageOrderSerializer(OrderSerializer):
         ]
     
     def get_items(self, obj):
-        # Only return beverage items
-        beverage_items = obj.items.filter(item_type='beverage')
+        # Only return beverage items; queue querysets prefetch them as station_items
+        beverage_items = getattr(obj, 'station_items', None)
+        if beverage_items is None:
+            beverage_items = obj.items.filter(item_type='beverage')
         return BeverageOrderItemSerializer(beverage_items, many=True).data
 
 
@@ -1,95 +1,13 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, post_init
 from django.dispatch import receiver
 from orders.models import Order, OrderItem
-from inventory.models import Stock, InventoryTransaction, AuditLog, ProductUnit
-from django.utils import timezone
-from django.db import transaction as db_transaction
-from django.contrib.contenttypes.models import ContentType
+from orders.aggregates import item_snapshot, apply_item_write, rebuild_order_aggregates
+from orders.changes import mark_order_changed
+from orders import events
+from payments.models import Payment
+import logging
 
-@receiver(post_save, sender=Order)
-def handle_order_stock_and_logs(sender, instance, created, **kwargs):
-    if not created:
-        return  # Only act on new orders
-
-    branch = instance.branch
-    user = instance.created_by
-
-    with db_transaction.atomic():
-        for item in instance.items.all():
-            product = item.product
-            quantity = item.quantity
-            unit_type = 'unit'  # default unless overridden below
-
-            try:
-                stock = Stock.objects.select_for_update().get(product=product, branch=branch)
-            except Stock.DoesNotExist:
-                print(f"⚠️ No stock for {product.name} in branch {branch.name}")
-                continue
-
-            deducted = False
-
-            # Get the appropriate unit for this product
-            try:
-                transaction_unit = product.base_unit
-            except:
-                # Fallback to a default unit
-                transaction_unit = ProductUnit.objects.filter(unit_name='unit').first()
-                if not transaction_unit:
-                    transaction_unit = ProductUnit.objects.first()
-
-            # Deduct from stock based on product type
-            if product.uses_carton:
-                # For products that use cartons
-                if stock.carton_qty >= quantity:
-                    stock.carton_qty -= quantity
-                    deducted = True
-                    unit_type = 'carton'
-                elif stock.bottle_qty >= quantity:
-                    stock.bottle_qty -= quantity
-                    deducted = True
-                    unit_type = 'bottle'
-                elif stock.unit_qty >= quantity:
-                    stock.unit_qty -= quantity
-                    deducted = True
-                    unit_type = 'unit'
-            else:
-                # For products that don't use cartons
-                if stock.unit_qty >= quantity:
-                    stock.unit_qty -= quantity
-                    deducted = True
-                    unit_type = 'unit'
-                elif stock.bottle_qty >= quantity:
-                    stock.bottle_qty -= quantity
-                    deducted = True
-                    unit_type = 'bottle'
-
-            if deducted:
-                stock.save()
-                print(f"✅ Stock deducted: {quantity} {unit_type} of {product.name} from {branch.name}")
-                
-                # Create inventory transaction record
-                InventoryTransaction.objects.create(
-                    product=product,
-                    branch=branch,
-                    transaction_type='deduction',
-                    quantity=quantity,
-                    unit_type=unit_type,
-                    reason=f'Order #{instance.order_number}',
-                    user=user,
-                    timestamp=timezone.now()
-                )
-                
-                # Create audit log
-                AuditLog.objects.create(
-                    user=user,
-                    action='stock_deduction',
-                    model_name='Stock',
-                    object_id=stock.id,
-                    details=f'Deducted {quantity} {unit_type} of {product.name} for order #{instance.order_number}',
-                    timestamp=timezone.now()
-                )
-            else:
-                print(f"❌ Insufficient stock for {product.name} in {branch.name}")
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Order)
 def update_table_status_on_order_change(sender, instance, **kwargs):
@@ -100,9 +18,9 @@ def update_table_status_on_order_change(sender, instance, **kwargs):
     try:
         # Update the table status based on the order
         instance.table.update_status_from_order(instance)
-        print(f"✅ Table {instance.table.number} status updated to '{instance.table.status}' for order #{instance.order_number}")
+        logger.debug("Table %s status updated to '%s' for order #%s", instance.table.number, instance.table.status, instance.order_number)
     except Exception as e:
-        print(f"❌ Error updating table status: {e}")
+        logger.error("Error updating table status: %s", e)
 
 @receiver(post_delete, sender=Order)
 def update_table_status_on_order_deletion(sender, instance, **kwargs):
@@ -130,44 +48,56 @@ def update_table_status_on_order_deletion(sender, instance, **kwargs):
             # No other active orders, mark table as available
             instance.table.update_status_from_order(None)
         
-        print(f"✅ Table {instance.table.number} status updated after order deletion")
+        logger.debug("Table %s status updated after order deletion", instance.table.number)
     except Exception as e:
-        print(f"❌ Error updating table status after order deletion: {e}")
+        logger.error("Error updating table status after order deletion: %s", e)
+
+@receiver(post_init, sender=OrderItem)
+def remember_item_aggregate_state(sender, instance, **kwargs):
+    """Keep the values the order counters currently reflect for this item"""
+    instance._aggregate_snapshot = item_snapshot(instance)
+
 
 @receiver(post_save, sender=OrderItem)
-def update_order_status_on_item_change(sender, instance, **kwargs):
-    """Update order status when item status changes"""
-    order = instance.order
-    
-    # Check if all items are completed
-    all_items = order.items.all()
-    food_items = all_items.filter(item_type='food')
-    beverage_items = all_items.filter(item_type='beverage')
-    
-    # Update food status
-    if food_items.exists():
-        if all(item.status == 'completed' for item in food_items):
-            order.food_status = 'completed'
-        elif any(item.status == 'preparing' for item in food_items):
-            order.food_status = 'preparing'
-        elif any(item.status == 'pending' for item in food_items):
-            order.food_status = 'pending'
-    else:
-        order.food_status = 'not_applicable'
-    
-    # Update beverage status
-    if beverage_items.exists():
-        if all(item.status == 'completed' for item in beverage_items):
-            order.beverage_status = 'completed'
-        elif any(item.status == 'preparing' for item in beverage_items):
-            order.beverage_status = 'preparing'
-        elif any(item.status == 'pending' for item in beverage_items):
-            order.beverage_status = 'pending'
-    else:
-        order.beverage_status = 'not_applicable'
-    
-    order.save()
-    
-    # Update table status based on the new order status
-    if order.table:
-        order.table.update_status_from_order(order)
+def update_order_aggregates_on_item_save(sender, instance, created, raw=False, **kwargs):
+    """Turn an item write into F() deltas on the order counters"""
+    if raw:
+        return
+    old = None if created else instance._aggregate_snapshot
+    if old is None and not created:
+        # Item was loaded with deferred fields; we can't tell what changed
+        rebuild_order_aggregates(instance.order)
+        instance._aggregate_snapshot = item_snapshot(instance)
+        return
+    apply_item_write(instance, old, item_snapshot(instance))
+    if old is not None and old[2] != instance.status:
+        events.item_status_changed(instance, previous_status=old[2])
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_order_aggregates_on_item_delete(sender, instance, origin=None, **kwargs):
+    """Subtract a deleted item from its order, unless the order itself is being deleted"""
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return
+    apply_item_write(instance, instance._aggregate_snapshot, None)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_save, sender=Payment)
+def log_order_change_on_save(sender, instance, raw=False, **kwargs):
+    """Feed order, item and payment writes into the dashboards' change log"""
+    if raw:
+        return
+    mark_order_changed(instance.pk if sender is Order else instance.order_id)
+
+
+@receiver(post_delete, sender=Order)
+def log_order_tombstone(sender, instance, **kwargs):
+    mark_order_changed(instance.pk, branch_id=instance.branch_id)
+
+
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=Payment)
+def log_order_change_on_delete(sender, instance, **kwargs):
+    mark_order_changed(instance.order_id)
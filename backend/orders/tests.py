@@ -1,3 +1,710 @@
-from django.test import TestCase
+import asyncio
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.realtime import group_name, publish
+from core.testing import QueryBudgetMixin
+from kebede_pos.consumers import NotificationConsumer
+
+from branches.models import Branch, Table
+from users.models import User
+from .models import Order, OrderChange, OrderItem, OrderNumberSequence
+from .numbering import OrderNumberAllocator, allocate_order_number
+from .utils import add_order_items, edit_order
+from .serializers import OrderSerializer
+
+
+class OrderStatusSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name='Main')
+        cls.order = Order.objects.create(order_number='20260101-01-B1', branch=branch)
+        OrderItem.objects.create(order=cls.order, name='Tibs', price=Decimal('250.00'), item_type='food', status='accepted')
+        OrderItem.objects.create(order=cls.order, name='Kitfo', price=Decimal('300.00'), item_type='meat', status='pending')
+        OrderItem.objects.create(order=cls.order, name='Tea', price=Decimal('20.00'), item_type='beverage', status='rejected')
+
+    def test_summary_uses_one_query(self):
+        order = Order.objects.get(pk=self.order.pk)
+        with self.assertNumQueries(1):
+            summary = order.status_summary()
+        self.assertEqual(summary['food'], {'items': 2, 'pending': 1, 'accepted': 1, 'rejected': 0, 'cancelled': 0,
+                                           'status': 'pending'})
+        self.assertEqual(summary['beverage']['status'], 'rejected')
+
+    def test_summary_uses_prefetched_items(self):
+        order = Order.objects.prefetch_related('items').get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(order.calculate_food_status(), 'pending')
+            self.assertEqual(order.calculate_beverage_status(), 'rejected')
+
+    def test_summary_matches_stored_statuses(self):
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.food_status, order.calculate_food_status())
+        self.assertEqual(order.beverage_status, order.calculate_beverage_status())
+
+    def test_status_rules(self):
+        # Pending wins, then rejected; only a station whose items are all accepted is completed
+        cases = [
+            ((), 'not_applicable'),
+            (('pending',), 'pending'),
+            (('pending', 'accepted'), 'pending'),
+            (('pending', 'rejected'), 'pending'),
+            (('accepted', 'rejected'), 'rejected'),
+            (('rejected',), 'rejected'),
+            (('accepted', 'accepted'), 'completed'),
+            (('accepted', 'cancelled'), 'pending'),
+            (('cancelled',), 'pending'),
+        ]
+        for number, (statuses, expected) in enumerate(cases, start=2):
+            order = Order.objects.create(order_number=f'20260101-{number:02d}-B1', branch=self.order.branch)
+            for status in statuses:
+                OrderItem.objects.create(order=order, name='Tea', price=Decimal('20.00'), item_type='beverage',
+                                         status=status)
+            with self.subTest(statuses=statuses):
+                self.assertEqual(Order.objects.get(pk=order.pk).calculate_beverage_status(), expected)
+                prefetched = Order.objects.prefetch_related('items').get(pk=order.pk)
+                self.assertEqual(prefetched.calculate_beverage_status(), expected)
+
+
+class StationStatusDeltaTests(TestCase):
+    """The statuses item changes write through the counter deltas (orders/aggregates.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+
+    def setUp(self):
+        self.order = Order.objects.create(order_number=f'20260101-01-B{self.branch.pk}', branch=self.branch)
+
+    def add(self, status, item_type='beverage'):
+        return OrderItem.objects.create(order=self.order, name=item_type, price=Decimal('10.00'),
+                                        item_type=item_type, status=status)
+
+    def set_status(self, item, status):
+        item.status = status
+        item.save()
+
+    def status(self):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.beverage_status, self.order.calculate_beverage_status())
+        return self.order.beverage_status
+
+    def test_transitions(self):
+        first = self.add('pending')
+        self.assertEqual(self.status(), 'pending')
+        second = self.add('pending')
+        self.set_status(first, 'accepted')
+        # Pending wins over accepted
+        self.assertEqual(self.status(), 'pending')
+        self.set_status(second, 'accepted')
+        self.assertEqual(self.status(), 'completed')
+        self.set_status(second, 'rejected')
+        # Rejected wins over accepted
+        self.assertEqual(self.status(), 'rejected')
+        third = self.add('pending')
+        # ...but not over pending
+        self.assertEqual(self.status(), 'pending')
+        self.set_status(third, 'cancelled')
+        self.assertEqual(self.status(), 'rejected')
+        second.delete()
+        # Accepted and cancelled items: not every item is accepted
+        self.assertEqual(self.status(), 'pending')
+        third.delete()
+        self.assertEqual(self.status(), 'completed')
+        first.delete()
+        self.assertEqual(self.status(), 'not_applicable')
+
+    def test_rebuild_matches_deltas(self):
+        from .aggregates import rebuild_order_aggregates
+        self.add('accepted')
+        self.add('cancelled')
+        self.add('accepted', item_type='food')
+        self.order.refresh_from_db()
+        derived = (self.order.food_status, self.order.beverage_status, self.order.beverage_cancelled_count)
+        rebuild_order_aggregates(self.order)
+        self.order.refresh_from_db()
+        self.assertEqual(derived, ('completed', 'pending', 1))
+        self.assertEqual((self.order.food_status, self.order.beverage_status, self.order.beverage_cancelled_count),
+                         derived)
+
+
+class StationQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.table = Table.objects.create(number=1, branch=cls.branch)
+        cls.user = User.objects.create_user(username='chef', password='x', role='meat', branch=cls.branch)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_order(self, number, *items):
+        order = Order.objects.create(order_number=f'20260101-{number:02d}-B1', branch=self.branch, table=self.table)
+        for item_type, status in items:
+            OrderItem.objects.create(order=order, name=item_type, price=Decimal('10.00'), item_type=item_type, status=status)
+        return order
+
+    def queue_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_queues_partition_items_by_station(self):
+        mixed = self.make_order(1, ('food', 'pending'), ('meat', 'accepted'), ('beverage', 'pending'))
+        self.make_order(2, ('food', 'rejected'))
+        self.make_order(3, ('beverage', 'cancelled'))
+
+        food, _ = self.queue_queries(reverse('food-order-list'))
+        self.assertEqual([order['id'] for order in food], [mixed.id])
+        self.assertEqual(sorted(item['item_type'] for item in food[0]['items']), ['food', 'meat'])
+
+        bar, _ = self.queue_queries(reverse('beverage-order-list'))
+        self.assertEqual([order['id'] for order in bar], [mixed.id])
+        self.assertEqual([item['item_type'] for item in bar[0]['items']], ['beverage'])
+
+    def test_closed_orders_leave_the_queue(self):
+        order = self.make_order(1, ('food', 'pending'))
+        order.cashier_status = 'paid'
+        order.save(update_fields=['cashier_status'])
+        food, _ = self.queue_queries(reverse('food-order-list'))
+        self.assertEqual(food, [])
+
+    def test_query_count_does_not_grow_with_tickets(self):
+        self.make_order(1, ('food', 'pending'), ('beverage', 'pending'))
+        _, one_ticket = self.queue_queries(reverse('food-order-list'))
+        for number in range(2, 12):
+            self.make_order(number, ('food', 'pending'), ('meat', 'pending'), ('beverage', 'accepted'))
+        food, many_tickets = self.queue_queries(reverse('food-order-list'))
+        self.assertEqual(len(food), 11)
+        self.assertEqual(one_ticket, many_tickets)
+
+
+class OrderChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.table = Table.objects.create(number=1, branch=cls.branch)
+        cls.cashier = User.objects.create_user(username='cashier', password='x', role='cashier', branch=cls.branch)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+        patcher = mock.patch('orders.changes.SETTLE_SECONDS', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def feed(self, cursor=None, scope='orders'):
+        params = {'scope': scope}
+        if cursor is not None:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('order-change-feed'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def make_order(self, number, branch=None, item_type='food'):
+        branch = branch or self.branch
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(order_number=f'20260101-{number:02d}-B{branch.id}', branch=branch, table=self.table)
+            OrderItem.objects.create(order=order, name='Tibs', price=Decimal('10.00'), item_type=item_type)
+        return order
+
+    def test_without_cursor_client_must_reset(self):
+        self.make_order(1)
+        page = self.feed()
+        self.assertTrue(page['reset'])
+        self.assertEqual(page['cursor'], OrderChange.objects.latest('id').id)
+
+    def test_returns_only_changes_since_cursor(self):
+        self.make_order(1)
+        cursor = self.feed()['cursor']
+        second = self.make_order(2)
+        self.make_order(3, branch=self.other_branch)
+
+        page = self.feed(cursor)
+        self.assertEqual([order['id'] for order in page['orders']], [second.id])
+        self.assertEqual(self.feed(page['cursor'])['orders'], [])
+
+    def test_one_change_row_per_order_and_transaction(self):
+        before = OrderChange.objects.count()
+        self.make_order(1)
+        self.assertEqual(OrderChange.objects.count(), before + 1)
+
+    def test_deleted_orders_become_tombstones(self):
+        order = self.make_order(1)
+        order_id = order.id
+        cursor = self.feed()['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        page = self.feed(cursor)
+        self.assertEqual(page['deleted'], [order_id])
+        self.assertEqual(page['orders'], [])
+
+    def test_deleting_a_branch_with_orders_leaves_no_tombstones(self):
+        branch = Branch.objects.create(name='Closed')
+        self.make_order(1, branch=branch)
+        branch_id = branch.id
+        with self.captureOnCommitCallbacks(execute=True):
+            branch.delete()
+        self.assertFalse(OrderChange.objects.filter(branch_id=branch_id).exists())
+        self.assertFalse(Order.objects.filter(branch_id=branch_id).exists())
+
+    def test_station_scope_reports_closed_tickets(self):
+        order = self.make_order(1)
+        cursor = self.feed(scope='food')['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            item = order.items.get()
+            item.status = 'rejected'
+            item.save()
+        page = self.feed(cursor, scope='food')
+        self.assertEqual(page['orders'], [])
+        self.assertEqual(page['closed'], [order.id])
+
+    def test_cursor_waits_for_recent_changes_to_settle(self):
+        cursor = self.feed()['cursor']
+        order = self.make_order(1)
+        with mock.patch('orders.changes.SETTLE_SECONDS', 60):
+            page = self.feed(cursor)
+        self.assertEqual([o['id'] for o in page['orders']], [order.id])
+        self.assertEqual(page['cursor'], cursor)
+
+
+class OrderEndpointBudgetTests(QueryBudgetMixin, TestCase):
+    """Query budgets for the polling endpoints (settings.QUERY_BUDGETS)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name='Main')
+        table = Table.objects.create(number=1, branch=branch)
+        cls.user = User.objects.create_user(username='cashier', password='x', role='cashier', branch=branch)
+        cls.items = []
+        for number in range(1, 11):
+            order = Order.objects.create(order_number=f'20260101-{number:02d}-B1', branch=branch, table=table)
+            for item_type in ('food', 'meat', 'beverage'):
+                cls.items.append(OrderItem.objects.create(order=order, name=item_type, price=Decimal('10.00'), item_type=item_type))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_station_queues(self):
+        self.assertEndpointWithinBudget('food-order-list')
+        self.assertEndpointWithinBudget('beverage-order-list')
+
+    def test_change_feed(self):
+        from .changes import flush_order_changes, mark_order_changed
+        for item in self.items:
+            mark_order_changed(item.order_id)
+        flush_order_changes()
+        with mock.patch('orders.changes.SETTLE_SECONDS', 0):
+            response = self.assertEndpointWithinBudget('order-change-feed', data={'cursor': 0})
+        self.assertEqual(len(response.json()['orders']), 10)
+
+    def test_item_status_update(self):
+        self.assertEndpointWithinBudget(
+            'order-item-update-status', method='patch', args=[self.items[0].pk],
+            data={'status': 'accepted'}, format='json',
+        )
+
+
+class OrderWritePipelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.waiter = User.objects.create_user(username='waiter', password='x', role='waiter', branch=cls.branch)
+        cls.bartender = User.objects.create_user(username='bar', password='x', role='bartender', branch=cls.branch)
+
+    def items(self, count):
+        return [{'name': f'Item {n}', 'price': '10.00', 'quantity': 1, 'item_type': ('food', 'beverage')[n % 2]}
+                for n in range(count)]
+
+    def test_order_create_queries_do_not_grow_with_items(self):
+        for number, count in enumerate((1, 30), start=1):
+            table = Table.objects.create(number=number, branch=self.branch)
+            serializer = OrderSerializer(data={'table': table.pk, 'items': self.items(count)})
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            with self.assertNumQueries(14):
+                order = serializer.save(created_by=self.waiter)
+            self.assertEqual(order.items.count(), count)
+
+    def test_accepting_an_item_of_a_forty_item_order(self):
+        table = Table.objects.create(number=1, branch=self.branch)
+        order = Order.objects.create(order_number=f'20260101-01-B{self.branch.pk}', branch=self.branch, table=table)
+        items = add_order_items(order, self.items(40), default_item_type=None)
+        client = APIClient()
+        client.force_authenticate(self.bartender)
+        with self.assertNumQueries(9):
+            response = client.patch(reverse('order-item-update-status', args=[items[1].pk]), {'status': 'accepted'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.total_money, order.beverage_accepted_count), (Decimal('10.00'), 1))
+
+    def test_an_invalid_item_leaves_no_order_behind(self):
+        table = Table.objects.create(number=1, branch=self.branch)
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(self.waiter)
+        items = self.items(2) + [{'name': 'Tibs', 'price': '-1', 'item_type': 'food'}]
+        client.post(reverse('order-list-create'), {'table': table.pk, 'items': items}, format='json')
+        self.assertFalse(Order.objects.filter(table=table).exists())
+        self.assertEqual(Table.objects.get(pk=table.pk).status, table.status)
+        # Its order number was given back: the next order takes it
+        self.assertFalse(OrderNumberSequence.objects.filter(branch=self.branch, last_value__gt=0).exists())
+
+    def test_items_and_order_counters_are_written_together(self):
+        order = Order.objects.create(order_number=f'20260101-01-B{self.branch.pk}', branch=self.branch)
+        with mock.patch('orders.utils.apply_item_changes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                add_order_items(order, self.items(3), default_item_type=None)
+        self.assertFalse(order.items.exists())
+
+
+class OrderEditTests(TestCase):
+    def test_failed_edit_is_logged_and_rolled_back(self):
+        branch = Branch.objects.create(name='Main')
+        order = Order.objects.create(order_number=f'20260101-01-B{branch.pk}', branch=branch)
+        OrderItem.objects.create(order=order, name='Tea', price=Decimal('20.00'), item_type='beverage')
+        with self.assertLogs('orders.utils', 'ERROR') as logs, \
+                mock.patch('orders.utils.add_order_items', side_effect=RuntimeError('boom')):
+            result = edit_order(order.pk, [{'name': 'Tibs', 'price': '120.00', 'item_type': 'food'}])
+        self.assertFalse(result['success'])
+        self.assertIsNotNone(logs.records[0].exc_info)
+        # The pending item removed before the failure is back
+        self.assertEqual(list(order.items.values_list('name', flat=True)), ['Tea'])
+
+
+@override_settings(REALTIME_DISPATCH='sync')
+class RealtimeEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.table = Table.objects.create(number=1, branch=cls.branch)
+        cls.waiter = User.objects.create_user(username='waiter', password='x', role='waiter', branch=cls.branch)
+        cls.bartender = User.objects.create_user(username='bar', password='x', role='bartender', branch=cls.branch)
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+        self.addCleanup(async_to_sync(self.layer.flush))
+
+    def subscribe(self, station, branch=None):
+        channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(group_name((branch or self.branch).pk, station), channel)
+        return channel
+
+    def received(self, channel):
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(channel), 0.01))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def test_new_order_reaches_its_branch_stations_with_their_items(self):
+        bar, kitchen, floor = self.subscribe('beverage'), self.subscribe('food'), self.subscribe('floor')
+        other_bar = self.subscribe('beverage', self.other_branch)
+        serializer = OrderSerializer(data={'table': self.table.pk, 'items': [
+            {'name': 'Tibs', 'price': '120.00', 'quantity': 1, 'item_type': 'food'},
+            {'name': 'Beer', 'price': '60.00', 'quantity': 2, 'item_type': 'beverage'},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save(created_by=self.waiter)
+
+        [event] = self.received(bar)
+        self.assertEqual((event['event'], event['branch'], event['station']),
+                         ('order_created', self.branch.pk, 'beverage'))
+        self.assertEqual([item['name'] for item in event['data']['items']], ['Beer'])
+        self.assertEqual([item['name'] for item in self.received(kitchen)[0]['data']['items']], ['Tibs'])
+        self.assertEqual(len(self.received(floor)[0]['data']['items']), 2)
+        self.assertEqual(self.received(other_bar), [])
+
+    def test_item_status_change_carries_the_item_and_order_diff(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(order_number='20260101-01-B1', branch=self.branch, table=self.table)
+            item = OrderItem.objects.create(order=order, name='Beer', price=Decimal('60.00'), item_type='beverage')
+        bar, kitchen = self.subscribe('beverage'), self.subscribe('food')
+        client = APIClient()
+        client.force_authenticate(self.bartender)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(reverse('order-item-update-status', args=[item.pk]), {'status': 'rejected'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+
+        [event] = self.received(bar)
+        self.assertEqual(event['event'], 'item_status_changed')
+        self.assertEqual((event['data']['item']['id'], event['data']['item']['status'], event['data']['previous_status']),
+                         (item.pk, 'rejected', 'pending'))
+        self.assertEqual(event['data']['order']['beverage_status'], 'rejected')
+        self.assertEqual(self.received(kitchen), [])
+
+    def test_events_of_rolled_back_work_are_not_sent(self):
+        floor = self.subscribe('floor')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    publish('order_printed', self.branch.pk, ['floor'], {'order': {'id': 1}})
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            publish('order_printed', self.branch.pk, ['floor'], {'order': {'id': 2}})
+        self.assertEqual([event['data']['order']['id'] for event in self.received(floor)], [2])
+
+    def test_consumer_joins_the_stations_of_its_role_and_branch(self):
+        def groups(user, query_string=b''):
+            consumer = NotificationConsumer()
+            consumer.scope = {'query_string': query_string}
+            return async_to_sync(consumer.get_group_names)(user)
+
+        self.assertEqual(groups(self.bartender), [group_name(self.branch.pk, 'beverage')])
+        # A station filter cannot add stations the role does not see
+        self.assertEqual(groups(self.bartender, b'stations=food,beverage'), [group_name(self.branch.pk, 'beverage')])
+        manager = User.objects.create_user(username='manager', password='x', role='manager', branch=self.branch)
+        self.assertEqual(groups(manager, b'stations=food,cashier'),
+                         [group_name(self.branch.pk, 'food'), group_name(self.branch.pk, 'cashier')])
+        self.assertEqual(groups(User.objects.create_user(username='drifter', password='x', role='waiter')), [])
+
+
+class Screen:
+    """A dashboard: NotificationConsumer connections wired to the channel layer, minus the socket"""
+
+    def __init__(self, user, layer, query_string=b''):
+        self.user = user
+        self.layer = layer
+        self.query_string = query_string
+        self.frames = []
+        self.last_seen = {}
+        self.consumer = None
+
+    async def connect(self, resume=False):
+        consumer = NotificationConsumer()
+        consumer.scope = {'user': self.user, 'query_string': self.query_string}
+        consumer.channel_layer = self.layer
+        consumer.channel_name = await self.layer.new_channel()
+
+        async def base_send(message):
+            if message['type'] == 'websocket.send':
+                self.take(json.loads(message['text']))
+
+        consumer.base_send = base_send
+        await consumer.connect()
+        self.consumer = consumer
+        if resume:
+            await self.resume()
+
+    async def resume(self):
+        await self.consumer.receive(text_data=json.dumps({'action': 'resume', 'streams': self.resume_from}))
+
+    async def disconnect(self):
+        await self.consumer.disconnect(1006)
+        self.consumer = None
+        # Live events on the next connection may overtake the replay, so the
+        # screen resumes from what it had when the connection dropped
+        self.resume_from = dict(self.last_seen)
+
+    async def pump(self):
+        """Hand the consumer whatever the channel layer holds for it"""
+        channel = self.consumer.channel_name
+        while channel in self.layer.channels:
+            message = await self.layer.receive(channel)
+            await getattr(self.consumer, message['type'].replace('.', '_'))(message)
+
+    def take(self, frame):
+        self.frames.append(frame)
+        if frame['event'] == 'subscribed':
+            for stream, seq in frame['streams'].items():
+                self.last_seen.setdefault(stream, seq)
+        elif frame['event'] == 'resync_required':
+            self.last_seen[frame['stream']] = frame['seq']
+        elif frame['seq'] is not None:
+            self.last_seen[frame['stream']] = max(frame['seq'], self.last_seen.get(frame['stream'], 0))
+
+    def events(self, stream=None):
+        return [frame for frame in self.frames
+                if 'data' in frame and stream in (None, frame['stream'])]
+
+
+@override_settings(REALTIME_DISPATCH='sync')
+class StreamResumeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager', branch=cls.branch)
+
+    def setUp(self):
+        cache.clear()
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+        self.addCleanup(async_to_sync(self.layer.flush))
+        self.streams = [group_name(self.branch.pk, 'food'), group_name(self.branch.pk, 'beverage')]
+
+    async def publish(self, numbers):
+        def send():
+            # Outside the test transaction, so the events commit (and go out) at once
+            for n in numbers:
+                publish('order_updated', self.branch.pk, [('food', 'beverage')[n % 2]], {'n': n})
+        await sync_to_async(send, thread_sensitive=False)()
+
+    def test_reconnecting_screen_gets_exactly_what_it_missed(self):
+        rng = random.Random(24)
+
+        async def scenario():
+            screen = Screen(self.manager, self.layer, b'stations=food,beverage')
+            await screen.connect()
+            published, offline_for = 0, 0
+            while published < 600:
+                batch = list(range(published, published + rng.randint(1, 8)))
+                published += len(batch)
+                await self.publish(batch)
+                if screen.consumer is None:
+                    offline_for -= 1
+                    if offline_for > 0:
+                        continue
+                    await screen.connect()
+                    # Live events can reach the new connection before the resume request
+                    await self.publish([published])
+                    published += 1
+                    await screen.pump()
+                    await screen.resume()
+                elif rng.random() < 0.15:
+                    await screen.pump()
+                    await screen.disconnect()
+                    offline_for = rng.randint(1, 6)
+                    continue
+                await screen.pump()
+            if screen.consumer is None:
+                await screen.connect(resume=True)
+            await screen.pump()
+            return screen, published
+
+        screen, published = async_to_sync(scenario)()
+        self.assertEqual(sorted(frame['data']['n'] for frame in screen.events()), list(range(published)))
+        for stream in self.streams:
+            seqs = [frame['seq'] for frame in screen.events(stream)]
+            self.assertEqual(sorted(seqs), list(range(1, len(seqs) + 1)))
+        self.assertFalse([frame for frame in screen.frames if frame['event'] == 'resync_required'])
+
+    @override_settings(REALTIME_REPLAY_SIZE=10)
+    def test_gap_larger_than_the_buffer_requires_a_resync(self):
+        async def scenario():
+            screen = Screen(self.manager, self.layer, b'stations=food')
+            await screen.connect()
+            await self.publish([0, 2])
+            await screen.pump()
+            await screen.disconnect()
+            await self.publish(range(4, 50, 2))
+            await screen.connect(resume=True)
+            await self.publish([50])
+            await screen.pump()
+            return screen
+
+        screen = async_to_sync(scenario)()
+        resync = [frame for frame in screen.frames if frame['event'] == 'resync_required']
+        self.assertEqual(resync, [{'event': 'resync_required', 'stream': self.streams[0], 'seq': 25}])
+        # Nothing from the gap is replayed; the stream carries on live
+        self.assertEqual([frame['data']['n'] for frame in screen.events()], [0, 2, 50])
+        self.assertEqual(screen.events()[-1]['seq'], 26)
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_without_a_shared_cache_resuming_requires_a_resync(self):
+        async def scenario():
+            screen = Screen(self.manager, self.layer, b'stations=food')
+            await screen.connect()
+            await self.publish([0])
+            await screen.pump()
+            await screen.disconnect()
+            await self.publish([2])
+            await screen.connect(resume=True)
+            await self.publish([4])
+            await screen.pump()
+            return screen
+
+        screen = async_to_sync(scenario)()
+        resync = [frame for frame in screen.frames if frame['event'] == 'resync_required']
+        self.assertEqual(resync, [{'event': 'resync_required', 'stream': self.streams[0], 'seq': 0}])
+        self.assertEqual([(frame['data']['n'], frame['seq']) for frame in screen.events()], [(0, None), (4, None)])
+
+
+class OrderNumberTests(TransactionTestCase):
+    day = date(2026, 1, 5)
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name='Main')
+
+    def last_value(self):
+        return OrderNumberSequence.objects.get(branch=self.branch, day=self.day).last_value
+
+    def test_numbers_count_up_per_branch_and_day(self):
+        other = Branch.objects.create(name='Other')
+        self.assertEqual(allocate_order_number(self.branch, self.day), f'20260105-01-B{self.branch.pk}')
+        self.assertEqual(allocate_order_number(self.branch, self.day), f'20260105-02-B{self.branch.pk}')
+        self.assertEqual(allocate_order_number(other, self.day), f'20260105-01-B{other.pk}')
+        self.assertEqual(allocate_order_number(self.branch, date(2026, 1, 6)), f'20260106-01-B{self.branch.pk}')
+        self.assertEqual(self.last_value(), 2)
+
+    def test_workers_lease_disjoint_blocks(self):
+        first, second = OrderNumberAllocator(block_size=5), OrderNumberAllocator(block_size=5)
+        self.assertEqual(first.next_sequence(self.branch.pk, self.day), 1)
+        self.assertEqual(second.next_sequence(self.branch.pk, self.day), 6)
+        self.assertEqual(self.last_value(), 10)
+        with self.assertNumQueries(0):
+            sequences = [first.next_sequence(self.branch.pk, self.day) for _ in range(4)]
+        self.assertEqual(sequences, [2, 3, 4, 5])
+        # The lease is used up: the next number comes from a new block
+        self.assertEqual(first.next_sequence(self.branch.pk, self.day), 11)
+        self.assertEqual(self.last_value(), 15)
+
+    def test_no_leasing_inside_a_transaction(self):
+        allocator = OrderNumberAllocator(block_size=5)
+        with transaction.atomic():
+            self.assertEqual(allocator.next_sequence(self.branch.pk, self.day), 1)
+        self.assertEqual(self.last_value(), 1)
+
+    def test_threads_share_a_lease_without_duplicates(self):
+        allocator = OrderNumberAllocator(block_size=100)
+
+        def allocate(_):
+            try:
+                return allocator.allocate(self.branch, self.day)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            numbers = list(pool.map(allocate, range(60)))
+        self.assertEqual(sorted(numbers), [f'20260105-{n:02d}-B{self.branch.pk}' for n in range(1, 61)])
+        self.assertEqual(self.last_value(), 100)
+
+    @skipIf(connection.vendor == 'sqlite', 'SQLite test databases lock out concurrent writers')
+    def test_concurrent_allocations_are_unique(self):
+        for block_size in (1, 3):
+            allocators = [OrderNumberAllocator(block_size=block_size) for _ in range(4)]
+
+            def allocate(n):
+                try:
+                    return allocators[n % 4].allocate(self.branch, self.day)
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                numbers = list(pool.map(allocate, range(60)))
+            self.assertEqual(len(set(numbers)), 60, block_size)
+            OrderNumberSequence.objects.all().delete()
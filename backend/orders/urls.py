@@ -13,6 +13,7 @@ urlpatterns = [
     path('food/', views.FoodOrderListView.as_view(), name='food-order-list'),
     path('beverages/', views.BeverageOrderListView.as_view(), name='beverage-order-list'),
     path('printed-orders/', views.PrintedOrderListView.as_view(), name='printed-order-list'),
+    path('changes/', views.OrderChangeFeedView.as_view(), name='order-change-feed'),
     path('<int:pk>/accept-beverage/', views.AcceptbeverageOrderView.as_view(), name='accept-beverage-order'),
     path('<int:pk>/cancel/', views.CancelOrderView.as_view(), name='cancel-order'),
     path('sales-summary/', views.DailySalesSummaryView.as_view(), name='sales-summary'),
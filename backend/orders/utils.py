@@ -1,8 +1,100 @@
 from orders.models import Order, OrderItem
 from django.db import transaction
 import json
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from orders.models import OrderUpdate
+from django.core.exceptions import ValidationError
+from orders.aggregates import apply_item_changes
+import logging
+from core.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+ORDER_ITEM_TYPES = {choice for choice, _ in OrderItem.ORDER_ITEM_TYPE}
+
+
+def build_order_items(order, items_data, status='pending', default_item_type='food', skip_invalid=False):
+    """
+    Validate raw item dicts and turn them into unsaved OrderItem instances.
+
+    Args:
+        order (Order): The order the items belong to
+        items_data (list): Dicts with name, quantity, price, item_type and product/product_id
+        status (str): Status given to every new item (None keeps each item's own status)
+        default_item_type (str): Used when an item has no item_type (None makes it required)
+        skip_invalid (bool): Drop invalid items instead of raising
+
+    Returns:
+        list: Unsaved OrderItem instances
+    """
+    items = []
+    for index, item_data in enumerate(items_data):
+        try:
+            name = item_data.get('name')
+            if not name:
+                raise ValidationError(f"Item {index + 1} is missing a name")
+
+            quantity = int(item_data.get('quantity', 1))
+            if quantity <= 0:
+                raise ValidationError(f"Quantity for '{name}' must be greater than 0")
+
+            price = Decimal(str(item_data.get('price', 0)))
+            if price < 0:
+                raise ValidationError(f"Price for '{name}' must be non-negative")
+
+            item_type = item_data.get('item_type') or default_item_type
+            if item_type not in ORDER_ITEM_TYPES:
+                raise ValidationError(f"Invalid item_type '{item_type}' for '{name}'")
+
+            product = item_data.get('product_id') or item_data.get('product')
+            product_id = getattr(product, 'pk', product)
+        except (ValidationError, ValueError, TypeError, InvalidOperation) as e:
+            if skip_invalid:
+                logger.warning("Skipping invalid order item %s: %s", item_data, e)
+                continue
+            if isinstance(e, ValidationError):
+                raise
+            raise ValidationError(f"Invalid data for item {index + 1}: {e}")
+
+        items.append(OrderItem(
+            order=order,
+            name=name,
+            quantity=quantity,
+            price=price,
+            item_type=item_type,
+            product_id=product_id,
+            status=status or item_data.get('status') or 'pending',
+        ))
+    return items
+
+
+@traced(logger, 'add_order_items')
+def add_order_items(order, items_data, status='pending', default_item_type='food', skip_invalid=False):
+    """
+    Shared write pipeline for order items: validate, insert in one bulk_create,
+    then fold all new items into the order counters with a single update.
+
+    bulk_create bypasses the per-item post_save handler, so adding N items costs
+    a constant number of queries. total_money, food_status and beverage_status
+    are derived from the counters (see orders/aggregates.py) and refreshed on
+    ``order`` before returning. The insert and the counter update commit
+    together; callers creating ``order`` should do so in the same transaction.
+
+    Returns:
+        list: The created OrderItem instances
+    """
+    items = build_order_items(order, items_data, status, default_item_type, skip_invalid)
+    with transaction.atomic():
+        if items:
+            OrderItem.objects.bulk_create(items)
+        apply_item_changes(order, items, created=True)
+    from reports.dashboard import COUNTED_STATUSES, invalidate_item_series
+    from reports.kpis import invalidate_owner_kpis
+    if any(item.status in COUNTED_STATUSES for item in items):
+        invalidate_item_series(order.branch_id)
+        invalidate_owner_kpis(order.branch_id)
+    return items
+
 
 def get_waiter_actions(order_id):
     """
@@ -18,11 +110,10 @@ def get_waiter_actions(order_id):
         # Get the order with related items
         order = Order.objects.select_related('table', 'created_by').prefetch_related('items').get(id=order_id)
         
-        # Check if order has beverage items
-        has_beverages = order.items.filter(item_type='beverage').exists()
-        
-        # Check if order has food items
-        has_food = order.items.filter(item_type='food').exists()
+        # Check which stations the order has items for (uses the prefetched items)
+        summary = order.status_summary()
+        has_beverages = summary['beverage']['items'] > 0
+        has_food = summary['food']['items'] > 0
         
         # Get beverage status
         beverage_status = order.beverage_status
@@ -180,34 +271,34 @@ def validate_order_update(order_id, updated_items, user):
         dict: Validation result with success/error status and message
     """
     try:
-        print(f"[DEBUG] validate_order_update - Starting validation for order {order_id}")
-        print(f"[DEBUG] validate_order_update - Updated items: {updated_items}")
-        print(f"[DEBUG] validate_order_update - User: {user.username if user else 'None'}")
+        logger.debug("validate_order_update - Starting validation for order %s", order_id)
+        logger.debug("validate_order_update - Updated items: %s", updated_items)
+        logger.debug("validate_order_update - User: %s", user.username if user else 'None')
         
         # Get current order
         current_order = Order.objects.select_related('table').prefetch_related('items').get(id=order_id)
-        print(f"[DEBUG] validate_order_update - Found order: {current_order.order_number}")
+        logger.debug("validate_order_update - Found order: %s", current_order.order_number)
         
         # Get waiter actions
         actions = get_waiter_actions(order_id)
-        print(f"[DEBUG] validate_order_update - Waiter actions: {actions}")
+        logger.debug("validate_order_update - Waiter actions: %s", actions)
         
         # Check if there was an error getting actions
         if 'error' in actions:
-            print(f"[DEBUG] validate_order_update - Error getting actions: {actions['error']}")
+            logger.debug("validate_order_update - Error getting actions: %s", actions['error'])
             return {
                 'success': False,
                 'error': f"Failed to get waiter actions: {actions['error']}"
             }
         
         if not actions['actions']['edit']['enabled']:
-            print(f"[DEBUG] validate_order_update - Edit not allowed: {actions['actions']['edit']['reason']}")
+            logger.debug("validate_order_update - Edit not allowed: %s", actions['actions']['edit']['reason'])
             return {
                 'success': False,
                 'error': f"Edit not allowed: {actions['actions']['edit']['reason']}"
             }
         
-        print(f"[DEBUG] validate_order_update - Edit is allowed")
+        logger.debug("validate_order_update - Edit is allowed")
         
         # Check if this is a quantity reduction (not allowed after acceptance)
         if current_order.beverage_status in ['accepted', 'preparing', 'completed']:
@@ -219,7 +310,7 @@ def validate_order_update(order_id, updated_items, user):
                 current_quantity = current_items.get(item_name, 0)
                 
                 if new_quantity < current_quantity:
-                    print(f"[DEBUG] validate_order_update - Quantity reduction not allowed: {item_name} {current_quantity} -> {new_quantity}")
+                    logger.debug("validate_order_update - Quantity reduction not allowed: %s %s -> %s", item_name, current_quantity, new_quantity)
                     return {
                         'success': False,
                         'error': f"Cannot reduce quantity of '{item_name}' from {current_quantity} to {new_quantity} after order acceptance"
@@ -227,29 +318,29 @@ def validate_order_update(order_id, updated_items, user):
         
         # Ensure product_id is present for new items only (but be flexible for food items)
         current_item_names = {item.name for item in current_order.items.all()}
-        print(f"[DEBUG] validate_order_update - Current item names: {current_item_names}")
+        logger.debug("validate_order_update - Current item names: %s", current_item_names)
         
         for item in updated_items:
             item_name = item.get('name')
             item_type = item.get('item_type', 'food')
             
-            print(f"[DEBUG] validate_order_update - Validating item: {item_name} (type: {item_type})")
+            logger.debug("validate_order_update - Validating item: %s (type: %s)", item_name, item_type)
             
             # Only check product_id for new items
             if item_name not in current_item_names:
-                print(f"[DEBUG] validate_order_update - {item_name} is a new item")
+                logger.debug("validate_order_update - %s is a new item", item_name)
                 
                 # For food items, product_id is optional
                 if item_type == 'food':
                     # Food items don't require product_id
-                    print(f"[DEBUG] validate_order_update - {item_name} is food item, product_id not required")
+                    logger.debug("validate_order_update - %s is food item, product_id not required", item_name)
                     continue
                 elif item_type == 'beverage':
                     # Beverage items require product_id for inventory tracking
                     product_id = item.get('product_id') or item.get('product')
-                    print(f"[DEBUG] validate_order_update - {item_name} is beverage item, product_id: {product_id}")
+                    logger.debug("validate_order_update - %s is beverage item, product_id: %s", item_name, product_id)
                     if not product_id:
-                        print(f"[DEBUG] validate_order_update - {item_name} missing product_id")
+                        logger.debug("validate_order_update - %s missing product_id", item_name)
                         return {
                             'success': False,
                             'error': f"Product ID is required for beverage item '{item_name}'"
@@ -257,30 +348,30 @@ def validate_order_update(order_id, updated_items, user):
                 else:
                     # For other item types, require product_id
                     product_id = item.get('product_id') or item.get('product')
-                    print(f"[DEBUG] validate_order_update - {item_name} is {item_type} item, product_id: {product_id}")
+                    logger.debug("validate_order_update - %s is %s item, product_id: %s", item_name, item_type, product_id)
                     if not product_id:
-                        print(f"[DEBUG] validate_order_update - {item_name} missing product_id")
+                        logger.debug("validate_order_update - %s missing product_id", item_name)
                         return {
                             'success': False,
                             'error': f"Product ID is required for new item '{item_name}'"
                         }
             else:
-                print(f"[DEBUG] validate_order_update - {item_name} is existing item, no validation needed")
+                logger.debug("validate_order_update - %s is existing item, no validation needed", item_name)
         
-        print(f"[DEBUG] validate_order_update - All validations passed")
+        logger.debug("validate_order_update - All validations passed")
         return {
             'success': True,
             'message': 'Order update validation passed'
         }
         
     except Order.DoesNotExist:
-        print(f"[DEBUG] validate_order_update - Order {order_id} not found")
+        logger.debug("validate_order_update - Order %s not found", order_id)
         return {
             'success': False,
             'error': f'Order with ID {order_id} not found'
         }
     except Exception as e:
-        print(f"[DEBUG] validate_order_update - Exception: {str(e)}")
+        logger.debug("validate_order_update - Exception: %s", e)
         return {
             'success': False,
             'error': f'Validation error: {str(e)}'
@@ -301,40 +392,40 @@ def update_order_with_validation(order_id, updated_items, user):
         dict: Update result with success/error status and updated order data
     """
     try:
-        print(f"[DEBUG] update_order_with_validation - Starting update for order {order_id}")
-        print(f"[DEBUG] update_order_with_validation - Updated items: {updated_items}")
-        print(f"[DEBUG] update_order_with_validation - User: {user.username if user else 'None'}")
+        logger.debug("update_order_with_validation - Starting update for order %s", order_id)
+        logger.debug("update_order_with_validation - Updated items: %s", updated_items)
+        logger.debug("update_order_with_validation - User: %s", user.username if user else 'None')
         
         # Validate the update
         validation = validate_order_update(order_id, updated_items, user)
         if not validation['success']:
-            print(f"[DEBUG] update_order_with_validation - Validation failed: {validation['error']}")
+            logger.debug("update_order_with_validation - Validation failed: %s", validation['error'])
             return validation
         
-        print(f"[DEBUG] update_order_with_validation - Validation passed")
+        logger.debug("update_order_with_validation - Validation passed")
         
         # Get the order
         order = Order.objects.get(id=order_id)
-        print(f"[DEBUG] update_order_with_validation - Found order: {order.order_number}")
+        logger.debug("update_order_with_validation - Found order: %s", order.order_number)
         
         # Get current items for comparison
         current_items = {item.name: item for item in order.items.all()}
-        print(f"[DEBUG] update_order_with_validation - Current items: {list(current_items.keys())}")
+        logger.debug("update_order_with_validation - Current items: %s", list(current_items.keys()))
         
         # Process updated items
-        new_items = []
+        new_items_data = []
         updated_existing = []
         
         for item_data in updated_items:
             item_name = item_data.get('name')
-            print(f"[DEBUG] update_order_with_validation - Processing item: {item_name}")
+            logger.debug("update_order_with_validation - Processing item: %s", item_name)
             
             if item_name in current_items:
                 # Update existing item
                 current_item = current_items[item_name]
                 new_quantity = item_data.get('quantity', current_item.quantity)
                 
-                print(f"[DEBUG] update_order_with_validation - Updating existing item {item_name}: quantity {current_item.quantity} -> {new_quantity}")
+                logger.debug("update_order_with_validation - Updating existing item %s: quantity %s -> %s", item_name, current_item.quantity, new_quantity)
                 
                 # Check if quantity is being reduced (not allowed after acceptance)
                 if order.beverage_status in ['accepted', 'preparing', 'completed'] and new_quantity < current_item.quantity:
@@ -345,54 +436,20 @@ def update_order_with_validation(order_id, updated_items, user):
                 
                 current_item.quantity = new_quantity
                 current_item.price = item_data.get('price', current_item.price)
-                current_item.save()
                 updated_existing.append(current_item)
                 
             else:
-                # Add new item
-                print(f"[DEBUG] update_order_with_validation - Creating new item: {item_name}")
-                print(f"[DEBUG] update_order_with_validation - Item data: {item_data}")
-                
-                try:
-                    new_item = OrderItem.objects.create(
-                        order=order,
-                        name=item_name,
-                        quantity=item_data.get('quantity', 1),
-                        price=item_data.get('price', 0),
-                        item_type=item_data.get('item_type'),
-                        product_id=item_data.get('product_id') or item_data.get('product'),
-                        status='pending'
-                    )
-                    new_items.append(new_item)
-                    print(f"[DEBUG] update_order_with_validation - Successfully created new item: {new_item.id}")
-                except Exception as e:
-                    print(f"[ERROR] update_order_with_validation - Failed to create item {item_name}: {str(e)}")
-                    raise
-        
-        # Update order total - include all items regardless of status for updates
-        total = 0
-        for item in order.items.all():
-            # For updates, include all items in the total calculation
-            total += float(item.price) * item.quantity
-        
-        order.total_money = total
-        order.save()
-        
-        # Recalculate order status based on current item statuses
-        if new_items or updated_existing:
-            # Recalculate beverage status
-            new_beverage_status = order.calculate_beverage_status()
-            if new_beverage_status != order.beverage_status:
-                print(f"[DEBUG] Updating beverage_status from '{order.beverage_status}' to '{new_beverage_status}'")
-                order.beverage_status = new_beverage_status
-            
-            # Recalculate food status
-            new_food_status = order.calculate_food_status()
-            if new_food_status != order.food_status:
-                print(f"[DEBUG] Updating food_status from '{order.food_status}' to '{new_food_status}'")
-                order.food_status = new_food_status
-            
-            order.save()
+                # Collect new items for a single bulk insert
+                logger.debug("update_order_with_validation - New item: %s", item_name)
+                new_items_data.append(item_data)
+        
+        if updated_existing:
+            OrderItem.objects.bulk_update(updated_existing, ['quantity', 'price'])
+            apply_item_changes(order, updated_existing)
+        
+        # Insert new items, then refresh the order total and statuses once
+        new_items = add_order_items(order, new_items_data, status='pending')
+        total = order.total_money
         
         return {
             'success': True,
@@ -453,7 +510,7 @@ def edit_order(order_id, new_items, user=None):
             elif item.status == 'pending':
                 pending_items.append(item)
         
-        print(f"[DEBUG] edit_order - Order {order_id}: {len(accepted_items)} accepted items, {len(pending_items)} pending items")
+        logger.debug("edit_order - Order %s: %s accepted items, %s pending items", order_id, len(accepted_items), len(pending_items))
         
         # Step 3: Log the Edit Request
         # Calculate total addition cost
@@ -523,57 +580,26 @@ def edit_order(order_id, new_items, user=None):
             created_by=user
         )
         
-        print(f"[DEBUG] edit_order - Created OrderUpdate record {order_update.id} with type '{update_type}'")
+        logger.debug("edit_order - Created OrderUpdate record %s with type '%s'", order_update.id, update_type)
         
         # Step 4: Remove Old Pending Items
         if pending_items:
             pending_item_ids = [item.id for item in pending_items]
             deleted_count = OrderItem.objects.filter(id__in=pending_item_ids).delete()[0]
-            print(f"[DEBUG] edit_order - Deleted {deleted_count} pending items")
-        
-        # Step 5: Add New Items
-        new_order_items = []
-        for item_data in new_items:
-            try:
-                new_item = OrderItem.objects.create(
-                    order=order,
-                    name=item_data.get('name', 'Unknown Item'),
-                    quantity=int(item_data.get('quantity', 1)),
-                    price=Decimal(str(item_data.get('price', 0))),
-                    item_type=item_data.get('item_type', 'food'),
-                    status='pending',
-                    product_id=item_data.get('product_id')
-                )
-                new_order_items.append(new_item)
-                print(f"[DEBUG] edit_order - Created new item: {new_item.name} x {new_item.quantity}")
-            except (ValueError, TypeError) as e:
-                print(f"[ERROR] edit_order - Invalid item data: {item_data}, error: {e}")
-                continue
-        
-        # Step 6: Update Main Order
-        # Reset statuses to 'pending' if new items were added
-        has_new_food = any(item.item_type == 'food' for item in new_order_items)
-        has_new_beverage = any(item.item_type == 'beverage' for item in new_order_items)
-        
-        if has_new_food:
-            order.food_status = 'pending'
-            print(f"[DEBUG] edit_order - Reset food_status to 'pending'")
-        
-        if has_new_beverage:
-            order.beverage_status = 'pending'
-            print(f"[DEBUG] edit_order - Reset beverage_status to 'pending'")
-        
-        # Recalculate total_money as sum of all accepted + pending items
-        total_money = sum(
-            item.price * item.quantity 
-            for item in accepted_items + new_order_items
+            logger.debug("edit_order - Deleted %s pending items", deleted_count)
+        
+        # Step 5 & 6: Add New Items in one insert, then update the main order once.
+        # Statuses and total_money are derived from the order's item counters
+        # (new pending items reset the station status to 'pending').
+        new_order_items = add_order_items(
+            order,
+            new_items,
+            status='pending',
+            skip_invalid=True,
         )
-        order.total_money = total_money
-        
-        # Save the updated order
-        order.save()
+        total_money = order.total_money
         
-        print(f"[DEBUG] edit_order - Updated order total_money to {total_money}")
+        logger.debug("edit_order - Added %s items, total_money is now %s", len(new_order_items), total_money)
         
         # Step 7: Commit Transaction (handled by @transaction.atomic decorator)
         
@@ -593,10 +619,9 @@ def edit_order(order_id, new_items, user=None):
         }
         
     except Exception as e:
-        # Transaction will automatically rollback due to @transaction.atomic
-        print(f"[ERROR] edit_order - Failed to edit order {order_id}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        # The error is swallowed, so @transaction.atomic has to be told to roll back
+        transaction.set_rollback(True)
+        logger.exception("edit_order - Failed to edit order %s: %s", order_id, e)
         
         return {
             'success': False,
@@ -642,14 +667,14 @@ def check_order_update_completion(order_update_id):
         order_update.status = 'accepted'
         order_update.save()
         
-        print(f"[DEBUG] check_order_update_completion - OrderUpdate {order_update_id} marked as accepted")
+        logger.debug("check_order_update_completion - OrderUpdate %s marked as accepted", order_update_id)
         return True
         
     except OrderUpdate.DoesNotExist:
-        print(f"[ERROR] check_order_update_completion - OrderUpdate {order_update_id} not found")
+        logger.error("check_order_update_completion - OrderUpdate %s not found", order_update_id)
         return False
     except Exception as e:
-        print(f"[ERROR] check_order_update_completion - Error: {str(e)}")
+        logger.error("check_order_update_completion - Error: %s", e)
         return False
 
 
@@ -8,6 +8,9 @@ from rest_framework import status
 from rest_framework.views import APIView
 from django.utils.dateparse import parse_date
 from payments.models import Payment
+from payments.rollups import sales_totals
+from reports.sales_lines import top_items
+from inventory.consumption import consume_items, restore_items
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Q
 from rest_framework.decorators import action
 from rest_framework import viewsets
@@ -19,6 +22,11 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from .utils import get_waiter_actions
+from .numbering import allocate_order_number
+from .utils import add_order_items
+from .queues import open_tickets
+from .changes import cursor_expired, feed_queryset, latest_cursor, read_changes
+from . import events
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -28,6 +36,10 @@ from .models import Order, OrderUpdate
 from .serializers import OrderUpdateSerializer, OrderUpdateActionSerializer
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.exceptions import NotFound
+import logging
+from core.tracing import traced, tracing_enabled
+
+logger = logging.getLogger(__name__)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class OrderListView(generics.ListCreateAPIView):
@@ -37,59 +49,37 @@ class OrderListView(generics.ListCreateAPIView):
     def get_queryset(self):
         user = self.request.user
         
-        # Check for session key in headers as fallback
-        session_key = self.request.headers.get('X-Session-Key')
-        if session_key and not user.is_authenticated:
-            try:
-                from django.contrib.sessions.models import Session
-                from django.contrib.auth import get_user_model
-                
-                # Get session data
-                session = Session.objects.get(session_key=session_key)
-                user_id = session.get_decoded().get('_auth_user_id')
-                
-                if user_id:
-                    User = get_user_model()
-                    user = User.objects.get(id=user_id)
-                    print(f"[DEBUG] User authenticated via session key: {user.username}")
-                else:
-                    print(f"[DEBUG] No user ID found in session: {session_key}")
-                    return Order.objects.none()
-            except (Session.DoesNotExist, User.DoesNotExist) as e:
-                print(f"[DEBUG] Session validation failed: {e}")
-                return Order.objects.none()
-        
-        print(f"[DEBUG] OrderListView.get_queryset - User: {user.username if user.is_authenticated else 'Anonymous'}, Role: {getattr(user, 'role', 'None')}, ID: {user.id if user.is_authenticated else 'None'}")
+        logger.debug("OrderListView.get_queryset - User: %s, Role: %s, ID: %s", user.username if user.is_authenticated else 'Anonymous', getattr(user, 'role', 'None'), user.id if user.is_authenticated else 'None')
         
         if not user.is_authenticated:
-            print(f"[DEBUG] OrderListView.get_queryset - User not authenticated, returning empty queryset")
+            logger.debug("OrderListView.get_queryset - User not authenticated, returning empty queryset")
             return Order.objects.none()
         
         # Check user role and filter accordingly
         if user.is_superuser:
             # Superuser can see all orders
             queryset = Order.objects.all()
-            print(f"[DEBUG] Superuser - showing all orders")
+            logger.debug("Superuser - showing all orders")
         elif hasattr(user, 'role') and user.role in ['manager', 'owner', 'cashier']:
             # Managers, owners, and cashiers can see all orders in their branch
             if hasattr(user, 'branch') and user.branch:
                 queryset = Order.objects.filter(branch=user.branch)
-                print(f"[DEBUG] {user.role} - showing all orders for branch: {user.branch.name}")
+                logger.debug("%s - showing all orders for branch: %s", user.role, user.branch.name)
             else:
                 queryset = Order.objects.all()
-                print(f"[DEBUG] {user.role} without branch - showing all orders")
+                logger.debug("%s without branch - showing all orders", user.role)
         else:
             # Waiters and other users can only see their own orders
             queryset = Order.objects.filter(created_by=user)
-            print(f"[DEBUG] Waiter {user.username} - showing only own orders (created_by={user.id})")
+            logger.debug("Waiter %s - showing only own orders (created_by=%s)", user.username, user.id)
         
         table_number = self.request.query_params.get('table_number')
         date = self.request.query_params.get('date')
         cashier_status = self.request.query_params.get('cashier_status')
         
-        print(f"DEBUG: User role: {user.role}")
-        print(f"DEBUG: Cashier status filter: {cashier_status}")
-        print(f"DEBUG: Date filter: {date}")
+        logger.debug("User role: %s", user.role)
+        logger.debug("Cashier status filter: %s", cashier_status)
+        logger.debug("Date filter: %s", date)
         
         # For cashier dashboard, show all orders (not just user's orders)
         if user.role == 'cashier':
@@ -106,41 +96,19 @@ class OrderListView(generics.ListCreateAPIView):
             if cashier_status == 'pending':
                 # For 'pending' filter, show both 'pending' and 'ready_for_payment' orders
                 queryset = queryset.filter(cashier_status__in=['pending', 'ready_for_payment'])
-                print(f"DEBUG: Applied pending filter (pending + ready_for_payment)")
+                logger.debug("Applied pending filter (pending + ready_for_payment)")
             else:
                 queryset = queryset.filter(cashier_status=cashier_status)
-                print(f"DEBUG: Applied cashier_status filter: {cashier_status}")
-            print(f"DEBUG: Query count after filter: {queryset.count()}")
+                logger.debug("Applied cashier_status filter: %s", cashier_status)
         
-        print(f"DEBUG: Final query count: {queryset.count()}")
+        if tracing_enabled(logger):
+            logger.debug("Final query count: %s", queryset.count())
         return queryset
 
+    @traced(logger, 'OrderListView.perform_create')
     def perform_create(self, serializer):
         user = self.request.user
         
-        # Check for session key in headers as fallback
-        if not user.is_authenticated:
-            session_key = self.request.headers.get('X-Session-Key')
-            if session_key:
-                try:
-                    from django.contrib.sessions.models import Session
-                    from django.contrib.auth import get_user_model
-                    
-                    # Get session data
-                    session = Session.objects.get(session_key=session_key)
-                    user_id = session.get_decoded().get('_auth_user_id')
-                    
-                    if user_id:
-                        User = get_user_model()
-                        user = User.objects.get(id=user_id)
-                        print(f"[DEBUG] User authenticated via session key in perform_create: {user.username}")
-                    else:
-                        print(f"[DEBUG] No user ID found in session during create: {session_key}")
-                        raise PermissionDenied("User not authenticated")
-                except (Session.DoesNotExist, User.DoesNotExist) as e:
-                    print(f"[DEBUG] Session validation failed during create: {e}")
-                    raise PermissionDenied("Invalid session")
-        
         if not user.is_authenticated:
             raise PermissionDenied("User not authenticated")
         
@@ -154,51 +122,34 @@ class OrderListView(generics.ListCreateAPIView):
                 original_order = Order.objects.get(id=original_order_id)
                 items_data = self.request.data.get('items', [])
                 
-                # Generate new order number for the updated order
-                today = timezone.now().date()
-                today_str = today.strftime('%Y%m%d')
-                last_order_today = Order.objects.filter(created_at__date=today).order_by('created_at').last()
-                if last_order_today and last_order_today.order_number.startswith(today_str):
-                    last_seq = int(last_order_today.order_number.split('-')[-1])
-                    new_seq = last_seq + 1
-                else:
-                    new_seq = 1
-                new_order_number = f"{today_str}-{new_seq:02d}"
-                while Order.objects.filter(order_number=new_order_number).exists():
-                    new_seq += 1
-                    new_order_number = f"{today_str}-{new_seq:02d}"
-                
-                # Create NEW order with same table but new order number
-                updated_order = Order.objects.create(
-                    order_number=new_order_number,
-                    table=original_order.table,  # Keep the same table
-                    created_by=user,
-                    branch=original_order.branch,
-                    food_status='accepted',  # Auto-accept food items for updated orders
-                    beverage_status='accepted'  # Auto-accept beverage items for updated orders
-                )
-                
-                # Add all items to the new order
-                for item_data in items_data:
-                    OrderItem.objects.create(
-                        order=updated_order,
-                        name=item_data.get('name'),
-                        quantity=item_data.get('quantity', 1),
-                        price=item_data.get('price', 0),
-                        item_type=item_data.get('item_type'),  # Remove default fallback - item_type must be set
-                        product_id=item_data.get('product'),
-                        status='accepted'  # Auto-accept items for updated orders (no need for bartender approval)
+                # The order number, the order and its items are saved together, or not at all
+                with transaction.atomic():
+                    # Generate new order number for the updated order
+                    new_order_number = allocate_order_number(original_order.branch_id)
+
+                    # Create NEW order with same table but new order number
+                    updated_order = Order.objects.create(
+                        order_number=new_order_number,
+                        table=original_order.table,  # Keep the same table
+                        created_by=user,
+                        branch=original_order.branch,
+                        food_status='accepted',  # Auto-accept food items for updated orders
+                        beverage_status='accepted'  # Auto-accept beverage items for updated orders
+                    )
+
+                    # Add all items to the new order; its total and statuses follow from them
+                    items = add_order_items(
+                        updated_order,
+                        items_data,
+                        status='accepted',  # Auto-accept items for updated orders (no need for bartender approval)
+                        default_item_type=None,  # item_type must be set
                     )
                 
-                # Calculate total for the new order
-                total = sum(item.price * item.quantity for item in updated_order.items.all())
-                updated_order.total_money = total
-                updated_order.save()
-                
-                print(f"[DEBUG] Edit Order - Created NEW order {updated_order.order_number} from original {original_order.order_number}")
-                print(f"[DEBUG] Edit Order - Same table: {updated_order.table.number}, New items: {len(items_data)}")
-                print(f"[DEBUG] Edit Order - New order ID: {updated_order.id}, Original order ID: {original_order.id}")
-                print(f"[DEBUG] Edit Order - Auto-accepted: food_status={updated_order.food_status}, beverage_status={updated_order.beverage_status}")
+                logger.debug("Edit Order - Created NEW order %s from original %s", updated_order.order_number, original_order.order_number)
+                logger.debug("Edit Order - Same table: %s, New items: %s", updated_order.table.number, len(items_data))
+                logger.debug("Edit Order - New order ID: %s, Original order ID: %s", updated_order.id, original_order.id)
+                logger.debug("Edit Order - Auto-accepted: food_status=%s, beverage_status=%s", updated_order.food_status, updated_order.beverage_status)
+                events.order_created(updated_order, items)
                 
                 # Return the NEW order (not the original)
                 return updated_order
@@ -239,27 +190,13 @@ class OrderListView(generics.ListCreateAPIView):
                 f"Please complete or cancel the existing order before creating a new one."
             )
         
-        # This is a new order
-        today = timezone.now().date()
-        today_str = today.strftime('%Y%m%d')
-        last_order_today = Order.objects.filter(created_at__date=today).order_by('created_at').last()
-        if last_order_today and last_order_today.order_number.startswith(today_str):
-            last_seq = int(last_order_today.order_number.split('-')[-1])
-            new_seq = last_seq + 1
-        else:
-            new_seq = 1
-        new_order_number = f"{today_str}-{new_seq:02d}"
-        while Order.objects.filter(order_number=new_order_number).exists():
-            new_seq += 1
-            new_order_number = f"{today_str}-{new_seq:02d}"
-        
         # Handle receipt image and payment option
         receipt_image = self.request.FILES.get('receipt_image')
         payment_option = self.request.data.get('payment_option', 'cash')
         
         # If receipt image is provided, it should be in the request data
         if receipt_image:
-            print(f"[DEBUG] Order creation - Receipt image provided: {receipt_image.name}")
+            logger.debug("Order creation - Receipt image provided: %s", receipt_image.name)
         
         # Handle items data - could be from JSON or regular form data
         items_data = self.request.data.get('items', [])
@@ -269,9 +206,9 @@ class OrderListView(generics.ListCreateAPIView):
             try:
                 import json
                 items_data = json.loads(items_data)
-                print(f"[DEBUG] Order creation - Parsed items from JSON string: {len(items_data)} items")
+                logger.debug("Order creation - Parsed items from JSON string: %s items", len(items_data))
             except json.JSONDecodeError as e:
-                print(f"[ERROR] Order creation - Failed to parse items JSON: {e}")
+                logger.error("Order creation - Failed to parse items JSON: %s", e)
                 items_data = []
         
         if not items_data:
@@ -279,40 +216,30 @@ class OrderListView(generics.ListCreateAPIView):
         
         # Create the order
         order_data = {
-            'order_number': new_order_number,
             'table': table,
             'created_by': user,
             'branch': table.branch,
             'payment_option': payment_option,
         }
         
-        # Create order instance
-        order = Order.objects.create(**order_data)
-        
-        # Create order items
-        total = 0
-        for item_data in items_data:
-            item = OrderItem.objects.create(
-                order=order,
-                name=item_data.get('name'),
-                quantity=item_data.get('quantity', 1),
-                price=item_data.get('price', 0),
-                item_type=item_data.get('item_type'),
-                product_id=item_data.get('product'),
-                status='pending'
-            )
-            if item.status == 'accepted':
-                total += item.price * item.quantity
-        
-        # Set order total and save
-        order.total_money = total
-        order.save()
-        
-        # Update table status to reflect the new order
-        table.update_status_from_order(order)
+        # The order number, the order, its items and the table status are saved
+        # together, or not at all; a failed insert gives its number back
+        with transaction.atomic():
+            # This is a new order
+            order_data['order_number'] = allocate_order_number(table.branch_id)
+
+            # Create order instance
+            order = Order.objects.create(**order_data)
+
+            # Create order items, then set the order total (accepted items only) and statuses
+            items = add_order_items(order, items_data, status='pending', default_item_type=None)
+
+            # Update table status to reflect the new order
+            table.update_status_from_order(order)
+        events.order_created(order, items)
         
-        print(f"[DEBUG] New order created: {order.order_number} for table {table.number}")
-        print(f"[DEBUG] Table status updated to: {table.status}")
+        logger.debug("New order created: %s for table %s", order.order_number, table.number)
+        logger.debug("Table status updated to: %s", table.status)
         
         return order
 
@@ -337,55 +264,31 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        print(f"[DEBUG] OrderDetailView.get_queryset - User: {user.username if user.is_authenticated else 'Anonymous'}")
-        print(f"[DEBUG] OrderDetailView.get_queryset - User authenticated: {user.is_authenticated}")
-        print(f"[DEBUG] OrderDetailView.get_queryset - User role: {getattr(user, 'role', 'None')}")
-        
-        # Check for session key in headers as fallback
-        if not user.is_authenticated:
-            session_key = self.request.headers.get('X-Session-Key')
-            if session_key:
-                try:
-                    from django.contrib.sessions.models import Session
-                    from django.contrib.auth import get_user_model
-                    
-                    # Get session data
-                    session = Session.objects.get(session_key=session_key)
-                    user_id = session.get_decoded().get('_auth_user_id')
-                    
-                    if user_id:
-                        User = get_user_model()
-                        user = User.objects.get(id=user_id)
-                        print(f"[DEBUG] User authenticated via session key in OrderDetailView: {user.username}")
-                    else:
-                        print(f"[DEBUG] No user ID found in session in OrderDetailView: {session_key}")
-                        return Order.objects.none()
-                except (Session.DoesNotExist, User.DoesNotExist) as e:
-                    print(f"[DEBUG] Session validation failed in OrderDetailView: {e}")
-                    return Order.objects.none()
+        logger.debug("OrderDetailView.get_queryset - User: %s", user.username if user.is_authenticated else 'Anonymous')
+        logger.debug("OrderDetailView.get_queryset - User authenticated: %s", user.is_authenticated)
+        logger.debug("OrderDetailView.get_queryset - User role: %s", getattr(user, 'role', 'None'))
         
         if not user.is_authenticated:
-            print(f"[DEBUG] OrderDetailView.get_queryset - User not authenticated, returning empty queryset")
+            logger.debug("OrderDetailView.get_queryset - User not authenticated, returning empty queryset")
             return Order.objects.none()
         
         # Check user role and filter accordingly
         if user.is_superuser:
             # Superuser can see all orders
             queryset = Order.objects.prefetch_related('items').all()
-            print(f"[DEBUG] OrderDetailView.get_queryset - Superuser - showing all orders: {queryset.count()}")
+            logger.debug("OrderDetailView.get_queryset - Superuser - showing all orders")
         elif hasattr(user, 'role') and user.role in ['manager', 'owner', 'cashier']:
             # Managers, owners, and cashiers can see all orders in their branch
             if hasattr(user, 'branch') and user.branch:
                 queryset = Order.objects.filter(branch=user.branch).prefetch_related('items')
-                print(f"[DEBUG] OrderDetailView.get_queryset - {user.role} - showing orders for branch {user.branch.name}: {queryset.count()}")
+                logger.debug("OrderDetailView.get_queryset - %s - showing orders for branch %s", user.role, user.branch.name)
             else:
                 queryset = Order.objects.prefetch_related('items').all()
-                print(f"[DEBUG] OrderDetailView.get_queryset - {user.role} without branch - showing all orders: {queryset.count()}")
+                logger.debug("OrderDetailView.get_queryset - %s without branch - showing all orders", user.role)
         else:
             # Waiters and other users can only see their own orders
             queryset = Order.objects.filter(created_by=user).prefetch_related('items')
-            print(f"[DEBUG] OrderDetailView.get_queryset - Waiter {user.username} - showing own orders: {queryset.count()}")
-            print(f"[DEBUG] OrderDetailView.get_queryset - Orders created by user {user.id}: {list(queryset.values_list('id', 'order_number'))}")
+            logger.debug("OrderDetailView.get_queryset - Waiter %s - showing own orders", user.username)
         
         return queryset
 
@@ -394,66 +297,44 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
         Custom get_object method with better debugging and error handling
         """
         try:
-            print(f"[DEBUG] OrderDetailView.get_object - User: {self.request.user.username if self.request.user.is_authenticated else 'Anonymous'}")
-            print(f"[DEBUG] OrderDetailView.get_object - User authenticated: {self.request.user.is_authenticated}")
-            print(f"[DEBUG] OrderDetailView.get_object - User role: {getattr(self.request.user, 'role', 'None')}")
+            logger.debug("OrderDetailView.get_object - User: %s", self.request.user.username if self.request.user.is_authenticated else 'Anonymous')
+            logger.debug("OrderDetailView.get_object - User authenticated: %s", self.request.user.is_authenticated)
+            logger.debug("OrderDetailView.get_object - User role: %s", getattr(self.request.user, 'role', 'None'))
             
-            # Check for session key in headers as fallback
             user = self.request.user
             if not user.is_authenticated:
-                session_key = self.request.headers.get('X-Session-Key')
-                if session_key:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        from django.contrib.auth import get_user_model
-                        
-                        # Get session data
-                        session = Session.objects.get(session_key=session_key)
-                        user_id = session.get_decoded().get('_auth_user_id')
-                        
-                        if user_id:
-                            User = get_user_model()
-                            user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] User authenticated via session key in get_object: {user.username}")
-                        else:
-                            print(f"[DEBUG] No user ID found in session in get_object: {session_key}")
-                            raise PermissionDenied("Invalid session")
-                    except (Session.DoesNotExist, User.DoesNotExist) as e:
-                        print(f"[DEBUG] Session validation failed in get_object: {e}")
-                        raise PermissionDenied("Invalid session")
-                else:
-                    raise PermissionDenied("Authentication required")
+                raise PermissionDenied("Authentication required")
             
             # Get the order
             order_id = self.kwargs.get('pk')
-            print(f"[DEBUG] OrderDetailView.get_object - Looking for order ID: {order_id}")
+            logger.debug("OrderDetailView.get_object - Looking for order ID: %s", order_id)
             
             # Check user role and filter accordingly
             if user.is_superuser:
                 # Superuser can see all orders
                 order = Order.objects.get(id=order_id)
-                print(f"[DEBUG] Superuser - order access granted")
+                logger.debug("Superuser - order access granted")
             elif hasattr(user, 'role') and user.role in ['manager', 'owner', 'cashier']:
                 # Managers, owners, and cashiers can see all orders in their branch
                 if hasattr(user, 'branch') and user.branch:
                     order = Order.objects.get(id=order_id, branch=user.branch)
-                    print(f"[DEBUG] {user.role} - order access granted for branch {user.branch.name}")
+                    logger.debug("%s - order access granted for branch %s", user.role, user.branch.name)
                 else:
                     order = Order.objects.get(id=order_id)
-                    print(f"[DEBUG] {user.role} without branch - order access granted")
+                    logger.debug("%s without branch - order access granted", user.role)
             else:
                 # Waiters and other users can only see their own orders
                 order = Order.objects.get(id=order_id, created_by=user)
-                print(f"[DEBUG] Waiter {user.username} - order access granted (own order)")
+                logger.debug("Waiter %s - order access granted (own order)", user.username)
             
-            print(f"[DEBUG] OrderDetailView.get_object - Order found: {order.id}, Order number: {order.order_number}")
+            logger.debug("OrderDetailView.get_object - Order found: %s, Order number: %s", order.id, order.order_number)
             return order
             
         except Order.DoesNotExist:
-            print(f"[ERROR] OrderDetailView.get_object - Order not found: {self.kwargs.get('pk')}")
+            logger.error("OrderDetailView.get_object - Order not found: %s", self.kwargs.get('pk'))
             raise NotFound("Order not found")
         except Exception as e:
-            print(f"[ERROR] OrderDetailView.get_object - Exception: {str(e)}")
+            logger.error("OrderDetailView.get_object - Exception: %s", e)
             raise e
 
     def retrieve(self, request, *args, **kwargs):
@@ -461,56 +342,27 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
         Custom retrieve method with better debugging and error handling
         """
         try:
-            print(f"[DEBUG] OrderDetailView.retrieve - User: {request.user.username if request.user.is_authenticated else 'Anonymous'}")
-            print(f"[DEBUG] OrderDetailView.retrieve - Order ID: {kwargs.get('pk')}")
-            print(f"[DEBUG] OrderDetailView.retrieve - User authenticated: {request.user.is_authenticated}")
-            print(f"[DEBUG] OrderDetailView.retrieve - User role: {getattr(request.user, 'role', 'None')}")
+            logger.debug("OrderDetailView.retrieve - User: %s", request.user.username if request.user.is_authenticated else 'Anonymous')
+            logger.debug("OrderDetailView.retrieve - Order ID: %s", kwargs.get('pk'))
+            logger.debug("OrderDetailView.retrieve - User authenticated: %s", request.user.is_authenticated)
+            logger.debug("OrderDetailView.retrieve - User role: %s", getattr(request.user, 'role', 'None'))
             
-            # Check for session key in headers as fallback
-            user = request.user
-            if not user.is_authenticated:
-                session_key = request.headers.get('X-Session-Key')
-                if session_key:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        from django.contrib.auth import get_user_model
-                        
-                        # Get session data
-                        session = Session.objects.get(session_key=session_key)
-                        user_id = session.get_decoded().get('_auth_user_id')
-                        
-                        if user_id:
-                            User = get_user_model()
-                            user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] User authenticated via session key in retrieve: {user.username}")
-                        else:
-                            print(f"[DEBUG] No user ID found in session in retrieve: {session_key}")
-                            return Response(
-                                {"error": "Invalid session"}, 
-                                status=status.HTTP_401_UNAUTHORIZED
-                            )
-                    except (Session.DoesNotExist, User.DoesNotExist) as e:
-                        print(f"[DEBUG] Session validation failed in retrieve: {e}")
-                        return Response(
-                            {"error": "Invalid session"}, 
-                            status=status.HTTP_401_UNAUTHORIZED
-                        )
-                else:
-                    return Response(
-                        {"error": "Authentication required"}, 
-                        status=status.HTTP_401_UNAUTHORIZED
-                    )
+            if not request.user.is_authenticated:
+                return Response(
+                    {"error": "Authentication required"}, 
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
             
             instance = self.get_object()
-            print(f"[DEBUG] OrderDetailView.retrieve - Order found: {instance.id}, Order number: {instance.order_number}")
+            logger.debug("OrderDetailView.retrieve - Order found: %s, Order number: %s", instance.id, instance.order_number)
             
             serializer = self.get_serializer(instance)
             response_data = serializer.data
-            print(f"[DEBUG] OrderDetailView.retrieve - Response data keys: {list(response_data.keys())}")
+            logger.debug("OrderDetailView.retrieve - Response data keys: %s", list(response_data.keys()))
             
             return Response(response_data)
         except Exception as e:
-            print(f"[ERROR] OrderDetailView.retrieve - Exception: {str(e)}")
+            logger.error("OrderDetailView.retrieve - Exception: %s", e)
             return Response(
                 {"error": f"Failed to retrieve order: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -521,60 +373,31 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
         Custom update method with better debugging and error handling
         """
         try:
-            print(f"[DEBUG] OrderDetailView.update - User: {request.user.username if request.user.is_authenticated else 'Anonymous'}")
-            print(f"[DEBUG] OrderDetailView.update - Order ID: {kwargs.get('pk')}")
-            print(f"[DEBUG] OrderDetailView.update - User authenticated: {request.user.is_authenticated}")
-            print(f"[DEBUG] OrderDetailView.update - User role: {getattr(request.user, 'role', 'None')}")
+            logger.debug("OrderDetailView.update - User: %s", request.user.username if request.user.is_authenticated else 'Anonymous')
+            logger.debug("OrderDetailView.update - Order ID: %s", kwargs.get('pk'))
+            logger.debug("OrderDetailView.update - User authenticated: %s", request.user.is_authenticated)
+            logger.debug("OrderDetailView.update - User role: %s", getattr(request.user, 'role', 'None'))
             
-            # Check for session key in headers as fallback
-            user = request.user
-            if not user.is_authenticated:
-                session_key = request.headers.get('X-Session-Key')
-                if session_key:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        from django.contrib.auth import get_user_model
-                        
-                        # Get session data
-                        session = Session.objects.get(session_key=session_key)
-                        user_id = session.get_decoded().get('_auth_user_id')
-                        
-                        if user_id:
-                            User = get_user_model()
-                            user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] User authenticated via session key in update: {user.username}")
-                        else:
-                            print(f"[DEBUG] No user ID found in session in update: {session_key}")
-                            return Response(
-                                {"error": "Invalid session"}, 
-                                status=status.HTTP_401_UNAUTHORIZED
-                            )
-                    except (Session.DoesNotExist, User.DoesNotExist) as e:
-                        print(f"[DEBUG] Session validation failed in update: {e}")
-                        return Response(
-                            {"error": "Invalid session"}, 
-                            status=status.HTTP_401_UNAUTHORIZED
-                        )
-                else:
-                    return Response(
-                        {"error": "Authentication required"}, 
-                        status=status.HTTP_401_UNAUTHORIZED
-                    )
+            if not request.user.is_authenticated:
+                return Response(
+                    {"error": "Authentication required"}, 
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
             
             instance = self.get_object()
-            print(f"[DEBUG] OrderDetailView.update - Order found: {instance.id}, Order number: {instance.order_number}")
+            logger.debug("OrderDetailView.update - Order found: %s, Order number: %s", instance.id, instance.order_number)
             
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
-                print(f"[DEBUG] OrderDetailView.update - Order updated successfully")
+                logger.debug("OrderDetailView.update - Order updated successfully")
                 return Response(serializer.data)
             else:
-                print(f"[DEBUG] OrderDetailView.update - Validation errors: {serializer.errors}")
+                logger.debug("OrderDetailView.update - Validation errors: %s", serializer.errors)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
                 
         except Exception as e:
-            print(f"[ERROR] OrderDetailView.update - Exception: {str(e)}")
+            logger.error("OrderDetailView.update - Exception: %s", e)
             return Response(
                 {"error": f"Failed to update order: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -585,55 +408,26 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
         Custom destroy method with better debugging and error handling
         """
         try:
-            print(f"[DEBUG] OrderDetailView.destroy - User: {request.user.username if request.user.is_authenticated else 'Anonymous'}")
-            print(f"[DEBUG] OrderDetailView.destroy - Order ID: {kwargs.get('pk')}")
-            print(f"[DEBUG] OrderDetailView.destroy - User authenticated: {request.user.is_authenticated}")
-            print(f"[DEBUG] OrderDetailView.destroy - User role: {getattr(request.user, 'role', 'None')}")
+            logger.debug("OrderDetailView.destroy - User: %s", request.user.username if request.user.is_authenticated else 'Anonymous')
+            logger.debug("OrderDetailView.destroy - Order ID: %s", kwargs.get('pk'))
+            logger.debug("OrderDetailView.destroy - User authenticated: %s", request.user.is_authenticated)
+            logger.debug("OrderDetailView.destroy - User role: %s", getattr(request.user, 'role', 'None'))
             
-            # Check for session key in headers as fallback
-            user = request.user
-            if not user.is_authenticated:
-                session_key = request.headers.get('X-Session-Key')
-                if session_key:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        from django.contrib.auth import get_user_model
-                        
-                        # Get session data
-                        session = Session.objects.get(session_key=session_key)
-                        user_id = session.get_decoded().get('_auth_user_id')
-                        
-                        if user_id:
-                            User = get_user_model()
-                            user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] User authenticated via session key in destroy: {user.username}")
-                        else:
-                            print(f"[DEBUG] No user ID found in session in destroy: {session_key}")
-                            return Response(
-                                {"error": "Invalid session"}, 
-                                status=status.HTTP_401_UNAUTHORIZED
-                            )
-                    except (Session.DoesNotExist, User.DoesNotExist) as e:
-                        print(f"[DEBUG] Session validation failed in destroy: {e}")
-                        return Response(
-                            {"error": "Invalid session"}, 
-                            status=status.HTTP_401_UNAUTHORIZED
-                        )
-                else:
-                    return Response(
-                        {"error": "Authentication required"}, 
-                        status=status.HTTP_401_UNAUTHORIZED
-                    )
+            if not request.user.is_authenticated:
+                return Response(
+                    {"error": "Authentication required"}, 
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
             
             instance = self.get_object()
-            print(f"[DEBUG] OrderDetailView.destroy - Order found: {instance.id}, Order number: {instance.order_number}")
+            logger.debug("OrderDetailView.destroy - Order found: %s, Order number: %s", instance.id, instance.order_number)
             
             instance.delete()
-            print(f"[DEBUG] OrderDetailView.destroy - Order deleted successfully")
+            logger.debug("OrderDetailView.destroy - Order deleted successfully")
             return Response(status=status.HTTP_204_NO_CONTENT)
                 
         except Exception as e:
-            print(f"[ERROR] OrderDetailView.destroy - Exception: {str(e)}")
+            logger.error("OrderDetailView.destroy - Exception: %s", e)
             return Response(
                 {"error": f"Failed to delete order: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -643,39 +437,11 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
     def upload_receipt(self, request, pk=None):
         """Upload receipt image for an order"""
         try:
-            # Check authentication
-            user = request.user
-            if not user.is_authenticated:
-                session_key = request.headers.get('X-Session-Key')
-                if session_key:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        from django.contrib.auth import get_user_model
-                        
-                        # Get session data
-                        session = Session.objects.get(session_key=session_key)
-                        user_id = session.get_decoded().get('_auth_user_id')
-                        
-                        if user_id:
-                            User = get_user_model()
-                            user = User.objects.get(id=user_id)
-                            print(f"[DEBUG] User authenticated via session key in upload_receipt: {user.username}")
-                        else:
-                            return Response(
-                                {"error": "Invalid session"}, 
-                                status=status.HTTP_401_UNAUTHORIZED
-                            )
-                    except (Session.DoesNotExist, User.DoesNotExist) as e:
-                        print(f"[DEBUG] Session validation failed in upload_receipt: {e}")
-                        return Response(
-                            {"error": "Invalid session"}, 
-                            status=status.HTTP_401_UNAUTHORIZED
-                        )
-                else:
-                    return Response(
-                        {"error": "Authentication required"}, 
-                        status=status.HTTP_401_UNAUTHORIZED
-                    )
+            if not request.user.is_authenticated:
+                return Response(
+                    {"error": "Authentication required"}, 
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
             
             order = self.get_object()
             receipt_image = request.FILES.get('receipt_image')
@@ -694,98 +460,53 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
             return Response(serializer.data)
             
         except Exception as e:
-            print(f"[ERROR] upload_receipt - Exception: {str(e)}")
+            logger.error("upload_receipt - Exception: %s", e)
             return Response(
                 {"error": f"Failed to upload receipt: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
-class FoodOrderListView(generics.ListAPIView):
-    serializer_class = FoodOrderSerializer
+class StationQueueView(generics.ListAPIView):
+    """
+    Open tickets for one station, served from the open-ticket index
+    (orders/queues.py) in a fixed number of queries.
+    """
     permission_classes = [AllowAny]
+    station = None
+
+    @traced(logger, 'StationQueueView.list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def get_queryset(self):
         user = self.request.user
         if not user.is_authenticated:
             return Order.objects.none()
         
-        # Filter by user's branch and ensure orders actually contain food items
+        date = self.request.query_params.get('date')
         if hasattr(user, 'branch') and user.branch:
-            queryset = Order.objects.filter(
-                branch=user.branch,
-                food_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='food'  # Only orders with food items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] Filtering food orders for branch: {user.branch.name}")
+            logger.debug("Filtering %s orders for branch: %s", self.station, user.branch.name)
+            return open_tickets(self.station, branch=user.branch, date=date)
         elif user.is_superuser:
-            # Superuser can see all food orders
-            queryset = Order.objects.filter(
-                food_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='food'  # Only orders with food items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] Superuser - showing all food orders")
+            logger.debug("Superuser - showing all %s orders", self.station)
+            return open_tickets(self.station, date=date)
         else:
-            # For users without branch, show only their own food orders
-            queryset = Order.objects.filter(
-                created_by=user,
-                food_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='food'  # Only orders with food items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] User without branch - showing only own food orders")
-        
-        date = self.request.query_params.get('date')
-        if date:
-            queryset = queryset.filter(created_at__date=date)
-        
-        return queryset
+            # For users without branch, show only their own orders
+            logger.debug("User without branch - showing only own %s orders", self.station)
+            return open_tickets(self.station, created_by=user, date=date)
 
-class BeverageOrderListView(generics.ListAPIView):
-    serializer_class = BeverageOrderSerializer
-    permission_classes = [AllowAny]
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Order.objects.none()
-        
-        # Filter by user's branch and ensure orders actually contain beverage items
-        if hasattr(user, 'branch') and user.branch:
-            # Show orders that have beverage items AND are pending beverage preparation
-            # This includes mixed orders (food + beverage) - they appear in both dashboards
-            queryset = Order.objects.filter(
-                branch=user.branch,
-                beverage_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='beverage'  # Only orders with beverage items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] Filtering beverage orders for branch: {user.branch.name}")
-        elif user.is_superuser:
-            # Superuser can see all beverage orders
-            queryset = Order.objects.filter(
-                beverage_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='beverage'  # Only orders with beverage items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] Superuser - showing all beverage orders")
-        else:
-            # For users without branch, show only their own beverage orders
-            queryset = Order.objects.filter(
-                created_by=user,
-                beverage_status__in=['pending', 'preparing', 'completed'],
-                cashier_status__in=['pending', 'ready_for_payment', 'printed'],
-                items__item_type='beverage'  # Only orders with beverage items
-            ).prefetch_related('items').distinct()
-            print(f"[DEBUG] User without branch - showing only own beverage orders")
-        
-        date = self.request.query_params.get('date')
-        if date:
-            queryset = queryset.filter(created_at__date=date)
-        
-        return queryset
+class FoodOrderListView(StationQueueView):
+    # Kitchen queue: food and meat items
+    serializer_class = FoodOrderSerializer
+    station = 'food'
+
+
+class BeverageOrderListView(StationQueueView):
+    # Bar queue: mixed orders show up here and in the kitchen queue
+    serializer_class = BeverageOrderSerializer
+    station = 'beverage'
 
 
 class UpdateCashierStatusView(generics.UpdateAPIView):
@@ -797,9 +518,80 @@ class UpdateCashierStatusView(generics.UpdateAPIView):
         instance = self.get_object()
         instance.cashier_status = 'printed'
         instance.save()
+        events.order_printed(instance)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+class OrderChangeFeedView(APIView):
+    """
+    Delta-sync feed for the dashboards (orders/changes.py).
+
+    GET ?scope=orders|printed|food|beverage&cursor=<id>
+
+    Without a cursor (or with one older than the retained log) the response has
+    ``reset: true`` and the current cursor: load the full list once from the
+    regular endpoint, then poll here with the returned cursor. Each poll returns
+    the orders of the scope changed since the cursor, the ids of changed orders
+    that left the scope (``closed``) and of deleted orders (``deleted``).
+    """
+    permission_classes = [AllowAny]
+    serializers_by_scope = {
+        'orders': OrderSerializer,
+        'printed': OrderSerializer,
+        'food': FoodOrderSerializer,
+        'beverage': BeverageOrderSerializer,
+    }
+
+    def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        scope = request.query_params.get('scope', 'orders')
+        serializer_class = self.serializers_by_scope.get(scope)
+        if serializer_class is None:
+            return Response({"error": f"Unknown scope: {scope}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Same visibility as the list endpoints the feed replaces
+        branch = getattr(user, 'branch', None)
+        created_by = None
+        if user.is_superuser:
+            branch = None
+        elif scope in ('orders', 'printed') and getattr(user, 'role', None) not in ['manager', 'owner', 'cashier']:
+            created_by = user
+        elif not branch:
+            created_by = user
+
+        cursor = request.query_params.get('cursor')
+        if cursor in (None, ''):
+            return Response(self.reset_response(branch))
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            return Response({"error": "cursor must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if cursor_expired(cursor):
+            return Response(self.reset_response(branch))
+
+        changed_ids, deleted_ids, next_cursor, has_more = read_changes(cursor, branch=branch)
+        orders = []
+        if changed_ids:
+            orders = list(feed_queryset(scope, branch=branch, created_by=created_by).filter(pk__in=changed_ids))
+        returned = {order.pk for order in orders}
+
+        return Response({
+            'cursor': next_cursor,
+            'reset': False,
+            'has_more': has_more,
+            'orders': serializer_class(orders, many=True, context={'request': request}).data,
+            'closed': [order_id for order_id in changed_ids if order_id not in returned],
+            'deleted': deleted_ids,
+        })
+
+    def reset_response(self, branch):
+        return {'cursor': latest_cursor(branch), 'reset': True, 'has_more': False,
+                'orders': [], 'closed': [], 'deleted': []}
+
+
 class PrintedOrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [AllowAny]
@@ -815,7 +607,7 @@ class PrintedOrderListView(generics.ListAPIView):
             queryset = Order.objects.filter(
                 cashier_status='printed'
             )
-            print(f"[DEBUG] Superuser - showing all printed orders")
+            logger.debug("Superuser - showing all printed orders")
         elif hasattr(user, 'role') and user.role in ['manager', 'owner', 'cashier']:
             # Managers, owners, and cashiers can see all printed orders in their branch
             if hasattr(user, 'branch') and user.branch:
@@ -823,19 +615,19 @@ class PrintedOrderListView(generics.ListAPIView):
                     branch=user.branch,
                     cashier_status='printed'
                 )
-                print(f"[DEBUG] {user.role} - showing all printed orders for branch: {user.branch.name}")
+                logger.debug("%s - showing all printed orders for branch: %s", user.role, user.branch.name)
             else:
                 queryset = Order.objects.filter(
                     cashier_status='printed'
                 )
-                print(f"[DEBUG] {user.role} without branch - showing all printed orders")
+                logger.debug("%s without branch - showing all printed orders", user.role)
         else:
             # Waiters and other users can only see their own printed orders
             queryset = Order.objects.filter(
                 created_by=user,
                 cashier_status='printed'
             )
-            print(f"[DEBUG] Waiter {user.username} - showing only own printed orders")
+            logger.debug("Waiter %s - showing only own printed orders", user.username)
         
         date = self.request.query_params.get('date')
         if date:
@@ -852,25 +644,25 @@ class UpdatePaymentOptionView(generics.UpdateAPIView):
         instance = self.get_object()
         payment_option = request.data.get('payment_option')
         
-        print(f"[DEBUG] UpdatePaymentOptionView - Order ID: {instance.id}")
-        print(f"[DEBUG] UpdatePaymentOptionView - Order Number: {instance.order_number}")
-        print(f"[DEBUG] UpdatePaymentOptionView - Current payment_option: {instance.payment_option}")
-        print(f"[DEBUG] UpdatePaymentOptionView - New payment_option: {payment_option}")
-        print(f"[DEBUG] UpdatePaymentOptionView - Request user: {request.user}")
+        logger.debug("UpdatePaymentOptionView - Order ID: %s", instance.id)
+        logger.debug("UpdatePaymentOptionView - Order Number: %s", instance.order_number)
+        logger.debug("UpdatePaymentOptionView - Current payment_option: %s", instance.payment_option)
+        logger.debug("UpdatePaymentOptionView - New payment_option: %s", payment_option)
+        logger.debug("UpdatePaymentOptionView - Request user: %s", request.user)
         
         # Check if order has been processed (has a payment)
         from payments.models import Payment
         has_payment = Payment.objects.filter(order=instance).exists()
         
         if has_payment:
-            print(f"[DEBUG] UpdatePaymentOptionView - Order has been processed, payment option cannot be changed")
+            logger.debug("UpdatePaymentOptionView - Order has been processed, payment option cannot be changed")
             return Response({
                 'error': 'Payment option cannot be changed after order has been processed'
             }, status=400)
         
         # Check if order has been printed
         if instance.cashier_status == 'printed':
-            print(f"[DEBUG] UpdatePaymentOptionView - Order has been printed, payment option cannot be changed")
+            logger.debug("UpdatePaymentOptionView - Order has been printed, payment option cannot be changed")
             return Response({
                 'error': 'Payment option cannot be changed after order has been printed'
             }, status=400)
@@ -878,15 +670,15 @@ class UpdatePaymentOptionView(generics.UpdateAPIView):
         if payment_option in ['cash', 'online']:
             instance.payment_option = payment_option
             instance.save()
-            print(f"[DEBUG] UpdatePaymentOptionView - Payment option updated successfully to: {instance.payment_option}")
+            logger.debug("UpdatePaymentOptionView - Payment option updated successfully to: %s", instance.payment_option)
             
             serializer = self.get_serializer(instance)
             response_data = serializer.data
-            print(f"[DEBUG] UpdatePaymentOptionView - Response payment_option: {response_data.get('payment_option')}")
+            logger.debug("UpdatePaymentOptionView - Response payment_option: %s", response_data.get('payment_option'))
             
             return Response(response_data)
         
-        print(f"[ERROR] UpdatePaymentOptionView - Invalid payment option: {payment_option}")
+        logger.error("UpdatePaymentOptionView - Invalid payment option: %s", payment_option)
         return Response({'error': 'Invalid payment option'}, status=400)
 
 class PrintOrderView(generics.UpdateAPIView):
@@ -897,10 +689,10 @@ class PrintOrderView(generics.UpdateAPIView):
     def patch(self, request, *args, **kwargs):
         instance = self.get_object()
         
-        print(f"[DEBUG] PrintOrderView - Order ID: {instance.id}")
-        print(f"[DEBUG] PrintOrderView - Order Number: {instance.order_number}")
-        print(f"[DEBUG] PrintOrderView - Current cashier_status: {instance.cashier_status}")
-        print(f"[DEBUG] PrintOrderView - Request user: {request.user}")
+        logger.debug("PrintOrderView - Order ID: %s", instance.id)
+        logger.debug("PrintOrderView - Order Number: %s", instance.order_number)
+        logger.debug("PrintOrderView - Current cashier_status: %s", instance.cashier_status)
+        logger.debug("PrintOrderView - Request user: %s", request.user)
         
         # Check if order can be printed
         if instance.cashier_status == 'printed':
@@ -917,6 +709,7 @@ class PrintOrderView(generics.UpdateAPIView):
         # Update order status to printed
         instance.cashier_status = 'printed'
         instance.save()
+        events.order_printed(instance)
         
         # Automatically reset table status to allow new orders
         if instance.table:
@@ -926,11 +719,11 @@ class PrintOrderView(generics.UpdateAPIView):
                 table = instance.table
                 table.status = 'available'
                 table.save()
-                print(f"[DEBUG] PrintOrderView - Table {table.number} status reset to 'available' for new orders")
+                logger.debug("PrintOrderView - Table %s status reset to 'available' for new orders", table.number)
             except Exception as e:
-                print(f"[WARNING] PrintOrderView - Failed to reset table status: {e}")
+                logger.warning("PrintOrderView - Failed to reset table status: %s", e)
         
-        print(f"[DEBUG] PrintOrderView - Order printed successfully and table reset for new orders")
+        logger.debug("PrintOrderView - Order printed successfully and table reset for new orders")
         
         serializer = self.get_serializer(instance)
         return Response({
@@ -958,7 +751,7 @@ class ResetTableStatusView(APIView):
             table.status = 'available'
             table.save()
             
-            print(f"[DEBUG] ResetTableStatusView - Table {table.number} manually reset to 'available' for new orders")
+            logger.debug("ResetTableStatusView - Table %s manually reset to 'available' for new orders", table.number)
             
             return Response({
                 'message': f'Table {table.number} reset successfully. Ready for new orders.',
@@ -969,7 +762,7 @@ class ResetTableStatusView(APIView):
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=404)
         except Exception as e:
-            print(f"[ERROR] ResetTableStatusView - Exception: {str(e)}")
+            logger.error("ResetTableStatusView - Exception: %s", e)
             return Response({'error': f'Error resetting table: {str(e)}'}, status=500)
 
 
@@ -1014,7 +807,7 @@ class CancelOrderView(APIView):
             order.save()
             
             # Log the cancellation for reporting
-            print(f"[CANCELLATION] Order {order.order_number} cancelled. Reason: {reason}")
+            logger.debug("[CANCELLATION] Order %s cancelled. Reason: %s", order.order_number, reason)
             
             return Response({
                 'message': 'Order cancelled successfully',
@@ -1035,16 +828,15 @@ class DailySalesSummaryView(APIView):
         date = request.query_params.get('date')
         if not date:
             return Response({'error': 'Date is required'}, status=400)
-        payments = Payment.objects.filter(processed_at__date=parse_date(date), is_completed=True)
-        total_orders = payments.count()
-        total_sales = sum(p.amount for p in payments)
-        cash_sales = sum(p.amount for p in payments if p.payment_method == 'cash')
-        online_sales = sum(p.amount for p in payments if p.payment_method == 'online')
+        day = parse_date(date)
+        if day is None:
+            return Response({'error': 'Invalid date'}, status=400)
+        totals = sales_totals(day, day)
         return Response({
-            'total_orders': total_orders,
-            'total_sales': total_sales,
-            'cash_sales': cash_sales,
-            'online_sales': online_sales,
+            'total_orders': totals['total_orders'],
+            'total_sales': totals['total_sales'],
+            'cash_sales': totals['cash_sales'],
+            'online_sales': totals['online_sales'],
         })
 
 class SalesReportView(APIView):
@@ -1055,37 +847,21 @@ class SalesReportView(APIView):
         end = request.query_params.get('end')
         if not (start and end):
             return Response({'error': 'Start and end dates are required'}, status=400)
-        payments = Payment.objects.filter(processed_at__date__range=[parse_date(start), parse_date(end)], is_completed=True)
-        total_orders = payments.count()
-        total_sales = sum(p.amount for p in payments)
-        cash_sales = sum(p.amount for p in payments if p.payment_method == 'cash')
-        online_sales = sum(p.amount for p in payments if p.payment_method == 'online')
-
-        # Get all paid orders in the range
-        paid_order_ids = payments.values_list('order_id', flat=True)
-        items = OrderItem.objects.filter(order_id__in=paid_order_ids)
-        items = items.annotate(
-            revenue=ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField())
-        )
-        top_items = (
-            items.values('name')
-            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
-            .order_by('-quantity')[:10]
-        )
+        start, end = parse_date(start), parse_date(end)
+        if start is None or end is None:
+            return Response({'error': 'Invalid date'}, status=400)
+        totals = sales_totals(start, end)
+
         top_selling_items = [
-            {
-                'name': i['name'],
-                'quantity': i['quantity'],
-                'revenue': float(i['revenue']) if i['revenue'] is not None else 0.0
-            }
-            for i in top_items
+            {'name': i['name'], 'quantity': i['quantity'], 'revenue': float(i['revenue'])}
+            for i in top_items(start, end)
         ]
 
         return Response({
-            'total_orders': total_orders,
-            'total_sales': total_sales,
-            'cash_sales': cash_sales,
-            'online_sales': online_sales,
+            'total_orders': totals['total_orders'],
+            'total_sales': totals['total_sales'],
+            'cash_sales': totals['cash_sales'],
+            'online_sales': totals['online_sales'],
             'top_selling_items': top_selling_items,
         })
 
@@ -1126,7 +902,7 @@ class WaiterStatsView(APIView):
         # Placeholder for rating (could be implemented later)
         average_rating = 0.0
         
-        print(f"[DEBUG] Daily Waiter Stats for {waiter.username}: Date={today}, Orders={total_orders_today}, Sales={total_sales_today}, ActiveTables={active_tables_today}")
+        logger.debug("Daily Waiter Stats for %s: Date=%s, Orders=%s, Sales=%s, ActiveTables=%s", waiter.username, today, total_orders_today, total_sales_today, active_tables_today)
 
         return Response({
             'total_orders': total_orders_today,
@@ -1144,12 +920,14 @@ from decimal import Decimal
 class OrderItemStatusUpdateView(APIView):
     permission_classes = [AllowAny]
 
+    @traced(logger, 'OrderItemStatusUpdateView.patch')
     @transaction.atomic
     def patch(self, request, pk):
         if not (request.user.is_authenticated and getattr(request.user, 'role', None) in ['meat', 'manager', 'owner', 'waiter', 'bartender', 'cashier']):
             return Response({'error': 'Forbidden'}, status=403)
         try:
-            item = OrderItem.objects.select_related('order').get(pk=pk)
+            # Locked so two clicks cannot both take the item out of stock
+            item = OrderItem.objects.select_for_update(of=('self',)).select_related('order').get(pk=pk)
         except OrderItem.DoesNotExist:
             return Response({'error': 'Order item not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1157,91 +935,22 @@ class OrderItemStatusUpdateView(APIView):
         if status_value not in ['pending', 'accepted', 'rejected']:
             return Response({'error': 'Invalid status value'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Handle beverage stock deduction
-        # if status_value == 'accepted' and item.item_type == 'beverage':
-        #     bartender = request.user
-        #     try:
-        #         barman_stock = BarmanStock.objects.select_related('stock__product').get(
-        #             bartender=bartender,
-        #             stock__product__name__iexact=item.name,
-        #             stock__branch=item.order.branch
-        #         )
-        #     except BarmanStock.DoesNotExist:
-        #         return Response(
-        #             {'error': f"No barman stock found for '{item.name}'"},
-        #             status=status.HTTP_400_BAD_REQUEST
-        #         )
-
-        #     if barman_stock.quantity_in_base_units < item.quantity:
-        #         return Response(
-        #             {
-        #                 'error': (
-        #                     f"Not enough stock. Available: {barman_stock.quantity_in_base_units}, "
-        #                     f"Required: {item.quantity}"
-        #                 )
-        #             },
-        #             status=status.HTTP_400_BAD_REQUEST
-        #         )
-
-        # product = barman_stock.stock.product
-        # try:
-        #     # Assuming you have a method to get conversion factor from base unit to original unit
-        #     conversion_factor = product.get_conversion_factor(product.base_unit, barman_stock.original_unit)
-        #     original_quantity_delta = item.quantity / conversion_factor
-        # except Exception:
-        #     # Fallback: treat original quantity same as base units if conversion unavailable
-        #     original_quantity_delta = item.quantity
-
-        # # Use your adjust_quantity method to deduct stock (make sure this method is in BarmanStock or Stock model)
-        # try:
-        #     barman_stock.adjust_quantity(
-        #         quantity=item.quantity,
-        #         unit=product.base_unit,
-        #         is_addition=False
-        #     )
-        # except Exception as e:
-        #     return Response({'error': f'Stock adjustment failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Update item status
+        # Accepting an item takes it out of stock (the bartender's own stock for
+        # beverages); the status only changes if the deduction succeeds. Taking
+        # the acceptance back puts the stock back.
+        if status_value == 'accepted' and item.status != 'accepted':
+            bartender = request.user if request.user.role == 'bartender' else None
+            try:
+                consume_items([item], bartender=bartender, initiated_by=request.user)
+            except ValidationError as e:
+                return Response({'error': ' '.join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        elif item.status == 'accepted' and status_value != 'accepted':
+            restore_items([item], initiated_by=request.user)
+
+        # Update item status; the post_save handler applies the change to the
+        # order's counters, which re-derives total_money and the station statuses
         item.status = status_value
-        item.save()
-
-        # Update order total money based on accepted items
-        order = item.order
-        accepted_items = order.items.filter(status='accepted')
-        order.total_money = sum(i.price * i.quantity for i in accepted_items)
-
-        # Update order status based on item types
-        food_items = order.items.filter(item_type='food')
-        beverage_items = order.items.filter(item_type='beverage')
-        
-        # Update food_status
-        if food_items.exists():
-            food_statuses = list(food_items.values_list('status', flat=True))
-            if all(s in ['accepted', 'rejected'] for s in food_statuses):
-                if any(s == 'accepted' for s in food_statuses):
-                    order.food_status = 'completed'
-                else:
-                    order.food_status = 'rejected'
-            elif any(s == 'accepted' for s in food_statuses):
-                order.food_status = 'preparing'
-            else:
-                order.food_status = 'pending'
-        
-        # Update beverage_status
-        if beverage_items.exists():
-            beverage_statuses = list(beverage_items.values_list('status', flat=True))
-            if all(s in ['accepted', 'rejected'] for s in beverage_statuses):
-                if any(s == 'accepted' for s in beverage_statuses):
-                    order.beverage_status = 'completed'
-                else:
-                    order.beverage_status = 'rejected'
-            elif any(s == 'accepted' for s in beverage_statuses):
-                order.beverage_status = 'preparing'
-            else:
-                order.beverage_status = 'pending'
-        
-        order.save()
+        item.save(update_fields=['status'])
         
         return Response({'message': 'Order item status updated successfully'})
 
@@ -1545,65 +1254,19 @@ def add_items_to_order(request, order_id):
         if not items_data:
             return Response({'error': 'No items provided'}, status=400)
         
-        # Add new items
-        new_items = []
-        for item_data in items_data:
-            try:
-                new_item = OrderItem.objects.create(
-                    order=order,
-                    name=item_data.get('name'),
-                    quantity=item_data.get('quantity', 1),
-                    price=item_data.get('price', 0),
-                    item_type=item_data.get('item_type', 'food'),
-                    product_id=item_data.get('product_id') or item_data.get('product'),
-                    status='pending'
-                )
-                new_items.append(new_item)
-                print(f"[DEBUG] add_items_to_order - Created item: {new_item.name} ({new_item.item_type})")
-            except Exception as e:
-                print(f"[ERROR] add_items_to_order - Failed to create item {item_data.get('name')}: {str(e)}")
-                return Response({'error': f'Failed to create item: {str(e)}'}, status=400)
-        
-        # Recalculate order total
-        total = sum(item.price * item.quantity for item in order.items.all())
-        order.total_money = total
-        
-        # Update order statuses based on new items
-        if new_items:
-            # Check if we have food or beverage items
-            has_food = order.items.filter(item_type='food').exists()
-            has_beverage = order.items.filter(item_type='beverage').exists()
-            
-            if has_food and order.food_status == 'not_applicable':
-                order.food_status = 'pending'
-            
-            if has_beverage and order.beverage_status == 'not_applicable':
-                order.beverage_status = 'pending'
-        
-        order.save()
+        # Add new items, then recalculate the order total and statuses once
+        try:
+            with transaction.atomic():
+                new_items = add_order_items(order, items_data, status='pending')
+        except ValidationError as e:
+            logger.error("add_items_to_order - Failed to create items: %s", e)
+            return Response({'error': f'Failed to create item: {"; ".join(e.messages)}'}, status=400)
+        total = order.total_money
         
-        print(f"[DEBUG] add_items_to_order - Successfully added {len(new_items)} items to order {order.id}")
+        logger.debug("add_items_to_order - Successfully added %s items to order %s", len(new_items), order.id)
         
-        # Send notifications to appropriate staff based on item types
-        try:
-            from .serializers import send_notification_to_role
-            
-            # Group new items by type
-            beverage_items = [item for item in new_items if item.item_type == 'beverage']
-            food_items = [item for item in new_items if item.item_type == 'food']
-            
-            if beverage_items:
-                beverage_message = f"Order #{order.order_number} (Table {order.table.number if order.table else 'Unknown'}) updated with {len(beverage_items)} beverage item(s)"
-                send_notification_to_role('bartender', beverage_message)
-                print(f"[DEBUG] add_items_to_order - Notification sent to bartender: {beverage_message}")
-            
-            if food_items:
-                food_message = f"Order #{order.order_number} (Table {order.table.number if order.table else 'Unknown'}) updated with {len(food_items)} food item(s)"
-                send_notification_to_role('meat_area', food_message)
-                print(f"[DEBUG] add_items_to_order - Notification sent to meat area: {food_message}")
-                
-        except Exception as e:
-            print(f"[WARNING] add_items_to_order - Failed to send notifications: {str(e)}")
+        # The kitchen and bar screens get the new items of their station
+        events.items_added(order, new_items)
         
         return Response({
             'success': True,
@@ -1616,7 +1279,7 @@ def add_items_to_order(request, order_id):
     except Order.DoesNotExist:
         return Response({'error': 'Order not found'}, status=404)
     except Exception as e:
-        print(f"[ERROR] add_items_to_order - Unexpected error: {str(e)}")
+        logger.error("add_items_to_order - Unexpected error: %s", e)
         return Response({'error': f'Unexpected error: {str(e)}'}, status=500)
 
 @api_view(['GET'])
@@ -1719,9 +1382,9 @@ def edit_order_items_view(request, order_id):
     """
     try:
         # Log the incoming request data
-        print(f"[edit_order_items_view] Request data: {request.data}")
-        print(f"[edit_order_items_view] Order ID: {order_id}")
-        print(f"[edit_order_items_view] User: {request.user.username}")
+        logger.debug("[edit_order_items_view] Request data: %s", request.data)
+        logger.debug("[edit_order_items_view] Order ID: %s", order_id)
+        logger.debug("[edit_order_items_view] User: %s", request.user.username)
         
         # Get the order
         order = get_object_or_404(Order, id=order_id)
@@ -1743,8 +1406,8 @@ def edit_order_items_view(request, order_id):
         # Get the updated items from request data
         updated_items = request.data.get('items', [])
         
-        print(f"[edit_order_items_view] Updated items: {updated_items}")
-        print(f"[edit_order_items_view] Items count: {len(updated_items)}")
+        logger.debug("[edit_order_items_view] Updated items: %s", updated_items)
+        logger.debug("[edit_order_items_view] Items count: %s", len(updated_items))
         
         if not updated_items:
             return Response({
@@ -1836,8 +1499,8 @@ def edit_order_items_view(request, order_id):
             )
             
             # Log the edit action
-            print(f"[edit_order_items_view] Order {order.order_number} edited by {request.user.username}")
-            print(f"[edit_order_items_view] {removed_count} items removed, {updated_count} items updated")
+            logger.debug("[edit_order_items_view] Order %s edited by %s", order.order_number, request.user.username)
+            logger.debug("[edit_order_items_view] %s items removed, %s items updated", removed_count, updated_count)
             
             return Response({
                 'message': f'Order updated successfully. {removed_count} items removed, {updated_count} items updated.',
@@ -1855,9 +1518,7 @@ def edit_order_items_view(request, order_id):
             'error': 'Order not found'
         }, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        import traceback
-        print(f"[edit_order_items_view] Error: {str(e)}")
-        print(f"[edit_order_items_view] Traceback: {traceback.format_exc()}")
+        logger.exception("[edit_order_items_view] Error: %s", e)
         return Response({
             'error': f'Failed to edit order items: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
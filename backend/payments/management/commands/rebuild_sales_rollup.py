@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.rollups import rebuild_sales_rollup
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup from the payments table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD), default: all history')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD), default: today')
+        parser.add_argument('--branch', type=int, help='Only rebuild this branch id')
+
+    def handle(self, *args, **options):
+        start = _parse_date(options['start']) if options['start'] else None
+        end = _parse_date(options['end']) if options['end'] else None
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        rows = rebuild_sales_rollup(start, end, branch_id=options['branch'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily sales rollup rows."))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:13
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    DailySalesRollup = apps.get_model('payments', 'DailySalesRollup')
+    grouped = (
+        Payment.objects.filter(is_completed=True)
+        .annotate(day=TruncDate('processed_at'))
+        .values('order__branch_id', 'day', 'payment_method')
+        .annotate(payment_count=Count('id'), total_amount=Sum('amount'))
+    )
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            branch_id=row['order__branch_id'], date=row['day'], payment_method=row['payment_method'],
+            payment_count=row['payment_count'], total_amount=row['total_amount'] or Decimal('0.00'),
+        )
+        for row in grouped
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0002_initial'),
+        ('payments', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('mobile', 'Mobile Payment'), ('online', 'Online')], max_length=20)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='branches.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'branch'], name='sales_rollup_date_idx')],
+                'unique_together': {('branch', 'date', 'payment_method')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
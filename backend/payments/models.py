@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from orders.models import Order
 from branches.models import Branch
+from decimal import Decimal
 
 class Payment(models.Model):
     PAYMENT_METHODS = [
@@ -30,3 +31,25 @@ class Income(models.Model):
     def __str__(self):
         return f"Income {self.amount} on {self.date} by {self.cashier} at {self.branch}"
 
+
+class DailySalesRollup(models.Model):
+    """
+    Completed payments per branch, day and payment method, kept up to date by
+    the Payment signals (see payments/rollups.py). Sales reports read these
+    rows instead of adding up individual payments.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS)
+    payment_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('branch', 'date', 'payment_method')
+        indexes = [
+            models.Index(fields=['date', 'branch'], name='sales_rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id} {self.date} {self.payment_method}: {self.payment_count} / {self.total_amount}"
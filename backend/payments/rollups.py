@@ -0,0 +1,157 @@
+"""
+Daily sales rollup.
+
+``DailySalesRollup`` holds one row per (branch, day, payment method) with the
+number and total of completed payments. Payment writes turn into +/- deltas on
+those rows (payments/signals.py), and the report views aggregate the rollup
+instead of loading every payment: a year for every branch is a few hundred
+rows.
+
+The day of a payment is the local date of ``processed_at``, the same date the
+old ``processed_at__date`` filters used. ``rebuild_sales_rollup`` recomputes
+any date range from the payments table (management command
+``rebuild_sales_rollup``).
+"""
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Payment
+
+ZERO = Decimal('0.00')
+
+
+# Snapshot of a payment loaded with deferred fields: its contribution is unknown
+UNKNOWN = object()
+
+
+def payment_snapshot(payment):
+    """What a payment contributes to the rollup, or None if it contributes nothing"""
+    values = payment.__dict__
+    try:
+        completed, processed_at = values['is_completed'], values['processed_at']
+        key = (values['order_id'], values['payment_method'], values['amount'])
+    except KeyError:
+        return UNKNOWN
+    if not completed or processed_at is None:
+        return None
+    return key + (timezone.localdate(processed_at),)
+
+
+def apply_rollup_delta(branch_id, day, payment_method, count, amount):
+    """Add ``count`` payments worth ``amount`` to a rollup row, creating it if needed"""
+    rows = DailySalesRollup.objects.filter(branch_id=branch_id, date=day, payment_method=payment_method)
+    changes = {'payment_count': F('payment_count') + count, 'total_amount': F('total_amount') + amount,
+               'updated_at': timezone.now()}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(
+                branch_id=branch_id, date=day, payment_method=payment_method,
+                payment_count=count, total_amount=amount,
+            )
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(**changes)
+
+
+def apply_payment_change(old, new, branch_id=None):
+    """Move a payment's contribution from snapshot ``old`` to ``new``"""
+    if old == new:
+        return
+    if branch_id is None:
+        from orders.models import Order
+        order_id = (new or old)[0]
+        branch_id = Order.objects.filter(pk=order_id).values_list('branch_id', flat=True).first()
+        if branch_id is None:
+            return
+    for snapshot, sign in ((old, -1), (new, 1)):
+        if snapshot is not None:
+            _, payment_method, amount, day = snapshot
+            apply_rollup_delta(branch_id, day, payment_method, sign, sign * Decimal(str(amount or 0)))
+
+
+@transaction.atomic
+def rebuild_sales_rollup(start=None, end=None, branch_id=None):
+    """Recompute the rollup rows for ``start``..``end`` (inclusive) from the payments. Returns the row count."""
+    rollups = DailySalesRollup.objects.all()
+    payments = Payment.objects.filter(is_completed=True)
+    if start:
+        rollups = rollups.filter(date__gte=start)
+        payments = payments.filter(processed_at__date__gte=start)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+        payments = payments.filter(processed_at__date__lte=end)
+    if branch_id:
+        rollups = rollups.filter(branch_id=branch_id)
+        payments = payments.filter(order__branch_id=branch_id)
+
+    grouped = (
+        payments
+        .annotate(day=TruncDate('processed_at'))
+        .values('order__branch_id', 'day', 'payment_method')
+        .annotate(payment_count=Count('id'), total_amount=Sum('amount'))
+    )
+    rows = [
+        DailySalesRollup(
+            branch_id=row['order__branch_id'], date=row['day'], payment_method=row['payment_method'],
+            payment_count=row['payment_count'], total_amount=row['total_amount'] or ZERO,
+        )
+        for row in grouped
+    ]
+    rollups.delete()
+    DailySalesRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def _rollup_rows(start, end, branch_id=None):
+    rows = DailySalesRollup.objects.filter(date__gte=start, date__lte=end)
+    if branch_id:
+        rows = rows.filter(branch_id=branch_id)
+    return rows
+
+
+def sales_totals(start, end, branch_id=None):
+    """Payment count and amounts for ``start``..``end``, overall and per payment method"""
+    by_method = {
+        row['payment_method']: (row['payment_count'], row['total_amount'] or ZERO)
+        for row in _rollup_rows(start, end, branch_id)
+        .values('payment_method')
+        .annotate(payment_count=Sum('payment_count'), total_amount=Sum('total_amount'))
+    }
+    return {
+        'total_orders': sum(count for count, _ in by_method.values()),
+        'total_sales': sum((amount for _, amount in by_method.values()), ZERO),
+        'cash_sales': by_method.get('cash', (0, ZERO))[1],
+        'online_sales': by_method.get('online', (0, ZERO))[1],
+        'by_method': {method: amount for method, (_, amount) in by_method.items()},
+    }
+
+
+def sales_by_day(start, end, branch_id=None):
+    """OrderedDict of every day in ``start``..``end`` -> total sales (days without sales are 0)"""
+    days = OrderedDict()
+    day = start
+    while day <= end:
+        days[day] = ZERO
+        day += timedelta(days=1)
+    rows = _rollup_rows(start, end, branch_id).values('date').annotate(total_amount=Sum('total_amount'))
+    for row in rows:
+        days[row['date']] = row['total_amount'] or ZERO
+    return days
+
+
+def sales_by_branch(start, end):
+    """branch_id -> (payment count, total sales) for ``start``..``end``"""
+    rows = (
+        _rollup_rows(start, end)
+        .values('branch_id')
+        .annotate(payment_count=Sum('payment_count'), total_amount=Sum('total_amount'))
+    )
+    return {row['branch_id']: (row['payment_count'], row['total_amount'] or ZERO) for row in rows}
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from payments.models import Payment
+from payments.rollups import UNKNOWN, apply_payment_change, payment_snapshot, rebuild_sales_rollup
+
+
+def _branch_id(payment):
+    if Payment.order.is_cached(payment):
+        return payment.order.branch_id
+    return None
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_rollup_state(sender, instance, **kwargs):
+    """Keep what the sales rollup currently counts for this payment"""
+    instance._rollup_snapshot = payment_snapshot(instance)
+
+
+@receiver(post_save, sender=Payment)
+def update_sales_rollup_on_payment_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._rollup_snapshot
+    new = payment_snapshot(instance)
+    if old is UNKNOWN or new is UNKNOWN:
+        # Loaded with deferred fields; recount the payment's day instead
+        instance.refresh_from_db()
+        new = payment_snapshot(instance)
+        if new is not None:
+            rebuild_sales_rollup(new[3], new[3], branch_id=instance.order.branch_id)
+    else:
+        apply_payment_change(old, new, branch_id=_branch_id(instance))
+    instance._rollup_snapshot = new
+
+
+@receiver(post_delete, sender=Payment)
+def update_sales_rollup_on_payment_delete(sender, instance, **kwargs):
+    old = instance._rollup_snapshot
+    if old is UNKNOWN:
+        return
+    apply_payment_change(old, None, branch_id=_branch_id(instance))
@@ -1,3 +1,95 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from branches.models import Branch
+from orders.models import Order
+from users.models import User
+from .models import DailySalesRollup, Payment
+from .rollups import rebuild_sales_rollup, sales_by_day, sales_totals
+
+
+class DailySalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.cashier = User.objects.create_user(username='cashier', password='x', role='cashier', branch=cls.branch)
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def pay(self, amount, method='cash', branch=None, completed=True):
+        self.count += 1
+        branch = branch or self.branch
+        order = Order.objects.create(order_number=f'20260101-{self.count:02d}-B{branch.id}', branch=branch,
+                                     total_money=Decimal(amount))
+        return Payment.objects.create(order=order, payment_method=method, amount=Decimal(amount),
+                                      processed_by=self.cashier, is_completed=completed)
+
+    def rollup(self):
+        return {
+            (row.branch_id, row.payment_method): (row.payment_count, row.total_amount)
+            for row in DailySalesRollup.objects.filter(date=self.today)
+        }
+
+    def test_payment_writes_update_rollup(self):
+        first = self.pay('100.00')
+        self.pay('50.00', method='online')
+        self.pay('30.00', branch=self.other_branch)
+        pending = self.pay('999.00', completed=False)
+        self.assertEqual(self.rollup(), {
+            (self.branch.id, 'cash'): (1, Decimal('100.00')),
+            (self.branch.id, 'online'): (1, Decimal('50.00')),
+            (self.other_branch.id, 'cash'): (1, Decimal('30.00')),
+        })
+
+        pending.is_completed = True
+        pending.save()
+        first.amount = Decimal('120.00')
+        first.save()
+        self.assertEqual(self.rollup()[(self.branch.id, 'cash')], (2, Decimal('1119.00')))
+
+        first.order.delete()
+        self.assertEqual(self.rollup()[(self.branch.id, 'cash')], (1, Decimal('999.00')))
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.pay('100.00')
+        self.pay('25.50', method='card')
+        self.pay('30.00', branch=self.other_branch)
+        incremental = self.rollup()
+        DailySalesRollup.objects.update(payment_count=0, total_amount=0)
+        self.assertEqual(rebuild_sales_rollup(self.today, self.today), 3)
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_totals_and_series(self):
+        self.pay('100.00')
+        self.pay('40.00', method='online')
+        self.pay('30.00', branch=self.other_branch)
+        totals = sales_totals(self.today, self.today, branch_id=self.branch.id)
+        self.assertEqual(totals['total_orders'], 2)
+        self.assertEqual(totals['total_sales'], Decimal('140.00'))
+        self.assertEqual(totals['online_sales'], Decimal('40.00'))
+        days = sales_by_day(self.today - timedelta(days=2), self.today)
+        self.assertEqual(list(days.values()), [0, 0, Decimal('170.00')])
+
+    def test_sales_summary_reads_rollup(self):
+        self.pay('100.00')
+        self.pay('40.00', method='online')
+        with self.assertNumQueries(1):
+            response = APIClient().get(reverse('sales-summary'), {'date': self.today.isoformat()})
+        self.assertEqual(response.json(), {'total_orders': 2, 'total_sales': 140.0, 'cash_sales': 100.0, 'online_sales': 40.0})
 
-# Create your tests here.
+    def test_api_payment_counted_once_at_order_total(self):
+        order = Order.objects.create(order_number='20260101-99-B1', branch=self.branch, total_money=Decimal('75.00'))
+        client = APIClient()
+        client.force_authenticate(self.cashier)
+        response = client.post(reverse('payment-list'),
+                               {'order': order.id, 'payment_method': 'cash', 'amount': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.rollup(), {(self.branch.id, 'cash'): (1, Decimal('75.00'))})
@@ -6,6 +6,9 @@ from .serializers import PaymentSerializer, IncomeSerializer
 from rest_framework import viewsets, permissions
 from .models import Payment, Income
 from .serializers import PaymentSerializer, IncomeSerializer
+import logging
+
+logger = logging.getLogger(__name__)
 
 def transaction_list_view(request):
     return JsonResponse({"message": "Payments endpoint ready."})
@@ -23,35 +26,33 @@ class PaymentViewSet(viewsets.ModelViewSet):
         if hasattr(user, 'branch') and user.branch:
             # Filter payments for orders in the user's branch
             queryset = Payment.objects.filter(order__branch=user.branch)
-            print(f"[DEBUG] Filtering payments for branch: {user.branch.name}")
+            logger.debug("Filtering payments for branch: %s", user.branch.name)
         elif user.is_superuser:
             # Superuser can see all payments
             queryset = Payment.objects.all()
-            print(f"[DEBUG] Superuser - showing all payments")
+            logger.debug("Superuser - showing all payments")
         else:
             # For users without branch, show only payments they processed
             queryset = Payment.objects.filter(processed_by=user)
-            print(f"[DEBUG] User without branch - showing only own payments")
+            logger.debug("User without branch - showing only own payments")
         
         return queryset
 
     def perform_create(self, serializer):
         try:
             user = self.request.user
-            print(f"[DEBUG] Creating payment for user: {user.username} (ID: {user.id})")
-            print(f"[DEBUG] User branch: {getattr(user, 'branch', 'No branch assigned')}")
-            print(f"[DEBUG] Payment data: {serializer.validated_data}")
-            
-            payment = serializer.save(processed_by=user, is_completed=True)
-            print(f"[DEBUG] Payment created with ID: {payment.id}")
+            logger.debug("Creating payment for user: %s (ID: %s)", user.username, user.id)
+            logger.debug("User branch: %s", getattr(user, 'branch', 'No branch assigned'))
+            logger.debug("Payment data: %s", serializer.validated_data)
             
-            # Always use the latest order total
-            order = payment.order
-            print(f"[DEBUG] Order: {order.order_number}, Total: {order.total_money}, Branch: {order.branch}")
-            
-            payment.amount = order.total_money
-            payment.save()
-            print(f"[DEBUG] Payment amount updated to: {payment.amount}")
+            # Always use the latest order total; set before the first save so
+            # the sales rollup sees the payment once with its final amount
+            order = serializer.validated_data['order']
+            logger.debug("Order: %s, Total: %s, Branch: %s", order.order_number, order.total_money, order.branch)
+
+            amount = order.total_money if order.total_money is not None else serializer.validated_data['amount']
+            payment = serializer.save(processed_by=user, is_completed=True, amount=amount)
+            logger.debug("Payment created with ID: %s, amount: %s", payment.id, payment.amount)
             
             # Create income record
             from .models import Income
@@ -61,14 +62,11 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 branch=order.branch,
                 payment=payment
             )
-            print(f"[DEBUG] Income record created with ID: {income.id}")
-            print(f"[DEBUG] Payment successfully processed and saved!")
+            logger.debug("Income record created with ID: %s", income.id)
+            logger.debug("Payment successfully processed and saved!")
             
         except Exception as e:
-            print(f"[ERROR] Failed to create payment: {str(e)}")
-            print(f"[ERROR] Exception type: {type(e).__name__}")
-            import traceback
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            logger.exception("Failed to create payment (%s): %s", type(e).__name__, e)
             raise
 
 class IncomeViewSet(viewsets.ModelViewSet):
@@ -84,14 +82,14 @@ class IncomeViewSet(viewsets.ModelViewSet):
         if hasattr(user, 'branch') and user.branch:
             # Filter income for the user's branch
             queryset = Income.objects.filter(branch=user.branch)
-            print(f"[DEBUG] Filtering income for branch: {user.branch.name}")
+            logger.debug("Filtering income for branch: %s", user.branch.name)
         elif user.is_superuser:
             # Superuser can see all income
             queryset = Income.objects.all()
-            print(f"[DEBUG] Superuser - showing all income")
+            logger.debug("Superuser - showing all income")
         else:
             # For users without branch, show only income they generated
             queryset = Income.objects.filter(cashier=user)
-            print(f"[DEBUG] User without branch - showing only own income")
+            logger.debug("User without branch - showing only own income")
         
         return queryset
@@ -6,6 +6,9 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from .models import Product, ItemType
 from .serializers import ProductSerializer, ItemTypeSerializer, LowStockProductSerializer
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class LowStockProductView(APIView):
@@ -21,7 +24,7 @@ class LowStockProductView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except Exception as e:
-            print('Low stock API error:', str(e))  # ✅ This will show errors in your Django console
+            logger.debug("Low stock API error: %s", e)  # ✅ This will show errors in your Django console
             return Response(
                 {'detail': 'Server error while fetching low stock items.'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
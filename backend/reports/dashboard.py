@@ -0,0 +1,96 @@
+"""
+Sold/rejected item series for the report dashboards.
+
+``ReportDashboardView`` and ``FoodDashboardReportView`` show, for a given day,
+the number of accepted and rejected items of that day, of the day before and of
+each of the last seven days. ``item_status_series`` produces the whole window
+with one grouped query (day, status, item type) and both views slice it, so a
+dashboard refresh never walks orders or items in Python.
+
+Series are cached per (branch, window) under generation tokens (see
+core/generations.py) that are replaced once a transaction touching order items
+commits (reports/signals.py), so repeated refreshes are served from the cache
+until an item of that branch is added, deleted or changes status. Without a
+cache shared by every worker (core/shared_cache.py) series are not cached.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from core.generations import current_token, invalidate
+from core.shared_cache import is_shared
+
+SERIES_DAYS = 7
+SERIES_TIMEOUT = 60 * 60
+COUNTED_STATUSES = {'accepted': 'sold', 'rejected': 'rejected'}
+NAMESPACE = 'report-series'
+
+
+def invalidate_item_series(branch_id=None):
+    """Drop the cached series of ``branch_id`` (every branch if None) once the current transaction commits"""
+    invalidate(NAMESPACE, branch_id)
+
+
+def _query_series(start, end, branch_id=None):
+    from orders.models import OrderItem
+
+    items = OrderItem.objects.filter(
+        order__created_at__date__gte=start,
+        order__created_at__date__lte=end,
+        status__in=list(COUNTED_STATUSES),
+    )
+    if branch_id is not None:
+        items = items.filter(order__branch_id=branch_id)
+    rows = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'status', 'item_type')
+        .annotate(count=Count('id'))
+    )
+    counts = {}
+    for row in rows:
+        key = (row['day'].isoformat(), row['item_type'], COUNTED_STATUSES[row['status']])
+        counts[key] = counts.get(key, 0) + row['count']
+    return counts
+
+
+def item_status_series(date, branch_id=None):
+    """
+    {(iso day, item_type, 'sold'|'rejected'): item count} for the ``SERIES_DAYS``
+    days ending on ``date``, from the cache when nothing changed since.
+    """
+    start = date - timedelta(days=SERIES_DAYS - 1)
+    if not is_shared():
+        return _query_series(start, date, branch_id)
+    key = f'{NAMESPACE}:{branch_id or "all"}:{start.isoformat()}:{date.isoformat()}:{current_token(NAMESPACE, branch_id)}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = _query_series(start, date, branch_id)
+        cache.set(key, counts, SERIES_TIMEOUT)
+    return counts
+
+
+def dashboard_report(date, branch_id=None, item_types=None):
+    """Payload of the report dashboards, counting only ``item_types`` when given"""
+    counts = item_status_series(date, branch_id)
+
+    def total(day, outcome):
+        day = day.isoformat()
+        return sum(
+            count for (count_day, item_type, count_outcome), count in counts.items()
+            if count_day == day and count_outcome == outcome and (item_types is None or item_type in item_types)
+        )
+
+    yesterday = date - timedelta(days=1)
+    days = [date - timedelta(days=SERIES_DAYS - 1 - i) for i in range(SERIES_DAYS)]
+    return {
+        'totalSold': total(date, 'sold'),
+        'totalRejected': total(date, 'rejected'),
+        'yesterdayTotalSold': total(yesterday, 'sold'),
+        'yesterdayTotalRejected': total(yesterday, 'rejected'),
+        'dailySales': [
+            {'date': day.isoformat(), 'sold': total(day, 'sold'), 'rejected': total(day, 'rejected')}
+            for day in days
+        ],
+    }
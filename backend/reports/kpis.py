@@ -0,0 +1,128 @@
+"""
+Owner dashboard KPI snapshots.
+
+``owner_snapshot`` returns the owner screen payload (KPIs, weekly profit trend
+and top sellers) for a date range and optional branch. Every figure comes from
+an aggregate query: revenue from the daily sales rollup, the trend from its
+per-day series, top sellers from the sales lines, inventory value and the
+food/beverage income of closed orders from one SUM each.
+
+Snapshots are cached per (branch, range) under generation tokens (see
+core/generations.py). Payments, stock changes, product price changes, order
+closings and item status changes invalidate the affected branch once their
+transaction commits (reports/signals.py, inventory/models.py), so the screen
+is served from the cache until something it shows has changed. Without a
+cache shared by every worker (core/shared_cache.py) snapshots are not cached.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+
+from core.generations import current_token, invalidate
+from core.shared_cache import is_shared
+from payments.rollups import sales_by_day, sales_totals
+
+from .sales_lines import top_items
+
+NAMESPACE = 'owner-kpis'
+SNAPSHOT_TIMEOUT = 60 * 60
+ZERO = Decimal('0.00')
+
+# Placeholders until products and expenses carry real costs
+COST_OF_GOODS = Decimal('45000')
+OPERATING_EXPENSES = Decimal('35000')
+
+BEVERAGE_TYPES = ['beverage', 'drink']
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def invalidate_owner_kpis(branch_id=None):
+    """Drop cached snapshots of ``branch_id`` (every branch if None) once the current transaction commits"""
+    invalidate(NAMESPACE, branch_id)
+
+
+def inventory_value(branch_id=None):
+    """Value of the store stock at base unit prices"""
+    from inventory.models import Stock
+    stocks = Stock.objects.filter(product__base_unit_price__isnull=False)
+    if branch_id:
+        stocks = stocks.filter(branch_id=branch_id)
+    value = stocks.aggregate(value=Sum(
+        ExpressionWrapper(F('quantity_in_base_units') * F('product__base_unit_price'), output_field=MONEY)
+    ))['value']
+    return value or ZERO
+
+
+def closed_order_income(start, end, branch_id=None):
+    """Accepted beverage and food income of waiters' printed, paid orders created in ``start``..``end``"""
+    from orders.models import OrderItem
+    items = OrderItem.objects.filter(
+        status='accepted',
+        order__created_by__role='waiter',
+        order__cashier_status='printed',
+        order__created_at__date__gte=start,
+        order__created_at__date__lte=end,
+        order__payment__is_completed=True,
+    )
+    if branch_id:
+        items = items.filter(order__branch_id=branch_id)
+    revenue = ExpressionWrapper(F('price') * F('quantity'), output_field=MONEY)
+    totals = items.aggregate(
+        beverage=Sum(revenue, filter=Q(item_type__in=BEVERAGE_TYPES)),
+        food=Sum(revenue, filter=Q(item_type='food')),
+    )
+    return totals['beverage'] or ZERO, totals['food'] or ZERO
+
+
+def profit_trend(start, end, branch_id=None):
+    """Revenue, placeholder costs and net profit per week of the range"""
+    daily_sales = list(sales_by_day(start, end, branch_id=branch_id).values())
+    num_weeks = max(1, (len(daily_sales) + 6) // 7)
+    week_costs = COST_OF_GOODS / Decimal(num_weeks)
+    trend = []
+    for week in range(num_weeks):
+        week_revenue = sum(daily_sales[week * 7:week * 7 + 7], ZERO)
+        trend.append({
+            'name': f'Week {week + 1}',
+            'revenue': float(week_revenue),
+            'costs': float(week_costs),
+            'netProfit': float(week_revenue - week_costs),
+        })
+    return trend
+
+
+def compute_owner_snapshot(start, end, branch_id=None):
+    totals = sales_totals(start, end, branch_id=branch_id)
+    total_sales = totals['total_sales']
+    avg_order_value = total_sales / totals['total_orders'] if totals['total_orders'] else ZERO
+    net_profit = total_sales - COST_OF_GOODS - OPERATING_EXPENSES
+    profit_of_inventory, food_income = closed_order_income(start, end, branch_id)
+    return {
+        'kpi': {
+            'totalRevenue': float(total_sales),
+            'costOfInventory': float(inventory_value(branch_id)),
+            'profitOfInventory': float(profit_of_inventory),
+            'operatingExpenses': float(OPERATING_EXPENSES),
+            'netProfit': float(net_profit),
+            'avgOrderValue': float(avg_order_value),
+            'foodIncome': float(food_income),
+        },
+        'profitTrend': profit_trend(start, end, branch_id),
+        'topSellingItems': [
+            {'name': item['name'], 'revenue': float(item['revenue'])}
+            for item in top_items(start, end, branch_id=branch_id)
+        ],
+    }
+
+
+def owner_snapshot(start, end, branch_id=None):
+    """Owner dashboard payload for ``start``..``end``, from the cache when nothing changed since"""
+    if not is_shared():
+        return compute_owner_snapshot(start, end, branch_id)
+    key = f'{NAMESPACE}:{branch_id or "all"}:{start.isoformat()}:{end.isoformat()}:{current_token(NAMESPACE, branch_id)}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = compute_owner_snapshot(start, end, branch_id)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
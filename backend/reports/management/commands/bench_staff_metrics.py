@@ -0,0 +1,158 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from branches.models import Branch, Table
+from core.query_budget import QueryRecorder
+from orders.models import Order
+from payments.models import Payment
+from reports.staff_metrics import rebuild_waiter_sales, staff_performance, unsettled_tables
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_staff_performance(start_date, end_date):
+    """The per-waiter loop StaffPerformanceView used to run"""
+    data = []
+    for waiter in User.objects.filter(role='waiter'):
+        orders = Order.objects.filter(
+            created_by=waiter,
+            created_at__date__gte=start_date,
+            created_at__date__lte=end_date,
+            cashier_status='printed'
+        )
+        order_ids = orders.values_list('id', flat=True)
+        payments = Payment.objects.filter(order_id__in=order_ids, is_completed=True)
+        total_orders = orders.count()
+        total_sales = sum(p.amount for p in payments)
+        data.append({
+            'waiter': waiter.get_full_name() or waiter.username,
+            'branch': waiter.branch.name if waiter.branch else 'N/A',
+            'totalOrders': total_orders,
+            'totalSales': float(total_sales),
+        })
+    return data
+
+
+def legacy_unsettled_tables():
+    """The per-waiter loop WaiterUnsettledTablesView used to run"""
+    result = []
+    for waiter in User.objects.filter(role='waiter'):
+        orders = Order.objects.filter(created_by=waiter, cashier_status='ready_for_payment').select_related('table')
+        result.append({
+            'name': waiter.get_full_name() or waiter.username,
+            'tables': sorted({o.table.number for o in orders if o.table}),
+            'amount': float(sum([o.total_money or 0 for o in orders])),
+            'orders': orders.count(),
+        })
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the staff performance and unsettled tables endpoints before and after '
+        'grouped aggregation and the per-waiter daily rollup (runs in a rolled back transaction).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--waiters', type=int, default=200)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--orders-per-day', type=int, default=2, help='Printed orders per waiter and day')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per variant')
+
+    def handle(self, *args, **options):
+        self.options = options
+        try:
+            with transaction.atomic():
+                self.create_fixtures()
+                self.run()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_fixtures(self):
+        options = self.options
+        started = time.perf_counter()
+        branch = Branch.objects.create(name='Staff metrics benchmark')
+        tables = Table.objects.bulk_create([Table(number=n, branch=branch) for n in range(1, 21)])
+        waiters = User.objects.bulk_create([
+            User(username=f'bench-waiter-{n}', first_name='Waiter', last_name=str(n), role='waiter', branch=branch)
+            for n in range(options['waiters'])
+        ])
+
+        today = timezone.localdate()
+        now = timezone.now()
+        self.end = today
+        self.start = today - timedelta(days=options['days'] - 1)
+        for day_offset in range(options['days']):
+            created_at = now - timedelta(days=day_offset)
+            orders = Order.objects.bulk_create([
+                Order(order_number=f'bench-{day_offset}-{waiter.id}-{n}', branch=branch, created_by=waiter,
+                      table=tables[n % len(tables)], cashier_status='printed', total_money=Decimal('120.00'))
+                for waiter in waiters for n in range(options['orders_per_day'])
+            ])
+            # created_at is auto_now_add; move the day's orders back afterwards
+            Order.objects.filter(pk__in=[o.pk for o in orders]).update(created_at=created_at)
+            Payment.objects.bulk_create([
+                Payment(order=order, payment_method='cash', amount=order.total_money, is_completed=True)
+                for order in orders
+            ])
+        Order.objects.bulk_create([
+            Order(order_number=f'bench-open-{waiter.id}', branch=branch, created_by=waiter,
+                  table=tables[waiter.id % len(tables)], cashier_status='ready_for_payment',
+                  total_money=Decimal('80.00'))
+            for waiter in waiters
+        ])
+        rows = rebuild_waiter_sales(self.start, self.end)
+        self.stdout.write(
+            f"Fixtures: {len(waiters)} waiters x {options['days']} days, "
+            f"{Order.objects.filter(branch=branch).count()} orders, {rows} rollup rows "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+
+    def measure(self, func):
+        timings = []
+        result = None
+        for _ in range(self.options['repeat']):
+            with QueryRecorder() as recorder:
+                started = time.perf_counter()
+                result = func()
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), recorder.count, result
+
+    def run(self):
+        start, end = self.start, self.end
+        variants = [
+            ('staff performance', 'legacy loop', lambda: legacy_staff_performance(start, end)),
+            ('staff performance', 'grouped', lambda: staff_performance(start, end, use_rollup=False)),
+            ('staff performance', 'rollup', lambda: staff_performance(start, end, use_rollup=True)),
+            ('unsettled tables', 'legacy loop', legacy_unsettled_tables),
+            ('unsettled tables', 'grouped', unsettled_tables),
+        ]
+        self.stdout.write(f"{'endpoint':<20}{'variant':<14}{'median ms':>11}{'queries':>9}")
+        results = {}
+        for endpoint, variant, func in variants:
+            elapsed, queries, result = self.measure(func)
+            results[endpoint, variant] = result
+            self.stdout.write(f"{endpoint:<20}{variant:<14}{elapsed:>11.1f}{queries:>9}")
+
+        key = lambda row: row.get('waiter') or row.get('name')
+        same = (
+            sorted(results['staff performance', 'legacy loop'], key=key)
+            == sorted(results['staff performance', 'grouped'], key=key)
+            == sorted(results['staff performance', 'rollup'], key=key)
+            and sorted(results['unsettled tables', 'legacy loop'], key=key)
+            == sorted(results['unsettled tables', 'grouped'], key=key)
+        )
+        if same:
+            self.stdout.write(self.style.SUCCESS('All variants return the same rows.'))
+        else:
+            self.stdout.write(self.style.ERROR('Variants disagree!'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:15
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('branches', '0002_initial'),
+        ('inventory', '0002_initial'),
+        ('menu', '0001_initial'),
+        ('orders', '0006_order_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('name', models.CharField(max_length=100)),
+                ('item_type', models.CharField(choices=[('food', 'Food'), ('beverage', 'beverage'), ('meat', 'Meat')], max_length=20)),
+                ('quantity', models.PositiveIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_lines', to='branches.branch')),
+                ('menu_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_lines', to='menu.menuitem')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_lines', to='orders.order')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_lines', to='inventory.product')),
+                ('waiter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_lines', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'branch', 'item_type', 'name', 'quantity', 'revenue'], name='sales_line_date_idx'), models.Index(fields=['branch', 'date', 'item_type', 'name', 'quantity', 'revenue'], name='sales_line_branch_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,61 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+from orders.models import OrderItem
+
+
+class SalesLine(models.Model):
+    """
+    One accepted item of a paid order, denormalised for sales analytics (see
+    reports/sales_lines.py). Lines are written when the payment completes and
+    dated like the payment, so they agree with the daily sales rollup.
+    """
+    date = models.DateField()
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='sales_lines')
+    order = models.ForeignKey('orders.Order', on_delete=models.CASCADE, related_name='sales_lines')
+    waiter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='sales_lines')
+    product = models.ForeignKey('inventory.Product', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='sales_lines')
+    menu_item = models.ForeignKey('menu.MenuItem', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='sales_lines')
+    name = models.CharField(max_length=100)
+    item_type = models.CharField(max_length=20, choices=OrderItem.ORDER_ITEM_TYPE)
+    quantity = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        # Every column a top-N query reads is in the index, so reports are
+        # answered from the index alone however much history the table holds.
+        indexes = [
+            models.Index(fields=['date', 'branch', 'item_type', 'name', 'quantity', 'revenue'],
+                         name='sales_line_date_idx'),
+            models.Index(fields=['branch', 'date', 'item_type', 'name', 'quantity', 'revenue'],
+                         name='sales_line_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.name} x {self.quantity}"
+
+
+class WaiterDailySales(models.Model):
+    """
+    Printed orders and their completed payments per waiter and order day,
+    refreshed on commit of every order/payment write (see reports/staff_metrics.py).
+    """
+    waiter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    order_count = models.IntegerField(default=0)
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ('waiter', 'date')
+        indexes = [
+            models.Index(fields=['date', 'waiter', 'order_count', 'sales_total'], name='waiter_sales_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.waiter_id} {self.date}: {self.order_count} orders"
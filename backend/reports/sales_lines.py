@@ -0,0 +1,172 @@
+"""
+Item-level sales facts.
+
+Every accepted item of a paid order becomes a ``SalesLine`` carrying the date,
+branch, waiter, product, menu item, quantity, revenue and cost it was sold
+with. Item quantities are in the product's sales unit, so the cost converts
+them to base units first, the way stock consumption does
+(inventory/consumption.py). The lines are written once, when the order's payment completes
+(reports/signals.py), and removed if the payment is deleted or reopened.
+
+Top-seller reports group the lines of a date range by item name. The columns
+they read are all part of the ``SalesLine`` indexes, so they never touch the
+orders, items or payments tables. ``rebuild_sales_lines`` recomputes a date
+range from the payments (management command ``rebuild_sales_lines``).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import SalesLine
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+RANKINGS = ('quantity', 'revenue')
+
+
+def _menu_item_ids(names):
+    """Menu item id for each item name, used to link lines to the menu"""
+    from menu.models import MenuItem
+    ids = {}
+    for menu_item_id, name in MenuItem.objects.filter(name__in=set(names)).order_by('id').values_list('id', 'name'):
+        ids.setdefault(name, menu_item_id)
+    return ids
+
+
+def _base_units_per_item(rows):
+    """product id -> base units in one item, which is counted in the product's sales unit"""
+    from inventory.consumption import sales_units
+    products = {
+        row['product_id']: {'id': row['product_id'], 'name': row['product__name'],
+                            'base_unit_id': row['product__base_unit_id']}
+        for row in rows if row['product_id'] is not None
+    }
+    return {product_id: factor for product_id, (_, factor) in sales_units(products.values()).items()}
+
+
+def _build_lines(rows):
+    """SalesLine instances from item rows carrying their payment day and order branch/waiter"""
+    rows = list(rows)
+    menu_items = _menu_item_ids(row['name'] for row in rows)
+    base_units = _base_units_per_item(rows)
+    lines = []
+    for row in rows:
+        quantity = row['quantity']
+        unit_cost = row['product__base_unit_price']
+        if unit_cost is not None:
+            # base_unit_price is per base unit; the quantity is in sales units
+            unit_cost *= base_units.get(row['product_id'], 1)
+        lines.append(SalesLine(
+            date=row['day'],
+            branch_id=row['order__branch_id'],
+            order_id=row['order_id'],
+            waiter_id=row['order__created_by_id'],
+            product_id=row['product_id'],
+            menu_item_id=menu_items.get(row['name']),
+            name=row['name'],
+            item_type=row['item_type'],
+            quantity=quantity,
+            revenue=row['price'] * quantity,
+            cost=(unit_cost * quantity).quantize(CENT) if unit_cost is not None else ZERO,
+        ))
+    return lines
+
+
+def _item_rows(items):
+    return items.filter(status='accepted', order__branch__isnull=False).values(
+        'order_id', 'order__branch_id', 'order__created_by_id', 'product_id', 'product__name',
+        'product__base_unit_id', 'product__base_unit_price', 'name', 'item_type', 'quantity', 'price',
+    )
+
+
+@transaction.atomic
+def record_order_sales(order_id, processed_at):
+    """(Re)write the sales lines of a paid order. Returns the number of lines."""
+    from orders.models import OrderItem
+    day = timezone.localdate(processed_at)
+    rows = [dict(row, day=day) for row in _item_rows(OrderItem.objects.filter(order_id=order_id))]
+    SalesLine.objects.filter(order_id=order_id).delete()
+    return len(SalesLine.objects.bulk_create(_build_lines(rows)))
+
+
+def clear_order_sales(order_id):
+    SalesLine.objects.filter(order_id=order_id).delete()
+
+
+@transaction.atomic
+def rebuild_sales_lines(start=None, end=None, branch_id=None):
+    """Recompute the sales lines for ``start``..``end`` (inclusive) from the payments. Returns the line count."""
+    from orders.models import OrderItem
+    from payments.models import Payment
+
+    payments = Payment.objects.filter(is_completed=True)
+    lines = SalesLine.objects.all()
+    if start:
+        payments = payments.filter(processed_at__date__gte=start)
+        lines = lines.filter(date__gte=start)
+    if end:
+        payments = payments.filter(processed_at__date__lte=end)
+        lines = lines.filter(date__lte=end)
+    if branch_id:
+        payments = payments.filter(order__branch_id=branch_id)
+        lines = lines.filter(branch_id=branch_id)
+
+    days = {order_id: timezone.localdate(processed_at)
+            for order_id, processed_at in payments.values_list('order_id', 'processed_at')}
+    rows = _item_rows(OrderItem.objects.filter(order_id__in=payments.values('order_id')))
+    rows = [dict(row, day=days[row['order_id']]) for row in rows.iterator(chunk_size=2000)]
+    lines.delete()
+    return len(SalesLine.objects.bulk_create(_build_lines(rows), batch_size=1000))
+
+
+def sales_lines(start, end, branch_id=None, item_type=None):
+    """Lines sold between ``start`` and ``end`` (inclusive), optionally for one branch and item type(s)"""
+    lines = SalesLine.objects.filter(date__gte=start, date__lte=end)
+    if branch_id:
+        lines = lines.filter(branch_id=branch_id)
+    if item_type:
+        if isinstance(item_type, str):
+            lines = lines.filter(item_type=item_type)
+        else:
+            lines = lines.filter(item_type__in=list(item_type))
+    return lines
+
+
+def top_items(start, end, branch_id=None, item_type=None, by='quantity', limit=10):
+    """
+    Best sellers of a date range ranked ``by`` quantity or revenue.
+
+    Returns a list of {'name', 'quantity', 'revenue'} dicts, at most ``limit`` long.
+    """
+    if by not in RANKINGS:
+        raise ValueError(f"Unknown ranking: {by}")
+    other = 'revenue' if by == 'quantity' else 'quantity'
+    rows = (
+        sales_lines(start, end, branch_id, item_type)
+        .values('name')
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .order_by(F(f'total_{by}').desc(), F(f'total_{other}').desc(), 'name')[:limit]
+    )
+    return [
+        {'name': row['name'], 'quantity': row['total_quantity'], 'revenue': row['total_revenue'] or ZERO}
+        for row in rows
+    ]
+
+
+def sales_by_item_type(start, end, branch_id=None):
+    """item_type -> {'quantity', 'revenue', 'cost'} for ``start``..``end``"""
+    rows = (
+        sales_lines(start, end, branch_id)
+        .values('item_type')
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'), total_cost=Sum('cost'))
+    )
+    return {
+        row['item_type']: {
+            'quantity': row['total_quantity'],
+            'revenue': row['total_revenue'] or ZERO,
+            'cost': row['total_cost'] or ZERO,
+        }
+        for row in rows
+    }
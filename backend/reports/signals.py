@@ -0,0 +1,128 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from inventory.models import Product, Stock
+from orders.models import Order, OrderItem
+from payments.models import Payment
+from reports.dashboard import invalidate_item_series
+from reports.kpis import invalidate_owner_kpis
+from reports.sales_lines import clear_order_sales, record_order_sales
+from reports.staff_metrics import mark_waiter_sales_changed
+
+
+def _order_branch_id(instance, model):
+    """Branch of the order a payment or item belongs to, when it is already loaded"""
+    if model.order.is_cached(instance):
+        return instance.order.branch_id
+    return None
+
+
+@receiver(post_save, sender=Payment)
+def write_sales_lines_on_payment(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.is_completed and instance.processed_at:
+        record_order_sales(instance.order_id, instance.processed_at)
+    else:
+        clear_order_sales(instance.order_id)
+    invalidate_owner_kpis(_order_branch_id(instance, Payment))
+    mark_waiter_sales_changed(instance.order_id)
+
+
+@receiver(post_delete, sender=Payment)
+def clear_sales_lines_on_payment_delete(sender, instance, **kwargs):
+    clear_order_sales(instance.order_id)
+    invalidate_owner_kpis(_order_branch_id(instance, Payment))
+    mark_waiter_sales_changed(instance.order_id)
+
+def _series_state(item):
+    """What the dashboards count an item as: (order, item type, status), or None if deferred"""
+    values = item.__dict__
+    try:
+        return values['order_id'], values['item_type'], values['status']
+    except KeyError:
+        return None
+
+
+def _item_branch_id(item, origin=None):
+    if isinstance(origin, Order):
+        return origin.branch_id
+    return _order_branch_id(item, OrderItem)
+
+
+def invalidate_item_reports(branch_id):
+    invalidate_item_series(branch_id)
+    invalidate_owner_kpis(branch_id)
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_item_series_state(sender, instance, **kwargs):
+    instance._series_state = _series_state(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def invalidate_item_series_on_item_save(sender, instance, created, raw=False, **kwargs):
+    """New items and status changes move the dashboards' sold/rejected counts and the owner's income"""
+    if raw:
+        return
+    state = _series_state(instance)
+    if created or state is None or state != instance._series_state:
+        invalidate_item_reports(_item_branch_id(instance))
+    instance._series_state = state
+
+
+@receiver(post_delete, sender=OrderItem)
+def invalidate_item_series_on_item_delete(sender, instance, origin=None, **kwargs):
+    invalidate_item_reports(_item_branch_id(instance, origin))
+
+
+def _closing_state(order):
+    """What decides whether the owner KPIs count an order as closed"""
+    values = order.__dict__
+    return values.get('cashier_status'), values.get('created_by_id')
+
+
+@receiver(post_init, sender=Order)
+def remember_order_closing_state(sender, instance, **kwargs):
+    instance._closing_state = _closing_state(instance)
+
+
+@receiver(post_save, sender=Order)
+def refresh_reports_on_order_close(sender, instance, created, raw=False, **kwargs):
+    """Closing, reopening or reassigning an order moves the owner KPIs and the waiter's sales"""
+    if raw:
+        return
+    state = _closing_state(instance)
+    old_status, old_waiter = instance._closing_state
+    instance._closing_state = state
+    if created:
+        if instance.cashier_status == 'printed':
+            mark_waiter_sales_changed(instance.pk)
+        return
+    if state == (old_status, old_waiter):
+        return
+    invalidate_owner_kpis(instance.branch_id)
+    mark_waiter_sales_changed(instance.pk)
+    if old_waiter is not None and old_waiter != instance.created_by_id:
+        mark_waiter_sales_changed(waiter_id=old_waiter, created_at=instance.created_at)
+
+
+@receiver(post_delete, sender=Order)
+def refresh_reports_on_order_delete(sender, instance, **kwargs):
+    invalidate_owner_kpis(instance.branch_id)
+    mark_waiter_sales_changed(waiter_id=instance.created_by_id, created_at=instance.created_at)
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def invalidate_owner_kpis_on_stock_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_owner_kpis(instance.branch_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_owner_kpis_on_product_change(sender, instance, raw=False, **kwargs):
+    """Inventory value depends on base unit prices in every branch"""
+    if not raw:
+        invalidate_owner_kpis()
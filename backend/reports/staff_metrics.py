@@ -0,0 +1,205 @@
+"""
+Waiter metrics for the staff screens.
+
+``staff_performance`` (owner staff screen) and ``unsettled_tables`` (cashier
+screen) return one row per waiter from a fixed number of grouped queries,
+however many waiters there are: one for the waiters with their branch and one
+or two ``GROUP BY created_by`` aggregates over orders.
+
+Printed orders and their completed payments are also kept per waiter and
+order day in ``WaiterDailySales``. Order and payment writes mark the affected
+(waiter, day) pairs, which are recounted once the transaction commits
+(reports/signals.py). Ranges of ``ROLLUP_MIN_DAYS`` days or more are read from
+that table instead of the orders; ``rebuild_waiter_sales`` recomputes it
+(management command ``rebuild_waiter_sales``).
+"""
+import threading
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import WaiterDailySales
+
+CLOSED_STATUS = 'printed'
+UNSETTLED_STATUS = 'ready_for_payment'
+ROLLUP_MIN_DAYS = 14
+ZERO = Decimal('0.00')
+
+_local = threading.local()
+
+
+def waiters():
+    from users.models import User
+    return User.objects.filter(role='waiter').select_related('branch')
+
+
+def waiter_name(waiter):
+    return waiter.get_full_name() or waiter.username
+
+
+def _closed_orders():
+    from orders.models import Order
+    return Order.objects.filter(cashier_status=CLOSED_STATUS)
+
+
+def _sales_columns():
+    return {
+        'order_count': Count('id'),
+        'sales_total': Sum('payment__amount', filter=Q(payment__is_completed=True)),
+    }
+
+
+def live_waiter_sales(start, end):
+    """waiter id -> (printed orders, completed payments) for orders created in ``start``..``end``"""
+    rows = (
+        _closed_orders()
+        .filter(created_at__date__gte=start, created_at__date__lte=end, created_by__role='waiter')
+        .values('created_by_id')
+        .annotate(**_sales_columns())
+    )
+    return {row['created_by_id']: (row['order_count'], row['sales_total'] or ZERO) for row in rows}
+
+
+def rollup_waiter_sales(start, end):
+    """Same as ``live_waiter_sales``, read from the per-day rollup"""
+    rows = (
+        WaiterDailySales.objects
+        .filter(date__gte=start, date__lte=end, waiter__role='waiter')
+        .values('waiter_id')
+        .annotate(order_count=Sum('order_count'), sales_total=Sum('sales_total'))
+    )
+    return {row['waiter_id']: (row['order_count'], row['sales_total'] or ZERO) for row in rows}
+
+
+def waiter_sales(start, end, use_rollup=None):
+    if use_rollup is None:
+        use_rollup = (end - start).days + 1 >= ROLLUP_MIN_DAYS
+    return rollup_waiter_sales(start, end) if use_rollup else live_waiter_sales(start, end)
+
+
+def staff_performance(start, end, use_rollup=None):
+    """Printed orders and sales of every waiter for orders created in ``start``..``end``"""
+    sales = waiter_sales(start, end, use_rollup)
+    rows = []
+    for waiter in waiters():
+        total_orders, total_sales = sales.get(waiter.id, (0, ZERO))
+        rows.append({
+            'waiter': waiter_name(waiter),
+            'branch': waiter.branch.name if waiter.branch else 'N/A',
+            'totalOrders': total_orders,
+            'totalSales': float(total_sales),
+        })
+    return rows
+
+
+def unsettled_tables():
+    """Tables, order count and amount of every waiter's orders waiting for payment"""
+    from orders.models import Order
+    unsettled = Order.objects.filter(cashier_status=UNSETTLED_STATUS, created_by__role='waiter')
+    totals = {
+        row['created_by_id']: (row['orders'], row['amount'] or ZERO)
+        for row in unsettled.values('created_by_id').annotate(orders=Count('id'), amount=Sum('total_money'))
+    }
+    tables = {}
+    for waiter_id, number in (
+        unsettled.filter(table__isnull=False).values_list('created_by_id', 'table__number').distinct()
+    ):
+        tables.setdefault(waiter_id, []).append(number)
+
+    rows = []
+    for waiter in waiters():
+        orders, amount = totals.get(waiter.id, (0, ZERO))
+        rows.append({
+            'name': waiter_name(waiter),
+            'tables': sorted(tables.get(waiter.id, [])),
+            'amount': float(amount),
+            'orders': orders,
+        })
+    return rows
+
+
+def _pending():
+    if not hasattr(_local, 'orders'):
+        _local.orders = set()
+        _local.days = set()
+    return _local
+
+
+def mark_waiter_sales_changed(order_id=None, waiter_id=None, created_at=None):
+    """
+    Recount the rollup row of an order's waiter and day once the current
+    transaction commits. Pass ``waiter_id`` and ``created_at`` for orders that
+    are being deleted or reassigned, so the old row is recounted too.
+    """
+    pending = _pending()
+    if waiter_id is not None and created_at is not None:
+        pending.days.add((waiter_id, timezone.localdate(created_at)))
+    elif order_id is not None:
+        pending.orders.add(order_id)
+    else:
+        return
+    transaction.on_commit(flush_waiter_sales)
+
+
+def flush_waiter_sales():
+    """Recount the marked (waiter, day) rows (idempotent, runs on commit)"""
+    from orders.models import Order
+    pending = _pending()
+    if not pending.orders and not pending.days:
+        return 0
+    order_ids, days = set(pending.orders), set(pending.days)
+    pending.orders.clear()
+    pending.days.clear()
+    for waiter_id, created_at in Order.objects.filter(pk__in=order_ids).values_list('created_by_id', 'created_at'):
+        if waiter_id is not None:
+            days.add((waiter_id, timezone.localdate(created_at)))
+    return refresh_waiter_days(days)
+
+
+@transaction.atomic
+def refresh_waiter_days(pairs):
+    """Recount the rollup rows of the given (waiter id, day) pairs from the orders"""
+    if not pairs:
+        return 0
+    by_waiter = {}
+    for waiter_id, day in pairs:
+        by_waiter.setdefault(waiter_id, set()).add(day)
+    orders_q, rows_q = Q(), Q()
+    for waiter_id, dates in by_waiter.items():
+        orders_q |= Q(created_by_id=waiter_id, created_at__date__in=dates)
+        rows_q |= Q(waiter_id=waiter_id, date__in=dates)
+
+    WaiterDailySales.objects.filter(rows_q).delete()
+    return len(WaiterDailySales.objects.bulk_create(_rollup_rows(_closed_orders().filter(orders_q))))
+
+
+def _rollup_rows(orders):
+    grouped = (
+        orders.filter(created_by__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('created_by_id', 'day')
+        .annotate(**_sales_columns())
+    )
+    return [
+        WaiterDailySales(waiter_id=row['created_by_id'], date=row['day'], order_count=row['order_count'],
+                         sales_total=row['sales_total'] or ZERO)
+        for row in grouped
+    ]
+
+
+@transaction.atomic
+def rebuild_waiter_sales(start=None, end=None):
+    """Recompute the rollup for ``start``..``end`` (inclusive). Returns the row count."""
+    orders = _closed_orders()
+    rows = WaiterDailySales.objects.all()
+    if start:
+        orders = orders.filter(created_at__date__gte=start)
+        rows = rows.filter(date__gte=start)
+    if end:
+        orders = orders.filter(created_at__date__lte=end)
+        rows = rows.filter(date__lte=end)
+    rows.delete()
+    return len(WaiterDailySales.objects.bulk_create(_rollup_rows(orders), batch_size=1000))
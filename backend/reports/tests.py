@@ -1,3 +1,319 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from branches.models import Branch, Table
+from orders.models import Order, OrderItem
+from payments.models import Payment
+from users.models import User
+from inventory.models import Product, ProductMeasurement, ProductUnit, Stock
+from .dashboard import dashboard_report
+from .kpis import owner_snapshot
+from .models import SalesLine, WaiterDailySales
+from .sales_lines import rebuild_sales_lines, top_items
+from .staff_metrics import rebuild_waiter_sales, staff_performance, unsettled_tables
+
+
+class SalesLineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.waiter = User.objects.create_user(username='waiter', password='x', role='waiter', branch=cls.branch)
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def paid_order(self, *items, branch=None):
+        self.count += 1
+        branch = branch or self.branch
+        order = Order.objects.create(order_number=f'20260101-{self.count:02d}-B{branch.id}', branch=branch,
+                                     created_by=self.waiter)
+        for name, item_type, quantity, price, status in items:
+            OrderItem.objects.create(order=order, name=name, item_type=item_type, quantity=quantity,
+                                     price=Decimal(price), status=status)
+        Payment.objects.create(order=order, payment_method='cash', amount=Decimal('1.00'), is_completed=True)
+        return order
+
+    def test_lines_written_for_accepted_items_when_paid(self):
+        order = self.paid_order(('Tibs', 'food', 2, '250.00', 'accepted'), ('Tea', 'beverage', 1, '20.00', 'rejected'))
+        line = SalesLine.objects.get(order=order)
+        self.assertEqual((line.name, line.quantity, line.revenue, line.waiter_id, line.date),
+                         ('Tibs', 2, Decimal('500.00'), self.waiter.id, self.today))
+
+        order.payment.delete()
+        self.assertFalse(SalesLine.objects.filter(order=order).exists())
+
+    def test_cost_converts_sales_units_to_base_units(self):
+        bottle, shot = ProductUnit.objects.create(unit_name='bottle'), ProductUnit.objects.create(unit_name='shot')
+        gin = Product.objects.create(name='Gin', base_unit=bottle, base_unit_price=Decimal('500.00'))
+        beer = Product.objects.create(name='Beer', base_unit=bottle, base_unit_price=Decimal('40.00'))
+        ProductMeasurement.objects.create(product=gin, from_unit=bottle, to_unit=shot, amount_per=25,
+                                          is_default_sales_unit=True)
+        order = Order.objects.create(order_number=f'20260101-01-B{self.branch.id}', branch=self.branch,
+                                     created_by=self.waiter)
+        OrderItem.objects.create(order=order, name='Gin', item_type='beverage', quantity=5, price=Decimal('30.00'),
+                                 status='accepted', product=gin)
+        OrderItem.objects.create(order=order, name='Beer', item_type='beverage', quantity=3, price=Decimal('60.00'),
+                                 status='accepted', product=beer)
+        Payment.objects.create(order=order, payment_method='cash', amount=Decimal('1.00'), is_completed=True)
+        # 5 shots are a fifth of a bottle; beer is sold by the (base unit) bottle
+        self.assertEqual(dict(SalesLine.objects.filter(order=order).values_list('name', 'cost')),
+                         {'Gin': Decimal('100.00'), 'Beer': Decimal('120.00')})
+
+    def test_top_items_by_quantity_and_revenue(self):
+        self.paid_order(('Tibs', 'food', 2, '250.00', 'accepted'), ('Tea', 'beverage', 5, '20.00', 'accepted'))
+        self.paid_order(('Tibs', 'food', 1, '250.00', 'accepted'), ('Kitfo', 'meat', 1, '400.00', 'accepted'))
+        self.paid_order(('Tea', 'beverage', 9, '20.00', 'accepted'), branch=self.other_branch)
+
+        by_quantity = top_items(self.today, self.today, branch_id=self.branch.id)
+        self.assertEqual([(i['name'], i['quantity']) for i in by_quantity], [('Tea', 5), ('Tibs', 3), ('Kitfo', 1)])
+        by_revenue = top_items(self.today, self.today, item_type=['food', 'meat'], by='revenue', limit=1)
+        self.assertEqual(by_revenue, [{'name': 'Tibs', 'quantity': 3, 'revenue': Decimal('750.00')}])
+
+        with self.assertNumQueries(1):
+            top_items(self.today, self.today, branch_id=self.branch.id, item_type='food')
+
+    def test_rebuild_matches_incremental_lines(self):
+        self.paid_order(('Tibs', 'food', 2, '250.00', 'accepted'))
+        self.paid_order(('Tea', 'beverage', 3, '20.00', 'accepted'), branch=self.other_branch)
+        before = top_items(self.today, self.today)
+        SalesLine.objects.all().delete()
+        self.assertEqual(rebuild_sales_lines(self.today, self.today), 2)
+        self.assertEqual(top_items(self.today, self.today), before)
+
+    def test_top_items_endpoint(self):
+        self.paid_order(('Tibs', 'food', 2, '250.00', 'accepted'))
+        client = APIClient()
+        client.force_authenticate(self.waiter)
+        response = client.get(reverse('top-items'), {'start': self.today.isoformat(), 'end': self.today.isoformat(),
+                                                     'by': 'revenue'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], [{'name': 'Tibs', 'quantity': 2, 'revenue': 500.0}])
+        bad = client.get(reverse('top-items'), {'start': self.today.isoformat(), 'end': self.today.isoformat(),
+                                                'by': 'margin'})
+        self.assertEqual(bad.status_code, 400)
+
+
+class ReportDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.user = User.objects.create_user(username='manager', password='x', role='manager', branch=cls.branch)
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def order(self, *items, branch=None, days_ago=0):
+        self.count += 1
+        branch = branch or self.branch
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(order_number=f'20260101-{self.count:02d}-B{branch.id}', branch=branch)
+            if days_ago:
+                Order.objects.filter(pk=order.pk).update(created_at=order.created_at - timedelta(days=days_ago))
+            return [OrderItem.objects.create(order=order, name=item_type, item_type=item_type,
+                                             price=Decimal('10.00'), status=status) for item_type, status in items]
+
+    def test_series_counts(self):
+        self.order(('food', 'accepted'), ('food', 'rejected'), ('beverage', 'accepted'), ('food', 'pending'))
+        self.order(('food', 'accepted'), days_ago=1)
+        self.order(('meat', 'accepted'), days_ago=6)
+        self.order(('food', 'accepted'), days_ago=7)
+        self.order(('food', 'accepted'), branch=self.other_branch)
+
+        report = dashboard_report(self.today, branch_id=self.branch.id)
+        self.assertEqual((report['totalSold'], report['totalRejected']), (2, 1))
+        self.assertEqual((report['yesterdayTotalSold'], report['yesterdayTotalRejected']), (1, 0))
+        self.assertEqual([day['sold'] for day in report['dailySales']], [1, 0, 0, 0, 0, 1, 2])
+        self.assertEqual(report['dailySales'][-1]['date'], self.today.isoformat())
+
+        food = dashboard_report(self.today, branch_id=self.branch.id, item_types={'food'})
+        self.assertEqual([day['sold'] for day in food['dailySales']], [0, 0, 0, 0, 0, 1, 1])
+        self.assertEqual(dashboard_report(self.today)['totalSold'], 3)
+
+    def test_refreshes_are_cached_until_an_item_changes(self):
+        item, = self.order(('food', 'pending'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        params = {'date': self.today.isoformat(), 'branch': self.branch.id}
+        self.assertEqual(client.get(reverse('dashboard-report'), params).json()['totalSold'], 0)
+        with self.assertNumQueries(0):
+            dashboard_report(self.today, branch_id=self.branch.id)
+
+        item = OrderItem.objects.select_related('order').get(pk=item.pk)
+        item.status = 'accepted'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertEqual(client.get(reverse('dashboard-report'), params).json()['totalSold'], 1)
+        self.assertEqual(client.get(reverse('food-dashboard-report'), params).json()['totalSold'], 1)
+
+    def test_other_branch_writes_keep_cache(self):
+        self.order(('food', 'accepted'))
+        dashboard_report(self.today, branch_id=self.branch.id)
+        other, = self.order(('food', 'pending'), branch=self.other_branch)
+        other = OrderItem.objects.select_related('order').get(pk=other.pk)
+        other.status = 'accepted'
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        with self.assertNumQueries(0):
+            dashboard_report(self.today, branch_id=self.branch.id)
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_series_are_not_cached_in_a_per_process_cache(self):
+        item, = self.order(('food', 'pending'))
+        self.assertEqual(dashboard_report(self.today, branch_id=self.branch.id)['totalSold'], 0)
+        # Another worker's write: this process never hears of it
+        OrderItem.objects.filter(pk=item.pk).update(status='accepted')
+        self.assertEqual(dashboard_report(self.today, branch_id=self.branch.id)['totalSold'], 1)
+
+
+class OwnerKpiSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.other_branch = Branch.objects.create(name='Other')
+        cls.waiter = User.objects.create_user(username='waiter', password='x', role='waiter', branch=cls.branch)
+        cls.product = Product.objects.create(name='Beer', base_unit_price=Decimal('50.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock = Stock.objects.create(product=self.product, branch=self.branch,
+                                              quantity_in_base_units=Decimal('10'))
+
+    def close_order(self, number, *items, branch=None):
+        branch = branch or self.branch
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(order_number=f'20260101-{number:02d}-B{branch.id}', branch=branch,
+                                         created_by=self.waiter, cashier_status='printed')
+            for item_type, price in items:
+                OrderItem.objects.create(order=order, name=item_type, item_type=item_type, price=Decimal(price),
+                                         status='accepted')
+            order.refresh_from_db()
+            Payment.objects.create(order=order, payment_method='cash', amount=order.total_money, is_completed=True)
+        return order
+
+    def snapshot(self, branch_id=None):
+        return owner_snapshot(self.today, self.today, branch_id=branch_id)
+
+    def test_kpis(self):
+        self.close_order(1, ('food', '300.00'), ('beverage', '40.00'))
+        self.close_order(2, ('food', '100.00'), branch=self.other_branch)
+        kpi = self.snapshot(self.branch.id)['kpi']
+        self.assertEqual(kpi['totalRevenue'], 340.0)
+        self.assertEqual(kpi['foodIncome'], 300.0)
+        self.assertEqual(kpi['profitOfInventory'], 40.0)
+        self.assertEqual(kpi['costOfInventory'], 500.0)
+        self.assertEqual(self.snapshot()['kpi']['totalRevenue'], 440.0)
+        self.assertEqual(self.snapshot()['topSellingItems'][0], {'name': 'food', 'revenue': 400.0})
+
+    def test_snapshot_cached_until_payment_or_stock_changes(self):
+        self.close_order(1, ('food', '300.00'))
+        self.snapshot(self.branch.id)
+        with self.assertNumQueries(0):
+            self.snapshot(self.branch.id)
+
+        self.close_order(2, ('food', '100.00'))
+        self.assertEqual(self.snapshot(self.branch.id)['kpi']['totalRevenue'], 400.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.adjust_quantity(Decimal('2'), None, is_addition=False)
+        self.assertEqual(self.snapshot(self.branch.id)['kpi']['costOfInventory'], 400.0)
+
+    def test_other_branch_payment_keeps_snapshot(self):
+        self.snapshot(self.branch.id)
+        self.close_order(1, ('food', '100.00'), branch=self.other_branch)
+        with self.assertNumQueries(0):
+            self.snapshot(self.branch.id)
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_snapshots_are_not_cached_in_a_per_process_cache(self):
+        self.assertEqual(self.snapshot(self.branch.id)['kpi']['costOfInventory'], 500.0)
+        # Another worker's write: this process never hears of it
+        Stock.objects.filter(pk=self.stock.pk).update(quantity_in_base_units=Decimal('4'))
+        self.assertEqual(self.snapshot(self.branch.id)['kpi']['costOfInventory'], 200.0)
+
+
+class StaffMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Main')
+        cls.tables = [Table.objects.create(number=n, branch=cls.branch) for n in (1, 2)]
+        cls.alice = User.objects.create_user(username='alice', password='x', role='waiter', branch=cls.branch,
+                                             first_name='Alice', last_name='A')
+        cls.bob = User.objects.create_user(username='bob', password='x', role='waiter')
+        User.objects.create_user(username='cashier', password='x', role='cashier', branch=cls.branch)
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def order(self, waiter, cashier_status='printed', amount='100.00', table=None, paid=True):
+        self.count += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(order_number=f'20260101-{self.count:02d}-B1', branch=self.branch,
+                                         created_by=waiter, table=table, cashier_status=cashier_status,
+                                         total_money=Decimal(amount))
+            if paid:
+                Payment.objects.create(order=order, payment_method='cash', amount=Decimal(amount), is_completed=True)
+        return order
+
+    def performance(self, use_rollup):
+        return {row['waiter']: (row['totalOrders'], row['totalSales'])
+                for row in staff_performance(self.today, self.today, use_rollup=use_rollup)}
+
+    def test_staff_performance_in_constant_queries(self):
+        self.order(self.alice)
+        self.order(self.alice, amount='50.00')
+        self.order(self.alice, paid=False)
+        self.order(self.bob, cashier_status='pending')
+        expected = {'Alice A': (3, 150.0), 'bob': (0, 0.0)}
+        for use_rollup in (False, True):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.performance(use_rollup), expected)
+
+    def test_rollup_follows_order_changes(self):
+        order = self.order(self.alice)
+        reopened = self.order(self.alice, amount='30.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            reopened.cashier_status = 'pending'
+            reopened.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            order.created_by = self.bob
+            order.save()
+        self.assertEqual(self.performance(True), {'Alice A': (0, 0.0), 'bob': (1, 100.0)})
+        self.assertEqual(self.performance(True), self.performance(False))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertFalse(WaiterDailySales.objects.exists())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.order(self.alice)
+        self.order(self.bob, amount='20.00')
+        incremental = sorted(WaiterDailySales.objects.values_list('waiter_id', 'date', 'order_count', 'sales_total'))
+        self.assertEqual(rebuild_waiter_sales(), 2)
+        self.assertEqual(
+            sorted(WaiterDailySales.objects.values_list('waiter_id', 'date', 'order_count', 'sales_total')),
+            incremental,
+        )
+
+    def test_unsettled_tables(self):
+        self.order(self.alice, 'ready_for_payment', '40.00', self.tables[1], paid=False)
+        self.order(self.alice, 'ready_for_payment', '60.00', self.tables[0], paid=False)
+        self.order(self.alice, 'ready_for_payment', '10.00', self.tables[0], paid=False)
+        self.order(self.bob, 'printed')
+        with self.assertNumQueries(3):
+            rows = {row['name']: row for row in unsettled_tables()}
+        self.assertEqual(rows['Alice A'], {'name': 'Alice A', 'tables': [1, 2], 'amount': 110.0, 'orders': 3})
+        self.assertEqual(rows['bob'], {'name': 'bob', 'tables': [], 'amount': 0.0, 'orders': 0})
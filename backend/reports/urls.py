@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import BranchDashboardView, ReportDashboardView, FoodDashboardReportView
+from .views import BranchDashboardView, ReportDashboardView, FoodDashboardReportView, TopItemsView
 
 urlpatterns = [
     path('branch-dashboard/', BranchDashboardView.as_view()),
-    path('dashboard-report/', ReportDashboardView.as_view()),
-    path('food-dashboard-report/', FoodDashboardReportView.as_view()),
+    path('dashboard-report/', ReportDashboardView.as_view(), name='dashboard-report'),
+    path('food-dashboard-report/', FoodDashboardReportView.as_view(), name='food-dashboard-report'),
+    path('top-items/', TopItemsView.as_view(), name='top-items'),
 ]
\ No newline at end of file
@@ -9,7 +9,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from orders.models import Order
 from django.utils.dateparse import parse_date
-from datetime import timedelta
+import logging
+from .dashboard import dashboard_report
+from .sales_lines import RANKINGS, top_items
+
+logger = logging.getLogger(__name__)
+
+
+def _branch_param(request):
+    """Optional ?branch= id; raises ValueError when it is not a number"""
+    branch = request.query_params.get('branch')
+    return int(branch) if branch else None
+
 
 class BranchDashboardView(APIView):
     def get(self, request):
@@ -29,56 +40,11 @@ class ReportDashboardView(APIView):
         date = parse_date(date_str)
         if not date:
             return Response({'error': 'Invalid date'}, status=400)
-
-        # Today
-        today_orders = Order.objects.filter(created_at__date=date)
-        total_sold = 0
-        total_rejected = 0
-        for order in today_orders:
-            for item in order.items.all():
-                if item.status == 'accepted':
-                    total_sold += 1
-                elif item.status == 'rejected':
-                    total_rejected += 1
-
-        # Yesterday
-        yesterday = date - timedelta(days=1)
-        yesterday_orders = Order.objects.filter(created_at__date=yesterday)
-        yesterday_total_sold = 0
-        yesterday_total_rejected = 0
-        for order in yesterday_orders:
-            for item in order.items.all():
-                if item.status == 'accepted':
-                    yesterday_total_sold += 1
-                elif item.status == 'rejected':
-                    yesterday_total_rejected += 1
-
-        # Daily sales for the last 7 days
-        daily_sales = []
-        for i in range(7):
-            d = date - timedelta(days=6-i)
-            d_orders = Order.objects.filter(created_at__date=d)
-            sold = 0
-            rejected = 0
-            for order in d_orders:
-                for item in order.items.all():
-                    if item.status == 'accepted':
-                        sold += 1
-                    elif item.status == 'rejected':
-                        rejected += 1
-            daily_sales.append({
-                'date': d.isoformat(),
-                'sold': sold,
-                'rejected': rejected
-            })
-
-        return Response({
-            'totalSold': total_sold,
-            'totalRejected': total_rejected,
-            'yesterdayTotalSold': yesterday_total_sold,
-            'yesterdayTotalRejected': yesterday_total_rejected,
-            'dailySales': daily_sales
-        })
+        try:
+            branch_id = _branch_param(request)
+        except ValueError:
+            return Response({'error': 'Invalid branch'}, status=400)
+        return Response(dashboard_report(date, branch_id=branch_id))
 
 class FoodDashboardReportView(APIView):
     permission_classes = [AllowAny]
@@ -89,59 +55,43 @@ class FoodDashboardReportView(APIView):
         date = parse_date(date_str)
         if not date:
             return Response({'error': 'Invalid date'}, status=400)
+        try:
+            branch_id = _branch_param(request)
+        except ValueError:
+            return Response({'error': 'Invalid branch'}, status=400)
+        return Response(dashboard_report(date, branch_id=branch_id, item_types={'food'}))
 
-        # Today
-        today_orders = Order.objects.filter(created_at__date=date)
-        print(f"[DEBUG] Found {today_orders.count()} orders for {date}")
-        total_sold = 0
-        total_rejected = 0
-        for order in today_orders:
-            food_items = order.items.filter(item_type='food')
-            print(f"[DEBUG] Order {order.id} has {food_items.count()} food items")
-            for item in food_items:
-                print(f"  [DEBUG] Item {item.name} status: {item.status}")
-                if item.status == 'accepted':
-                    total_sold += 1
-                elif item.status == 'rejected':
-                    total_rejected += 1
 
-        # Yesterday
-        yesterday = date - timedelta(days=1)
-        yesterday_orders = Order.objects.filter(created_at__date=yesterday)
-        yesterday_total_sold = 0
-        yesterday_total_rejected = 0
-        for order in yesterday_orders:
-            food_items = order.items.filter(item_type='food')
-            for item in food_items:
-                if item.status == 'accepted':
-                    yesterday_total_sold += 1
-                elif item.status == 'rejected':
-                    yesterday_total_rejected += 1
+class TopItemsView(APIView):
+    """Best sellers from the sales lines: ?start=&end=[&branch=&item_type=food,meat&by=revenue&limit=10]"""
+    permission_classes = [IsAuthenticated]
 
-        # Daily sales for the last 7 days
-        daily_sales = []
-        for i in range(7):
-            d = date - timedelta(days=6-i)
-            d_orders = Order.objects.filter(created_at__date=d)
-            sold = 0
-            rejected = 0
-            for order in d_orders:
-                food_items = order.items.filter(item_type='food')
-                for item in food_items:
-                    if item.status == 'accepted':
-                        sold += 1
-                    elif item.status == 'rejected':
-                        rejected += 1
-            daily_sales.append({
-                'date': d.isoformat(),
-                'sold': sold,
-                'rejected': rejected
-            })
+    def get(self, request):
+        start = parse_date(request.query_params.get('start') or '')
+        end = parse_date(request.query_params.get('end') or '')
+        if not (start and end):
+            return Response({'error': 'Valid start and end dates are required'}, status=400)
+        by = request.query_params.get('by', 'quantity')
+        if by not in RANKINGS:
+            return Response({'error': f"'by' must be one of {', '.join(RANKINGS)}"}, status=400)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=400)
+        try:
+            branch_id = _branch_param(request)
+        except ValueError:
+            return Response({'error': 'Invalid branch'}, status=400)
+        item_type = request.query_params.get('item_type')
+        item_types = [t for t in item_type.split(',') if t] if item_type else None
 
+        items = top_items(start, end, branch_id=branch_id, item_type=item_types, by=by, limit=limit)
         return Response({
-            'totalSold': total_sold,
-            'totalRejected': total_rejected,
-            'yesterdayTotalSold': yesterday_total_sold,
-            'yesterdayTotalRejected': yesterday_total_rejected,
-            'dailySales': daily_sales
-        })
\ No newline at end of file
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'by': by,
+            'items': [
+                {'name': i['name'], 'quantity': i['quantity'], 'revenue': float(i['revenue'])}
+                for i in items
+            ],
+        })
@@ -31,17 +31,20 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from core.decorators import csrf_exempt_for_cors
 from core.session_manager import SessionManager
+import logging
+
+logger = logging.getLogger(__name__)
 
 @csrf_exempt
 def test_logout(request):
-    print('test_logout called, method:', request.method)
+    logger.debug("test_logout called, method: %s", request.method)
     if request.method == 'POST':
         return JsonResponse({'ok': True})
     return JsonResponse({'error': 'Only POST allowed'}, status=405)
 
 @csrf_exempt
 def session_logout(request):
-    print("session_logout called, method:", request.method)
+    logger.debug("session_logout called, method: %s", request.method)
     if request.method == 'POST':
         from django.contrib.auth import logout
         logout(request)
@@ -50,13 +53,16 @@ def session_logout(request):
             request.session.clear()
             request.session.delete()
         except Exception as e:
-            print("Session clear/delete error:", e)
+            logger.debug("Session clear/delete error: %s", e)
         try:
             from django.contrib.sessions.models import Session
             if request.session.session_key:
                 Session.objects.filter(session_key=request.session.session_key).delete()
+            # Clients without the cookie log out the session they send in the header
+            if request.headers.get('X-Session-Key'):
+                Session.objects.filter(session_key=request.headers['X-Session-Key']).delete()
         except Exception as e:
-            print("Session DB delete error:", e)
+            logger.debug("Session DB delete error: %s", e)
         # Get the origin from the request to determine the redirect URL
         origin = request.headers.get('Origin', 'http://localhost:3000')
         redirect_url = f"{origin}/login"
@@ -83,21 +89,21 @@ class SessionLoginView(APIView):
         username = request.data.get("username")
         password = request.data.get("password")
         
-        print(f"[DEBUG] Login attempt for user: {username}")
-        print(f"[DEBUG] Request cookies: {dict(request.COOKIES)}")
-        print(f"[DEBUG] Request headers: {dict(request.headers)}")
+        logger.debug("Login attempt for user: %s", username)
+        logger.debug("Request cookies: %s", dict(request.COOKIES))
+        logger.debug("Request headers: %s", dict(request.headers))
         
         user = authenticate(request, username=username, password=password)
         
-        print(f"Authentication result: {user}")
+        logger.debug("Authentication result: %s", user)
 
         if user:
             # Use SessionManager to create session
             session_key = SessionManager.create_session(request, user)
             
-            print(f"[DEBUG] User authenticated: {user.username}")
-            print(f"[DEBUG] Session key after login: {session_key}")
-            print(f"[DEBUG] User is authenticated: {request.user.is_authenticated}")
+            logger.debug("User authenticated: %s", user.username)
+            logger.debug("Session key after login: %s", session_key)
+            logger.debug("User is authenticated: %s", request.user.is_authenticated)
             
             # Create response with user data and session info for network access
             response_data = UserLoginSerializer(user).data
@@ -108,7 +114,7 @@ class SessionLoginView(APIView):
             
             # Get origin to determine cookie settings
             origin = request.headers.get('Origin', '')
-            print(f"[DEBUG] Origin header: {origin}")
+            logger.debug("Origin header: %s", origin)
             
             # Set session cookie explicitly for network access
             if session_key:
@@ -120,9 +126,9 @@ class SessionLoginView(APIView):
                         from urllib.parse import urlparse
                         parsed = urlparse(origin)
                         cookie_domain = parsed.hostname
-                        print(f"[DEBUG] Setting cookie domain to: {cookie_domain}")
+                        logger.debug("Setting cookie domain to: %s", cookie_domain)
                     except Exception as e:
-                        print(f"[DEBUG] Error parsing origin: {e}")
+                        logger.debug("Error parsing origin: %s", e)
                         cookie_domain = None
                 
                 # Set session cookie with proper settings for cross-origin
@@ -137,11 +143,11 @@ class SessionLoginView(APIView):
                     path='/',
                     domain=None  # Don't restrict domain - let browser handle it
                 )
-                print(f"[DEBUG] Session cookie set without domain restriction")
+                logger.debug("Session cookie set without domain restriction")
                 
                 # Also set a custom header to help frontend track session
                 response['X-Session-Key'] = session_key
-                print(f"[DEBUG] Session key header set: {session_key}")
+                logger.debug("Session key header set: %s", session_key)
             
             # Set CSRF cookie if not already set
             if 'csrftoken' not in request.COOKIES:
@@ -157,13 +163,13 @@ class SessionLoginView(APIView):
                         path='/',
                         domain=None  # Don't restrict domain - let browser handle it
                     )
-                    print(f"[DEBUG] CSRF cookie set without domain restriction")
+                    logger.debug("CSRF cookie set without domain restriction")
             
-            print(f"[DEBUG] Response cookies: {dict(response.cookies)}")
-            print(f"[DEBUG] Response headers: {dict(response.headers)}")
+            logger.debug("Response cookies: %s", dict(response.cookies))
+            logger.debug("Response headers: %s", dict(response.headers))
             return response
         
-        print(f"[DEBUG] Authentication failed for user: {username}")
+        logger.debug("Authentication failed for user: %s", username)
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
@@ -173,16 +179,16 @@ def get_csrf(request):
     from django.middleware.csrf import get_token
     csrf_token = get_token(request)
     
-    print(f"[DEBUG] CSRF endpoint called")
-    print(f"[DEBUG] CSRF token generated: {csrf_token[:10] if csrf_token else 'None'}...")
-    print(f"[DEBUG] Request cookies: {dict(request.COOKIES)}")
-    print(f"[DEBUG] Request headers: {dict(request.headers)}")
+    logger.debug("CSRF endpoint called")
+    logger.debug("CSRF token generated: %s...", csrf_token[:10] if csrf_token else 'None')
+    logger.debug("Request cookies: %s", dict(request.COOKIES))
+    logger.debug("Request headers: %s", dict(request.headers))
     
     response = JsonResponse({"message": "CSRF cookie set", "csrf_token": csrf_token})
     
     # Get origin to determine cookie settings
     origin = request.headers.get('Origin', '')
-    print(f"[DEBUG] Origin header: {origin}")
+    logger.debug("Origin header: %s", origin)
     
     # Force CSRF cookie to be set
     if csrf_token:
@@ -194,9 +200,9 @@ def get_csrf(request):
                 from urllib.parse import urlparse
                 parsed = urlparse(origin)
                 cookie_domain = parsed.hostname
-                print(f"[DEBUG] Setting CSRF cookie domain to: {cookie_domain}")
+                logger.debug("Setting CSRF cookie domain to: %s", cookie_domain)
             except Exception as e:
-                print(f"[DEBUG] Error parsing origin: {e}")
+                logger.debug("Error parsing origin: %s", e)
                 cookie_domain = None
         
         from django.conf import settings
@@ -210,16 +216,16 @@ def get_csrf(request):
             path='/',
             domain=None  # Don't restrict domain - let browser handle it
         )
-        print(f"[DEBUG] CSRF cookie explicitly set without domain restriction")
+        logger.debug("CSRF cookie explicitly set without domain restriction")
     else:
-        print(f"[DEBUG] No CSRF token generated")
+        logger.debug("No CSRF token generated")
     
     # Also set additional headers for debugging
     response['Access-Control-Allow-Credentials'] = 'true'
     response['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
     
-    print(f"[DEBUG] CSRF cookie set in response: {csrf_token[:10] if csrf_token else 'None'}...")
-    print(f"[DEBUG] Response headers: {dict(response.headers)}")
+    logger.debug("CSRF cookie set in response: %s...", csrf_token[:10] if csrf_token else 'None')
+    logger.debug("Response headers: %s", dict(response.headers))
     return response
 
 class DebugAuthView(APIView):
@@ -294,23 +300,23 @@ class UserViewSet(ModelViewSet):
             if user.role == 'manager':
                 # Branch managers can see all users in their branch
                 queryset = User.objects.filter(branch=user.branch)
-                print(f"[DEBUG] Filtering users for branch manager: {user.branch.name}")
+                logger.debug("Filtering users for branch manager: %s", user.branch.name)
             elif user.role == 'owner':
                 # Owners can see all users
                 queryset = User.objects.all()
-                print(f"[DEBUG] Owner - showing all users")
+                logger.debug("Owner - showing all users")
             else:
                 # Other roles see only themselves
                 queryset = User.objects.filter(id=user.id)
-                print(f"[DEBUG] User {user.role} - showing only self")
+                logger.debug("User %s - showing only self", user.role)
         elif user.is_superuser:
             # Superuser can see all users
             queryset = User.objects.all()
-            print(f"[DEBUG] Superuser - showing all users")
+            logger.debug("Superuser - showing all users")
         else:
             # For users without branch, show only themselves
             queryset = User.objects.filter(id=user.id)
-            print(f"[DEBUG] User without branch - showing only self")
+            logger.debug("User without branch - showing only self")
         
         return queryset
 
@@ -377,12 +383,12 @@ class CurrentUserView(APIView):
 
     def get(self, request):
         # Add debugging information
-        print(f"[DEBUG] /me/ endpoint called")
-        print(f"[DEBUG] Request cookies: {dict(request.COOKIES)}")
-        print(f"[DEBUG] Request headers: {dict(request.headers)}")
-        print(f"[DEBUG] Session key: {request.session.session_key if hasattr(request, 'session') else 'No session'}")
-        print(f"[DEBUG] User: {request.user}")
-        print(f"[DEBUG] Is authenticated: {request.user.is_authenticated if hasattr(request, 'user') else False}")
+        logger.debug("/me/ endpoint called")
+        logger.debug("Request cookies: %s", dict(request.COOKIES))
+        logger.debug("Request headers: %s", dict(request.headers))
+        logger.debug("Session key: %s", request.session.session_key if hasattr(request, 'session') else 'No session')
+        logger.debug("User: %s", request.user)
+        logger.debug("Is authenticated: %s", request.user.is_authenticated if hasattr(request, 'user') else False)
         
         # Django's authentication middleware should have already authenticated the user
         # if the session is valid
@@ -398,24 +404,8 @@ class WaiterUnsettledTablesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        from users.models import User
-        waiters = User.objects.filter(role='waiter')
-        result = []
-        for waiter in waiters:
-            # Find orders for this waiter in the required state
-            orders = Order.objects.filter(
-                created_by=waiter,
-                cashier_status='ready_for_payment'
-            ).select_related('table')
-            table_numbers = list({o.table.number for o in orders if o.table})
-            total_amount = sum([o.total_money or 0 for o in orders])
-            result.append({
-                'name': waiter.get_full_name() or waiter.username,
-                'tables': table_numbers,
-                'amount': float(total_amount),
-                'orders': orders.count(),
-            })
-        return Response(result)
+        from reports.staff_metrics import unsettled_tables
+        return Response(unsettled_tables())
 # ✅ Custom User Login Serializer
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -426,20 +416,20 @@ class TestLoginView(APIView):
         username = request.data.get("username")
         password = request.data.get("password")
         
-        print(f"[DEBUG] Test login attempt for user: {username}")
+        logger.debug("Test login attempt for user: %s", username)
         
         user = authenticate(request, username=username, password=password)
 
         if user:
             login(request, user)
-            print(f"[DEBUG] Test login successful for: {user.username}")
+            logger.debug("Test login successful for: %s", user.username)
             return Response({
                 "message": "Login successful",
                 "user": UserLoginSerializer(user).data,
                 "session_key": request.session.session_key
             })
         
-        print(f"[DEBUG] Test login failed for user: {username}")
+        logger.debug("Test login failed for user: %s", username)
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 # Add this new view for CORS testing